@@ -0,0 +1,53 @@
+"""Add pnl_rollups and a (user_id, status) index on position_groups
+
+Revision ID: a7b8c9d0e1f2
+Revises: f6a7b8c9d0e1
+Create Date: 2025-11-27 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7b8c9d0e1f2'
+down_revision: Union[str, Sequence[str], None] = 'f6a7b8c9d0e1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('pnl_rollups',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('symbol', sa.String(), nullable=False),
+    sa.Column('timeframe', sa.Integer(), nullable=False),
+    sa.Column('realized_pnl_usd', sa.Numeric(precision=20, scale=10), nullable=False),
+    sa.Column('closed_groups', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'day', 'symbol', 'timeframe')
+    )
+    op.create_index('ix_position_groups_user_status', 'position_groups', ['user_id', 'status'])
+
+    # Seed from the groups closed so far, on the day they closed
+    op.execute("""
+        INSERT INTO pnl_rollups (user_id, day, symbol, timeframe, realized_pnl_usd, closed_groups, updated_at)
+        SELECT user_id,
+               coalesce(closed_at, updated_at, created_at)::date,
+               symbol,
+               timeframe,
+               sum(coalesce(realized_pnl_usd, 0)),
+               count(*) FILTER (WHERE status = 'closed'),
+               now()
+        FROM position_groups
+        WHERE status = 'closed' OR coalesce(realized_pnl_usd, 0) <> 0
+        GROUP BY 1, 2, 3, 4
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_position_groups_user_status', table_name='position_groups')
+    op.drop_table('pnl_rollups')
@@ -0,0 +1,38 @@
+"""Add the remaining uppercase labels to group_status_enum and move rows to them
+
+SQLAlchemy binds PositionGroupStatus by member name, so every status the
+app filters on or writes must exist in the type as its uppercase name, as
+'LIVE' already does (a1b2c3d4e5f6, b2c3d4e5f6a7).
+
+Revision ID: b8c9d0e1f2a3
+Revises: a7b8c9d0e1f2
+Create Date: 2025-11-28 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8c9d0e1f2a3'
+down_revision: Union[str, Sequence[str], None] = 'a7b8c9d0e1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+STATUS_NAMES = ('WAITING', 'PARTIALLY_FILLED', 'ACTIVE', 'CLOSING', 'CLOSED', 'FAILED')
+
+
+def upgrade() -> None:
+    # New labels must be committed before any row can use them
+    with op.get_context().autocommit_block():
+        for name in STATUS_NAMES:
+            op.execute(f"ALTER TYPE group_status_enum ADD VALUE IF NOT EXISTS '{name}'")
+    for name in STATUS_NAMES:
+        op.execute(f"UPDATE position_groups SET status = '{name}' WHERE status = '{name.lower()}'")
+
+
+def downgrade() -> None:
+    # As with 'LIVE', the labels stay in the type; only the rows move back.
+    for name in STATUS_NAMES:
+        op.execute(f"UPDATE position_groups SET status = '{name.lower()}' WHERE status = '{name}'")
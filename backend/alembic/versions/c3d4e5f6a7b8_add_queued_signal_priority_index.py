@@ -0,0 +1,29 @@
+"""Add (user_id, status, priority_score, queued_at) index to queued_signals
+
+Revision ID: c3d4e5f6a7b8
+Revises: b2c3d4e5f6a7
+Create Date: 2025-11-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3d4e5f6a7b8'
+down_revision: Union[str, Sequence[str], None] = 'b2c3d4e5f6a7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        'ix_queued_signals_user_status_priority',
+        'queued_signals',
+        ['user_id', 'status', 'priority_score', 'queued_at'],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_queued_signals_user_status_priority', table_name='queued_signals')
@@ -0,0 +1,50 @@
+"""Add the context columns logging_service writes to system_logs and audit_logs
+
+Revision ID: d4e5f6a7b8c9
+Revises: c3d4e5f6a7b8
+Create Date: 2025-11-24 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4e5f6a7b8c9'
+down_revision: Union[str, Sequence[str], None] = 'c3d4e5f6a7b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column('system_logs', 'service', existing_type=sa.String(), nullable=True)
+    op.add_column('system_logs', sa.Column('category', sa.String(), nullable=True))
+    op.add_column('system_logs', sa.Column('user_id', sa.UUID(), nullable=True))
+    op.add_column('system_logs', sa.Column('details', postgresql.JSONB(astext_type=sa.Text()), nullable=True))
+    op.add_column('audit_logs', sa.Column('resource', sa.String(), nullable=True))
+    op.add_column('audit_logs', sa.Column('resource_id', sa.String(), nullable=True))
+    op.alter_column(
+        'audit_logs', 'details',
+        existing_type=sa.Text(),
+        type_=postgresql.JSONB(astext_type=sa.Text()),
+        postgresql_using='to_jsonb(details)',
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'audit_logs', 'details',
+        existing_type=postgresql.JSONB(astext_type=sa.Text()),
+        type_=sa.Text(),
+        postgresql_using='details::text',
+    )
+    op.drop_column('audit_logs', 'resource_id')
+    op.drop_column('audit_logs', 'resource')
+    op.drop_column('system_logs', 'details')
+    op.drop_column('system_logs', 'user_id')
+    op.drop_column('system_logs', 'category')
+    op.execute("UPDATE system_logs SET service = coalesce(category, 'unknown') WHERE service IS NULL")
+    op.alter_column('system_logs', 'service', existing_type=sa.String(), nullable=False)
@@ -0,0 +1,69 @@
+"""Range-partition the log tables by day
+
+Revision ID: e5f6a7b8c9d0
+Revises: d4e5f6a7b8c9
+Create Date: 2025-11-25 10:00:00.000000
+
+"""
+from datetime import date, datetime, timedelta
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f6a7b8c9d0'
+down_revision: Union[str, Sequence[str], None] = 'd4e5f6a7b8c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# table -> partition key; kept in step with app/services/log_partitions.py
+LOG_TABLES = {
+    'system_logs': 'timestamp',
+    'audit_logs': 'timestamp',
+    'webhook_logs': 'received_at',
+    'error_logs': 'timestamp',
+}
+DAYS_AHEAD = 7
+
+
+def _create_daily_partition(table: str, day: date) -> None:
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS {table}_p{day:%Y%m%d} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    today = datetime.utcnow().date()
+    for table, key in LOG_TABLES.items():
+        legacy = f'{table}_unpartitioned'
+        op.execute(f'ALTER TABLE {table} RENAME TO {legacy}')
+        op.execute(f'ALTER TABLE {legacy} RENAME CONSTRAINT {table}_pkey TO {legacy}_pkey')
+        op.execute(f'CREATE TABLE {table} (LIKE {legacy} INCLUDING DEFAULTS) PARTITION BY RANGE ("{key}")')
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "{key}" SET NOT NULL')
+        op.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id, "{key}")')
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+
+        op.execute(f'UPDATE {legacy} SET "{key}" = now() WHERE "{key}" IS NULL')
+        first_day = bind.execute(sa.text(f'SELECT min("{key}")::date FROM {legacy}')).scalar() or today
+        day = min(first_day, today)
+        while day <= today + timedelta(days=DAYS_AHEAD):
+            _create_daily_partition(table, day)
+            day += timedelta(days=1)
+        op.execute(f'INSERT INTO {table} SELECT * FROM {legacy}')
+        op.execute(f'DROP TABLE {legacy}')
+
+
+def downgrade() -> None:
+    for table, key in LOG_TABLES.items():
+        partitioned = f'{table}_partitioned'
+        op.execute(f'ALTER TABLE {table} RENAME TO {partitioned}')
+        op.execute(f'ALTER TABLE {partitioned} RENAME CONSTRAINT {table}_pkey TO {partitioned}_pkey')
+        op.execute(f'CREATE TABLE {table} (LIKE {partitioned} INCLUDING DEFAULTS)')
+        op.execute(f'ALTER TABLE {table} ALTER COLUMN "{key}" DROP NOT NULL')
+        op.execute(f'ALTER TABLE {table} ADD PRIMARY KEY (id)')
+        op.execute(f'INSERT INTO {table} SELECT * FROM {partitioned}')
+        op.execute(f'DROP TABLE {partitioned} CASCADE')
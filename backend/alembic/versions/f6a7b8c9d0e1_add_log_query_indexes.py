@@ -0,0 +1,46 @@
+"""Add keyset and full-text indexes for the log query API
+
+Revision ID: f6a7b8c9d0e1
+Revises: e5f6a7b8c9d0
+Create Date: 2025-11-26 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a7b8c9d0e1'
+down_revision: Union[str, Sequence[str], None] = 'e5f6a7b8c9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Created on the partitioned parents, so every current and future partition gets them.
+BTREE_INDEXES = {
+    'ix_system_logs_timestamp_id': ('system_logs', ['timestamp', 'id']),
+    'ix_system_logs_level_timestamp_id': ('system_logs', ['level', 'timestamp', 'id']),
+    'ix_system_logs_category_timestamp_id': ('system_logs', ['category', 'timestamp', 'id']),
+    'ix_audit_logs_timestamp_id': ('audit_logs', ['timestamp', 'id']),
+    'ix_audit_logs_user_timestamp_id': ('audit_logs', ['user_id', 'timestamp', 'id']),
+    'ix_audit_logs_action_timestamp_id': ('audit_logs', ['action', 'timestamp', 'id']),
+    'ix_audit_logs_user_action_timestamp_id': ('audit_logs', ['user_id', 'action', 'timestamp', 'id']),
+}
+
+
+def upgrade() -> None:
+    for name, (table, columns) in BTREE_INDEXES.items():
+        op.create_index(name, table, columns)
+    op.create_index(
+        'ix_system_logs_message_fts',
+        'system_logs',
+        [sa.text("to_tsvector('simple'::regconfig, message)")],
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_system_logs_message_fts', table_name='system_logs')
+    for name, (table, _) in BTREE_INDEXES.items():
+        op.drop_index(name, table_name=table)
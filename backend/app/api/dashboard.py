@@ -1,16 +1,39 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date
+from typing import List
 from ..db.session import get_async_db
-from ..schemas.dashboard_schemas import DashboardStats
-from ..services.dashboard_service import get_dashboard_stats
+from ..schemas.dashboard_schemas import DashboardStats, RealizedPnlBucket
+from ..schemas.auth_schemas import UserOut
+from ..services.dashboard_service import get_dashboard_stats, get_realized_pnl
+from ..services.pnl_rollup import PNL_PERIODS
+from ..middleware.auth_middleware import require_authenticated
 
 router = APIRouter()
 
 @router.get("/stats", response_model=DashboardStats)
 async def get_stats(
     db: AsyncSession = Depends(get_async_db),
+    current_user: UserOut = Depends(require_authenticated),
 ):
     """
-    Get dashboard statistics.
+    Get dashboard statistics for the authenticated user.
     """
-    return await get_dashboard_stats(db)
+    return await get_dashboard_stats(db, current_user.id)
+
+@router.get("/pnl", response_model=List[RealizedPnlBucket])
+async def get_pnl(
+    period: str = "day",
+    start_date: date = None,
+    end_date: date = None,
+    symbol: str = None,
+    timeframe: int = None,
+    db: AsyncSession = Depends(get_async_db),
+    current_user: UserOut = Depends(require_authenticated),
+):
+    """
+    Get realized PnL by day, week or month, per pair and timeframe.
+    """
+    if period not in PNL_PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of {', '.join(PNL_PERIODS)}")
+    return await get_realized_pnl(db, current_user.id, period, start_date, end_date, symbol, timeframe)
@@ -1,7 +1,7 @@
 from fastapi import APIRouter, Depends
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..db.session import get_async_db
-from ..services.health_service import check_system_health, check_database_health
+from ..services.health_service import check_system_health, check_database_health, get_performance_metrics
 
 router = APIRouter()
 
@@ -20,3 +20,10 @@ async def get_health_status(
         "database": database_health["status"],
         "redis": "connected", # Placeholder for actual Redis health check
     }
+
+@router.get("/metrics", response_model=dict)
+async def get_metrics():
+    """
+    Retrieve in-process performance metrics.
+    """
+    return await get_performance_metrics()
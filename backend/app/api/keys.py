@@ -4,6 +4,7 @@ from sqlalchemy import select, delete
 from ..db.session import get_async_db
 from ..schemas.key_schemas import ExchangeConfigCreate, ExchangeConfigOut
 from ..services import encryption_service, jwt_service
+from ..services.exchange_manager import client_pool
 from ..services.encryption_service import ENCRYPTION_KEY
 from ..models.key_models import ExchangeConfig
 from ..middleware.auth_middleware import require_authenticated
@@ -36,6 +37,7 @@ async def create_exchange_config(
     db.add(db_config)
     await db.commit()
     await db.refresh(db_config)
+    await client_pool.invalidate(current_user.id, exchange)
     return db_config
 
 @router.get("", response_model=List[ExchangeConfigOut])
@@ -81,6 +83,7 @@ async def delete_exchange_config(
         )
     )
     await db.commit()
+    await client_pool.invalidate(current_user.id, exchange)
     return {"success": True}
 
 @router.put("/{exchange}/mode")
@@ -106,6 +109,7 @@ async def set_exchange_mode(
     db_config.mode = mode
     db.add(db_config)
     await db.commit()
+    await client_pool.invalidate(current_user.id, exchange)
     return {"success": True}
 
 @router.put("/{exchange}/enable")
@@ -131,4 +135,5 @@ async def set_exchange_enabled(
     db_config.is_enabled = enable
     db.add(db_config)
     await db.commit()
+    await client_pool.invalidate(current_user.id, exchange)
     return {"success": True}
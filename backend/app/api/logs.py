@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, delete
+from sqlalchemy import delete
 from ..db.session import get_async_db
 from ..models.log_models import SystemLog, AuditLog
 from datetime import datetime, timedelta
 from typing import List
-from ..schemas.log_schemas import SystemLogOut, AuditLogOut
+from ..schemas.log_schemas import SystemLogOut, AuditLogOut, LogExportRequest
+from ..services import log_export, log_partitions, log_query
 from ..dependencies import require_role
 from ..models.user_models import User
 
@@ -18,57 +20,58 @@ async def redirect_to_system_logs():
     """
     raise HTTPException(status_code=307, detail="Redirecting to /api/logs/system", headers={"Location": "/api/logs/system"})
 
+def page_size(limit: int) -> int:
+    if limit < 1 or limit > log_query.MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {log_query.MAX_PAGE_SIZE}")
+    return limit
+
+async def paginate(db: AsyncSession, query, model, limit: int, cursor: str, response: Response):
+    """Runs a keyset page and returns the next cursor in the X-Next-Cursor header."""
+    try:
+        rows, next_cursor = await log_query.fetch_page(db, query, model, page_size(limit), cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
+
 @router.get("/system", response_model=List[SystemLogOut])
 async def get_system_logs(
+    response: Response,
     level: str = None,
     category: str = None,
     start_date: datetime = None,
     end_date: datetime = None,
+    q: str = None,
     limit: int = 100,
+    cursor: str = None,
     db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_role("admin")),
 ):
     """
-    Get system logs.
+    Get system logs, newest first. `q` is a full-text search over the message;
+    pass the X-Next-Cursor response header back as `cursor` for the next page.
     """
-    query = select(SystemLog)
-    if level:
-        query = query.where(SystemLog.level == level)
-    if category:
-        query = query.where(SystemLog.category == category)
-    if start_date:
-        query = query.where(SystemLog.timestamp >= start_date)
-    if end_date:
-        query = query.where(SystemLog.timestamp <= end_date)
-    
-    result = await db.execute(query.limit(limit))
-    return result.scalars().all()
+    query = log_query.system_log_query(level, category, start_date, end_date, q)
+    return await paginate(db, query, SystemLog, limit, cursor, response)
 
 @router.get("/audit", response_model=List[AuditLogOut])
 async def get_audit_logs(
+    response: Response,
     user_id: str = None,
     action: str = None,
     start_date: datetime = None,
     end_date: datetime = None,
     limit: int = 100,
+    cursor: str = None,
     db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(require_role("admin")),
 ):
     """
-    Get audit logs.
+    Get audit logs, newest first, paged like the system logs.
     """
-    query = select(AuditLog)
-    if user_id:
-        query = query.where(AuditLog.user_id == user_id)
-    if action:
-        query = query.where(AuditLog.action == action)
-    if start_date:
-        query = query.where(AuditLog.timestamp >= start_date)
-    if end_date:
-        query = query.where(AuditLog.timestamp <= end_date)
-    
-    result = await db.execute(query.limit(limit))
-    return result.scalars().all()
+    query = log_query.audit_log_query(user_id, action, start_date, end_date)
+    return await paginate(db, query, AuditLog, limit, cursor, response)
 
 @router.delete("/system/{days_old}")
 async def delete_system_logs(
@@ -83,15 +86,23 @@ async def delete_system_logs(
         raise HTTPException(status_code=400, detail="days_old must be a positive integer")
     
     cutoff_date = datetime.utcnow() - timedelta(days=days_old)
+    # Whole days go with their partitions; only the boundary day is deleted row by row
+    dropped = await log_partitions.drop_partitions_before(db, "system_logs", cutoff_date)
     await db.execute(delete(SystemLog).where(SystemLog.timestamp < cutoff_date))
     await db.commit()
-    return {"success": True}
+    return {"success": True, "partitions_dropped": len(dropped)}
 
 @router.post("/export")
-async def export_logs(current_user: User = Depends(require_role("admin"))):
+async def export_logs(
+    request: LogExportRequest,
+    current_user: User = Depends(require_role("admin")),
+):
     """
-    Export logs as CSV/JSON.
+    Export logs as CSV or NDJSON, optionally gzip-compressed, streamed row
+    batch by row batch.
     """
-    # This is a placeholder. In a real-world application, you would
-    # generate a CSV or JSON file and return it as a response.
-    return {"success": True}
\ No newline at end of file
+    return StreamingResponse(
+        log_export.stream_export(request),
+        media_type=log_export.export_media_type(request),
+        headers={"Content-Disposition": f'attachment; filename="{log_export.export_filename(request)}"'},
+    )
@@ -1,9 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import JSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..db.session import get_async_db
 from ..schemas.trading_schemas import SignalPayload
 from ..services.webhook_service import process_webhook_signal
 from ..services.jwt_service import verify_webhook_token
+from ..services.signal_inbox import signal_inbox, missing_signal_fields
+from ..services.signal_dedup import signal_dedup, signal_fingerprint
 from ..services.exchange_manager import ExchangeManager
 from ..models.trading_models import PositionGroup, PositionGroupStatus
 from ..core.config import settings
@@ -24,13 +27,40 @@ async def receive_webhook(
     if webhook_signal.secret != settings.WEBHOOK_SECRET:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid webhook secret")
 
-    # 2. Process the signal
+    # Queued signals are processed later, so reject incomplete ones up front
+    if settings.WEBHOOK_ASYNC_INTAKE:
+        missing = missing_signal_fields(webhook_signal.tv)
+        if missing:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Missing signal fields: {', '.join(missing)}")
+
+    # 2. Drop re-deliveries and duplicate alerts before any database work
+    fingerprint = None
+    if settings.SIGNAL_DEDUP_ENABLED:
+        fingerprint = signal_fingerprint(user_id, webhook_signal.tv, webhook_signal.execution_intent, webhook_signal.timestamp)
+        if not await signal_dedup.claim(fingerprint):
+            return {"status": "duplicate", "fingerprint": fingerprint}
+
+    # 3. Async intake: persist to the inbox and acknowledge; workers do the rest
+    if settings.WEBHOOK_ASYNC_INTAKE:
+        try:
+            inbox_id = await signal_inbox.enqueue(user_id, webhook_signal.tv, webhook_signal.execution_intent)
+        except Exception as e:
+            if fingerprint:
+                await signal_dedup.release(fingerprint)
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=f"Error queueing webhook: {e}")
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={"status": "accepted", "inbox_id": inbox_id})
+
+    # 4. Process the signal inline
     try:
         result = await process_webhook_signal(db, user_id, webhook_signal.tv, webhook_signal.execution_intent)
         return result
     except HTTPException as e:
+        if fingerprint:
+            await signal_dedup.release(fingerprint)
         raise e
     except Exception as e:
+        if fingerprint:
+            await signal_dedup.release(fingerprint)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Error processing webhook: {e}")
 
 @router.post("/test-signal/{user_id}", status_code=status.HTTP_200_OK)
@@ -11,6 +11,18 @@ class Settings(BaseSettings):
     APP_MODE: str = "webtop_self_contained"
     APP_DATA_DIR: str = "./engine_data"
     APP_LOG_LEVEL: str = "INFO"
+    LOG_SINK_CAPACITY: int = 10000
+    LOG_SINK_BATCH_SIZE: int = 500
+    LOG_SINK_FLUSH_MS: int = 200
+    # Failed flushes of a batch before it is written in halves and bad rows are dead-lettered
+    LOG_SINK_MAX_ATTEMPTS: int = 10
+    LOG_SINK_MAX_BACKOFF_SEC: int = 30
+    LOG_PARTITION_DAYS_AHEAD: int = 7
+    # Days of logs kept per table; 0 keeps everything
+    LOG_RETENTION_SYSTEM_DAYS: int = 30
+    LOG_RETENTION_AUDIT_DAYS: int = 90
+    LOG_RETENTION_WEBHOOK_DAYS: int = 0
+    LOG_RETENTION_ERROR_DAYS: int = 0
 
     # Exchange Settings
     EXCHANGE_NAME: str = "binance"
@@ -18,15 +30,47 @@ class Settings(BaseSettings):
     API_SECRET: str
     EXCHANGE_TESTNET: bool = True
     EXCHANGE_PRECISION_REFRESH_SEC: int = 60
+    EXCHANGE_CLIENT_IDLE_TTL_SEC: int = 900
+    EXCHANGE_ORDER_CONCURRENCY: int = 5
+    ORDER_MONITOR_BATCHED: bool = True
+    FILL_STREAM_ENABLED: bool = True
+    FILL_STREAM_RECONNECT_SEC: int = 5
+    PRICE_FEED_REFRESH_SEC: int = 2
+    PRICE_FEED_MAX_AGE_SEC: int = 10
+    TP_INDEX_REBUILD_SEC: int = 60
+    TP_EVALUATION_MODE: str = "index"  # "index" or "vectorized"
+
+    # Webhook Intake Settings
+    WEBHOOK_ASYNC_INTAKE: bool = False
+    SIGNAL_INBOX_STREAM: str = "signals:inbox"
+    SIGNAL_INBOX_GROUP: str = "signal-workers"
+    SIGNAL_INBOX_BATCH_SIZE: int = 100
+    SIGNAL_INBOX_BLOCK_MS: int = 1000
+    SIGNAL_INBOX_MAXLEN: int = 100000
+    SIGNAL_INBOX_CLAIM_IDLE_MS: int = 300000
+    SIGNAL_INBOX_CLAIM_INTERVAL_SEC: int = 60
+    SIGNAL_INBOX_RETRY_SEC: int = 5
+    SIGNAL_INBOX_MAX_ATTEMPTS: int = 5
+    SIGNAL_INBOX_DEAD_LETTER_STREAM: str = "signals:dead"
+    SIGNAL_EXECUTOR_CONCURRENCY: int = 16
+    SIGNAL_DEDUP_ENABLED: bool = True
+    SIGNAL_DEDUP_TTL_SECONDS: int = 86400
+    SIGNAL_DEDUP_LOCAL_SIZE: int = 10000
 
     # Execution Pool Settings
     POOL_MAX_OPEN_GROUPS: int = 10
     POOL_COUNT_PYRAMIDS: bool = False
+    POOL_RECONCILE_SEC: int = 60
+    QUEUE_LOSS_FLUSH_SEC: int = 5
+    QUEUE_LOSS_RESYNC_SEC: int = 60
+    QUEUE_PROMOTION_RETRY_SEC: int = 5
 
     # Risk Engine Settings
     RISK_LOSS_THRESHOLD_PERCENT: float = -5.0
     RISK_REQUIRE_FULL_PYRAMIDS: bool = True
     RISK_POST_FULL_WAIT_MINUTES: int = 60
+    RISK_MAX_WINNERS_TO_COMBINE: int = 3
+    RISK_OFFSET_CONCURRENCY_PER_EXCHANGE: int = 2
 
     # Database Settings
     DATABASE_URL: str
@@ -40,6 +84,9 @@ class Settings(BaseSettings):
     ENCRYPTION_KEY: str
     REDIS_URL: str
     PRECISION_CACHE_EXPIRY_SECONDS: int = 3600
+    PRECISION_LOCAL_CACHE_SIZE: int = 4096
+    PRECISION_LOCAL_TTL_SECONDS: int = 60
+    PRECISION_NEGATIVE_TTL_SECONDS: int = 300
 
     class Config:
         env_file = BASE_DIR.parent / ".env"
@@ -1,42 +1,80 @@
 import uuid
-from sqlalchemy import Column, String, DateTime, func, Text
+from sqlalchemy import Column, String, DateTime, func, Text, DDL, event, Index, literal_column
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from ..db.base import Base
 
+# Log tables are range-partitioned by day on their time column (see
+# services/log_partitions.py); the time column is part of the primary key.
+
 class WebhookLog(Base):
     __tablename__ = "webhook_logs"
+    __table_args__ = {"postgresql_partition_by": "RANGE (received_at)"}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=True)
     status = Column(String, nullable=False)
     payload = Column(JSONB)
     error_message = Column(Text)
-    received_at = Column(DateTime, default=func.now())
+    received_at = Column(DateTime, primary_key=True, default=func.now())
 
 class ErrorLog(Base):
     __tablename__ = "error_logs"
+    __table_args__ = {"postgresql_partition_by": 'RANGE ("timestamp")'}
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=True)
     service = Column(String) # e.g., "OrderService", "RiskEngine"
     error_message = Column(Text)
     traceback = Column(Text, nullable=True)
-    timestamp = Column(DateTime, default=func.now())
+    timestamp = Column(DateTime, primary_key=True, default=func.now())
 
 class SystemLog(Base):
     __tablename__ = "system_logs"
+    __table_args__ = (
+        # Keyset pages of the log console: (filter..., timestamp, id)
+        Index("ix_system_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_system_logs_level_timestamp_id", "level", "timestamp", "id"),
+        Index("ix_system_logs_category_timestamp_id", "category", "timestamp", "id"),
+        Index(
+            "ix_system_logs_message_fts",
+            func.to_tsvector(literal_column("'simple'::regconfig"), literal_column("message")),
+            postgresql_using="gin",
+        ),
+        {"postgresql_partition_by": 'RANGE ("timestamp")'},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    service = Column(String, nullable=False)
+    service = Column(String, nullable=True)
+    category = Column(String, nullable=True)
+    user_id = Column(UUID(as_uuid=True), nullable=True)
     message = Column(Text, nullable=False)
+    details = Column(JSONB, nullable=True)
     level = Column(String, default="INFO")
-    timestamp = Column(DateTime, default=func.now())
+    timestamp = Column(DateTime, primary_key=True, default=func.now())
 
 class AuditLog(Base):
     __tablename__ = "audit_logs"
+    __table_args__ = (
+        Index("ix_audit_logs_timestamp_id", "timestamp", "id"),
+        Index("ix_audit_logs_user_timestamp_id", "user_id", "timestamp", "id"),
+        Index("ix_audit_logs_action_timestamp_id", "action", "timestamp", "id"),
+        Index("ix_audit_logs_user_action_timestamp_id", "user_id", "action", "timestamp", "id"),
+        {"postgresql_partition_by": 'RANGE ("timestamp")'},
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), nullable=True)
     action = Column(String, nullable=False)
-    details = Column(Text)
-    timestamp = Column(DateTime, default=func.now())
\ No newline at end of file
+    resource = Column(String, nullable=True)
+    resource_id = Column(String, nullable=True)
+    details = Column(JSONB, nullable=True)
+    timestamp = Column(DateTime, primary_key=True, default=func.now())
+
+# Tables built with create_all (tests, fresh installs) get a catch-all
+# partition so inserts work before the daily partitions exist.
+for _model in (WebhookLog, ErrorLog, SystemLog, AuditLog):
+    event.listen(
+        _model.__table__,
+        "after_create",
+        DDL("CREATE TABLE IF NOT EXISTS %(table)s_default PARTITION OF %(table)s DEFAULT"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import (Column, String, Integer, Numeric, DateTime, Boolean, JSON, ForeignKey, Enum as SQLAlchemyEnum)
+from sqlalchemy import (Column, String, Integer, Numeric, Date, DateTime, Boolean, JSON, ForeignKey, Index, Enum as SQLAlchemyEnum)
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 import uuid
@@ -22,6 +22,10 @@ class PositionGroup(Base):
     Contains multiple pyramids and DCA legs.
     """
     __tablename__ = "position_groups"
+    __table_args__ = (
+        # Per-user dashboard counts and open-position lookups
+        Index("ix_position_groups_user_status", "user_id", "status"),
+    )
     
     # Identity
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
@@ -139,6 +143,10 @@ class QueuedSignal(Base):
     Represents a signal waiting in the queue.
     """
     __tablename__ = "queued_signals"
+    __table_args__ = (
+        # Heap recovery: a user's waiting signals in priority order, FIFO on ties
+        Index("ix_queued_signals_user_status_priority", "user_id", "status", "priority_score", "queued_at"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
@@ -158,4 +166,20 @@ class QueuedSignal(Base):
     current_loss_percent = Column(Numeric(10, 4))
     
     status = Column(SQLAlchemyEnum("queued", "promoted", "cancelled", name="queue_status_enum"), nullable=False, default="queued")
-    promoted_at = Column(DateTime)
\ No newline at end of file
+    promoted_at = Column(DateTime)
+
+class PnlRollup(Base):
+    """
+    Realized PnL per user, UTC day, symbol and timeframe, maintained
+    incrementally whenever a close realizes profit or loss.
+    """
+    __tablename__ = "pnl_rollups"
+
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    symbol = Column(String, primary_key=True)
+    timeframe = Column(Integer, primary_key=True)
+
+    realized_pnl_usd = Column(Numeric(20, 10), nullable=False, default=Decimal("0"))
+    closed_groups = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
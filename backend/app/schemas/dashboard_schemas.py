@@ -1,6 +1,16 @@
 from pydantic import BaseModel
+from datetime import date
 
 class DashboardStats(BaseModel):
     open_positions: int
     total_positions: int
     pnl: float
+    realized_pnl: float
+    unrealized_pnl: float
+
+class RealizedPnlBucket(BaseModel):
+    period_start: date
+    symbol: str
+    timeframe: int
+    realized_pnl_usd: float
+    closed_groups: int
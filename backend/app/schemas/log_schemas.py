@@ -1,12 +1,13 @@
 from pydantic import BaseModel
 from datetime import datetime
 from uuid import UUID
+from typing import Literal
 
 class SystemLogOut(BaseModel):
     id: UUID
     timestamp: datetime
     level: str
-    category: str
+    category: str = None
     user_id: UUID = None
     message: str
     details: dict = None
@@ -18,12 +19,25 @@ class SystemLogOut(BaseModel):
 class AuditLogOut(BaseModel):
     id: UUID
     timestamp: datetime
-    user_id: UUID
+    user_id: UUID = None
     action: str
-    resource: str
+    resource: str = None
     resource_id: str = None
     details: dict = None
     ip_address: str = None
 
     class Config:
         from_attributes = True
+
+class LogExportRequest(BaseModel):
+    log_type: Literal["system", "audit"] = "system"
+    format: Literal["csv", "ndjson"] = "csv"
+    compress: bool = False
+    # Same filters as the list endpoints
+    level: str = None
+    category: str = None
+    q: str = None
+    user_id: str = None
+    action: str = None
+    start_date: datetime = None
+    end_date: datetime = None
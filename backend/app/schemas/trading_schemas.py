@@ -7,6 +7,7 @@ class SignalPayload(BaseModel):
     secret: str
     tv: dict
     execution_intent: dict
+    timestamp: Optional[str] = None
 
 class PositionGroupOut(BaseModel):
     id: UUID
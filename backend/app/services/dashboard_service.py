@@ -1,26 +1,49 @@
+from datetime import date
+from typing import List, Optional
+from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 from ..models.trading_models import PositionGroup, PositionGroupStatus
+from ..services.pool_manager import SLOT_FREE_STATUSES
+from ..services import pnl_rollup
 
-async def get_dashboard_stats(db: AsyncSession):
+async def get_dashboard_stats(db: AsyncSession, user_id: UUID):
     """
-    Get dashboard statistics asynchronously.
+    Get a user's dashboard statistics. Counts and unrealized PnL come from one
+    pass over the user's groups on (user_id, status); realized PnL is the sum
+    of the user's rollup rows.
     """
-    open_positions_result = await db.execute(
-        select(func.count(PositionGroup.id)).where(PositionGroup.status == PositionGroupStatus.LIVE)
+    result = await db.execute(
+        select(
+            func.count(PositionGroup.id).filter(PositionGroup.status == PositionGroupStatus.LIVE),
+            func.count(PositionGroup.id),
+            func.coalesce(
+                func.sum(PositionGroup.unrealized_pnl_usd).filter(PositionGroup.status.notin_(SLOT_FREE_STATUSES)),
+                0,
+            ),
+        ).where(PositionGroup.user_id == user_id)
     )
-    open_positions = open_positions_result.scalar_one()
-
-    total_positions_result = await db.execute(select(func.count(PositionGroup.id)))
-    total_positions = total_positions_result.scalar_one()
-
-    pnl_result = await db.execute(
-        select(func.sum(PositionGroup.realized_pnl_usd + PositionGroup.unrealized_pnl_usd))
-    )
-    pnl = pnl_result.scalar_one_or_none() or 0
+    open_positions, total_positions, unrealized_pnl = result.one()
+    realized_pnl = await pnl_rollup.realized_pnl_total(db, user_id)
 
     return {
         "open_positions": open_positions,
         "total_positions": total_positions,
-        "pnl": pnl,
+        "pnl": realized_pnl + unrealized_pnl,
+        "realized_pnl": realized_pnl,
+        "unrealized_pnl": unrealized_pnl,
     }
+
+async def get_realized_pnl(
+    db: AsyncSession,
+    user_id: UUID,
+    period: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    symbol: Optional[str] = None,
+    timeframe: Optional[int] = None,
+) -> List[dict]:
+    """
+    Realized PnL by day, week or month, per pair and timeframe.
+    """
+    return await pnl_rollup.realized_pnl_by_period(db, user_id, period, start_date, end_date, symbol, timeframe)
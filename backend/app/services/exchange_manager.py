@@ -1,84 +1,537 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+import aiohttp
 import ccxt.async_support as ccxt
+import ccxt.pro as ccxtpro
 from sqlalchemy.orm import Session
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from ..models.key_models import ExchangeConfig
 from ..services import encryption_service
+from ..core.config import settings
+from ..services.metrics_service import metrics
+from contextlib import contextmanager
+from enum import IntEnum
 from uuid import UUID
 from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
 
-class ExchangeManager:
-    def __init__(self, db: AsyncSession, user_id: UUID, exchange_name: str):
-        self.db = db
-        self.user_id = user_id
-        self.exchange_name = exchange_name
-        self.exchange = None
+class Priority(IntEnum):
+    """Rate-limit queue priority; lower values are served first."""
+    EXIT = 0
+    TAKE_PROFIT = 1
+    ENTRY = 2
+    RECONCILE = 3
+    PRECISION = 4
 
-    async def __aenter__(self):
-        result = await self.db.execute(select(ExchangeConfig).filter(
-            ExchangeConfig.user_id == self.user_id,
-            ExchangeConfig.exchange_name == self.exchange_name,
-        ))
-        db_config = result.scalars().first()
+# Default priority per ccxt method when the caller has not set one.
+METHOD_PRIORITIES = {
+    'create_market_order': Priority.EXIT,
+    'cancel_order': Priority.EXIT,
+    'create_limit_order': Priority.ENTRY,
+    'create_orders': Priority.ENTRY,
+    'fetch_ticker': Priority.TAKE_PROFIT,
+    'fetch_tickers': Priority.TAKE_PROFIT,
+    'fetch_order': Priority.RECONCILE,
+    'fetch_open_orders': Priority.RECONCILE,
+    'fetch_closed_orders': Priority.RECONCILE,
+    'load_markets': Priority.PRECISION,
+}
+
+# Request weight per ccxt method (Binance weights; a reasonable proxy elsewhere).
+METHOD_WEIGHTS = {
+    'create_orders': 5,
+    'fetch_order': 4,
+    'fetch_open_orders': 6,
+    'fetch_closed_orders': 20,
+    'fetch_tickers': 40,
+    'load_markets': 20,
+}
+
+# (weight budget, window in seconds) per exchange.
+EXCHANGE_WEIGHT_BUDGETS = {
+    'binance': (6000, 60),
+    'bybit': (600, 5),
+    'okx': (60, 2),
+}
+DEFAULT_WEIGHT_BUDGET = (1200, 60)
+
+# Response headers reporting the weight already used in the current window.
+USED_WEIGHT_HEADERS = {
+    'binance': 'x-mbx-used-weight-1m',
+}
+
+_request_priority: contextvars.ContextVar[Optional[Priority]] = contextvars.ContextVar("request_priority", default=None)
+
+@contextmanager
+def request_priority(priority: Priority):
+    """Run exchange calls made inside the block (and tasks spawned from it) at `priority`."""
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+class TokenBucket:
+    """
+    Weight budget for one API key. Calls that cannot be served immediately
+    wait in a priority queue, so exits and TP jump ahead of reconciliation
+    and precision refreshes.
+    """
+    def __init__(self, capacity: float, window_seconds: float):
+        self.capacity = capacity
+        self.refill_per_second = capacity / window_seconds
+        self.tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiters: list = []
+        self._seq = itertools.count()
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.refill_per_second)
+        self._updated = now
+
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, weight: float, priority: Priority) -> float:
+        """Waits until `weight` can be spent; returns the time spent waiting."""
+        weight = min(weight, self.capacity)
+        self._refill()
+        if not self._waiters and time.monotonic() >= self._blocked_until and self.tokens >= weight:
+            self.tokens -= weight
+            return 0.0
+
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (int(priority), next(self._seq), weight, future))
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+        return time.monotonic() - started
 
-        if not db_config:
-            raise Exception("Exchange configuration not found")
+    async def _dispatch(self) -> None:
+        while self._waiters:
+            delay = self._blocked_until - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self._refill()
+            _, _, weight, future = self._waiters[0]
+            if future.cancelled():
+                heapq.heappop(self._waiters)
+                continue
+            if self.tokens >= weight:
+                heapq.heappop(self._waiters)
+                self.tokens -= weight
+                future.set_result(None)
+                continue
+            await asyncio.sleep((weight - self.tokens) / self.refill_per_second)
 
+    def sync_used_weight(self, used: float) -> None:
+        """Adopts the exchange's own count of weight used in the window if it is stricter."""
+        self._refill()
+        self.tokens = min(self.tokens, self.capacity - used)
+
+    def block(self, seconds: float) -> None:
+        """Stops serving calls for `seconds`, e.g. after a 429/418."""
+        self.tokens = 0.0
+        self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+
+class RateLimitScheduler:
+    """
+    Central limiter for every exchange call, with one token bucket per API key
+    (user_id, exchange); public market-data calls share the (None, exchange) bucket.
+    Exchanges also count weight per source IP, so every call additionally goes
+    through one shared bucket per exchange for this host.
+    """
+    def __init__(self, budgets: Dict[str, Tuple[int, int]] = None, ip_budgets: Dict[str, Tuple[int, int]] = None):
+        self.budgets = budgets or EXCHANGE_WEIGHT_BUDGETS
+        self.ip_budgets = ip_budgets or self.budgets
+        self._buckets: Dict[Tuple[Optional[UUID], str], TokenBucket] = {}
+        self._ip_buckets: Dict[str, TokenBucket] = {}
+
+    def bucket(self, user_id: Optional[UUID], exchange_name: str) -> TokenBucket:
+        key = (user_id, exchange_name)
+        if key not in self._buckets:
+            self._buckets[key] = TokenBucket(*self.budgets.get(exchange_name, DEFAULT_WEIGHT_BUDGET))
+        return self._buckets[key]
+
+    def ip_bucket(self, exchange_name: str) -> TokenBucket:
+        if exchange_name not in self._ip_buckets:
+            self._ip_buckets[exchange_name] = TokenBucket(*self.ip_budgets.get(exchange_name, DEFAULT_WEIGHT_BUDGET))
+        return self._ip_buckets[exchange_name]
+
+    async def call(self, user_id: Optional[UUID], exchange_name: str, client, method: str, *args, **kwargs):
+        """
+        Runs `client.<method>(*args, **kwargs)` once both the key's budget and
+        the exchange's shared per-IP budget allow it.
+        """
+        priority = _request_priority.get()
+        if priority is None:
+            priority = METHOD_PRIORITIES.get(method, Priority.RECONCILE)
+        bucket = self.bucket(user_id, exchange_name)
+        ip_bucket = self.ip_bucket(exchange_name)
+
+        weight = METHOD_WEIGHTS.get(method, 1)
+        # The key's own limit first, so a throttled key does not hold shared weight while it waits
+        waited = await bucket.acquire(weight, priority)
+        waited += await ip_bucket.acquire(weight, priority)
+        metrics.observe("exchange_rate_limit_wait_seconds", waited, exchange=exchange_name, priority=priority.name.lower())
+        metrics.gauge("exchange_rate_limit_queue_depth", ip_bucket.queue_depth(), exchange=exchange_name)
+        try:
+            return await getattr(client, method)(*args, **kwargs)
+        except (ccxt.RateLimitExceeded, ccxt.DDoSProtection) as e:
+            metrics.incr("exchange_rate_limit_rejections", exchange=exchange_name)
+            retry_after = self._retry_after(client)
+            bucket.block(retry_after)
+            # 429/418 bans are per IP: every key on this host has to back off
+            ip_bucket.block(retry_after)
+            raise e
+        finally:
+            self._sync_headers(bucket, exchange_name, client)
+            self._sync_headers(ip_bucket, exchange_name, client)
+
+    @staticmethod
+    def _retry_after(client) -> float:
+        headers = getattr(client, 'last_response_headers', None) or {}
+        try:
+            return float(headers.get('Retry-After') or headers.get('retry-after') or 60)
+        except (TypeError, ValueError):
+            return 60.0
+
+    @staticmethod
+    def _sync_headers(bucket: TokenBucket, exchange_name: str, client) -> None:
+        header = USED_WEIGHT_HEADERS.get(exchange_name)
+        headers = getattr(client, 'last_response_headers', None)
+        if not header or not isinstance(headers, dict):
+            return
+        used = headers.get(header) or headers.get(header.upper())
+        if used is not None:
+            try:
+                bucket.sync_used_weight(float(used))
+            except (TypeError, ValueError):
+                pass
+
+rate_limiter = RateLimitScheduler()
+
+class ExchangeClientPool:
+    """
+    Process-wide registry of warm ccxt clients keyed by (user_id, exchange, mode).
+    Clients share one aiohttp session, keep their loaded markets between uses and
+    are only closed when idle for longer than the TTL or explicitly invalidated.
+    """
+    def __init__(self, idle_ttl_seconds: int):
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._clients: Dict[Tuple[UUID, str, str], Any] = {}
+        self._last_used: Dict[Tuple[UUID, str, str], float] = {}
+        self._modes: Dict[Tuple[UUID, str], str] = {}
+        self._locks: Dict[Tuple[UUID, str], asyncio.Lock] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    def _build_client(self, exchange_name: str, db_config: ExchangeConfig, module=ccxt):
         api_key = encryption_service.decrypt_data(db_config.api_key_encrypted, encryption_service.ENCRYPTION_KEY)
         api_secret = encryption_service.decrypt_data(db_config.api_secret_encrypted, encryption_service.ENCRYPTION_KEY)
 
-        exchange_class = getattr(ccxt, self.exchange_name)
-        self.exchange = exchange_class({
+        exchange_class = getattr(module, exchange_name)
+        client = exchange_class({
             'apiKey': api_key,
             'secret': api_secret,
+            'session': self._get_session(),
+            'enableRateLimit': True,
         })
 
         if db_config.mode == 'testnet':
-            self.exchange.set_sandbox_mode(True)
-        
+            client.set_sandbox_mode(True)
+        return client
+
+    async def acquire(self, db: AsyncSession, user_id: UUID, exchange_name: str):
+        """
+        Returns a warm client for the user's exchange, building one from the
+        stored ExchangeConfig only when none is cached.
+        """
+        client = self._lookup(user_id, exchange_name)
+        if client is not None:
+            return client
+
+        lock = self._locks.setdefault((user_id, exchange_name), asyncio.Lock())
+        async with lock:
+            # Another coroutine may have built the client while we waited.
+            client = self._lookup(user_id, exchange_name)
+            if client is not None:
+                return client
+
+            db_config = await load_exchange_config(db, user_id, exchange_name)
+            client = self._build_client(exchange_name, db_config)
+            key = (user_id, exchange_name, db_config.mode)
+            self._clients[key] = client
+            self._last_used[key] = time.monotonic()
+            self._modes[(user_id, exchange_name)] = db_config.mode
+            return client
+
+    def get_public_client(self, exchange_name: str, testnet: bool = False):
+        """
+        Returns a shared unauthenticated client for public market data
+        (tickers, markets). It lives in the pool under user_id None, one per
+        (exchange, testnet), since sandbox prices differ from live ones.
+        """
+        key = (None, exchange_name, 'testnet' if testnet else 'public')
+        client = self._clients.get(key)
+        if client is None:
+            exchange_class = getattr(ccxt, exchange_name)
+            client = exchange_class({'session': self._get_session(), 'enableRateLimit': True})
+            if testnet:
+                client.set_sandbox_mode(True)
+            self._clients[key] = client
+        self._last_used[key] = time.monotonic()
+        return client
+
+    def _lookup(self, user_id: UUID, exchange_name: str):
+        mode = self._modes.get((user_id, exchange_name))
+        if mode is None:
+            return None
+        key = (user_id, exchange_name, mode)
+        client = self._clients.get(key)
+        if client is not None:
+            self._last_used[key] = time.monotonic()
+        return client
+
+    def release(self, user_id: UUID, exchange_name: str):
+        """Marks the client as recently used; the connection stays open."""
+        self._lookup(user_id, exchange_name)
+
+    async def invalidate(self, user_id: UUID, exchange_name: str):
+        """
+        Drops and closes the cached client, e.g. after the user's keys or mode change.
+        """
+        mode = self._modes.pop((user_id, exchange_name), None)
+        if mode is None:
+            return
+        await self._close((user_id, exchange_name, mode))
+
+    async def evict_idle(self):
+        """Closes clients that have not been used within the idle TTL."""
+        cutoff = time.monotonic() - self.idle_ttl_seconds
+        for key in [k for k, last_used in self._last_used.items() if last_used < cutoff]:
+            user_id, exchange_name, mode = key
+            if self._modes.get((user_id, exchange_name)) == mode:
+                del self._modes[(user_id, exchange_name)]
+            await self._close(key)
+
+    async def close_all(self):
+        for key in list(self._clients):
+            await self._close(key)
+        self._modes.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _close(self, key: Tuple[UUID, str, str]):
+        client = self._clients.pop(key, None)
+        self._last_used.pop(key, None)
+        if client is not None:
+            try:
+                await client.close()
+            except Exception as e:
+                print(f"Error closing exchange client {key[1]} for user {key[0]}: {e}")
+
+    async def create_stream_client(self, db: AsyncSession, user_id: UUID, exchange_name: str):
+        """
+        Builds a dedicated ccxt.pro client for websocket streams. Stream clients
+        are long-lived and owned (and closed) by the caller, not by the pool.
+        """
+        db_config = await load_exchange_config(db, user_id, exchange_name)
+        return self._build_client(exchange_name, db_config, module=ccxtpro)
+
+async def load_exchange_config(db: AsyncSession, user_id: UUID, exchange_name: str) -> ExchangeConfig:
+    result = await db.execute(select(ExchangeConfig).filter(
+        ExchangeConfig.user_id == user_id,
+        ExchangeConfig.exchange_name == exchange_name,
+    ))
+    db_config = result.scalars().first()
+
+    if not db_config:
+        raise Exception("Exchange configuration not found")
+    return db_config
+
+client_pool = ExchangeClientPool(settings.EXCHANGE_CLIENT_IDLE_TTL_SEC)
+
+# Maximum orders per batch-order request, for exchanges that have one.
+BATCH_ORDER_LIMITS = {'binance': 5, 'bybit': 10, 'okx': 20}
+
+_order_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+def order_semaphore(exchange_name: str) -> asyncio.Semaphore:
+    """Bounds concurrent order submissions per exchange across all users."""
+    if exchange_name not in _order_semaphores:
+        _order_semaphores[exchange_name] = asyncio.Semaphore(settings.EXCHANGE_ORDER_CONCURRENCY)
+    return _order_semaphores[exchange_name]
+
+class ExchangeManager:
+    def __init__(self, db: AsyncSession, user_id: UUID, exchange_name: str):
+        self.db = db
+        self.user_id = user_id
+        self.exchange_name = exchange_name
+        self.exchange = None
+
+    async def __aenter__(self):
+        self.exchange = await client_pool.acquire(self.db, self.user_id, self.exchange_name)
         return self
 
+    async def _call(self, method: str, *args, **kwargs):
+        return await rate_limiter.call(self.user_id, self.exchange_name, self.exchange, method, *args, **kwargs)
+
     async def get_current_price(self, symbol: str) -> Decimal:
         """Fetches the current market price for a symbol."""
-        ticker = await self.exchange.fetch_ticker(symbol)
+        ticker = await self._call('fetch_ticker', symbol)
         return Decimal(str(ticker['last']))
 
     async def create_market_order(self, symbol: str, side: str, amount: Decimal):
         """Places a market order."""
-        return await self.exchange.create_market_order(symbol, side, amount)
+        return await self._call('create_market_order', symbol, side, amount)
 
     async def place_order(self, symbol: str, side: str, amount: Decimal, order_type: str = 'market', price: Decimal = None):
         """Places an order on the exchange."""
         if order_type == 'limit':
             if price is None:
                 raise ValueError("Price must be specified for limit orders.")
-            return await self.exchange.create_limit_order(symbol, side, amount, float(price))
+            return await self._call('create_limit_order', symbol, side, amount, float(price))
         elif order_type == 'market':
             return await self.create_market_order(symbol, side, amount)
         else:
             raise NotImplementedError(f"Order type '{order_type}' is not supported.")
 
+    async def close_at_market(self, symbol: str, side: str, amount: Decimal) -> dict:
+        """
+        Places a market order that reduces a position. Some exchanges answer a
+        create with the order id only; the order is then fetched once so the
+        caller sees what actually filled (see `order_fill`).
+        """
+        order = await self.place_order(symbol, side, amount, 'market')
+        if order.get('filled') is None and order.get('id'):
+            order = await self.fetch_order(order['id'], symbol)
+        return order
+
+    async def place_orders(self, symbol: str, side: str, orders: List[Tuple[Decimal, Decimal]], order_type: str = 'limit') -> list:
+        """
+        Places several (amount, price) orders for one symbol. Uses the exchange's
+        batch-order endpoint where one exists, otherwise submits concurrently
+        under the per-exchange limiter. Returns one entry per order: the ccxt
+        order, or the exception raised for it. A batch that fails midway still
+        returns the orders of the earlier batches, which are live.
+        """
+        results = []
+        batch_limit = BATCH_ORDER_LIMITS.get(self.exchange_name)
+        if batch_limit and self.exchange.has.get('createOrders'):
+            try:
+                for start in range(0, len(orders), batch_limit):
+                    placed = await self._call('create_orders', [
+                        {
+                            'symbol': symbol,
+                            'type': order_type,
+                            'side': side,
+                            'amount': float(amount),
+                            'price': float(price) if price is not None else None,
+                        }
+                        for amount, price in orders[start:start + batch_limit]
+                    ])
+                    results.extend(
+                        result if result.get('id') else Exception(result.get('info') or "Order rejected in batch")
+                        for result in placed
+                    )
+                return results
+            except ccxt.NotSupported:
+                # Binance and Bybit only batch derivatives orders; spot falls through.
+                pass
+            except Exception as e:
+                # The failed batch and the ones never sent fail with the error.
+                return results + [e] * (len(orders) - len(results))
+
+        semaphore = order_semaphore(self.exchange_name)
+
+        async def submit(amount: Decimal, price: Decimal):
+            async with semaphore:
+                return await self.place_order(symbol, side, amount, order_type, price)
+
+        remaining = orders[len(results):]
+        return results + list(await asyncio.gather(*[submit(amount, price) for amount, price in remaining], return_exceptions=True))
+
     async def get_precision_rules(self, symbol: str) -> dict:
         """Fetches and returns precision rules for a given symbol."""
-        markets = await self.exchange.load_markets()
+        markets = await self._call('load_markets')
         market = markets.get(symbol)
         if not market:
             raise ValueError(f"Market for symbol {symbol} not found on {self.exchange_name}")
 
-        return {
-            'amount': market['precision']['amount'],
-            'price': market['precision']['price'],
-            'min_amount': market['limits']['amount']['min'],
-            'min_notional': market['limits']['cost']['min'] if 'cost' in market['limits'] else None
-        }
+        return precision_rules_from_market(market, getattr(self.exchange, 'precisionMode', None))
 
     async def cancel_order(self, symbol: str, order_id: str):
         """Cancels an order on the exchange."""
-        return await self.exchange.cancel_order(order_id, symbol)
+        return await self._call('cancel_order', order_id, symbol)
+
+    async def fetch_order(self, order_id: str, symbol: str) -> dict:
+        """Fetches a single order by its exchange id."""
+        return await self._call('fetch_order', order_id, symbol)
+
+    async def fetch_open_orders(self, symbol: str) -> list:
+        """Fetches all open orders for a symbol in one request."""
+        return await self._call('fetch_open_orders', symbol)
+
+    async def fetch_closed_orders(self, symbol: str, since: int = None) -> list:
+        """Fetches closed orders for a symbol, optionally since a millisecond timestamp."""
+        return await self._call('fetch_closed_orders', symbol, since)
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        if self.exchange:
-            await self.exchange.close()
+        if exc_type is not None and issubclass(exc_type, ccxt.AuthenticationError):
+            # Credentials were rejected; force a rebuild from the stored config next time.
+            await client_pool.invalidate(self.user_id, self.exchange_name)
+        elif self.exchange:
+            client_pool.release(self.user_id, self.exchange_name)
+
+PRECISION_MODES = {
+    ccxt.DECIMAL_PLACES: 'decimal_places',
+    ccxt.TICK_SIZE: 'tick_size',
+}
+
+def precision_rules_from_market(market: dict, precision_mode: int = None) -> dict:
+    """
+    Extracts the precision rules the order services use from a ccxt market.
+    `precision_mode` is the client's ccxt precisionMode, recorded so the
+    precision values can be read as digit counts or tick sizes.
+    """
+    rules = {
+        'amount': market['precision']['amount'],
+        'price': market['precision']['price'],
+        'min_amount': market['limits']['amount']['min'],
+        'min_notional': market['limits']['cost']['min'] if 'cost' in market['limits'] else None
+    }
+    if precision_mode in PRECISION_MODES:
+        rules['precision_mode'] = PRECISION_MODES[precision_mode]
+    return rules
+
+def order_fill(order: dict) -> Tuple[Decimal, Optional[Decimal]]:
+    """
+    (filled amount, average fill price) of a ccxt order; (0, None) when
+    nothing has filled.
+    """
+    filled = Decimal(str(order.get('filled') or 0))
+    if not filled:
+        return Decimal("0"), None
+    if order.get('average'):
+        return filled, Decimal(str(order['average']))
+    if order.get('cost'):
+        return filled, Decimal(str(order['cost'])) / filled
+    return filled, Decimal(str(order['price']))
 
 async def get_exchange(db: AsyncSession, exchange_name: str, user_id: UUID):
-    return ExchangeManager(db, user_id, exchange_name)
\ No newline at end of file
+    return ExchangeManager(db, user_id, exchange_name)
@@ -0,0 +1,151 @@
+import asyncio
+from typing import Dict, Tuple, Set, Callable, Any
+from uuid import UUID
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from ..models.key_models import ExchangeConfig
+from ..models.trading_models import DCAOrder, PositionGroup
+from ..services import order_service
+from ..services.exchange_manager import client_pool
+from ..db.session import get_async_db
+from ..core.config import settings
+
+class FillStreamManager:
+    """
+    Event-driven fill ingestion. Keeps one user-data stream (ccxt.pro
+    `watch_orders`) per enabled ExchangeConfig and hands every order update
+    to `order_service.handle_order_update`, so fills, cancels, expiries and
+    rejections are all settled from the stream. A stream only counts as live once
+    its first message arrives and the key's pending orders were reconciled;
+    until then, and while it is down, its (user_id, exchange) key is
+    reported as not streaming, so the batched poll picks those orders up
+    instead.
+    """
+    def __init__(self, client_factory: Callable = None, session_factory: Callable = None):
+        self.client_factory = client_factory or client_pool.create_stream_client
+        self.session_factory = session_factory or get_async_db
+        self.reconnect_seconds = settings.FILL_STREAM_RECONNECT_SEC
+        self._tasks: Dict[Tuple[UUID, str], asyncio.Task] = {}
+        self._healthy: Dict[Tuple[UUID, str], bool] = {}
+
+    def is_streaming(self, user_id: UUID, exchange_name: str) -> bool:
+        return self._healthy.get((user_id, exchange_name), False)
+
+    def streaming_keys(self) -> Set[Tuple[UUID, str]]:
+        """(user_id, exchange) pairs whose fills are currently covered by a live stream."""
+        return {key for key, healthy in self._healthy.items() if healthy}
+
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        Start streams for newly enabled exchange configs and stop streams for
+        configs that were disabled or deleted.
+        """
+        result = await db.execute(
+            select(ExchangeConfig.user_id, ExchangeConfig.exchange_name).where(ExchangeConfig.is_enabled.is_(True))
+        )
+        wanted = {(row[0], row[1]) for row in result.all()}
+
+        for key in set(self._tasks) - wanted:
+            await self.stop(*key)
+        for user_id, exchange_name in wanted - set(self._tasks):
+            self.start(user_id, exchange_name)
+
+    def start(self, user_id: UUID, exchange_name: str) -> None:
+        key = (user_id, exchange_name)
+        if key in self._tasks and not self._tasks[key].done():
+            return
+        self._healthy[key] = False
+        self._tasks[key] = asyncio.create_task(self._run(user_id, exchange_name))
+
+    async def stop(self, user_id: UUID, exchange_name: str) -> None:
+        key = (user_id, exchange_name)
+        task = self._tasks.pop(key, None)
+        self._healthy.pop(key, None)
+        if task is not None:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stop_all(self) -> None:
+        for key in list(self._tasks):
+            await self.stop(*key)
+
+    async def _run(self, user_id: UUID, exchange_name: str) -> None:
+        key = (user_id, exchange_name)
+        client = None
+        try:
+            while True:
+                try:
+                    if client is None:
+                        async for db in self.session_factory():
+                            client = await self.client_factory(db, user_id, exchange_name)
+                    orders = await client.watch_orders()
+                    if not self._healthy.get(key):
+                        # First message since (re)connecting, so the subscription is live:
+                        # settle what filled while it was down before the poll stops covering this key
+                        self._healthy[key] = await self.reconcile(user_id, exchange_name)
+                    for order in orders:
+                        # Updates to orders still on the book have nothing to settle
+                        if order.get("status") != "open":
+                            await self.ingest(user_id, exchange_name, order)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # Stream is down: let the batched poll cover this key until we reconnect
+                    self._healthy[key] = False
+                    print(f"Fill stream for {exchange_name} (user {user_id}) failed: {e}")
+                    if client is not None:
+                        await self._close_client(client)
+                        client = None
+                    await asyncio.sleep(self.reconnect_seconds)
+        finally:
+            self._healthy.pop(key, None)
+            if client is not None:
+                await self._close_client(client)
+
+    async def reconcile(self, user_id: UUID, exchange_name: str) -> bool:
+        """
+        Reconcile this key's pending orders against the exchange. Returns False
+        on failure, leaving the key to the batched poll.
+        """
+        try:
+            async for db in self.session_factory():
+                await order_service.reconcile_pending_orders(db, only={(user_id, exchange_name)})
+            return True
+        except Exception as e:
+            print(f"Error reconciling {exchange_name} (user {user_id}) after the fill stream connected: {e}")
+            return False
+
+    async def ingest(self, user_id: UUID, exchange_name: str, exchange_order: Dict[str, Any]) -> bool:
+        """
+        Apply an order update from the stream to its pending DCA order, if
+        any. Returns True once the DCA order was settled.
+        """
+        applied = False
+        async for db in self.session_factory():
+            result = await db.execute(
+                select(DCAOrder)
+                .join(PositionGroup, DCAOrder.group_id == PositionGroup.id)
+                .options(selectinload(DCAOrder.group))
+                .where(
+                    PositionGroup.user_id == user_id,
+                    PositionGroup.exchange == exchange_name,
+                    DCAOrder.exchange_order_id == exchange_order["id"],
+                    DCAOrder.status == "pending",
+                )
+            )
+            dca_order = result.scalars().first()
+            if dca_order is not None:
+                applied = await order_service.handle_order_update(db, dca_order, exchange_order)
+        return applied
+
+    async def _close_client(self, client) -> None:
+        try:
+            await client.close()
+        except Exception as e:
+            print(f"Error closing fill stream client: {e}")
+
+fill_stream_manager = FillStreamManager()
@@ -2,6 +2,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import text
 from ..db.session import get_async_db
 from ..services import exchange_manager
+from ..services.metrics_service import metrics
 from uuid import UUID
 
 async def check_system_health() -> dict:
@@ -35,8 +36,7 @@ async def check_database_health() -> dict:
 async def get_performance_metrics() -> dict:
     """
     Get performance metrics for the system.
+    Returns the in-process counters, gauges and timings, e.g. exchange
+    rate-limit queue waits.
     """
-    # This is a placeholder. In a real-world application, you would
-    # collect and return performance metrics, such as CPU usage,
-    # memory usage, etc.
-    return {"status": "ok"}
+    return {"status": "ok", **metrics.snapshot()}
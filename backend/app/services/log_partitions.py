@@ -0,0 +1,154 @@
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..services.metrics_service import metrics
+from ..core.config import settings
+
+# Log table -> the column it is range-partitioned on (one partition per UTC day).
+PARTITIONED_LOG_TABLES: Dict[str, str] = {
+    "system_logs": "timestamp",
+    "audit_logs": "timestamp",
+    "webhook_logs": "received_at",
+    "error_logs": "timestamp",
+}
+
+LIST_PARTITIONS_SQL = text(
+    "SELECT child.relname FROM pg_inherits "
+    "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+    "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+    "WHERE parent.relname = :table"
+)
+
+def retention_days() -> Dict[str, int]:
+    """Days of logs kept per table; 0 keeps everything."""
+    return {
+        "system_logs": settings.LOG_RETENTION_SYSTEM_DAYS,
+        "audit_logs": settings.LOG_RETENTION_AUDIT_DAYS,
+        "webhook_logs": settings.LOG_RETENTION_WEBHOOK_DAYS,
+        "error_logs": settings.LOG_RETENTION_ERROR_DAYS,
+    }
+
+def partition_name(table: str, day: date) -> str:
+    return f"{table}_p{day:%Y%m%d}"
+
+def partition_day(table: str, name: str) -> Optional[date]:
+    """The day a partition holds, or None for the default partition."""
+    prefix = f"{table}_p"
+    if not name.startswith(prefix):
+        return None
+    try:
+        return datetime.strptime(name[len(prefix):], "%Y%m%d").date()
+    except ValueError:
+        return None
+
+def create_partition_sql(table: str, day: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(table, day)} PARTITION OF {table} "
+        f"FOR VALUES FROM ('{day.isoformat()}') TO ('{(day + timedelta(days=1)).isoformat()}')"
+    )
+
+async def list_partitions(db: AsyncSession, table: str) -> List[str]:
+    result = await db.execute(LIST_PARTITIONS_SQL, {"table": table})
+    return [row[0] for row in result.all()]
+
+def default_partition_name(table: str) -> str:
+    return f"{table}_default"
+
+def day_bounds_sql(table: str) -> str:
+    column = PARTITIONED_LOG_TABLES[table]
+    return f'"{column}" >= :start AND "{column}" < :end'
+
+async def default_has_rows(db: AsyncSession, table: str, day: date) -> bool:
+    """True if rows for `day` already sit in the table's default partition."""
+    result = await db.execute(
+        text(f"SELECT EXISTS (SELECT 1 FROM {default_partition_name(table)} WHERE {day_bounds_sql(table)})"),
+        {"start": day, "end": day + timedelta(days=1)},
+    )
+    return bool(result.scalar())
+
+async def create_partition_from_default(db: AsyncSession, table: str, day: date) -> None:
+    """
+    Postgres refuses to create a partition whose rows are already in the
+    default partition, so the default is detached, the day's partition
+    created, its rows moved over and the default re-attached.
+    """
+    default = default_partition_name(table)
+    bounds = {"start": day, "end": day + timedelta(days=1)}
+    await db.execute(text(f"ALTER TABLE {table} DETACH PARTITION {default}"))
+    await db.execute(text(create_partition_sql(table, day)))
+    await db.execute(text(f"INSERT INTO {table} SELECT * FROM {default} WHERE {day_bounds_sql(table)}"), bounds)
+    await db.execute(text(f"DELETE FROM {default} WHERE {day_bounds_sql(table)}"), bounds)
+    await db.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {default} DEFAULT"))
+
+async def ensure_partitions(db: AsyncSession, today: date = None, days_ahead: int = None) -> List[str]:
+    """
+    Creates any missing daily partitions from today through `days_ahead` days
+    ahead, so rows never land in the default partition. Rows that already
+    did are moved into the new partition. Each table is committed on its
+    own, so one failing table does not hold back the others. Returns the
+    new names.
+    """
+    today = today or datetime.utcnow().date()
+    days_ahead = settings.LOG_PARTITION_DAYS_AHEAD if days_ahead is None else days_ahead
+    created = []
+    for table in PARTITIONED_LOG_TABLES:
+        try:
+            existing = set(await list_partitions(db, table))
+            table_created = []
+            for offset in range(days_ahead + 1):
+                day = today + timedelta(days=offset)
+                if partition_name(table, day) in existing:
+                    continue
+                if await default_has_rows(db, table, day):
+                    await create_partition_from_default(db, table, day)
+                    metrics.incr("log_partition_rows_moved", table=table)
+                else:
+                    await db.execute(text(create_partition_sql(table, day)))
+                table_created.append(partition_name(table, day))
+            await db.commit()
+            created.extend(table_created)
+        except Exception as e:
+            await db.rollback()
+            print(f"Error creating partitions for {table}: {e}")
+    if created:
+        metrics.incr("log_partitions_created", len(created))
+    return created
+
+async def drop_partitions_before(db: AsyncSession, table: str, cutoff: datetime) -> List[str]:
+    """
+    Drops every daily partition that ends at or before `cutoff`. Each drop is
+    a catalog change, so its cost does not depend on how many rows it held.
+    Rows older than `cutoff` that landed in the default partition are
+    deleted there.
+    """
+    dropped = []
+    pruned = 0
+    for name in await list_partitions(db, table):
+        if name == default_partition_name(table):
+            column = PARTITIONED_LOG_TABLES[table]
+            result = await db.execute(text(f'DELETE FROM {name} WHERE "{column}" < :cutoff'), {"cutoff": cutoff})
+            pruned = result.rowcount or 0
+            continue
+        day = partition_day(table, name)
+        if day is not None and datetime.combine(day + timedelta(days=1), datetime.min.time()) <= cutoff:
+            await db.execute(text(f"DROP TABLE IF EXISTS {name}"))
+            dropped.append(name)
+    await db.commit()
+    if dropped:
+        metrics.incr("log_partitions_dropped", len(dropped), table=table)
+    if pruned:
+        metrics.incr("log_default_rows_pruned", pruned, table=table)
+    return dropped
+
+async def enforce_retention(db: AsyncSession, now: datetime = None) -> Dict[str, List[str]]:
+    """
+    Drops the partitions of each log table that are past its retention and
+    deletes the expired rows in its default partition.
+    """
+    now = now or datetime.utcnow()
+    dropped = {}
+    for table, days in retention_days().items():
+        if days > 0:
+            dropped[table] = await drop_partitions_before(db, table, now - timedelta(days=days))
+    return dropped
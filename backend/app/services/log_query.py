@@ -0,0 +1,74 @@
+import base64
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import Select, func, literal_column, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.log_models import SystemLog, AuditLog
+
+MAX_PAGE_SIZE = 1000
+
+# Must match the expression of ix_system_logs_message_fts exactly for the GIN
+# index to be used, so the config is a literal rather than a bound parameter.
+FTS_CONFIG = literal_column("'simple'::regconfig")
+
+def message_tsvector():
+    return func.to_tsvector(FTS_CONFIG, SystemLog.message)
+
+def encode_cursor(timestamp: datetime, entry_id: UUID) -> str:
+    """Opaque cursor for the (timestamp, id) of the last row of a page."""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{entry_id}".encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, UUID]:
+    """Raises ValueError for a malformed cursor."""
+    try:
+        timestamp, entry_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(timestamp), UUID(entry_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+def system_log_query(level: str = None, category: str = None, start_date: datetime = None, end_date: datetime = None, search: str = None) -> Select:
+    query = select(SystemLog)
+    if level:
+        query = query.where(SystemLog.level == level)
+    if category:
+        query = query.where(SystemLog.category == category)
+    if start_date:
+        query = query.where(SystemLog.timestamp >= start_date)
+    if end_date:
+        query = query.where(SystemLog.timestamp <= end_date)
+    if search:
+        query = query.where(message_tsvector().op("@@")(func.plainto_tsquery(FTS_CONFIG, search)))
+    return query
+
+def audit_log_query(user_id: str = None, action: str = None, start_date: datetime = None, end_date: datetime = None) -> Select:
+    query = select(AuditLog)
+    if user_id:
+        query = query.where(AuditLog.user_id == user_id)
+    if action:
+        query = query.where(AuditLog.action == action)
+    if start_date:
+        query = query.where(AuditLog.timestamp >= start_date)
+    if end_date:
+        query = query.where(AuditLog.timestamp <= end_date)
+    return query
+
+def newest_first(query: Select, model: Any, cursor: Optional[str] = None) -> Select:
+    """
+    Orders by (timestamp, id) descending and, with a cursor, continues after
+    that row. The row comparison is answered by the (..., timestamp, id)
+    indexes, so every page costs the same however deep it is.
+    """
+    if cursor:
+        timestamp, entry_id = decode_cursor(cursor)
+        query = query.where(tuple_(model.timestamp, model.id) < tuple_(timestamp, entry_id))
+    return query.order_by(model.timestamp.desc(), model.id.desc())
+
+async def fetch_page(db: AsyncSession, query: Select, model: Any, limit: int, cursor: Optional[str] = None) -> Tuple[List[Any], Optional[str]]:
+    """One page of rows and the cursor for the next page (None on the last page)."""
+    result = await db.execute(newest_first(query, model, cursor).limit(limit + 1))
+    rows = result.scalars().all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].timestamp, rows[-1].id)
@@ -0,0 +1,210 @@
+import asyncio
+import json
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+from sqlalchemy import Table, insert
+from sqlalchemy.exc import InterfaceError, OperationalError
+from ..services.metrics_service import metrics
+from ..db.session import get_async_db
+from ..core.config import settings
+
+DEBUG = "DEBUG"
+
+# (table, row, monotonic enqueue time, failed flush attempts)
+LogRecord = Tuple[Table, dict, float, int]
+
+def _connection_error(error: Exception) -> bool:
+    """True when the database is unreachable, as opposed to rejecting rows."""
+    return isinstance(error, (OSError, asyncio.TimeoutError, OperationalError, InterfaceError)) or getattr(error, "connection_invalidated", False)
+
+class LogSink:
+    """
+    Bounded in-memory buffer for log rows, written by a background task in
+    multi-row INSERTs every LOG_SINK_FLUSH_MS or LOG_SINK_BATCH_SIZE rows,
+    whichever comes first, on its own session. Callers never wait on Postgres.
+    When the buffer is full, DEBUG rows are dropped first; `put` waits for
+    space instead of dropping. A failed batch is retried with backoff; once
+    it has failed `max_attempts` times for a reason other than a lost
+    connection, it is written in halves and the rows that fail on their own
+    go to a JSON-lines dead-letter file.
+    """
+    def __init__(self, session_factory: Callable = None, capacity: int = None, batch_size: int = None, flush_ms: int = None,
+                 max_attempts: int = None, dead_letter_path: Path = None):
+        self.session_factory = session_factory or get_async_db
+        self.capacity = capacity or settings.LOG_SINK_CAPACITY
+        self.batch_size = batch_size or settings.LOG_SINK_BATCH_SIZE
+        self.flush_interval = (flush_ms or settings.LOG_SINK_FLUSH_MS) / 1000
+        self.max_attempts = max_attempts or settings.LOG_SINK_MAX_ATTEMPTS
+        self.dead_letter_path = dead_letter_path or Path(settings.APP_DATA_DIR) / "log_sink_dead_letters.jsonl"
+        self._retry_at = 0.0
+        self._records: Deque[LogRecord] = deque()
+        self._debug: Deque[LogRecord] = deque()
+        self._wake = asyncio.Event()
+        self._space = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._records) + len(self._debug)
+
+    def emit(self, table: Table, row: dict, level: str = "INFO") -> bool:
+        """Buffers a row without blocking; False if it was dropped."""
+        if len(self) >= self.capacity:
+            self._wake.set()
+            if level == DEBUG or not self._debug:
+                metrics.incr("log_sink_dropped", level=level)
+                return False
+            self._debug.popleft()
+            metrics.incr("log_sink_dropped", level=DEBUG)
+        row.setdefault("timestamp", datetime.utcnow())
+        (self._debug if level == DEBUG else self._records).append((table, row, time.monotonic(), 0))
+        if len(self) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    async def put(self, table: Table, row: dict, level: str = "INFO") -> None:
+        """Buffers a row, waiting for a flush if the buffer is full of non-DEBUG rows."""
+        while len(self) >= self.capacity and (level == DEBUG or not self._debug):
+            self._space.clear()
+            self._wake.set()
+            await self._space.wait()
+        self.emit(table, row, level)
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stops the flusher and writes whatever is still buffered."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self.flush()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            if time.monotonic() < self._retry_at:
+                continue
+            await self.flush()
+
+    def _take(self, limit: int) -> List[LogRecord]:
+        batch = []
+        for source in (self._records, self._debug):
+            while source and len(batch) < limit:
+                batch.append(source.popleft())
+        return batch
+
+    def _requeue(self, batch: List[LogRecord]) -> None:
+        """Puts a failed batch back in front, as far as the buffer has room."""
+        room = max(self.capacity - len(self), 0)
+        for record in reversed(batch[:room]):
+            (self._debug if record[1].get("level") == DEBUG else self._records).appendleft(record)
+        if len(batch) > room:
+            metrics.incr("log_sink_dropped", len(batch) - room, level="FLUSH_FAILED")
+
+    async def _write(self, batch: List[LogRecord]) -> None:
+        rows: Dict[Table, List[dict]] = {}
+        for table, row, _, _ in batch:
+            rows.setdefault(table, []).append(row)
+        async for db in self.session_factory():
+            for table, table_rows in rows.items():
+                await db.execute(insert(table), table_rows)
+            await db.commit()
+
+    async def _bisect(self, batch: List[LogRecord], error: Exception) -> Tuple[int, List[LogRecord]]:
+        """
+        Writes a failing batch in halves down to single rows, dead-lettering
+        the rows that fail alone. Stops if the connection is lost. Returns
+        the rows written and the rows not yet tried.
+        """
+        if len(batch) == 1:
+            await self._dead_letter(batch[0], error)
+            return 0, []
+        middle = len(batch) // 2
+        halves = (batch[:middle], batch[middle:])
+        written = 0
+        for i, half in enumerate(halves):
+            try:
+                await self._write(half)
+            except Exception as e:
+                if _connection_error(e):
+                    return written, [record for rest in halves[i:] for record in rest]
+                half_written, left = await self._bisect(half, e)
+                written += half_written
+                if left:
+                    return written, left + [record for rest in halves[i + 1:] for record in rest]
+            else:
+                written += len(half)
+        return written, []
+
+    async def _dead_letter(self, record: LogRecord, error: Exception) -> None:
+        table, row = record[0], record[1]
+        line = json.dumps({"table": table.name, "row": row, "error": str(error)}, default=str)
+        try:
+            await asyncio.to_thread(self._append_dead_letter, line)
+        except OSError as e:
+            metrics.incr("log_sink_dropped", level="DEAD_LETTER_FAILED")
+            print(f"Error writing log sink dead letter: {e}: {line}")
+            return
+        metrics.incr("log_sink_dead_lettered", table=table.name)
+        print(f"Dead-lettered log row for {table.name}: {error}")
+
+    def _append_dead_letter(self, line: str) -> None:
+        self.dead_letter_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.dead_letter_path, "a") as f:
+            f.write(line + "\n")
+
+    def _retry_later(self, batch: List[LogRecord], attempts: int) -> None:
+        self._requeue([(table, row, enqueued, attempts) for table, row, enqueued, _ in batch])
+        backoff = min(self.flush_interval * 2 ** (attempts - 1), settings.LOG_SINK_MAX_BACKOFF_SEC)
+        self._retry_at = time.monotonic() + backoff
+
+    async def flush(self) -> int:
+        """Writes all buffered rows in batches; returns the number written."""
+        written = 0
+        while len(self):
+            batch = self._take(self.batch_size)
+            started = time.monotonic()
+            count = len(batch)
+            try:
+                await self._write(batch)
+            except Exception as e:
+                metrics.incr("log_sink_flush_failures")
+                print(f"Error flushing log sink: {e}")
+                attempts = max(record[3] for record in batch) + 1
+                if attempts < self.max_attempts or _connection_error(e):
+                    self._retry_later(batch, attempts)
+                    break
+                count, left = await self._bisect(batch, e)
+                if left:
+                    self._retry_later(left, attempts)
+                    metrics.incr("log_sink_rows_written", count)
+                    written += count
+                    break
+            self._retry_at = 0.0
+            finished = time.monotonic()
+            metrics.observe("log_sink_flush_lag_seconds", finished - min(record[2] for record in batch))
+            metrics.observe("log_sink_flush_seconds", finished - started)
+            metrics.incr("log_sink_rows_written", count)
+            written += count
+            self._space.set()
+        metrics.gauge("log_sink_buffered", len(self))
+        return written
+
+log_sink = LogSink()
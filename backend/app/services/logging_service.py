@@ -1,7 +1,11 @@
 from sqlalchemy.orm import Session
 from ..models.log_models import SystemLog, AuditLog
+from ..services.log_sink import log_sink
 from uuid import UUID
 
+# Log rows go through the batched log sink, never the caller's session:
+# `db` is kept in the signatures for existing callers but is not used.
+
 def log_debug(db: Session, category: str, message: str, user_id: UUID = None, details: dict = None):
     log(db, "DEBUG", category, message, user_id, details)
 
@@ -18,23 +22,19 @@ def log_critical(db: Session, category: str, message: str, user_id: UUID = None,
     log(db, "CRITICAL", category, message, user_id, details)
 
 def log(db: Session, level: str, category: str, message: str, user_id: UUID = None, details: dict = None):
-    log_entry = SystemLog(
-        level=level,
-        category=category,
-        message=message,
-        user_id=user_id,
-        details=details,
-    )
-    db.add(log_entry)
-    db.commit()
+    log_sink.emit(SystemLog.__table__, {
+        "level": level,
+        "category": category,
+        "message": message,
+        "user_id": user_id,
+        "details": details,
+    }, level)
 
 def audit_log(db: Session, user_id: UUID, action: str, resource: str, resource_id: str = None, details: dict = None):
-    log_entry = AuditLog(
-        user_id=user_id,
-        action=action,
-        resource=resource,
-        resource_id=resource_id,
-        details=details,
-    )
-    db.add(log_entry)
-    db.commit()
+    log_sink.emit(AuditLog.__table__, {
+        "user_id": user_id,
+        "action": action,
+        "resource": resource,
+        "resource_id": resource_id,
+        "details": details,
+    })
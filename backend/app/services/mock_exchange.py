@@ -1,5 +1,5 @@
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List
 
 class MockExchange:
     def __init__(self, api_key: str, api_secret: str, testnet: bool = True):
@@ -60,6 +60,68 @@ class MockExchange:
         self.orders[order_id] = order
         return order
 
+    async def fetch_order(self, order_id: str, symbol: str = None) -> Dict[str, Any]:
+        await asyncio.sleep(0.01)
+        return self.orders[order_id]
+
+    async def fetch_open_orders(self, symbol: str = None) -> List[Dict[str, Any]]:
+        await asyncio.sleep(0.01)
+        return [o for o in self.orders.values() if o['status'] == 'open' and symbol in (None, o['symbol'])]
+
+    async def fetch_closed_orders(self, symbol: str = None, since: int = None) -> List[Dict[str, Any]]:
+        await asyncio.sleep(0.01)
+        return [o for o in self.orders.values() if o['status'] == 'closed' and symbol in (None, o['symbol'])]
+
+    async def cancel_order(self, order_id: str, symbol: str = None) -> Dict[str, Any]:
+        await asyncio.sleep(0.01)
+        order = self.orders[order_id]
+        order['status'] = 'canceled'
+        order['info']['status'] = 'CANCELED'
+        return order
+
+    def fill_order(self, order_id: str, price: float = None) -> Dict[str, Any]:
+        """Marks an order as completely filled, as the matching engine would."""
+        order = self.orders[order_id]
+        fill_price = price if price is not None else order['price']
+        order.update({
+            'status': 'closed',
+            'filled': order['amount'],
+            'remaining': 0.0,
+            'average': fill_price,
+            'cost': fill_price * order['amount'] if fill_price else None,
+        })
+        order['info']['status'] = 'FILLED'
+        return order
+
     async def close(self):
         # Simulate closing connection
         await asyncio.sleep(0.01)
+
+class MockStreamingExchange(MockExchange):
+    """
+    Local stand-in for a ccxt.pro client. Order updates are delivered through
+    `watch_orders` as they would be on an exchange user-data stream.
+    """
+    def __init__(self, api_key: str, api_secret: str, testnet: bool = True):
+        super().__init__(api_key, api_secret, testnet)
+        self._order_updates: asyncio.Queue = asyncio.Queue()
+
+    def fill_order(self, order_id: str, price: float = None) -> Dict[str, Any]:
+        order = super().fill_order(order_id, price)
+        self._order_updates.put_nowait([dict(order)])
+        return order
+
+    async def cancel_order(self, order_id: str, symbol: str = None) -> Dict[str, Any]:
+        order = await super().cancel_order(order_id, symbol)
+        self._order_updates.put_nowait([dict(order)])
+        return order
+
+    def disconnect(self, error: Exception = None):
+        """Simulates the websocket dropping; the next watch_orders call raises."""
+        self._order_updates.put_nowait(error or ConnectionError("mock stream disconnected"))
+
+    async def watch_orders(self, symbol: str = None, since: int = None, limit: int = None, params: Dict = None) -> List[Dict[str, Any]]:
+        update = await self._order_updates.get()
+        if isinstance(update, Exception):
+            raise update
+        return [o for o in update if symbol in (None, o['symbol'])]
@@ -1,15 +1,36 @@
-from typing import List
-from sqlalchemy.orm import Session
+import calendar
+from typing import List, Dict, Set
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import select
-from ..models.trading_models import PositionGroup, DCAOrder
+from ..models.trading_models import PositionGroup, Pyramid, DCAOrder
 from ..services import exchange_manager, grid_calculator, validation_service
+from ..services.tp_trigger_index import tp_trigger_index
+from ..services.tp_evaluator import OPEN_LEG_STATUSES
+from ..services.take_profit_service import closing_side
+from ..core.config import settings
 from uuid import UUID
 from decimal import Decimal
+from datetime import datetime
 
-async def place_dca_orders(db: Session, position_group: PositionGroup) -> List[DCAOrder]:
+# ccxt statuses of orders that left the book without filling, and the DCA status they map to
+ENDED_ORDER_STATUSES = {"canceled": "cancelled", "expired": "cancelled", "rejected": "failed"}
+
+async def place_dca_orders(db: Session, position_group: PositionGroup, pyramid: Pyramid = None) -> List[DCAOrder]:
     """
-    Place DCA orders for a position group.
+    Place DCA orders for a position group, as legs of `pyramid` (by default the
+    group's latest pyramid).
     """
+    if pyramid is None:
+        result = await db.execute(
+            select(Pyramid)
+            .where(Pyramid.group_id == position_group.id)
+            .order_by(Pyramid.pyramid_index.desc())
+            .limit(1)
+        )
+        pyramid = result.scalars().first()
+    if pyramid is None:
+        raise ValueError(f"Position group {position_group.id} has no pyramid to place DCA orders for.")
+
     dca_config = position_group.entry_signal["dca_config"]
     dca_levels = grid_calculator.calculate_dca_levels(
         Decimal(position_group.entry_signal["entry_price"]),
@@ -20,51 +41,79 @@ async def place_dca_orders(db: Session, position_group: PositionGroup) -> List[D
         dca_config["dca_weights"],
     )
     
-    orders = []
+    # Precision is fetched once for the symbol and every leg rounded in one pass
+    legs = await validation_service.validate_and_adjust_grid(
+        db,
+        position_group.exchange,
+        position_group.symbol,
+        "buy",
+        [(dca_sizes[i] / level["price"], level["price"]) for i, level in enumerate(dca_levels)],
+    )
+    # Gaps, weights and the TP are fractions in the config (0.01 = 1%) and percents on the legs
+    tp_fraction = Decimal(str(dca_config["tp_percent"]))
+    tp_prices = grid_calculator.calculate_take_profit_prices([price for _, price in legs], tp_fraction)
+
     async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
-        for i, level in enumerate(dca_levels):
-            quantity, price = await validation_service.validate_and_adjust_order(
-                db,
-                position_group.exchange,
-                position_group.symbol,
-                "buy",
-                dca_sizes[i] / level["price"],
-                level["price"],
-            )
-            
-            order = await manager.place_order(
-                symbol=position_group.symbol,
-                side="buy",
-                order_type="limit",
-                amount=quantity,
-                price=price,
-            )
-            
-            db_order = DCAOrder(
-                group_id=position_group.id,
-                leg_index=i,
-                quantity=quantity,
-                status="pending",
-                exchange_order_id=order["id"],
-            )
-            db.add(db_order)
-            orders.append(db_order)
-        
-    db.commit()
+        results = await manager.place_orders(
+            symbol=position_group.symbol,
+            side="buy",
+            orders=legs,
+            order_type="limit",
+        )
+
+    submitted_at = datetime.utcnow()
+    orders = []
+    for i, ((quantity, price), order) in enumerate(zip(legs, results)):
+        if isinstance(order, Exception):
+            print(f"Error placing DCA leg {i} for {position_group.symbol}: {order}")
+            continue
+        orders.append(DCAOrder(
+            group_id=position_group.id,
+            pyramid_id=pyramid.id,
+            leg_index=i,
+            symbol=position_group.symbol,
+            side="buy",
+            order_type="limit",
+            price=price,
+            quantity=quantity,
+            gap_percent=Decimal(str(dca_config["price_gaps"][i])) * 100,
+            weight_percent=Decimal(str(dca_config["dca_weights"][i])) * 100,
+            tp_percent=tp_fraction * 100,
+            tp_price=tp_prices[i],
+            status="pending",
+            exchange_order_id=order["id"],
+            submitted_at=submitted_at,
+        ))
+
+    db.add_all(orders)
+    await db.commit()
     return orders
 
-async def monitor_order_fills(db: Session) -> None:
+async def monitor_order_fills(db: Session, batched: bool = None, exclude: Set[tuple] = None) -> None:
     """
     Monitor for filled orders and update the database.
+    Uses bulk reconciliation unless `batched` (or ORDER_MONITOR_BATCHED) is off,
+    in which case every pending order is fetched individually.
+    `exclude` holds (user_id, exchange) pairs already covered by a fill stream.
     """
+    if batched is None:
+        batched = settings.ORDER_MONITOR_BATCHED
+    if batched:
+        await reconcile_pending_orders(db, exclude=exclude)
+        return
+
     result = await db.execute(
-        select(DCAOrder).where(DCAOrder.status == "pending")
+        select(DCAOrder)
+        .options(selectinload(DCAOrder.group))
+        .where(DCAOrder.status == "pending")
     )
-    pending_orders = (await result).scalars().all()
+    pending_orders = result.scalars().all()
     # Group orders by user and exchange to minimize API calls
     exchange_groups = {}
     for order in pending_orders:
-        key = (order.position_group.user_id, order.position_group.exchange)
+        key = (order.group.user_id, order.group.exchange)
+        if exclude and key in exclude:
+            continue
         if key not in exchange_groups:
             exchange_groups[key] = []
         exchange_groups[key].append(order)
@@ -75,7 +124,7 @@ async def monitor_order_fills(db: Session) -> None:
                 try:
                     exchange_order = await manager.fetch_order(
                         order_id=order.exchange_order_id,
-                        symbol=order.position_group.symbol
+                        symbol=order.group.symbol
                     )
                     if exchange_order and exchange_order["status"] == "closed": # 'closed' typically means filled in ccxt
                         await handle_filled_order(db, order, exchange_order)
@@ -83,41 +132,186 @@ async def monitor_order_fills(db: Session) -> None:
                     # Log the error, but don't stop monitoring other orders
                     print(f"Error fetching order {order.exchange_order_id}: {e}")
 
-async def place_partial_close_order(db: Session, position_group: PositionGroup, usd_amount_to_realize: Decimal):
+async def reconcile_pending_orders(db: Session, exclude: Set[tuple] = None, only: Set[tuple] = None) -> int:
     """
-    Placeholder for placing a partial closing order.
+    Reconcile all pending DCA orders (or those of the (user_id, exchange) keys
+    in `only`) against the exchange in bulk.
+    Open and closed orders are fetched once per (user, exchange, symbol), diffed
+    against the database in memory, and every fill, cancel or rejection is
+    applied in one commit. Returns the number of orders settled.
     """
-    pass
+    result = await db.execute(
+        select(DCAOrder)
+        .options(selectinload(DCAOrder.group))
+        .where(DCAOrder.status == "pending")
+    )
+    pending_orders = result.scalars().all()
+
+    # (user_id, exchange) -> symbol -> pending orders
+    order_book: Dict[tuple, Dict[str, List[DCAOrder]]] = {}
+    for order in pending_orders:
+        group = order.group
+        key = (group.user_id, group.exchange)
+        if (exclude and key in exclude) or (only is not None and key not in only):
+            continue
+        order_book.setdefault(key, {}).setdefault(group.symbol, []).append(order)
+
+    settled_count = 0
+    for (user_id, exchange_name), orders_by_symbol in order_book.items():
+        try:
+            async with await exchange_manager.get_exchange(db, exchange_name, user_id) as manager:
+                for symbol, orders in orders_by_symbol.items():
+                    try:
+                        settled_count += await _reconcile_symbol(manager, symbol, orders)
+                    except Exception as e:
+                        # Log the error, but keep reconciling the other symbols
+                        print(f"Error reconciling {exchange_name}:{symbol} for user {user_id}: {e}")
+        except Exception as e:
+            print(f"Error reconciling orders on {exchange_name} for user {user_id}: {e}")
+
+    if settled_count:
+        for orders_by_symbol in order_book.values():
+            for orders in orders_by_symbol.values():
+                for order in orders:
+                    if order.status == "filled":
+                        tp_trigger_index.add_fill(order)
+        await db.commit()
+    return settled_count
+
+async def _reconcile_symbol(manager, symbol: str, orders: List[DCAOrder]) -> int:
+    """
+    Diff pending orders for one symbol against the exchange's open and closed orders.
+    Orders in neither list (e.g. older than the `since` window) are fetched one by one.
+    """
+    open_orders = await manager.fetch_open_orders(symbol)
+    open_ids = {o["id"] for o in open_orders}
+    missing = [order for order in orders if order.exchange_order_id not in open_ids]
+    if not missing:
+        return 0
+
+    created = [order.created_at for order in missing if isinstance(order.created_at, datetime)]
+    since = calendar.timegm(min(created).utctimetuple()) * 1000 if created else None
+    closed_orders = await manager.fetch_closed_orders(symbol, since)
+    closed_by_id = {o["id"]: o for o in closed_orders}
+
+    settled_count = 0
+    for order in missing:
+        exchange_order = closed_by_id.get(order.exchange_order_id)
+        if exchange_order is None:
+            try:
+                exchange_order = await manager.fetch_order(order_id=order.exchange_order_id, symbol=symbol)
+            except Exception as e:
+                print(f"Error fetching order {order.exchange_order_id}: {e}")
+                continue
+        if exchange_order and settle_order(order, exchange_order):
+            settled_count += 1
+    return settled_count
+
+async def place_partial_close_order(db: Session, position_group: PositionGroup, quantity: Decimal, mark_price: Decimal) -> dict:
+    """
+    Close `quantity` of a group's position at market, rounded to the symbol's
+    precision (`mark_price` is only used for the minimum-notional check).
+    Returns the ccxt order; the caller books what actually filled.
+    """
+    side = closing_side(position_group.side)
+    quantity, _ = await validation_service.validate_and_adjust_order(
+        db, position_group.exchange, position_group.symbol, side, quantity, mark_price
+    )
+    async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
+        return await manager.close_at_market(position_group.symbol, side, quantity)
+
+def apply_fill(dca_order: DCAOrder, fill_data: dict) -> None:
+    """
+    Copy fill details from a ccxt order onto a DCA order without committing.
+    `filled_quantity` is only set when less than the leg's quantity filled.
+    """
+    filled, fill_price = exchange_manager.order_fill(fill_data)
+    dca_order.status = "filled"
+    dca_order.avg_fill_price = fill_price or Decimal(str(fill_data.get("average") or fill_data["price"]))
+    if filled and filled < dca_order.quantity:
+        dca_order.filled_quantity = filled
+    dca_order.filled_at = datetime.utcnow()
+
+def settle_order(dca_order: DCAOrder, exchange_order: dict) -> bool:
+    """
+    Copy the outcome of a finished ccxt order onto a DCA order without
+    committing. Returns False while the order is still working.
+    """
+    status = exchange_order.get("status")
+    if status == "closed":
+        apply_fill(dca_order, exchange_order)
+        return True
+    if status not in ENDED_ORDER_STATUSES:
+        return False
+    if exchange_order.get("filled"):
+        # Part of the order filled before it was taken off the book
+        apply_fill(dca_order, exchange_order)
+    else:
+        dca_order.status = ENDED_ORDER_STATUSES[status]
+        if dca_order.status == "cancelled":
+            dca_order.cancelled_at = datetime.utcnow()
+    return True
 
 async def handle_filled_order(db: Session, dca_order: DCAOrder, fill_data: dict) -> None:
     """
     Handle a filled order.
     """
-    dca_order.status = "filled"
-    dca_order.filled_price = Decimal(fill_data["price"])
-    dca_order.filled_quantity = Decimal(fill_data["filled"])
+    apply_fill(dca_order, fill_data)
+    tp_trigger_index.add_fill(dca_order)
     await db.commit()
 
-async def cancel_pending_orders(db: Session, position_group_id: UUID) -> None:
+async def handle_order_update(db: Session, dca_order: DCAOrder, exchange_order: dict) -> bool:
     """
-    Cancel all pending orders for a position group.
+    Apply a ccxt order update to its DCA order and commit, once the order has
+    finished: filled, cancelled, expired or rejected. Returns False while it
+    is still working.
+    """
+    if not settle_order(dca_order, exchange_order):
+        return False
+    if dca_order.status == "filled":
+        tp_trigger_index.add_fill(dca_order)
+    await db.commit()
+    return True
+
+async def cancel_orders(manager, symbol: str, orders: List[DCAOrder]) -> None:
+    """
+    Take working DCA legs off the book and record the outcome without
+    committing. A leg that filled, in part or in full, before its cancel
+    landed is settled as a fill, so its quantity is not lost.
+    """
+    for order in orders:
+        try:
+            exchange_order = await manager.cancel_order(symbol=symbol, order_id=order.exchange_order_id)
+        except Exception as e:
+            # Usually the order already left the book; its final state says how
+            exchange_order = await manager.fetch_order(order_id=order.exchange_order_id, symbol=symbol)
+            if not exchange_order or exchange_order.get("status") == "open":
+                raise RuntimeError(f"Could not cancel order {order.exchange_order_id}: {e}") from e
+        if not (exchange_order and settle_order(order, exchange_order)):
+            order.status = "cancelled"
+            order.cancelled_at = datetime.utcnow()
+
+async def cancel_pending_orders(db: Session, position_group_id: UUID) -> List[DCAOrder]:
+    """
+    Cancel all working orders for a position group and commit.
     """
     result = await db.execute(
-        select(DCAOrder).where(
+        select(DCAOrder)
+        .options(selectinload(DCAOrder.group))
+        .where(
             DCAOrder.group_id == position_group_id,
-            DCAOrder.status == "pending"
+            DCAOrder.status.in_(OPEN_LEG_STATUSES),
         )
     )
-    orders = (await result).scalars().all()    
-    if orders:
-        # Assuming all orders in a position group are for the same exchange and user
-        position_group = orders[0].position_group
-        async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
-            for order in orders:
-                await manager.cancel_order(
-                    symbol=order.position_group.symbol,
-                    order_id=order.exchange_order_id,
-                )
-                order.status = "cancelled"
-            
-        db.commit()
+    orders = result.scalars().all()
+    if not orders:
+        return orders
+
+    position_group = orders[0].group
+    async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
+        await cancel_orders(manager, position_group.symbol, orders)
+    for order in orders:
+        if order.status == "filled":
+            tp_trigger_index.add_fill(order)
+    await db.commit()
+    return orders
@@ -0,0 +1,99 @@
+from datetime import date, datetime
+from decimal import Decimal
+from typing import List, Optional
+from uuid import UUID
+from sqlalchemy import func, select, literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.trading_models import PnlRollup, PositionGroup
+from ..services.metrics_service import metrics
+
+PNL_PERIODS = ("day", "week", "month")
+
+async def record_realized_pnl(db: AsyncSession, group: PositionGroup, amount: Decimal, closed: bool = False, at: datetime = None) -> None:
+    """
+    Adds realized PnL from a close of `group` to the group and to its
+    (user, day, symbol, timeframe) rollup row, in the caller's transaction, so
+    the rollup commits or rolls back together with the close. `amount` must
+    come from what the close actually filled (see exchange_manager.order_fill).
+    """
+    at = at or datetime.utcnow()
+    amount = Decimal(str(amount or 0))
+    group.realized_pnl_usd = (group.realized_pnl_usd or Decimal("0")) + amount
+    if closed:
+        group.closed_at = at
+    statement = insert(PnlRollup).values(
+        user_id=group.user_id,
+        day=at.date(),
+        symbol=group.symbol,
+        timeframe=group.timeframe,
+        realized_pnl_usd=amount,
+        closed_groups=1 if closed else 0,
+        updated_at=at,
+    )
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=[PnlRollup.user_id, PnlRollup.day, PnlRollup.symbol, PnlRollup.timeframe],
+        set_={
+            "realized_pnl_usd": PnlRollup.realized_pnl_usd + statement.excluded.realized_pnl_usd,
+            "closed_groups": PnlRollup.closed_groups + statement.excluded.closed_groups,
+            "updated_at": statement.excluded.updated_at,
+        },
+    ))
+    metrics.incr("pnl_rollup_updates")
+
+def position_pnl(group: PositionGroup, quantity: Decimal, entry_price: Decimal, exit_price: Decimal) -> Decimal:
+    """PnL in USD of closing `quantity` bought (or sold, for shorts) at `entry_price`."""
+    move = Decimal(str(exit_price)) - Decimal(str(entry_price))
+    if group.side == "short":
+        move = -move
+    return move * Decimal(str(quantity))
+
+async def realized_pnl_total(db: AsyncSession, user_id: UUID) -> Decimal:
+    result = await db.execute(
+        select(func.coalesce(func.sum(PnlRollup.realized_pnl_usd), 0)).where(PnlRollup.user_id == user_id)
+    )
+    return result.scalar_one()
+
+async def realized_pnl_by_period(
+    db: AsyncSession,
+    user_id: UUID,
+    period: str = "day",
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    symbol: Optional[str] = None,
+    timeframe: Optional[int] = None,
+) -> List[dict]:
+    """
+    Realized PnL per period, symbol and timeframe, read from the user's
+    rollup rows through the (user_id, day, ...) primary key.
+    """
+    if period not in PNL_PERIODS:
+        raise ValueError(f"period must be one of {', '.join(PNL_PERIODS)}")
+    bucket = func.date_trunc(literal_column(f"'{period}'"), PnlRollup.day).label("period_start")
+    query = select(
+        bucket,
+        PnlRollup.symbol,
+        PnlRollup.timeframe,
+        func.sum(PnlRollup.realized_pnl_usd).label("realized_pnl_usd"),
+        func.sum(PnlRollup.closed_groups).label("closed_groups"),
+    ).where(PnlRollup.user_id == user_id)
+    if start_date:
+        query = query.where(PnlRollup.day >= start_date)
+    if end_date:
+        query = query.where(PnlRollup.day <= end_date)
+    if symbol:
+        query = query.where(PnlRollup.symbol == symbol)
+    if timeframe:
+        query = query.where(PnlRollup.timeframe == timeframe)
+    query = query.group_by(bucket, PnlRollup.symbol, PnlRollup.timeframe).order_by(bucket, PnlRollup.symbol, PnlRollup.timeframe)
+    result = await db.execute(query)
+    return [
+        {
+            "period_start": row.period_start.date() if isinstance(row.period_start, datetime) else row.period_start,
+            "symbol": row.symbol,
+            "timeframe": row.timeframe,
+            "realized_pnl_usd": row.realized_pnl_usd,
+            "closed_groups": row.closed_groups,
+        }
+        for row in result.all()
+    ]
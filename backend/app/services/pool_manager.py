@@ -3,27 +3,187 @@ from ..db.session import get_async_db
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Depends # Import Depends
 from ..core.config import settings
+from ..services.metrics_service import metrics
 from uuid import UUID
+from typing import Callable, Dict, List, Optional
 from sqlalchemy import select, func
 
+# A group holds a pool slot from creation until it reaches one of these.
+SLOT_FREE_STATUSES = (PositionGroupStatus.CLOSED, PositionGroupStatus.FAILED)
+
+# KEYS[1] = counter, ARGV[1] = limit. -1: counter not seeded, 0: full, 1: acquired.
+ACQUIRE_SLOT_SCRIPT = """
+local used = redis.call('GET', KEYS[1])
+if not used then return -1 end
+if tonumber(used) >= tonumber(ARGV[1]) then return 0 end
+redis.call('INCR', KEYS[1])
+return 1
+"""
+
+# Never goes below zero; -1 if the counter is not seeded.
+RELEASE_SLOT_SCRIPT = """
+local used = redis.call('GET', KEYS[1])
+if not used then return -1 end
+if tonumber(used) <= 0 then return 0 end
+return redis.call('DECR', KEYS[1])
+"""
+
+# KEYS = counters, ARGV = (snapshot, count) per key, '' for a missing key.
+# A counter is only reset if it still holds its snapshot, so an acquire or
+# release that lands while reconcile is counting rows is never overwritten.
+RECONCILE_SLOTS_SCRIPT = """
+local reset = 0
+for i, key in ipairs(KEYS) do
+  local used = redis.call('GET', key) or ''
+  if used == ARGV[2 * i - 1] then
+    redis.call('SET', key, ARGV[2 * i])
+    reset = reset + 1
+  end
+end
+return reset
+"""
+
+def slot_count_query():
+    return select(func.count(PositionGroup.id)).where(PositionGroup.status.notin_(SLOT_FREE_STATUSES))
+
+class PoolSlotCounter:
+    """
+    Per-user count of used execution-pool slots in Redis. Acquire and release
+    are single Lua scripts, so the check-and-increment is atomic across
+    concurrent webhooks and workers, and no COUNT(*) runs per signal. A
+    missing counter is seeded from position_groups, and `reconcile`
+    periodically resets every counter to the table's truth. If Redis is
+    unavailable the pool falls back to counting rows. Release listeners are
+    called with the user id whenever a slot is freed.
+    """
+    def __init__(self, redis_factory: Callable = None):
+        self.redis_factory = redis_factory
+        self._redis = None
+        self._acquire = None
+        self._release = None
+        self._reconcile = None
+        self._release_listeners: List[Callable[[UUID], None]] = []
+
+    def add_release_listener(self, listener: Callable[[UUID], None]) -> None:
+        if listener not in self._release_listeners:
+            self._release_listeners.append(listener)
+
+    def remove_release_listener(self, listener: Callable[[UUID], None]) -> None:
+        if listener in self._release_listeners:
+            self._release_listeners.remove(listener)
+
+    async def _get_redis(self):
+        if self._redis is None:
+            if self.redis_factory is not None:
+                self._redis = await self.redis_factory()
+            else:
+                from ..services.precision_service import get_redis_client
+                self._redis = await get_redis_client()
+            self._acquire = self._redis.register_script(ACQUIRE_SLOT_SCRIPT)
+            self._release = self._redis.register_script(RELEASE_SLOT_SCRIPT)
+            self._reconcile = self._redis.register_script(RECONCILE_SLOTS_SCRIPT)
+        return self._redis
+
+    @staticmethod
+    def _key(user_id: UUID) -> str:
+        return f"pool:slots:{user_id}"
+
+    async def count_from_db(self, db: AsyncSession, user_id: UUID) -> int:
+        result = await db.execute(slot_count_query().where(PositionGroup.user_id == user_id))
+        return result.scalar_one()
+
+    async def seed(self, db: AsyncSession, user_id: UUID) -> None:
+        """Initialises a missing counter from the table; never overwrites a live one."""
+        redis = await self._get_redis()
+        await redis.set(self._key(user_id), await self.count_from_db(db, user_id), nx=True)
+
+    async def used(self, db: AsyncSession, user_id: UUID) -> int:
+        try:
+            redis = await self._get_redis()
+            value = await redis.get(self._key(user_id))
+            if value is None:
+                await self.seed(db, user_id)
+                value = await redis.get(self._key(user_id))
+            return int(value)
+        except Exception as e:
+            print(f"Error reading pool slots for user {user_id}: {e}")
+            return await self.count_from_db(db, user_id)
+
+    async def try_acquire(self, db: AsyncSession, user_id: UUID, limit: Optional[int] = None) -> bool:
+        """Takes a slot if one is free; True on success."""
+        limit = settings.POOL_MAX_OPEN_GROUPS if limit is None else limit
+        try:
+            await self._get_redis()
+            acquired = await self._acquire(keys=[self._key(user_id)], args=[limit])
+            if acquired == -1:
+                await self.seed(db, user_id)
+                acquired = await self._acquire(keys=[self._key(user_id)], args=[limit])
+        except Exception as e:
+            print(f"Error acquiring pool slot for user {user_id}: {e}")
+            return await self.count_from_db(db, user_id) < limit
+        metrics.incr("pool_slot_acquired" if acquired == 1 else "pool_slot_full")
+        return acquired == 1
+
+    async def release(self, user_id: UUID, notify: bool = True) -> None:
+        """
+        Returns a slot; reconcile corrects the counter if this is lost. With
+        `notify`, release listeners are told a slot is free.
+        """
+        try:
+            await self._get_redis()
+            await self._release(keys=[self._key(user_id)])
+            metrics.incr("pool_slot_released")
+        except Exception as e:
+            print(f"Error releasing pool slot for user {user_id}: {e}")
+        if notify:
+            for listener in list(self._release_listeners):
+                try:
+                    listener(user_id)
+                except Exception as e:
+                    print(f"Error in pool release listener for user {user_id}: {e}")
+
+    async def reconcile(self, db: AsyncSession) -> Dict[UUID, int]:
+        """
+        Resets every user's counter to the number of slot-holding groups in
+        position_groups, with one grouped query and one compare-and-set
+        script. Counters that moved while the rows were being counted are
+        left alone until the next pass.
+        """
+        redis = await self._get_redis()
+        keys = [key async for key in redis.scan_iter(match=self._key("*"))]
+        snapshot = dict(zip(keys, await redis.mget(keys))) if keys else {}
+        result = await db.execute(
+            select(PositionGroup.user_id, func.count(PositionGroup.id))
+            .where(PositionGroup.status.notin_(SLOT_FREE_STATUSES))
+            .group_by(PositionGroup.user_id)
+        )
+        counts = {row[0]: row[1] for row in result.all()}
+        targets = {key: 0 for key in snapshot}
+        for user_id, count in counts.items():
+            targets[self._key(user_id)] = count
+        if targets:
+            args = []
+            for key, count in targets.items():
+                value = snapshot.get(key)
+                args += ["" if value is None else str(value), count]
+            reset = await self._reconcile(keys=list(targets), args=args)
+            if reset < len(targets):
+                metrics.incr("pool_slot_reconcile_skipped", len(targets) - reset)
+        metrics.incr("pool_slot_reconciles")
+        return counts
+
+pool_slots = PoolSlotCounter()
+
 class ExecutionPoolManager:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, slots: PoolSlotCounter = None):
         self.db = db
+        self.slots = slots or pool_slots
 
     async def get_open_slots(self, user_id: UUID) -> int:
         """
         Count available slots
         """
-        max_open_groups = settings.POOL_MAX_OPEN_GROUPS
-        result = await self.db.execute(
-            select(func.count())
-            .where(
-                PositionGroup.user_id == user_id,
-                PositionGroup.status == PositionGroupStatus.LIVE
-            )
-        )
-        open_positions_count = result.scalar_one()
-        return max_open_groups - open_positions_count
+        return settings.POOL_MAX_OPEN_GROUPS - await self.slots.used(self.db, user_id)
 
     async def can_open_position(self, user_id: UUID) -> bool:
         """
@@ -32,21 +192,17 @@ class ExecutionPoolManager:
         open_slots = await self.get_open_slots(user_id)
         return open_slots > 0
 
-    async def consume_slot(self, group: PositionGroup):
+    async def consume_slot(self, group: PositionGroup) -> bool:
         """
-        Mark a slot as consumed.
+        Atomically take a slot for a new group; False if the pool is full.
         """
-        # This might involve updating the status of the position group
-        # or other logic to reflect a slot being used.
-        pass
+        return await self.slots.try_acquire(self.db, group.user_id)
 
     async def release_slot(self, group: PositionGroup):
         """
         Mark a slot as released.
         """
-        # This might involve updating the status of the position group
-        # or other logic to reflect a slot being freed.
-        pass
+        await self.slots.release(group.user_id)
 
 def get_pool_manager(db: AsyncSession = Depends(get_async_db)) -> ExecutionPoolManager:
     return ExecutionPoolManager(db)
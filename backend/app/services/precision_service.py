@@ -1,16 +1,22 @@
+import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from decimal import Decimal # Added this import
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Awaitable, Iterable, Set, Tuple
 import asyncio
 import json
 from uuid import UUID
  # Added this import
 
 import redis.asyncio as redis
+from sqlalchemy import select, union
 from sqlalchemy.orm import Session
 
-from ..services.exchange_manager import get_exchange # Modified import
+from ..models.trading_models import PositionGroup, PositionGroupStatus, QueuedSignal, DCAOrder
+from ..services.exchange_manager import get_exchange, client_pool, rate_limiter, precision_rules_from_market # Modified import
+from ..services.metrics_service import metrics
+from ..services.symbol_rounding import SymbolRounding
 from ..core.config import settings # Assuming settings will provide REDIS_URL
 
 # Global Redis client instance (or managed via FastAPI dependency)
@@ -22,11 +28,56 @@ async def get_redis_client() -> redis.Redis:
         redis_client = await redis.from_url(settings.REDIS_URL, decode_responses=True)
     return redis_client
 
+class PrecisionLRU:
+    """
+    In-process LRU with a per-entry TTL, sitting in front of Redis so that
+    order validation does not pay a Redis round trip and JSON decode per call.
+    """
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) is not None
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
 class PrecisionService:
-    def __init__(self, redis_client: redis.Redis):
+    def __init__(self, redis_client: redis.Redis, local_cache: PrecisionLRU = None):
         self.redis = redis_client
         self.cache_key_prefix = "precision:"
         self.cache_expiry_seconds = settings.PRECISION_CACHE_EXPIRY_SECONDS # Assuming this will be in config
+        self.local = local_cache or PrecisionLRU(settings.PRECISION_LOCAL_CACHE_SIZE, settings.PRECISION_LOCAL_TTL_SECONDS)
+        # Symbols a full market load did not list, so repeat lookups skip the reload
+        self.missing = PrecisionLRU(settings.PRECISION_LOCAL_CACHE_SIZE, settings.PRECISION_NEGATIVE_TTL_SECONDS)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._refreshed_at: Dict[str, float] = {}
+        self._roundings: Dict[str, Tuple[Dict[str, Any], SymbolRounding]] = {}
 
     async def _get_cache_key(self, exchange: str, symbol: str) -> str:
         return f"{self.cache_key_prefix}{exchange}:{symbol}"
@@ -42,34 +93,205 @@ class PrecisionService:
                 precision_rules = await exchange_manager_instance.get_precision_rules(symbol)
             cache_key = await self._get_cache_key(exchange, symbol)
             await self.redis.set(cache_key, json.dumps(precision_rules), ex=self.cache_expiry_seconds)
+            self.local.set(cache_key, precision_rules)
             print(f"Cached precision rules for {exchange}:{symbol}")
             return precision_rules
         except Exception as e:
             print(f"Error fetching and caching precision for {exchange}:{symbol}: {e}")
             return None
 
+    async def load_exchange_precisions(self, exchange: str, symbols: Optional[Set[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Turns one `load_markets` response into cache entries for every symbol on
+        the exchange (or only `symbols`), written to Redis in a single transaction.
+        A full load only refreshes the symbols already in the in-process tier,
+        so it cannot evict the hot entries.
+        """
+        client = client_pool.get_public_client(exchange, settings.EXCHANGE_TESTNET)
+        markets = await rate_limiter.call(None, exchange, client, 'load_markets', True)
+
+        rules_by_symbol = {}
+        precision_mode = getattr(client, 'precisionMode', None)
+        for symbol, market in markets.items():
+            if symbols is not None and symbol not in symbols:
+                continue
+            try:
+                rules_by_symbol[symbol] = precision_rules_from_market(market, precision_mode)
+            except (KeyError, TypeError):
+                continue
+
+        await self.store_precisions(exchange, rules_by_symbol, local_only_resident=symbols is None)
+        self._refreshed_at[exchange] = time.monotonic()
+        print(f"Cached precision rules for {len(rules_by_symbol)} {exchange} markets")
+        return rules_by_symbol
+
+    async def store_precisions(
+        self, exchange: str, rules_by_symbol: Dict[str, Dict[str, Any]], local_only_resident: bool = False
+    ) -> None:
+        """
+        Writes many symbols' rules to both tiers. Redis gets one MULTI/EXEC
+        round trip, so readers never see a half-rewritten exchange. With
+        `local_only_resident`, the in-process tier only updates entries it
+        already holds.
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        for symbol, rules in rules_by_symbol.items():
+            cache_key = await self._get_cache_key(exchange, symbol)
+            pipe.set(cache_key, json.dumps(rules), ex=self.cache_expiry_seconds)
+            self.missing.discard(cache_key)
+            if not local_only_resident or cache_key in self.local:
+                self.local.set(cache_key, rules)
+        await pipe.execute()
+
+    async def refresh_all(self, pairs: Iterable[Tuple[str, str]]) -> Dict[str, int]:
+        """
+        Refreshes the cached rules of every in-use (exchange, symbol) with one
+        market load per exchange, well before the cache TTL runs out.
+        Returns the number of symbols refreshed per exchange.
+        """
+        symbols_by_exchange: Dict[str, Set[str]] = {}
+        for exchange, symbol in pairs:
+            symbols_by_exchange.setdefault(exchange, set()).add(symbol)
+
+        results = await asyncio.gather(*[
+            self._refresh_exchange(exchange, symbols) for exchange, symbols in symbols_by_exchange.items()
+        ])
+        return dict(zip(symbols_by_exchange, results))
+
+    async def _refresh_exchange(self, exchange: str, symbols: Set[str]) -> int:
+        last_refresh = self._refreshed_at.get(exchange)
+        if last_refresh is not None:
+            metrics.gauge("precision_cache_staleness_seconds", time.monotonic() - last_refresh, exchange=exchange)
+
+        started = time.monotonic()
+        try:
+            rules_by_symbol = await self.load_exchange_precisions(exchange, symbols)
+        except Exception as e:
+            metrics.incr("precision_refresh_failures", exchange=exchange)
+            print(f"Error refreshing precision rules for {exchange}: {e}")
+            return 0
+        metrics.observe("precision_refresh_duration_seconds", time.monotonic() - started, exchange=exchange)
+        metrics.gauge("precision_cache_staleness_seconds", 0, exchange=exchange)
+
+        missing = symbols - set(rules_by_symbol)
+        if missing:
+            print(f"No {exchange} market found for: {', '.join(sorted(missing))}")
+        return len(rules_by_symbol)
+
     async def get_precision(self, db: Session, exchange: str, symbol: str) -> Optional[Dict[str, Any]]:
         """
-        Retrieves precision rules from cache, or fetches and caches if not found/expired.
+        Retrieves precision rules from the in-process cache, then Redis, and
+        bulk-loads the exchange's markets if neither has them. Concurrent
+        misses share a single lookup, and a symbol the exchange did not list
+        is answered with None until PRECISION_NEGATIVE_TTL_SECONDS pass.
         """
         cache_key = await self._get_cache_key(exchange, symbol)
-        cached_data = await self.redis.get(cache_key)
+        precision = self.local.get(cache_key)
+        if precision is not None:
+            return precision
+        if cache_key in self.missing:
+            metrics.incr("precision_negative_hits", exchange=exchange)
+            return None
+        return await self._single_flight(cache_key, lambda: self._get_uncached(exchange, symbol, cache_key))
 
+    async def get_rounding(self, db: Session, exchange: str, symbol: str) -> Optional[SymbolRounding]:
+        """
+        The compiled SymbolRounding for a symbol. It is rebuilt only when the
+        cached rules object changes, i.e. after a refresh or a cache miss.
+        """
+        precision = await self.get_precision(db, exchange, symbol)
+        if precision is None:
+            return None
+        cache_key = await self._get_cache_key(exchange, symbol)
+        compiled = self._roundings.get(cache_key)
+        if compiled is None or compiled[0] is not precision:
+            compiled = (precision, SymbolRounding.from_rules(precision))
+            self._roundings[cache_key] = compiled
+        return compiled[1]
+
+    async def _get_uncached(self, exchange: str, symbol: str, cache_key: str) -> Optional[Dict[str, Any]]:
+        cached_data = await self.redis.get(cache_key)
         if cached_data:
-            print(f"Retrieved precision rules for {exchange}:{symbol} from cache.")
-            return json.loads(cached_data)
+            precision = json.loads(cached_data)
+            self.local.set(cache_key, precision)
+            return precision
+
+        try:
+            rules_by_symbol = await self._single_flight(
+                f"{self.cache_key_prefix}{exchange}:*", lambda: self.load_exchange_precisions(exchange)
+            )
+        except Exception as e:
+            print(f"Error loading precision rules for {exchange}: {e}")
+            return None
+        precision = rules_by_symbol.get(symbol)
+        if precision is None:
+            self.missing.set(cache_key, {})
         else:
-            print(f"Precision rules for {exchange}:{symbol} not in cache. Fetching...")
-            return await self.fetch_and_cache_precision_rules(db, exchange, symbol)
+            self.local.set(cache_key, precision)
+        return precision
+
+    async def _single_flight(self, key: str, load: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs `load` once per key at a time; concurrent callers await the same result."""
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            return await asyncio.shield(inflight)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await load()
+        except BaseException as e:
+            # Cancellation included: waiters must never hang on a future nobody resolves
+            future.set_exception(e if isinstance(e, Exception) else RuntimeError(f"Loading {key} was cancelled"))
+            # Mark the exception as retrieved when nobody else was waiting.
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+_precision_service: Optional[PrecisionService] = None
+
+async def get_precision_service() -> PrecisionService:
+    """Process-wide PrecisionService, so the in-process tier is shared by all callers."""
+    global _precision_service
+    if _precision_service is None:
+        _precision_service = PrecisionService(await get_redis_client())
+    return _precision_service
+
+async def find_symbols_in_use(db: Session) -> Set[Tuple[str, str]]:
+    """
+    Distinct (exchange, symbol) pairs referenced by open position groups,
+    queued signals and pending DCA orders, in one UNION query.
+    """
+    query = union(
+        select(PositionGroup.exchange, PositionGroup.symbol)
+        .where(PositionGroup.status != PositionGroupStatus.CLOSED),
+        select(QueuedSignal.exchange, QueuedSignal.symbol)
+        .where(QueuedSignal.status == "queued"),
+        select(PositionGroup.exchange, DCAOrder.symbol)
+        .join(PositionGroup, DCAOrder.group_id == PositionGroup.id)
+        .where(DCAOrder.status == "pending"),
+    )
+    result = await db.execute(query)
+    return {(row[0], row[1]) for row in result.all()}
 
 async def fetch_precision_info(db: Session, exchange: str, symbol: str) -> dict:
     """
     Fetch precision information for a symbol on an exchange.
     """
-    redis_client_instance = await get_redis_client()
-    precision_service = PrecisionService(redis_client_instance)
+    precision_service = await get_precision_service()
     return await precision_service.get_precision(db, exchange, symbol)
 
+async def fetch_symbol_rounding(db: Session, exchange: str, symbol: str) -> Optional[SymbolRounding]:
+    """
+    Fetch the compiled rounding rules for a symbol on an exchange.
+    """
+    precision_service = await get_precision_service()
+    return await precision_service.get_rounding(db, exchange, symbol)
+
 def calculate_min_notional(quantity: Decimal, price: Decimal) -> Decimal:
     """
     Calculate the notional value of an order.
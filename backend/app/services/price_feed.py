@@ -0,0 +1,118 @@
+import asyncio
+import time
+from decimal import Decimal
+from typing import Dict, List, Set, Tuple, Optional, Callable
+from ..services.exchange_manager import client_pool, rate_limiter
+from ..core.config import settings
+
+class PriceTick:
+    """Latest known price for a symbol and the monotonic time it was observed."""
+    __slots__ = ("price", "timestamp")
+
+    def __init__(self, price: Decimal, timestamp: float):
+        self.price = price
+        self.timestamp = timestamp
+
+    def age(self) -> float:
+        return time.monotonic() - self.timestamp
+
+class PriceFeed:
+    """
+    Shared in-memory price cache. Each (exchange, symbol) is subscribed once no
+    matter how many position groups trade it, and `refresh` pulls every
+    subscribed symbol of an exchange with a single batched `fetch_tickers` call.
+    Readers (take-profit, risk engine) never touch the network. Listeners
+    registered with `add_listener` are called with each exchange's fresh
+    prices after every refresh. Tickers come from the testnet or the live
+    venue per `testnet` (EXCHANGE_TESTNET by default).
+    """
+    def __init__(self, max_age_seconds: float, client_factory: Callable = None, testnet: bool = None):
+        self.max_age_seconds = max_age_seconds
+        self.client_factory = client_factory or client_pool.get_public_client
+        self.testnet = settings.EXCHANGE_TESTNET if testnet is None else testnet
+        self._subscriptions: Dict[str, Set[str]] = {}
+        self._ticks: Dict[Tuple[str, str], PriceTick] = {}
+        self._listeners: List[Callable[[str, Dict[str, Decimal]], None]] = []
+
+    def add_listener(self, listener: Callable[[str, Dict[str, Decimal]], None]) -> None:
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[str, Dict[str, Decimal]], None]) -> None:
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def subscribe(self, exchange: str, symbol: str) -> None:
+        self._subscriptions.setdefault(exchange, set()).add(symbol)
+
+    def unsubscribe(self, exchange: str, symbol: str) -> None:
+        symbols = self._subscriptions.get(exchange)
+        if symbols:
+            symbols.discard(symbol)
+            if not symbols:
+                del self._subscriptions[exchange]
+        self._ticks.pop((exchange, symbol), None)
+
+    def subscriptions(self) -> Dict[str, Set[str]]:
+        return {exchange: set(symbols) for exchange, symbols in self._subscriptions.items()}
+
+    def update(self, exchange: str, symbol: str, price, timestamp: float = None) -> None:
+        self._ticks[(exchange, symbol)] = PriceTick(Decimal(str(price)), timestamp if timestamp is not None else time.monotonic())
+
+    def get_tick(self, exchange: str, symbol: str) -> Optional[PriceTick]:
+        return self._ticks.get((exchange, symbol))
+
+    def get_price(self, exchange: str, symbol: str, max_age: float = None) -> Optional[Decimal]:
+        """
+        Returns the latest price, or None if the symbol has no tick yet or the
+        tick is older than `max_age` (defaults to PRICE_FEED_MAX_AGE_SEC).
+        """
+        tick = self._ticks.get((exchange, symbol))
+        if tick is None:
+            return None
+        if tick.age() > (self.max_age_seconds if max_age is None else max_age):
+            return None
+        return tick.price
+
+    async def refresh(self) -> None:
+        """
+        Refresh all subscriptions, one batched request per exchange.
+        """
+        await asyncio.gather(*[
+            self._refresh_exchange(exchange, symbols)
+            for exchange, symbols in self.subscriptions().items()
+        ])
+
+    async def _refresh_exchange(self, exchange: str, symbols: Set[str]) -> None:
+        try:
+            client = self.client_factory(exchange, self.testnet)
+            symbol_list = sorted(symbols)
+            if client.has.get('fetchTickers'):
+                tickers = await rate_limiter.call(None, exchange, client, 'fetch_tickers', symbol_list)
+            else:
+                results = await asyncio.gather(*[
+                    rate_limiter.call(None, exchange, client, 'fetch_ticker', symbol) for symbol in symbol_list
+                ])
+                tickers = dict(zip(symbol_list, results))
+            now = time.monotonic()
+            updated = {}
+            for symbol, ticker in tickers.items():
+                if symbol in symbols and ticker.get('last') is not None:
+                    self.update(exchange, symbol, ticker['last'], now)
+                    updated[symbol] = self._ticks[(exchange, symbol)].price
+        except Exception as e:
+            # Keep the previous ticks; readers will see them go stale.
+            print(f"Error refreshing prices for {exchange}: {e}")
+            return
+        self._notify(exchange, updated)
+
+    def _notify(self, exchange: str, prices: Dict[str, Decimal]) -> None:
+        if not prices:
+            return
+        for listener in list(self._listeners):
+            try:
+                listener(exchange, prices)
+            except Exception as e:
+                print(f"Error in price listener for {exchange}: {e}")
+
+price_feed = PriceFeed(settings.PRICE_FEED_MAX_AGE_SEC)
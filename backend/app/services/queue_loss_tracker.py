@@ -0,0 +1,176 @@
+import numpy as np
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy import select, update, bindparam
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.trading_models import QueuedSignal
+from ..services.metrics_service import metrics
+from ..services.price_feed import price_feed
+from ..services.queue_priority import queue_book, priority_score
+
+# current_loss_percent is stored with 4 decimal places; smaller moves are not changes.
+LOSS_EPSILON = 0.00005
+
+class TrackedSignal:
+    """The fields of a waiting QueuedSignal that its priority depends on."""
+    __slots__ = ("id", "user_id", "entry_price", "side", "is_pyramid_continuation", "replacement_count", "queued_at", "loss_percent")
+
+    def __init__(self, entry: QueuedSignal):
+        self.id = entry.id
+        self.user_id = entry.user_id
+        self.entry_price = float(entry.entry_price or 0)
+        self.side = -1.0 if entry.side == "short" else 1.0
+        self.is_pyramid_continuation = bool(entry.is_pyramid_continuation)
+        self.replacement_count = entry.replacement_count or 0
+        self.queued_at = entry.queued_at
+        self.loss_percent = float(entry.current_loss_percent or 0)
+
+class SymbolQueue:
+    """
+    Waiting signals of one (exchange, symbol) with their entry prices, sides
+    and last loss % as aligned columns, rebuilt only when membership changes.
+    """
+    def __init__(self):
+        self.signals: Dict[UUID, TrackedSignal] = {}
+        self._columns: Optional[Tuple[List[TrackedSignal], np.ndarray, np.ndarray, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.signals)
+
+    def add(self, signal: TrackedSignal) -> None:
+        self.signals[signal.id] = signal
+        self._columns = None
+
+    def remove(self, entry_id: UUID) -> None:
+        if self.signals.pop(entry_id, None) is not None:
+            self._columns = None
+
+    def columns(self):
+        if self._columns is None:
+            rows = list(self.signals.values())
+            self._columns = (
+                rows,
+                np.array([s.entry_price for s in rows], dtype=np.float64),
+                np.array([s.side for s in rows], dtype=np.float64),
+                np.array([s.loss_percent for s in rows], dtype=np.float64),
+            )
+        return self._columns
+
+class QueueLossTracker:
+    """
+    Keeps `QueuedSignal.current_loss_percent` (SoW 5.3 rule 2) live. Queued
+    symbols are subscribed to the shared price feed; each price update
+    recomputes loss % for all waiting signals of that symbol in one vectorized
+    step and re-ranks only the entries whose loss changed in the queue heap.
+    Changed rows are written back by `flush` in one batched UPDATE, so the
+    database lags by at most one flush interval and no query runs per signal.
+    """
+    def __init__(self, feed=None):
+        self.feed = feed or price_feed
+        self._symbols: Dict[Tuple[str, str], SymbolQueue] = {}
+        self._locations: Dict[UUID, Tuple[str, str]] = {}
+        self._pending: Dict[UUID, Tuple[Decimal, Decimal]] = {}
+
+    def track(self, entry: QueuedSignal) -> None:
+        """Starts (or refreshes) tracking of a waiting signal."""
+        self.untrack(entry.id)
+        key = (entry.exchange, entry.symbol)
+        self._symbols.setdefault(key, SymbolQueue()).add(TrackedSignal(entry))
+        self._locations[entry.id] = key
+        self.feed.subscribe(entry.exchange, entry.symbol)
+
+    def untrack(self, entry_id: UUID) -> None:
+        key = self._locations.pop(entry_id, None)
+        self._pending.pop(entry_id, None)
+        if key is None:
+            return
+        book = self._symbols[key]
+        book.remove(entry_id)
+        if not len(book):
+            del self._symbols[key]
+
+    def tracked_symbols(self) -> List[Tuple[str, str]]:
+        return list(self._symbols)
+
+    def on_prices(self, exchange: str, prices: Dict[str, Decimal]) -> None:
+        """Price feed listener: reprices every tracked symbol in the update."""
+        for symbol, price in prices.items():
+            book = self._symbols.get((exchange, symbol))
+            if book is not None:
+                self.reprice(book, float(price))
+
+    def reprice(self, book: SymbolQueue, price: float) -> int:
+        rows, entry_price, side, last_loss = book.columns()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            loss = np.where(entry_price > 0, side * (price - entry_price) / entry_price * 100.0, 0.0)
+        loss = np.round(loss, 4)
+        changed = np.flatnonzero(np.abs(loss - last_loss) >= LOSS_EPSILON)
+        for row in changed:
+            signal = rows[row]
+            signal.loss_percent = float(loss[row])
+            last_loss[row] = loss[row]
+            loss_percent = Decimal(str(signal.loss_percent))
+            score = priority_score(signal.is_pyramid_continuation, loss_percent, signal.replacement_count)
+            queue_book.rekey(signal.user_id, signal.id, score, signal.queued_at)
+            self._pending[signal.id] = (loss_percent, score)
+        if len(changed):
+            metrics.incr("queue_loss_repriced", len(changed))
+        return len(changed)
+
+    def rekey_user(self, user_id: UUID) -> None:
+        """Applies not-yet-flushed scores to a user's freshly loaded heap."""
+        for entry_id, (_, score) in self._pending.items():
+            key = self._locations.get(entry_id)
+            if key is None:
+                continue
+            signal = self._symbols[key].signals[entry_id]
+            if signal.user_id == user_id:
+                queue_book.rekey(user_id, entry_id, score, signal.queued_at)
+
+    async def sync(self, db: AsyncSession) -> None:
+        """
+        Re-reads every waiting signal, picking up entries added or removed
+        elsewhere in both the tracker and the queue heaps.
+        """
+        result = await db.execute(select(QueuedSignal).where(QueuedSignal.status == "queued"))
+        entries = result.scalars().all()
+        waiting = {entry.id for entry in entries}
+        for entry_id, key in list(self._locations.items()):
+            if entry_id not in waiting:
+                queue_book.discard(self._symbols[key].signals[entry_id].user_id, entry_id)
+                self.untrack(entry_id)
+        for entry in entries:
+            if entry.id not in self._pending:
+                queue_book.upsert(entry)
+                self.track(entry)
+
+    async def flush(self, db: AsyncSession) -> int:
+        """Writes all changed loss % and scores in one executemany UPDATE."""
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        table = QueuedSignal.__table__
+        statement = (
+            update(table)
+            .where(table.c.id == bindparam("b_id"), table.c.status == "queued")
+            .values(current_loss_percent=bindparam("b_loss"), priority_score=bindparam("b_score"))
+        )
+        try:
+            await db.execute(statement, [
+                {"b_id": entry_id, "b_loss": loss_percent, "b_score": score}
+                for entry_id, (loss_percent, score) in pending.items()
+            ])
+            await db.commit()
+        except Exception as e:
+            # Keep the values for the next flush unless newer ones arrived meanwhile
+            for entry_id, values in pending.items():
+                if entry_id in self._locations:
+                    self._pending.setdefault(entry_id, values)
+            print(f"Error flushing queue loss percentages: {e}")
+            return 0
+        metrics.incr("queue_loss_rows_flushed", len(pending))
+        return len(pending)
+
+queue_loss_tracker = QueueLossTracker()
+price_feed.add_listener(queue_loss_tracker.on_prices)
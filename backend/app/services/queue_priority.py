@@ -0,0 +1,173 @@
+import heapq
+from datetime import datetime
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, Hashable, List, Optional, Tuple
+from uuid import UUID
+
+# priority_score packs the first three SoW 5.3 rules into one sortable number
+# (higher wins); FIFO is the queued_at tiebreak:
+#   continuation * 10^12 + loss depth (4dp, offset by 1000%) * 10^4 + replacements
+CONTINUATION_WEIGHT = Decimal(10) ** 12
+LOSS_DEPTH_OFFSET = Decimal(1000)
+LOSS_DEPTH_SCALE = Decimal(10) ** 4
+REPLACEMENT_CAP = 9999
+
+def priority_score(is_pyramid_continuation: bool, current_loss_percent: Optional[Decimal], replacement_count: int) -> Decimal:
+    """
+    Composite queue priority in SoW 5.3 order: pyramid continuation, then the
+    deepest current loss (most negative PnL %), then the replacement count.
+    """
+    depth = -Decimal(str(current_loss_percent or 0))
+    depth = min(max(depth, -LOSS_DEPTH_OFFSET), LOSS_DEPTH_OFFSET - 1)
+    depth_units = ((depth + LOSS_DEPTH_OFFSET) * LOSS_DEPTH_SCALE).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    return (
+        (CONTINUATION_WEIGHT if is_pyramid_continuation else 0)
+        + depth_units * LOSS_DEPTH_SCALE
+        + min(int(replacement_count or 0), REPLACEMENT_CAP)
+    )
+
+def heap_key(score: Decimal, queued_at: Optional[datetime], entry_id: UUID) -> Tuple:
+    """Min-heap key: highest score first, then oldest, then id for a stable order."""
+    return (-Decimal(str(score or 0)), queued_at or datetime.min, str(entry_id))
+
+class IndexedHeap:
+    """
+    Binary min-heap that tracks each item's position, so any item can be
+    re-keyed or removed in O(log n) instead of a linear scan.
+    """
+    def __init__(self):
+        self._heap: List[Tuple[Tuple, Hashable]] = []
+        self._positions: Dict[Hashable, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._positions
+
+    def push(self, item: Hashable, key: Tuple) -> None:
+        if item in self._positions:
+            self.update(item, key)
+            return
+        self._heap.append((key, item))
+        self._positions[item] = len(self._heap) - 1
+        self._sift_up(len(self._heap) - 1)
+
+    def update(self, item: Hashable, key: Tuple) -> None:
+        i = self._positions[item]
+        old_key = self._heap[i][0]
+        self._heap[i] = (key, item)
+        if key < old_key:
+            self._sift_up(i)
+        else:
+            self._sift_down(i)
+
+    def remove(self, item: Hashable) -> bool:
+        i = self._positions.pop(item, None)
+        if i is None:
+            return False
+        last = self._heap.pop()
+        if i < len(self._heap):
+            self._heap[i] = last
+            self._positions[last[1]] = i
+            self._sift_up(i)
+            self._sift_down(self._positions[last[1]])
+        return True
+
+    def peek(self) -> Optional[Hashable]:
+        return self._heap[0][1] if self._heap else None
+
+    def pop(self) -> Optional[Hashable]:
+        item = self.peek()
+        if item is not None:
+            self.remove(item)
+        return item
+
+    def items(self) -> List[Hashable]:
+        """Items in priority order (O(n log n); for inspection only)."""
+        return [item for _, item in sorted(self._heap)]
+
+    @classmethod
+    def from_items(cls, items: List[Tuple[Hashable, Tuple]]) -> "IndexedHeap":
+        heap = cls()
+        heap._heap = [(key, item) for item, key in items]
+        heapq.heapify(heap._heap)
+        heap._positions = {item: i for i, (_, item) in enumerate(heap._heap)}
+        return heap
+
+    def _swap(self, i: int, j: int) -> None:
+        self._heap[i], self._heap[j] = self._heap[j], self._heap[i]
+        self._positions[self._heap[i][1]] = i
+        self._positions[self._heap[j][1]] = j
+
+    def _sift_up(self, i: int) -> None:
+        while i > 0:
+            parent = (i - 1) // 2
+            if self._heap[i][0] >= self._heap[parent][0]:
+                break
+            self._swap(i, parent)
+            i = parent
+
+    def _sift_down(self, i: int) -> None:
+        size = len(self._heap)
+        while True:
+            smallest = i
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < size and self._heap[child][0] < self._heap[smallest][0]:
+                    smallest = child
+            if smallest == i:
+                return
+            self._swap(i, smallest)
+            i = smallest
+
+class QueueBook:
+    """
+    In-memory view of each user's waiting queue as an indexed heap of
+    QueuedSignal ids. `queued_signals` stays the source of truth: a user's heap
+    is rebuilt from it on first use (or after `invalidate`) through the
+    (user_id, status, priority_score) index, and every change here is made
+    alongside the matching row update.
+    """
+    def __init__(self):
+        self._heaps: Dict[UUID, IndexedHeap] = {}
+
+    def is_loaded(self, user_id: UUID) -> bool:
+        return user_id in self._heaps
+
+    def load(self, user_id: UUID, entries) -> None:
+        self._heaps[user_id] = IndexedHeap.from_items([
+            (entry.id, heap_key(entry.priority_score, entry.queued_at, entry.id)) for entry in entries
+        ])
+
+    def invalidate(self, user_id: UUID = None) -> None:
+        if user_id is None:
+            self._heaps.clear()
+        else:
+            self._heaps.pop(user_id, None)
+
+    def upsert(self, entry) -> None:
+        """Adds or re-keys a queued signal; a no-op until the user's heap is loaded."""
+        heap = self._heaps.get(entry.user_id)
+        if heap is not None:
+            heap.push(entry.id, heap_key(entry.priority_score, entry.queued_at, entry.id))
+
+    def rekey(self, user_id: UUID, entry_id: UUID, score: Decimal, queued_at: Optional[datetime]) -> None:
+        """Re-ranks an entry that is still waiting; entries not in the heap are ignored."""
+        heap = self._heaps.get(user_id)
+        if heap is not None and entry_id in heap:
+            heap.update(entry_id, heap_key(score, queued_at, entry_id))
+
+    def discard(self, user_id: UUID, entry_id: UUID) -> None:
+        heap = self._heaps.get(user_id)
+        if heap is not None:
+            heap.remove(entry_id)
+
+    def peek(self, user_id: UUID) -> Optional[UUID]:
+        heap = self._heaps.get(user_id)
+        return heap.peek() if heap is not None else None
+
+    def ordered(self, user_id: UUID) -> List[UUID]:
+        heap = self._heaps.get(user_id)
+        return heap.items() if heap is not None else []
+
+queue_book = QueueBook()
@@ -0,0 +1,116 @@
+import asyncio
+import time
+from typing import Callable, Dict, List
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..services import queue_service, webhook_service
+from ..services.pool_manager import PoolSlotCounter, pool_slots
+from ..services.metrics_service import metrics
+from ..db.session import get_async_db
+from ..core.config import settings
+
+class QueuePromoter:
+    """
+    Promotes queued signals as soon as pool slots are freed, instead of waiting
+    for a polling job. It listens to PoolSlotCounter releases; every release
+    seen before the drain task runs is handled in the same pass, with one
+    session and one heap load per user, and one promotion per freed slot.
+    A failure only affects its own user; releases that were not acted on are
+    retried after QUEUE_PROMOTION_RETRY_SEC.
+    """
+    def __init__(self, slots: PoolSlotCounter = None, session_factory: Callable = None):
+        self.slots = slots or pool_slots
+        self.session_factory = session_factory or get_async_db
+        self._pending: Dict[UUID, List[float]] = {}
+        self._task: asyncio.Task = None
+        self.retry_delay = settings.QUEUE_PROMOTION_RETRY_SEC
+
+    def on_release(self, user_id: UUID) -> None:
+        """Release listener: records the event and schedules a drain."""
+        self._pending.setdefault(user_id, []).append(time.monotonic())
+        if self._task is None or self._task.done():
+            try:
+                self._task = asyncio.get_running_loop().create_task(self._drain())
+            except RuntimeError:
+                # No running loop (e.g. a sync caller); the next release in the loop drains it
+                pass
+
+    async def _drain(self) -> None:
+        # Yield once so releases from the same tick are batched together
+        await asyncio.sleep(0)
+        while self._pending:
+            pending, self._pending = self._pending, {}
+            try:
+                async for db in self.session_factory():
+                    for user_id, released_at in pending.items():
+                        try:
+                            await self.promote_user(db, user_id, released_at)
+                        except Exception as e:
+                            metrics.incr("queue_promotion_failures")
+                            print(f"Error promoting queued signals for user {user_id}: {e}")
+                            await db.rollback()
+            except Exception as e:
+                print(f"Error promoting queued signals: {e}")
+            # promote_user consumes the releases it acted on
+            failed = {user_id: released_at for user_id, released_at in pending.items() if released_at}
+            if failed:
+                # Retry after a pause rather than spinning on a persistent error
+                await asyncio.sleep(self.retry_delay)
+                for user_id, released_at in failed.items():
+                    self._pending[user_id] = released_at + self._pending.get(user_id, [])
+
+    async def promote_user(self, db: AsyncSession, user_id: UUID, released_at: List[float]) -> int:
+        """
+        Fills the user's freed slots with the top-ranked queued signals and
+        returns how many were promoted. Releases are removed from
+        `released_at` as they are settled; the ones left after a failure
+        are still owed a promotion.
+        """
+        promoted = 0
+        try:
+            while released_at:
+                if not await self.slots.try_acquire(db, user_id):
+                    released_at.clear()
+                    break
+                try:
+                    entry = await queue_service.promote_from_queue(db, user_id)
+                except Exception:
+                    await self.slots.release(user_id, notify=False)
+                    raise
+                if entry is None:
+                    await self.slots.release(user_id, notify=False)
+                    released_at.clear()
+                    break
+                try:
+                    await webhook_service.create_position_group_from_signal(db, entry.signal_payload, user_id)
+                except Exception as e:
+                    metrics.incr("queue_promotion_failures")
+                    print(f"Error opening group for promoted signal {entry.id}: {e}")
+                    await db.rollback()
+                    await queue_service.requeue(db, entry)
+                    await self.slots.release(user_id, notify=False)
+                    break
+                released = released_at.pop(0)
+                metrics.observe("queue_promotion_latency_seconds", time.monotonic() - released)
+                promoted += 1
+        finally:
+            if promoted:
+                metrics.incr("queue_promotions", promoted)
+        return promoted
+
+    async def join(self) -> None:
+        """Waits for the current drain, if any."""
+        if self._task is not None:
+            await self._task
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+queue_promoter = QueuePromoter()
+pool_slots.add_release_listener(queue_promoter.on_release)
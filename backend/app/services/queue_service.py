@@ -1,70 +1,203 @@
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
-from ..models.trading_models import PositionGroup, QueuedSignal
+from ..models.trading_models import PositionGroup, PositionGroupStatus, QueuedSignal
+from ..services.queue_priority import queue_book, priority_score
+from ..services.queue_loss_tracker import queue_loss_tracker
+from ..services.price_feed import price_feed
 from uuid import UUID
 from decimal import Decimal
 from datetime import datetime
+from typing import Optional
+
+ACTIVE_GROUP_STATUSES = (
+    PositionGroupStatus.LIVE,
+    PositionGroupStatus.PARTIALLY_FILLED,
+    PositionGroupStatus.ACTIVE,
+)
+
+def parse_timeframe(timeframe) -> int:
+    """TradingView sends '15' or '15m'; the queue stores minutes."""
+    return int(str(timeframe).replace("m", ""))
+
+def signal_side(signal: dict) -> str:
+    action = str(signal.get("action") or signal.get("side") or "buy").lower()
+    return "short" if action in ("sell", "short") else "long"
+
+def signal_entry_price(signal: dict) -> Decimal:
+    price = signal.get("entry_price") or signal.get("close_price") or 0
+    try:
+        return Decimal(str(price))
+    except Exception:
+        return Decimal("0")
+
+def calculate_loss_percent(side: str, entry_price: Decimal, current_price: Optional[Decimal]) -> Decimal:
+    """Signed PnL % of the signal's entry against the current price; negative is a loss."""
+    if not entry_price or current_price is None:
+        return Decimal("0")
+    pnl_percent = (current_price - entry_price) / entry_price * 100
+    return -pnl_percent if side == "short" else pnl_percent
+
+def calculate_priority(signal: dict, is_pyramid_continuation: bool = False, replacement_count: int = 0) -> Decimal:
+    """
+    Calculate the priority of a signal in the queue (SoW 5.3): pyramid
+    continuation, then deepest current loss, then replacement count.
+    FIFO is applied at selection time via queued_at.
+    """
+    entry_price = signal_entry_price(signal)
+    current_price = price_feed.get_price(signal.get("exchange"), signal.get("symbol"))
+    loss_percent = calculate_loss_percent(signal_side(signal), entry_price, current_price)
+    return priority_score(is_pyramid_continuation, loss_percent, replacement_count)
+
+async def is_pyramid_continuation(db: AsyncSession, user_id: UUID, exchange: str, symbol: str, timeframe: int) -> bool:
+    """True if the signal would add a pyramid to an already active position group."""
+    result = await db.execute(
+        select(func.count(PositionGroup.id)).where(
+            PositionGroup.user_id == user_id,
+            PositionGroup.exchange == exchange,
+            PositionGroup.symbol == symbol,
+            PositionGroup.timeframe == timeframe,
+            PositionGroup.status.in_(ACTIVE_GROUP_STATUSES),
+        )
+    )
+    return result.scalar_one() > 0
+
+async def find_queued_signal(db: AsyncSession, user_id: UUID, exchange: str, symbol: str, timeframe: int) -> Optional[QueuedSignal]:
+    result = await db.execute(select(QueuedSignal).filter(
+        QueuedSignal.user_id == user_id,
+        QueuedSignal.exchange == exchange,
+        QueuedSignal.symbol == symbol,
+        QueuedSignal.timeframe == timeframe,
+        QueuedSignal.status == "queued",
+    ))
+    return result.scalars().first()
 
 async def add_to_queue(db: AsyncSession, signal: dict, user_id: UUID) -> QueuedSignal:
     """
-    Add a signal to the queue asynchronously.
+    Add a signal to the queue asynchronously. A newer signal for a pair and
+    timeframe that is already waiting replaces it instead of queueing twice.
     """
-    priority_score = calculate_priority(signal)
+    timeframe = parse_timeframe(signal["timeframe"])
+    existing_entry = await find_queued_signal(db, user_id, signal["exchange"], signal["symbol"], timeframe)
+    if existing_entry is not None:
+        return await replace_queued_signal(db, existing_entry, signal)
+
+    continuation = await is_pyramid_continuation(db, user_id, signal["exchange"], signal["symbol"], timeframe)
+    side = signal_side(signal)
+    entry_price = signal_entry_price(signal)
+    loss_percent = calculate_loss_percent(side, entry_price, price_feed.get_price(signal["exchange"], signal["symbol"]))
 
     queue_entry = QueuedSignal(
         user_id=user_id,
         exchange=signal["exchange"],
         symbol=signal["symbol"],
-        timeframe=signal["timeframe"],
-        original_signal=signal,
-        priority_score=priority_score,
-        replacement_count=0
+        timeframe=timeframe,
+        side=side,
+        entry_price=entry_price,
+        signal_payload=signal,
+        queued_at=datetime.utcnow(),
+        replacement_count=0,
+        is_pyramid_continuation=continuation,
+        current_loss_percent=loss_percent,
+        priority_score=priority_score(continuation, loss_percent, 0),
+        status="queued",
     )
     db.add(queue_entry)
     await db.commit()
     await db.refresh(queue_entry)
+    queue_book.upsert(queue_entry)
+    queue_loss_tracker.track(queue_entry)
     return queue_entry
 
-async def promote_from_queue(db: AsyncSession, user_id: UUID) -> QueuedSignal | None:
+async def replace_queued_signal(db: AsyncSession, existing_entry: QueuedSignal, new_signal: dict) -> QueuedSignal:
     """
-    Promote a signal from the queue to a live position based on priority rules.
+    Swap in the newer signal, bump the replacement count and re-rank the entry
+    in place (O(log n) in the heap). queued_at is kept, so FIFO position holds.
     """
-    result = await db.execute(select(QueuedSignal).filter(QueuedSignal.user_id == user_id))
-    queue_entries = result.scalars().all()
+    existing_entry.signal_payload = new_signal
+    existing_entry.entry_price = signal_entry_price(new_signal)
+    existing_entry.replacement_count = (existing_entry.replacement_count or 0) + 1
+    existing_entry.current_loss_percent = calculate_loss_percent(
+        existing_entry.side,
+        existing_entry.entry_price,
+        price_feed.get_price(existing_entry.exchange, existing_entry.symbol),
+    )
+    existing_entry.priority_score = priority_score(
+        existing_entry.is_pyramid_continuation,
+        existing_entry.current_loss_percent,
+        existing_entry.replacement_count,
+    )
+    await db.commit()
+    queue_book.upsert(existing_entry)
+    queue_loss_tracker.track(existing_entry)
+    return existing_entry
 
-    if not queue_entries:
-        return None
+async def load_queue(db: AsyncSession, user_id: UUID) -> None:
+    """(Re)builds a user's heap from queued_signals."""
+    result = await db.execute(
+        select(QueuedSignal)
+        .where(QueuedSignal.user_id == user_id, QueuedSignal.status == "queued")
+        .order_by(QueuedSignal.priority_score.desc(), QueuedSignal.queued_at)
+    )
+    queue_book.load(user_id, result.scalars().all())
+    # Loss moves since the last flush are newer than the stored scores
+    queue_loss_tracker.rekey_user(user_id)
 
-    sorted_entries = sorted(queue_entries,
-                            key=lambda entry: (entry.priority_score, entry.replacement_count, entry.created_at),
-                            reverse=True)
+async def promote_from_queue(db: AsyncSession, user_id: UUID) -> QueuedSignal | None:
+    """
+    Promote the highest-priority queued signal. Selection is a heap peek;
+    entries taken by another worker are dropped from the heap and skipped.
+    """
+    if not queue_book.is_loaded(user_id):
+        await load_queue(db, user_id)
 
-    highest_priority_entry = sorted_entries[0]
+    while True:
+        entry_id = queue_book.peek(user_id)
+        if entry_id is None:
+            return None
+        entry = await db.get(QueuedSignal, entry_id)
+        queue_book.discard(user_id, entry_id)
+        queue_loss_tracker.untrack(entry_id)
+        if entry is None or entry.status != "queued":
+            continue
 
-    highest_priority_entry.status = "promoted"
-    await db.delete(highest_priority_entry)
-    await db.commit()
+        entry.status = "promoted"
+        entry.promoted_at = datetime.utcnow()
+        try:
+            await db.commit()
+        except Exception:
+            # The heap no longer matches the table; rebuild it on next use
+            queue_book.invalidate(user_id)
+            raise
+        return entry
 
-    return highest_priority_entry
+async def requeue(db: AsyncSession, entry: QueuedSignal) -> None:
+    """Puts a promoted signal back in the queue, e.g. when its group could not be opened."""
+    entry.status = "queued"
+    entry.promoted_at = None
+    await db.commit()
+    queue_book.upsert(entry)
+    queue_loss_tracker.track(entry)
 
-def calculate_priority(signal: dict) -> Decimal:
+async def remove_from_queue(db: AsyncSession, user_id: UUID, exchange: str, symbol: str, timeframe) -> Optional[QueuedSignal]:
     """
-    Calculate the priority of a signal in the queue.
+    Cancel the waiting signal for a pair and timeframe, e.g. when its exit
+    signal arrives before it was ever promoted.
     """
-    return Decimal("0.0")
+    entry = await find_queued_signal(db, user_id, exchange, symbol, parse_timeframe(timeframe))
+    if entry is None:
+        return None
+    entry.status = "cancelled"
+    await db.commit()
+    queue_book.discard(user_id, entry.id)
+    queue_loss_tracker.untrack(entry.id)
+    return entry
 
 async def handle_signal_replacement(db: AsyncSession, new_signal: dict, user_id: UUID) -> None:
     """
     Handle a signal that is a replacement for an existing signal in the queue asynchronously.
     """
-    result = await db.execute(select(QueuedSignal).filter(
-        QueuedSignal.user_id == user_id,
-        QueuedSignal.symbol == new_signal["symbol"]
-    ))
-    existing_entry = result.scalars().first()
-
+    existing_entry = await find_queued_signal(
+        db, user_id, new_signal["exchange"], new_signal["symbol"], parse_timeframe(new_signal["timeframe"])
+    )
     if existing_entry:
-        existing_entry.original_signal = new_signal
-        existing_entry.replacement_count += 1
-        existing_entry.priority_score = calculate_priority(new_signal)
-        await db.commit()
+        await replace_queued_signal(db, existing_entry, new_signal)
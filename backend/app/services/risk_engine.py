@@ -1,3 +1,5 @@
+import asyncio
+import time
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 from ..models.trading_models import PositionGroup, Pyramid
@@ -5,23 +7,267 @@ from uuid import UUID
 from fastapi import Depends
 from ..db.session import get_async_db
 from decimal import Decimal
-from datetime import datetime
+from datetime import datetime, timedelta
 from ..core.config import settings
+from ..core.config_models import RiskEngineConfig
 from .order_service import place_partial_close_order
+from .exchange_manager import client_pool, request_priority, Priority, order_fill
 from ..models.risk_analytics_models import RiskAction
+from .price_feed import price_feed
+from .pnl_rollup import record_realized_pnl, position_pnl
+
+FULL_PYRAMID_COUNT = 5
+
+def pyramid_stats():
+    """Per-group pyramid count and latest entry time, as one grouped subquery."""
+    return (
+        select(
+            Pyramid.group_id,
+            func.count(Pyramid.id).label("pyramid_count"),
+            func.max(Pyramid.entry_timestamp).label("last_entry_at"),
+        )
+        .group_by(Pyramid.group_id)
+        .subquery()
+    )
+
+def default_risk_engine_config() -> RiskEngineConfig:
+    """RiskEngineConfig seeded from the environment settings."""
+    return RiskEngineConfig(
+        require_full_pyramids=settings.RISK_REQUIRE_FULL_PYRAMIDS,
+        post_full_wait_minutes=settings.RISK_POST_FULL_WAIT_MINUTES,
+        loss_threshold_percent=Decimal(str(settings.RISK_LOSS_THRESHOLD_PERCENT)),
+        max_winners_to_combine=settings.RISK_MAX_WINNERS_TO_COMBINE,
+    )
+
+class OffsetLeg:
+    """One winner's partial close within an offset plan, and its outcome."""
+    def __init__(self, winner: PositionGroup, profit_to_realize: Decimal, quantity: Decimal, notional: Decimal):
+        self.winner = winner
+        self.pnl_usd = winner.unrealized_pnl_usd
+        self.profit_to_realize = profit_to_realize
+        self.quantity = quantity
+        self.notional = notional
+        self.status = "planned"
+        self.error = None
+        self.latency_ms = None
+        # Filled in from the exchange's answer once the close has run
+        self.filled = Decimal("0")
+        self.fill_price = None
+        self.realized_usd = Decimal("0")
+
+    @property
+    def mark_price(self) -> Decimal:
+        return self.notional / self.quantity
+
+    def to_dict(self) -> dict:
+        return {
+            "group_id": str(self.winner.id),
+            "symbol": self.winner.symbol,
+            "exchange": self.winner.exchange,
+            "pnl_usd": str(self.pnl_usd),
+            "profit_to_realize": str(self.profit_to_realize),
+            "quantity_closed": str(self.quantity),
+            "notional_usd": str(self.notional),
+            "quantity_filled": str(self.filled),
+            "fill_price": str(self.fill_price) if self.fill_price is not None else None,
+            "realized_usd": str(self.realized_usd),
+            "status": self.status,
+            "error": self.error,
+            "latency_ms": self.latency_ms,
+        }
+
+class OffsetPlan:
+    """
+    The full set of partial closes for one loser, computed before anything is
+    sent to an exchange. Its dict form is the risk panel's "Projected Plan".
+    """
+    def __init__(self, loser: PositionGroup, required_usd: Decimal):
+        self.loser = loser
+        self.required_usd = required_usd
+        self.legs: list[OffsetLeg] = []
+        self.skipped: list[dict] = []
+        self.latency_ms = None
+
+    @property
+    def planned_usd(self) -> Decimal:
+        return sum((leg.profit_to_realize for leg in self.legs), Decimal("0"))
+
+    @property
+    def realized_usd(self) -> Decimal:
+        return sum((leg.realized_usd for leg in self.legs if leg.status == "closed"), Decimal("0"))
+
+    def to_dict(self) -> dict:
+        return {
+            "loser_group_id": str(self.loser.id),
+            "required_usd": str(self.required_usd),
+            "planned_usd": str(self.planned_usd),
+            "legs": [leg.to_dict() for leg in self.legs],
+            "skipped": self.skipped,
+            "latency_ms": self.latency_ms,
+        }
 
 class RiskEngine:
-    def __init__(self, db: AsyncSession):
+    def __init__(self, db: AsyncSession, config: RiskEngineConfig = None, session_factory=None):
         self.db = db
+        self.config = config or default_risk_engine_config()
+        # Opens the separate session each concurrent close runs on
+        self.session_factory = session_factory or get_async_db
+
+    @property
+    def post_full_wait_minutes(self) -> int:
+        """The configured post-full wait, or 0 when the wait is disabled."""
+        return self.config.post_full_wait_minutes if self.config.enable_post_full_wait else 0
 
     async def evaluate_risk_conditions(self) -> None:
         """
-        Evaluate risk conditions and execute mitigation strategies.
+        Evaluate risk conditions for every user and execute mitigation strategies.
+        Eligibility and ranking are done in SQL, so one pass costs two queries
+        (top loser per user, top winners per user) however many groups are open,
+        after active groups are re-marked to the price feed.
+        """
+        marked = await self.mark_active_to_market()
+        losers = await self.find_eligible_losers() if self.config.partial_close_enabled else []
+        # A loser flagged to skip once sits out this pass and loses the flag
+        skipped = [loser for loser in losers if loser.risk_skip_once]
+        for loser in skipped:
+            loser.risk_skip_once = False
+        losers = [loser for loser in losers if loser not in skipped]
+        if not losers:
+            if marked or skipped:
+                await self.db.commit()
+            return
+
+        winners_by_user = await self.find_top_winners({loser.user_id for loser in losers})
+        committed = False
+        for loser in losers:
+            winners = winners_by_user.get(loser.user_id)
+            if not winners:
+                continue
+            try:
+                await self.execute_risk_mitigation(loser, winners)
+                # The winners' fills, the loser's block and the RiskAction land together
+                await self.db.commit()
+                committed = True
+            except Exception as e:
+                print(f"Error executing risk mitigation for group {loser.id}: {e}")
+                await self.db.rollback()
+
+        if not committed and (marked or skipped):
+            await self.db.commit()
+
+    async def mark_active_to_market(self) -> int:
+        """
+        Re-marks every active group's unrealized PnL from the price feed and
+        flushes it, so the ranking queries see current prices. Groups without a
+        fresh price keep their stored values. Returns the number re-marked.
+        """
+        result = await self.db.execute(select(PositionGroup).where(PositionGroup.status == "active"))
+        marked = sum(1 for group in result.scalars().all() if self.mark_to_market(group))
+        if marked:
+            await self.db.flush()
+        return marked
+
+    async def find_eligible_losers(self) -> list[PositionGroup]:
+        """
+        The highest-priority eligible losing group of each user, in one query.
+        Applies the same activation rules as `should_activate_risk_engine`,
+        and leaves out groups blocked from the risk engine, including losers
+        already offset.
         """
-        # This is a placeholder. In a real-world application, you would
-        # query the database for all live position groups, and then
-        # evaluate the risk conditions for each one.
-        pass
+        stats = pyramid_stats()
+        filters = [
+            PositionGroup.status == "active",
+            PositionGroup.risk_blocked.isnot(True),
+            PositionGroup.unrealized_pnl_percent <= self.config.loss_threshold_percent,
+        ]
+        if self.config.require_full_pyramids:
+            filters.append(stats.c.pyramid_count >= FULL_PYRAMID_COUNT)
+        if self.post_full_wait_minutes > 0:
+            filters.append(stats.c.last_entry_at <= datetime.utcnow() - timedelta(minutes=self.post_full_wait_minutes))
+
+        ranked = (
+            select(
+                PositionGroup.id.label("group_id"),
+                func.row_number().over(
+                    partition_by=PositionGroup.user_id,
+                    order_by=self._loser_ordering(),
+                ).label("rank"),
+            )
+            .join(stats, stats.c.group_id == PositionGroup.id)
+            .where(*filters)
+            .subquery()
+        )
+        result = await self.db.execute(
+            select(PositionGroup)
+            .join(ranked, ranked.c.group_id == PositionGroup.id)
+            .where(ranked.c.rank == 1)
+        )
+        return result.scalars().all()
+
+    async def find_top_winners(self, user_ids: set[UUID], limit: int = None) -> dict[UUID, list[PositionGroup]]:
+        """
+        Up to `limit` (max_winners_to_combine) most profitable groups per user, in one query.
+        """
+        if limit is None:
+            limit = self.config.max_winners_to_combine
+        ranked = (
+            select(
+                PositionGroup.id.label("group_id"),
+                func.row_number().over(
+                    partition_by=PositionGroup.user_id,
+                    order_by=self._winner_ordering(),
+                ).label("rank"),
+            )
+            .where(
+                PositionGroup.user_id.in_(user_ids),
+                PositionGroup.status == "active",
+                PositionGroup.unrealized_pnl_usd > 0,
+            )
+            .subquery()
+        )
+        result = await self.db.execute(
+            select(PositionGroup)
+            .join(ranked, ranked.c.group_id == PositionGroup.id)
+            .where(ranked.c.rank <= limit)
+            .order_by(PositionGroup.user_id, ranked.c.rank)
+        )
+        winners_by_user: dict[UUID, list[PositionGroup]] = {}
+        for winner in result.scalars().all():
+            winners_by_user.setdefault(winner.user_id, []).append(winner)
+        return winners_by_user
+
+    @staticmethod
+    def _loser_ordering():
+        return (
+            PositionGroup.unrealized_pnl_percent.asc(),
+            PositionGroup.unrealized_pnl_usd.asc(),
+            PositionGroup.created_at.asc(),
+        )
+
+    @staticmethod
+    def _winner_ordering():
+        return (PositionGroup.unrealized_pnl_usd.desc(), PositionGroup.created_at.asc())
+
+    def mark_to_market(self, position_group: PositionGroup) -> bool:
+        """
+        Recompute unrealized PnL from the shared price feed, without network I/O.
+        Returns False when no fresh price is available for the group's symbol.
+        """
+        price_feed.subscribe(position_group.exchange, position_group.symbol)
+        current_price = price_feed.get_price(position_group.exchange, position_group.symbol)
+        if current_price is None or not position_group.total_filled_quantity:
+            return False
+
+        entry_price = position_group.weighted_avg_entry
+        if position_group.side == "short":
+            pnl_usd = (entry_price - current_price) * position_group.total_filled_quantity
+        else:
+            pnl_usd = (current_price - entry_price) * position_group.total_filled_quantity
+
+        position_group.unrealized_pnl_usd = pnl_usd
+        if position_group.total_invested_usd:
+            position_group.unrealized_pnl_percent = pnl_usd / position_group.total_invested_usd * 100
+        return True
 
     async def should_activate_risk_engine(self, position_group: PositionGroup, unrealized_pnl_percent: Decimal) -> bool:
         """
@@ -32,109 +278,149 @@ class RiskEngine:
         - Loss percent is below the threshold.
         - It must also respect the `timer_start_condition` from the config.
         """
+        # Pyramid count and last entry time come from a single aggregated query
+        result = await self.db.execute(
+            select(
+                func.count(Pyramid.id).label("pyramid_count"),
+                func.max(Pyramid.entry_timestamp).label("last_entry_at"),
+            ).where(Pyramid.group_id == position_group.id)
+        )
+        pyramid_count, last_entry_at = (await result).one()
+
         # 1. Check if all 5 pyramids are received (if required by config)
-        if settings.RISK_REQUIRE_FULL_PYRAMIDS:
-            result = await self.db.execute(
-                select(func.count())
-                .select_from(Pyramid)
-                .where(Pyramid.group_id == position_group.id)
-            )
-            pyramid_count = (await result).scalar_one()
-            if pyramid_count < 5:
-                return False
+        if self.config.require_full_pyramids and pyramid_count < FULL_PYRAMID_COUNT:
+            return False
 
         # 2. Check if loss percent is below the threshold
-        if unrealized_pnl_percent > settings.RISK_LOSS_THRESHOLD_PERCENT:
+        if unrealized_pnl_percent > self.config.loss_threshold_percent:
             return False
 
         # 3. Check post-full waiting time (implicitly assuming 'pyramid_full' as timer_start_condition)
-        if settings.RISK_POST_FULL_WAIT_MINUTES > 0:
-            # Find the creation time of the last pyramid entry
-            result = await self.db.execute(
-                select(Pyramid)
-                .where(Pyramid.group_id == position_group.id)
-                .order_by(Pyramid.entry_timestamp.desc())
-            )
-            last_pyramid = (await result).scalars().first()
-
-            if last_pyramid:
-                wait_time_seconds = settings.RISK_POST_FULL_WAIT_MINUTES * 60
-                time_since_last_pyramid = (datetime.utcnow() - last_pyramid.entry_timestamp).total_seconds()
-                if time_since_last_pyramid < wait_time_seconds:
-                    return False
-            else:
+        if self.post_full_wait_minutes > 0:
+            if last_entry_at is None:
+                return False
+            wait_time_seconds = self.post_full_wait_minutes * 60
+            time_since_last_pyramid = (datetime.utcnow() - last_entry_at).total_seconds()
+            if time_since_last_pyramid < wait_time_seconds:
                 return False
 
         return True
 
-    async def find_losing_positions(self, user_id: UUID) -> list[PositionGroup]:
+    async def find_losing_positions(self, user_id: UUID, limit: int = None) -> list[PositionGroup]:
         """
         Find all losing positions for a user, ranked by priority for risk mitigation.
         Ranking rules: 1) highest loss percent, 2) highest unrealized dollar loss, 3) oldest trade.
+        The ranking is done by the database.
         """
-        result = await self.db.execute(
-            select(PositionGroup).where(
+        query = (
+            select(PositionGroup)
+            .where(
                 PositionGroup.user_id == user_id,
                 PositionGroup.status == "active",
                 PositionGroup.unrealized_pnl_percent < 0
             )
+            .order_by(*self._loser_ordering())
         )
-        losing_positions = (await result).scalars().all()
-
-        sorted_losing_positions = sorted(
-            losing_positions,
-            key=lambda pg: (pg.unrealized_pnl_percent, pg.unrealized_pnl_usd, pg.created_at),
-            reverse=False
-        )
+        if limit is not None:
+            query = query.limit(limit)
+        result = await self.db.execute(query)
+        return (await result).scalars().all()
 
-        return sorted_losing_positions
-
-    async def find_winning_positions(self, user_id: UUID) -> list[PositionGroup]:
+    async def find_winning_positions(self, user_id: UUID, limit: int = None) -> list[PositionGroup]:
         """
-        Find all winning positions for a user, ranked by highest profit in USD.
+        Find the winning positions for a user, ranked by highest profit in USD.
+        At most `limit` (max_winners_to_combine) positions are returned.
         """
+        if limit is None:
+            limit = self.config.max_winners_to_combine
         result = await self.db.execute(
-            select(PositionGroup).where(
+            select(PositionGroup)
+            .where(
                 PositionGroup.user_id == user_id,
                 PositionGroup.status == "active",
                 PositionGroup.unrealized_pnl_usd > 0
             )
+            .order_by(*self._winner_ordering())
+            .limit(limit)
         )
-        winning_positions = (await result).scalars().all()
+        return (await result).scalars().all()
 
-        sorted_winning_positions = sorted(
-            winning_positions,
-            key=lambda pg: pg.unrealized_pnl_usd,
-            reverse=True
-        )
+    def plan_offset(self, losing_position: PositionGroup, winning_positions: list[PositionGroup]) -> OffsetPlan:
+        """
+        Compute the full offset plan without touching the exchange: up to
+        max_winners_to_combine winners, each closing just enough to cover the
+        loss, skipping closes below min_close_notional.
+        """
+        plan = OffsetPlan(losing_position, abs(losing_position.unrealized_pnl_usd))
+        remaining = plan.required_usd
+
+        for winner in winning_positions[:self.config.max_winners_to_combine]:
+            if remaining <= 0:
+                break
+            profit_to_realize = min(remaining, winner.unrealized_pnl_usd)
+
+            # Close the share of the position that carries this much of its profit,
+            # valued at the mark price implied by the stored PnL.
+            quantity = winner.total_filled_quantity * profit_to_realize / winner.unrealized_pnl_usd
+            pnl_per_unit = winner.unrealized_pnl_usd / winner.total_filled_quantity
+            if winner.side == "short":
+                mark_price = winner.weighted_avg_entry - pnl_per_unit
+            else:
+                mark_price = winner.weighted_avg_entry + pnl_per_unit
+            notional = quantity * mark_price
+
+            if notional < self.config.min_close_notional:
+                plan.skipped.append({
+                    "group_id": str(winner.id),
+                    "reason": f"notional {notional} below min_close_notional {self.config.min_close_notional}",
+                })
+                continue
 
-        return sorted_winning_positions
+            plan.legs.append(OffsetLeg(winner, profit_to_realize, quantity, notional))
+            remaining -= profit_to_realize
+
+        return plan
 
     async def execute_risk_mitigation(
-        self, losing_position: PositionGroup, winning_positions: list[PositionGroup]
-    ) -> None:
+        self, losing_position: PositionGroup, winning_positions: list[PositionGroup], dry_run: bool = False
+    ) -> OffsetPlan:
         """
         Execute a risk mitigation strategy by partially closing winning positions
         to cover the losses of a losing position.
+        The plan is computed first, the partial closes run concurrently (bounded
+        per exchange, each on its own session), and then, one at a time on this
+        engine's session, every actual fill is applied to its winner and booked
+        as realized PnL, and the plan is recorded as one RiskAction in the
+        caller's transaction. Once any of its loss is covered, the loser is
+        blocked from the risk engine in that same transaction, so later passes
+        do not offset it again. With `dry_run`, or when partial closes are
+        disabled in the config, the plan is only returned.
         """
-        required_usd = abs(losing_position.unrealized_pnl_usd)
-        realized_profit = Decimal("0.0")
-        winning_positions_used = []
+        plan = self.plan_offset(losing_position, winning_positions)
+        if dry_run or not self.config.partial_close_enabled or not plan.legs:
+            return plan
 
-        for winner in winning_positions:
-            if realized_profit >= required_usd:
-                break
+        started = time.perf_counter()
+        await self._warm_clients(plan.legs)
+        semaphores = {}
+        for leg in plan.legs:
+            if leg.winner.exchange not in semaphores:
+                semaphores[leg.winner.exchange] = asyncio.Semaphore(settings.RISK_OFFSET_CONCURRENCY_PER_EXCHANGE)
+        await asyncio.gather(*[
+            self._execute_leg(leg, semaphores[leg.winner.exchange])
+            for leg in plan.legs if leg.status == "planned"
+        ])
+        plan.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+        if any(leg.status == "closed" for leg in plan.legs):
+            losing_position.risk_blocked = True
+        for leg in plan.legs:
+            if leg.status == "closed":
+                await self._book_fill(leg)
 
-            profit_to_realize = min(required_usd - realized_profit, winner.unrealized_pnl_usd)
-            
-            await place_partial_close_order(
-                db=self.db,
-                position_group=winner,
-                usd_amount_to_realize=profit_to_realize
-            )
-            
-            realized_profit += profit_to_realize
-            winning_positions_used.append(winner)
+        failed = [leg for leg in plan.legs if leg.status == "failed"]
+        notes = f"Partial close of winning positions to cover loss. Realized {plan.realized_usd} of {plan.required_usd} USD in {plan.latency_ms} ms."
+        if failed:
+            notes += f" {len(failed)} of {len(plan.legs)} closes failed."
 
         # Log the operation
         risk_action_entry = RiskAction(
@@ -142,10 +428,69 @@ class RiskEngine:
             action_type="offset_loss",
             loser_group_id=losing_position.id,
             loser_pnl_usd=losing_position.unrealized_pnl_usd,
-            winner_details=[{"group_id": str(w.id), "pnl_usd": str(w.unrealized_pnl_usd)} for w in winning_positions_used],
-            notes="Partial close of winning positions to cover loss."
+            winner_details=[leg.to_dict() for leg in plan.legs] + [dict(entry, status="skipped") for entry in plan.skipped],
+            notes=notes
         )
         self.db.add(risk_action_entry)
+        return plan
+
+    async def _warm_clients(self, legs: list[OffsetLeg]) -> None:
+        """
+        Load each winner's exchange client up front, so a missing or rejected
+        config fails its leg before anything is sent and the concurrent closes
+        find their clients already pooled.
+        """
+        warmed = {}
+        for leg in legs:
+            key = (leg.winner.user_id, leg.winner.exchange)
+            if key not in warmed:
+                try:
+                    await client_pool.acquire(self.db, *key)
+                    warmed[key] = None
+                except Exception as e:
+                    warmed[key] = str(e)
+            if warmed[key] is not None:
+                leg.status = "failed"
+                leg.error = warmed[key]
+
+    async def _execute_leg(self, leg: OffsetLeg, semaphore: asyncio.Semaphore) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async for db in self.session_factory():
+                    with request_priority(Priority.EXIT):
+                        order = await place_partial_close_order(
+                            db=db,
+                            position_group=leg.winner,
+                            quantity=leg.quantity,
+                            mark_price=leg.mark_price,
+                        )
+                leg.filled, leg.fill_price = order_fill(order)
+                if not leg.filled:
+                    raise RuntimeError(f"Close order {order.get('id')} did not fill")
+                leg.status = "closed"
+            except Exception as e:
+                leg.status = "failed"
+                leg.error = str(e)
+                print(f"Error closing winner {leg.winner.id} for risk offset: {e}")
+            leg.latency_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    async def _book_fill(self, leg: OffsetLeg) -> None:
+        """Takes a winner's actual partial fill off the group and books its realized PnL."""
+        winner = leg.winner
+        leg.realized_usd = position_pnl(winner, leg.filled, winner.weighted_avg_entry, leg.fill_price)
+        remaining = 1 - min(leg.filled / winner.total_filled_quantity, Decimal("1"))
+        winner.total_filled_quantity = winner.total_filled_quantity * remaining
+        winner.total_invested_usd = (winner.total_invested_usd or Decimal("0")) * remaining
+        winner.unrealized_pnl_usd = winner.unrealized_pnl_usd * remaining
+        await record_realized_pnl(self.db, winner, leg.realized_usd)
 
 def get_risk_engine(db: AsyncSession = Depends(get_async_db)) -> RiskEngine:
     return RiskEngine(db)
+
+async def evaluate_risk_conditions() -> None:
+    """
+    Scheduler entry point: one portfolio-wide risk evaluation pass.
+    """
+    async for db in get_async_db():
+        await RiskEngine(db).evaluate_risk_conditions()
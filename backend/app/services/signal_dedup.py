@@ -0,0 +1,121 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from uuid import UUID
+from ..services.metrics_service import metrics
+from ..core.config import settings
+
+# TradingView fields that identify the bar an alert fired on, most specific first.
+BAR_TIME_FIELDS = ("bar_time", "time", "timestamp")
+
+def signal_fingerprint(user_id: UUID, tv_data: Dict[str, Any], execution_intent: Dict[str, Any], timestamp: Optional[str] = None) -> str:
+    """
+    Stable fingerprint of a signal: user, exchange, symbol, timeframe, action
+    and bar time. Re-deliveries and the same alert fired from several charts
+    map to the same value. Without a bar time the whole payload is hashed, so
+    only byte-identical re-deliveries collide.
+    """
+    bar_time = next((tv_data[field] for field in BAR_TIME_FIELDS if tv_data.get(field) not in (None, "")), timestamp)
+    action = tv_data.get("action") or execution_intent.get("side") or execution_intent.get("action")
+    identity = {
+        "user_id": str(user_id),
+        "exchange": str(tv_data.get("exchange", "")).lower(),
+        "symbol": str(tv_data.get("symbol", "")).upper(),
+        "timeframe": str(tv_data.get("timeframe", "")),
+        "action": str(action or "").lower(),
+    }
+    if bar_time not in (None, ""):
+        identity["bar_time"] = str(bar_time)
+    else:
+        identity["tv"] = tv_data
+        identity["execution_intent"] = execution_intent
+    canonical = json.dumps(identity, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+class SeenFingerprints:
+    """Bounded in-process set of recently seen fingerprints with a per-entry TTL."""
+    def __init__(self, maxsize: int, ttl_seconds: float):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, fingerprint: str) -> bool:
+        expires_at = self._entries.get(fingerprint)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._entries[fingerprint]
+            return False
+        return True
+
+    def add(self, fingerprint: str) -> None:
+        self._entries[fingerprint] = time.monotonic() + self.ttl_seconds
+        self._entries.move_to_end(fingerprint)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def discard(self, fingerprint: str) -> None:
+        self._entries.pop(fingerprint, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SignalDeduplicator:
+    """
+    Rejects duplicate webhook deliveries in O(1) without touching Postgres.
+    The in-process set answers repeats seen by this worker; Redis
+    `SET NX EX` is the shared source of truth across workers. If Redis is
+    unavailable the check degrades to the local set rather than dropping
+    signals.
+    """
+    def __init__(self, redis_factory: Callable = None):
+        self.redis_factory = redis_factory
+        self.ttl_seconds = settings.SIGNAL_DEDUP_TTL_SECONDS
+        self.local = SeenFingerprints(settings.SIGNAL_DEDUP_LOCAL_SIZE, settings.SIGNAL_DEDUP_TTL_SECONDS)
+        self._redis = None
+
+    async def _get_redis(self):
+        if self._redis is None:
+            if self.redis_factory is not None:
+                self._redis = await self.redis_factory()
+            else:
+                from ..services.precision_service import get_redis_client
+                self._redis = await get_redis_client()
+        return self._redis
+
+    @staticmethod
+    def _key(fingerprint: str) -> str:
+        return f"signal_dedup:{fingerprint}"
+
+    async def claim(self, fingerprint: str) -> bool:
+        """
+        Records the fingerprint and returns True if it was not seen within the
+        TTL, False for a duplicate.
+        """
+        if fingerprint in self.local:
+            metrics.incr("signal_dedup_duplicates", tier="local")
+            return False
+        try:
+            redis = await self._get_redis()
+            claimed = await redis.set(self._key(fingerprint), "1", nx=True, ex=self.ttl_seconds)
+        except Exception as e:
+            print(f"Error checking signal fingerprint in Redis: {e}")
+            claimed = True
+        self.local.add(fingerprint)
+        if not claimed:
+            metrics.incr("signal_dedup_duplicates", tier="redis")
+            return False
+        return True
+
+    async def release(self, fingerprint: str) -> None:
+        """Forgets a claimed fingerprint so a retry of a failed signal is accepted."""
+        self.local.discard(fingerprint)
+        try:
+            redis = await self._get_redis()
+            await redis.delete(self._key(fingerprint))
+        except Exception as e:
+            print(f"Error releasing signal fingerprint: {e}")
+
+signal_dedup = SignalDeduplicator()
@@ -0,0 +1,97 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Tuple
+from uuid import UUID
+from ..services.metrics_service import metrics
+from ..core.config import settings
+
+SignalKey = Tuple[str, str, str, str]
+
+def signal_key(user_id: UUID, tv_data: Dict[str, Any]) -> SignalKey:
+    """
+    Serialization key of a signal: everything that targets the same position
+    group (entries, pyramids, exits) shares it.
+    """
+    return (str(user_id), str(tv_data.get("exchange")), str(tv_data.get("symbol")), str(tv_data.get("timeframe")))
+
+class ShardedSignalExecutor:
+    """
+    Runs signal jobs strictly in submission order per key, and different keys
+    concurrently (bounded by `max_concurrency`). A key's drain task exists only
+    while it has work, so idle keys cost nothing.
+    """
+    def __init__(self, max_concurrency: int):
+        self.max_concurrency = max_concurrency
+        self._semaphore = None
+        self._backlogs: Dict[SignalKey, Deque[Tuple[Callable[[], Awaitable], asyncio.Future, float]]] = {}
+        self._tasks: Dict[SignalKey, asyncio.Task] = {}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def submit(self, key: SignalKey, job: Callable[[], Awaitable]) -> asyncio.Future:
+        """
+        Queues `job` behind any pending jobs for `key` and returns a future for
+        its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._backlogs.setdefault(key, deque()).append((job, future, time.monotonic()))
+        if key not in self._tasks:
+            self._tasks[key] = asyncio.create_task(self._drain(key))
+        self._report()
+        return future
+
+    async def run(self, key: SignalKey, job: Callable[[], Awaitable]) -> Any:
+        """Submits `job` and waits for its result."""
+        return await self.submit(key, job)
+
+    async def _drain(self, key: SignalKey) -> None:
+        backlog = self._backlogs[key]
+        try:
+            while backlog:
+                job, future, queued_at = backlog.popleft()
+                if future.cancelled():
+                    continue
+                async with self._get_semaphore():
+                    started = time.monotonic()
+                    metrics.observe("signal_executor_wait_seconds", started - queued_at)
+                    try:
+                        result = await job()
+                    except Exception as e:
+                        metrics.incr("signal_executor_failures")
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+                    metrics.observe("signal_executor_job_seconds", time.monotonic() - started)
+                    metrics.incr("signal_executor_processed")
+                self._report()
+        finally:
+            # Only reached early if the drain task itself was cancelled
+            for _, future, _ in backlog:
+                future.cancel()
+            del self._backlogs[key]
+            del self._tasks[key]
+            self._report()
+
+    def backlog(self) -> Dict[SignalKey, int]:
+        """Jobs still waiting per key (excluding the one currently running)."""
+        return {key: len(jobs) for key, jobs in self._backlogs.items()}
+
+    def _report(self) -> None:
+        sizes = [len(jobs) for jobs in self._backlogs.values()]
+        metrics.gauge("signal_executor_active_shards", len(sizes))
+        metrics.gauge("signal_executor_queued", sum(sizes))
+        metrics.gauge("signal_executor_max_shard_backlog", max(sizes, default=0))
+
+    async def join(self) -> None:
+        """Waits until every submitted job has finished."""
+        while self._tasks:
+            await asyncio.gather(*list(self._tasks.values()), return_exceptions=True)
+
+signal_executor = ShardedSignalExecutor(settings.SIGNAL_EXECUTOR_CONCURRENCY)
@@ -0,0 +1,270 @@
+import asyncio
+import json
+import os
+import socket
+import time
+from typing import Any, Callable, Dict, List, Optional
+from uuid import UUID
+from ..services.metrics_service import metrics
+from ..services.signal_executor import ShardedSignalExecutor, SignalKey, signal_executor, signal_key
+from ..db.session import get_async_db
+from ..core.config import settings
+
+REQUIRED_TV_FIELDS = ("exchange", "symbol", "timeframe")
+
+def missing_signal_fields(tv_data: Dict[str, Any]) -> List[str]:
+    """Fields the worker needs that are absent from the `tv` block."""
+    return [field for field in REQUIRED_TV_FIELDS if tv_data.get(field) in (None, "")]
+
+def entry_age_seconds(entry_id: str) -> float:
+    """Stream ids start with the server's millisecond timestamp."""
+    return max(0.0, time.time() - int(entry_id.split("-", 1)[0]) / 1000)
+
+class SignalInbox:
+    """
+    Durable intake queue for webhook signals, backed by a Redis Stream with a
+    consumer group. The webhook only appends to the stream and returns; the
+    consumer hands each batch to the sharded signal executor, so signals for
+    the same position group keep their order while different keys run in
+    parallel. Entries are acknowledged after processing. When an entry
+    fails, its key is held: later entries for that key wait behind it, and
+    the held entries are retried in order every `retry_seconds`. An entry
+    that fails `max_attempts` times, or cannot be parsed, is moved to the
+    dead-letter stream, which releases the entries behind it. The consumer
+    name changes with every process, so entries left pending by a dead
+    consumer are taken over with XAUTOCLAIM once they have been idle for
+    `claim_idle_ms`, at startup and then periodically.
+    """
+    def __init__(self, redis_factory: Callable = None, session_factory: Callable = None, processor: Callable = None, executor: ShardedSignalExecutor = None):
+        self.redis_factory = redis_factory
+        self.executor = executor or signal_executor
+        self.session_factory = session_factory or get_async_db
+        self.processor = processor
+        self.stream = settings.SIGNAL_INBOX_STREAM
+        self.group = settings.SIGNAL_INBOX_GROUP
+        self.consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = settings.SIGNAL_INBOX_BATCH_SIZE
+        self.block_ms = settings.SIGNAL_INBOX_BLOCK_MS
+        self.claim_idle_ms = settings.SIGNAL_INBOX_CLAIM_IDLE_MS
+        self.claim_interval = settings.SIGNAL_INBOX_CLAIM_INTERVAL_SEC
+        self.retry_seconds = settings.SIGNAL_INBOX_RETRY_SEC
+        self.max_attempts = settings.SIGNAL_INBOX_MAX_ATTEMPTS
+        self.dead_letter_stream = settings.SIGNAL_INBOX_DEAD_LETTER_STREAM
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+        # Keys with a failed entry: the failed entry first, then the ones held behind it
+        self._held: Dict[SignalKey, Dict[str, Dict[str, str]]] = {}
+        self._retry_at: Dict[SignalKey, float] = {}
+        self._attempts: Dict[str, int] = {}
+
+    async def _get_redis(self):
+        if self._redis is None:
+            if self.redis_factory is not None:
+                self._redis = await self.redis_factory()
+            else:
+                from ..services.precision_service import get_redis_client
+                self._redis = await get_redis_client()
+        return self._redis
+
+    async def enqueue(self, user_id: UUID, tv_data: Dict[str, Any], execution_intent: Dict[str, Any]) -> str:
+        """Appends a signal to the stream and returns its entry id."""
+        redis = await self._get_redis()
+        entry_id = await redis.xadd(
+            self.stream,
+            {
+                "user_id": str(user_id),
+                "tv": json.dumps(tv_data),
+                "execution_intent": json.dumps(execution_intent),
+            },
+            maxlen=settings.SIGNAL_INBOX_MAXLEN,
+            approximate=True,
+        )
+        metrics.incr("signal_inbox_enqueued")
+        return entry_id
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        redis = await self._get_redis()
+        try:
+            await redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+        except Exception as e:
+            # BUSYGROUP: the group survives restarts
+            if "BUSYGROUP" not in str(e):
+                raise
+        self._task = asyncio.create_task(self._consume())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def dispatch(self, entries) -> None:
+        """
+        Submits a batch of stream entries to the executor in stream order and
+        waits for the batch, which bounds how much is read ahead.
+        """
+        futures = []
+        for entry_id, fields in entries:
+            try:
+                key = signal_key(fields["user_id"], json.loads(fields["tv"]))
+            except (KeyError, TypeError, ValueError) as e:
+                await self.dead_letter(entry_id, fields, e)
+                continue
+            futures.append(self.executor.submit(
+                key, lambda key=key, entry_id=entry_id, fields=fields: self._process(key, entry_id, fields)
+            ))
+        await asyncio.gather(*futures, return_exceptions=True)
+
+    async def _process(self, key: SignalKey, entry_id: str, fields: Dict[str, str]) -> bool:
+        held = self._held.get(key)
+        if held is not None:
+            # An earlier entry for this key is waiting for its retry
+            held.setdefault(entry_id, fields)
+            return False
+        if await self.handle(entry_id, fields):
+            return True
+        self._held[key] = {entry_id: fields}
+        self._retry_at[key] = time.monotonic() + self.retry_seconds
+        return False
+
+    async def retry_held(self) -> int:
+        """
+        Retries the held keys whose backoff has passed, each in order on the
+        executor. Returns the number of keys retried.
+        """
+        now = time.monotonic()
+        due = [key for key, retry_at in self._retry_at.items() if retry_at <= now]
+        for key in due:
+            # Not due again while this retry is queued or running
+            self._retry_at[key] = float("inf")
+        await asyncio.gather(
+            *[self.executor.submit(key, lambda key=key: self._drain(key)) for key in due],
+            return_exceptions=True,
+        )
+        return len(due)
+
+    async def _drain(self, key: SignalKey) -> None:
+        held = self._held.get(key, {})
+        while held:
+            entry_id, fields = next(iter(held.items()))
+            if not await self.handle(entry_id, fields):
+                self._retry_at[key] = time.monotonic() + self.retry_seconds
+                return
+            del held[entry_id]
+        self._held.pop(key, None)
+        self._retry_at.pop(key, None)
+
+    async def dead_letter(self, entry_id: str, fields: Dict[str, str], error: Exception) -> None:
+        """Copies an entry to the dead-letter stream with its error, then acknowledges it."""
+        redis = await self._get_redis()
+        await redis.xadd(
+            self.dead_letter_stream,
+            {**(fields or {}), "entry_id": entry_id, "error": str(error)},
+            maxlen=settings.SIGNAL_INBOX_MAXLEN,
+            approximate=True,
+        )
+        await redis.xack(self.stream, self.group, entry_id)
+        metrics.incr("signal_inbox_dead_lettered")
+        print(f"Moved inbox signal {entry_id} to {self.dead_letter_stream}: {error}")
+
+    async def claim_stale(self) -> int:
+        """
+        Takes over entries that any consumer left unacknowledged for longer
+        than `claim_idle_ms` and processes them. Returns the number claimed.
+        """
+        redis = await self._get_redis()
+        claimed = 0
+        start_id = "0-0"
+        while True:
+            response = await redis.xautoclaim(
+                self.stream, self.group, self.consumer, self.claim_idle_ms,
+                start_id=start_id, count=self.batch_size,
+            )
+            start_id, entries = response[0], response[1]
+            # Entries trimmed from the stream come back without fields; nothing to process
+            for entry_id, fields in entries:
+                if not fields:
+                    await redis.xack(self.stream, self.group, entry_id)
+            entries = [(entry_id, fields) for entry_id, fields in entries if fields]
+            claimed += len(entries)
+            await self.dispatch(entries)
+            if start_id == "0-0":
+                break
+        if claimed:
+            metrics.incr("signal_inbox_claimed", value=claimed)
+        return claimed
+
+    async def _consume(self) -> None:
+        redis = await self._get_redis()
+        # Walk our pending list first (entries read but never acknowledged),
+        # then switch to new entries, claiming stale ones from other consumers
+        # every `claim_interval` seconds.
+        cursor = "0"
+        last_claim = None
+        while True:
+            try:
+                recovering = cursor != ">"
+                if not recovering and (last_claim is None or time.monotonic() - last_claim >= self.claim_interval):
+                    last_claim = time.monotonic()
+                    await self.claim_stale()
+                await self.retry_held()
+                response = await redis.xreadgroup(
+                    self.group, self.consumer, {self.stream: cursor},
+                    count=self.batch_size, block=None if recovering else self.block_ms,
+                )
+                entries = response[0][1] if response else []
+                if recovering:
+                    cursor = entries[-1][0] if entries else ">"
+                await self.dispatch(entries)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error reading signal inbox: {e}")
+                await asyncio.sleep(1)
+
+    async def handle(self, entry_id: str, fields: Dict[str, str]) -> bool:
+        """
+        Processes one inbox entry and acknowledges it. Returns False when it
+        failed and stays pending for a retry; on its `max_attempts`-th
+        failure it is dead-lettered instead.
+        """
+        metrics.observe("signal_inbox_lag_seconds", entry_age_seconds(entry_id))
+        processor = self.processor
+        if processor is None:
+            # Already serialized by the executor
+            from ..services.webhook_service import apply_webhook_signal as processor
+        try:
+            async for db in self.session_factory():
+                await processor(
+                    db,
+                    UUID(fields["user_id"]),
+                    json.loads(fields["tv"]),
+                    json.loads(fields["execution_intent"]),
+                )
+        except Exception as e:
+            metrics.incr("signal_inbox_failures")
+            print(f"Error processing inbox signal {entry_id}: {e}")
+            attempts = self._attempts.get(entry_id, 0) + 1
+            if attempts < self.max_attempts:
+                self._attempts[entry_id] = attempts
+                return False
+            self._attempts.pop(entry_id, None)
+            await self.dead_letter(entry_id, fields, e)
+            return True
+        self._attempts.pop(entry_id, None)
+        redis = await self._get_redis()
+        await redis.xack(self.stream, self.group, entry_id)
+        metrics.incr("signal_inbox_processed")
+        return True
+
+signal_inbox = SignalInbox()
@@ -0,0 +1,95 @@
+from decimal import Decimal, ROUND_HALF_UP
+from typing import List, Optional, Tuple
+
+DECIMAL_PLACES = "decimal_places"
+TICK_SIZE = "tick_size"
+
+def _quantum(value, precision_mode: Optional[str]) -> Decimal:
+    """
+    Converts a ccxt precision value into a Decimal quantum. Decimal-places
+    exchanges report digit counts (ints); tick-size exchanges report the step
+    itself. Without an explicit mode, ints are read as digit counts.
+    """
+    if precision_mode == DECIMAL_PLACES or (precision_mode is None and isinstance(value, int)):
+        return Decimal(1).scaleb(-int(value))
+    quantum = Decimal(str(value))
+    if quantum == quantum.to_integral_value():
+        # 1.0 -> 1, so results carry no spurious decimal places
+        quantum = quantum.quantize(Decimal(1))
+    return quantum
+
+def _is_power_of_ten(quantum: Decimal) -> bool:
+    """True for 1, 0.1, 0.01, ... which round with a plain quantize."""
+    return quantum <= 1 and quantum.normalize().as_tuple().digits == (1,)
+
+def _optional_decimal(value) -> Optional[Decimal]:
+    if value is None:
+        return None
+    return Decimal(str(value))
+
+class SymbolRounding:
+    """
+    Precompiled rounding rules for one symbol, built once from its cached
+    precision rules. Rounds with Decimal arithmetic only, so small ticks are
+    exact and there is no float/string round trip per leg.
+    """
+    __slots__ = ("price_tick", "amount_step", "min_amount", "min_notional", "_price_exact", "_amount_exact")
+
+    def __init__(self, price_tick: Decimal, amount_step: Decimal, min_amount: Decimal = None, min_notional: Decimal = None):
+        self.price_tick = price_tick
+        self.amount_step = amount_step
+        self.min_amount = min_amount
+        self.min_notional = min_notional
+        # Power-of-ten quanta round with a single quantize.
+        self._price_exact = _is_power_of_ten(price_tick)
+        self._amount_exact = _is_power_of_ten(amount_step)
+
+    @classmethod
+    def from_rules(cls, rules: dict) -> "SymbolRounding":
+        precision_mode = rules.get('precision_mode')
+        return cls(
+            price_tick=_quantum(rules['price'], precision_mode),
+            amount_step=_quantum(rules['amount'], precision_mode),
+            min_amount=_optional_decimal(rules.get('min_amount')),
+            min_notional=_optional_decimal(rules.get('min_notional')),
+        )
+
+    @staticmethod
+    def _round(value: Decimal, quantum: Decimal, exact: bool) -> Decimal:
+        if exact:
+            return value.quantize(quantum, rounding=ROUND_HALF_UP)
+        return ((value / quantum).quantize(Decimal(1), rounding=ROUND_HALF_UP) * quantum).quantize(quantum)
+
+    def round_price(self, price: Decimal) -> Decimal:
+        return self._round(price, self.price_tick, self._price_exact)
+
+    def round_amount(self, amount: Decimal) -> Decimal:
+        return self._round(amount, self.amount_step, self._amount_exact)
+
+    def round_leg(self, quantity: Decimal, price: Decimal) -> Tuple[Decimal, Decimal]:
+        return self.round_amount(quantity), self.round_price(price)
+
+    def check_leg(self, quantity: Decimal, price: Decimal) -> Optional[str]:
+        """Returns why a rounded leg would be rejected by the exchange, or None."""
+        if quantity <= 0:
+            return f"quantity {quantity} rounds to zero"
+        if self.min_amount is not None and quantity < self.min_amount:
+            return f"quantity {quantity} below min amount {self.min_amount}"
+        if self.min_notional is not None and quantity * price < self.min_notional:
+            return f"notional {quantity * price} below min notional {self.min_notional}"
+        return None
+
+    def round_grid(self, legs: List[Tuple[Decimal, Decimal]]) -> List[Tuple[Decimal, Decimal]]:
+        """
+        Rounds a whole grid of (quantity, price) legs and enforces the minimums.
+        Raises ValueError listing every leg that would be rejected.
+        """
+        rounded = [self.round_leg(quantity, price) for quantity, price in legs]
+        errors = [
+            f"leg {i}: {reason}"
+            for i, (quantity, price) in enumerate(rounded)
+            if (reason := self.check_leg(quantity, price)) is not None
+        ]
+        if errors:
+            raise ValueError("Order grid violates exchange limits: " + "; ".join(errors))
+        return rounded
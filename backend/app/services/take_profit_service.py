@@ -2,17 +2,29 @@ from sqlalchemy.orm import Session
 from sqlalchemy import select
 from ..models.trading_models import PositionGroup, DCAOrder
 from ..services import exchange_manager
+from ..services.price_feed import price_feed
+from ..core.config import settings
 from decimal import Decimal
 from typing import List
 
 async def check_take_profit_conditions() -> None:
     """
     Check for take-profit conditions and execute orders.
+    By default thresholds live in the incremental trigger index, so each run
+    only touches the legs and groups whose target the latest price has
+    crossed. With TP_EVALUATION_MODE "vectorized", every open leg is screened
+    in one NumPy pass per run instead.
     """
-    # This is a placeholder. In a real-world application, you would
-    # query the database for all live position groups, and then check
-    # their take-profit conditions.
-    pass
+    # Imported here: both evaluators build on the helpers in this module.
+    from ..db.session import get_async_db
+    from .tp_evaluator import evaluate_take_profits
+    from .tp_trigger_index import tp_trigger_index
+
+    async for db in get_async_db():
+        if settings.TP_EVALUATION_MODE == "vectorized":
+            await evaluate_take_profits(db)
+        else:
+            await tp_trigger_index.check(db)
 
 async def execute_per_leg_tp(db: Session, position_group: PositionGroup) -> None:
     """
@@ -32,7 +44,7 @@ async def execute_per_leg_tp(db: Session, position_group: PositionGroup) -> None
 
     orders_updated = False
     async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
-        current_price = await manager.get_current_price(position_group.symbol)
+        current_price = await get_current_price(manager, position_group)
         
         tp_config = position_group.tp_config
         price_targets_pct = tp_config["tp_price_targets"]
@@ -41,14 +53,12 @@ async def execute_per_leg_tp(db: Session, position_group: PositionGroup) -> None
             # Ensure we don't try to access a price target that doesn't exist
             if order.dca_level < len(price_targets_pct):
                 tp_multiplier = price_targets_pct[order.dca_level]
-                # Assuming long position for now
-                # In a real scenario, you'd check the position side
-                target_price = order.filled_price * tp_multiplier
+                target_price = calculate_tp_target(order.filled_price, tp_multiplier, position_group.side)
 
-                if current_price >= target_price:
+                if is_target_reached(current_price, target_price, position_group.side):
                     await manager.place_order(
                         symbol=position_group.symbol,
-                        side="sell",
+                        side=closing_side(position_group.side),
                         order_type="market",
                         amount=order.quantity
                     )
@@ -59,6 +69,34 @@ async def execute_per_leg_tp(db: Session, position_group: PositionGroup) -> None
     if orders_updated:
         db.commit()
 
+async def get_current_price(manager, position_group: PositionGroup) -> Decimal:
+    """
+    Reads the group's price from the shared price feed, falling back to a
+    ticker request only when the feed has no fresh tick for the symbol.
+    """
+    price_feed.subscribe(position_group.exchange, position_group.symbol)
+    current_price = price_feed.get_price(position_group.exchange, position_group.symbol)
+    if current_price is None:
+        current_price = await manager.get_current_price(position_group.symbol)
+    return current_price
+
+def calculate_tp_target(entry_price: Decimal, tp_multiplier: Decimal, side: str = "long") -> Decimal:
+    """
+    TP price for an entry. Multipliers are expressed for longs (1.01 = +1%);
+    shorts mirror them below the entry.
+    """
+    if side == "short":
+        return entry_price * (2 - tp_multiplier)
+    return entry_price * tp_multiplier
+
+def is_target_reached(current_price: Decimal, target_price: Decimal, side: str = "long") -> bool:
+    if side == "short":
+        return current_price <= target_price
+    return current_price >= target_price
+
+def closing_side(side: str) -> str:
+    return "buy" if side == "short" else "sell"
+
 def calculate_average_entry_price(orders: List[DCAOrder]) -> Decimal:
     """
     Calculates the weighted average entry price for a list of DCA orders.
@@ -96,20 +134,20 @@ async def execute_aggregate_tp(db: Session, position_group: PositionGroup) -> No
         return # No filled orders or zero average entry price
 
     async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
-        current_price = await manager.get_current_price(position_group.symbol)
+        current_price = await get_current_price(manager, position_group)
 
         tp_config = position_group.tp_config
         # Assuming only one aggregate target for simplicity as per test setup
         tp_multiplier = tp_config["tp_price_targets"][0]
 
-        target_price = average_entry_price * tp_multiplier
+        target_price = calculate_tp_target(average_entry_price, tp_multiplier, position_group.side)
 
-        if current_price >= target_price:
+        if is_target_reached(current_price, target_price, position_group.side):
             total_quantity = sum([order.quantity for order in orders_to_check if order.status == "filled"], Decimal("0.0"))
             if total_quantity > Decimal("0.0"):
                 await manager.place_order(
                     symbol=position_group.symbol,
-                    side="sell",
+                    side=closing_side(position_group.side),
                     order_type="market",
                     amount=total_quantity
                 )
@@ -145,18 +183,18 @@ async def execute_hybrid_tp(db: Session, position_group: PositionGroup) -> None:
         return # Hybrid config missing
 
     async with await exchange_manager.get_exchange(db, position_group.exchange, position_group.user_id) as manager:
-        current_price = await manager.get_current_price(position_group.symbol)
+        current_price = await get_current_price(manager, position_group)
 
-        target_price = average_entry_price * aggregate_profit_target
+        target_price = calculate_tp_target(average_entry_price, aggregate_profit_target, position_group.side)
 
-        if current_price >= target_price:
+        if is_target_reached(current_price, target_price, position_group.side):
             total_quantity = sum([order.quantity for order in orders_to_check if order.status == "filled"], Decimal("0.0"))
             if total_quantity > Decimal("0.0"):
                 quantity_to_close = total_quantity * partial_close_percentage
                 
                 await manager.place_order(
                     symbol=position_group.symbol,
-                    side="sell",
+                    side=closing_side(position_group.side),
                     order_type="market",
                     amount=quantity_to_close
                 )
@@ -1,18 +1,61 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from ..services import order_service, take_profit_service, risk_engine, exchange_manager, precision_service
+from ..services.fill_stream import fill_stream_manager
+from ..services.price_feed import price_feed
+from ..services.queue_loss_tracker import queue_loss_tracker
+from ..services.pool_manager import pool_slots
+# Registers the promoter on pool slot releases made by the TP jobs
+from ..services.queue_promoter import queue_promoter  # noqa: F401
+from ..core.config import settings
 from ..db.session import get_async_db
 
 async def refresh_all_precisions():
     """
-    Iterate through all unique exchange/symbol combinations and refresh their precision cache.
+    Refresh the precision cache for every exchange/symbol combination in use,
+    with one market load per exchange.
     """
-    # TODO: Implement logic to get a database session and query for unique exchange/symbols
-    # from the PositionGroup table. For now, we'll use a placeholder.
-    print("Refreshing precision cache for all active symbols...")
-    # async with get_async_db() as db:
-    #     symbols = db.query(PositionGroup.exchange, PositionGroup.symbol).distinct().all()
-    #     for exchange, symbol in symbols:
-    #         await precision_service.fetch_and_cache_precision_rules(db, exchange, symbol)
+    async for db in get_async_db():
+        pairs = await precision_service.find_symbols_in_use(db)
+    if pairs:
+        service = await precision_service.get_precision_service()
+        await service.refresh_all(pairs)
+
+async def monitor_order_fills():
+    """
+    Reconcile pending DCA orders with the exchanges.
+    Accounts with a healthy fill stream are skipped; the poll only covers
+    exchanges whose stream is down or disabled.
+    """
+    async for db in get_async_db():
+        await order_service.monitor_order_fills(db, exclude=fill_stream_manager.streaming_keys())
+
+async def sync_fill_streams():
+    """
+    Start or stop user-data fill streams to match the enabled exchange configs.
+    """
+    async for db in get_async_db():
+        await fill_stream_manager.sync(db)
+
+async def flush_queue_losses():
+    """
+    Write the queue's repriced loss percentages back in one batch.
+    """
+    async for db in get_async_db():
+        await queue_loss_tracker.flush(db)
+
+async def sync_queue_losses():
+    """
+    Pick up queued signals added or removed by other workers.
+    """
+    async for db in get_async_db():
+        await queue_loss_tracker.sync(db)
+
+async def reconcile_pool_slots():
+    """
+    Reset the cached pool slot counters to the position_groups table.
+    """
+    async for db in get_async_db():
+        await pool_slots.reconcile(db)
 
 def setup_scheduler():
     """
@@ -21,10 +64,17 @@ def setup_scheduler():
     scheduler = AsyncIOScheduler()
     
     # Schedule tasks
-    scheduler.add_job(order_service.monitor_order_fills, 'interval', seconds=10)
-    scheduler.add_job(take_profit_service.check_take_profit_conditions, 'interval', seconds=15)
+    scheduler.add_job(monitor_order_fills, 'interval', seconds=10)
+    scheduler.add_job(take_profit_service.check_take_profit_conditions, 'interval', seconds=settings.PRICE_FEED_REFRESH_SEC)
     scheduler.add_job(risk_engine.evaluate_risk_conditions, 'interval', seconds=30)
-    scheduler.add_job(refresh_all_precisions, 'interval', minutes=5)
+    scheduler.add_job(refresh_all_precisions, 'interval', seconds=settings.EXCHANGE_PRECISION_REFRESH_SEC)
+    scheduler.add_job(exchange_manager.client_pool.evict_idle, 'interval', seconds=60)
+    scheduler.add_job(price_feed.refresh, 'interval', seconds=settings.PRICE_FEED_REFRESH_SEC)
+    scheduler.add_job(flush_queue_losses, 'interval', seconds=settings.QUEUE_LOSS_FLUSH_SEC)
+    scheduler.add_job(sync_queue_losses, 'interval', seconds=settings.QUEUE_LOSS_RESYNC_SEC)
+    scheduler.add_job(reconcile_pool_slots, 'interval', seconds=settings.POOL_RECONCILE_SEC)
+    if settings.FILL_STREAM_ENABLED:
+        scheduler.add_job(sync_fill_streams, 'interval', seconds=60)
     # scheduler.add_job(exchange_manager.validate_exchange_connections, 'interval', minutes=5)
     
     return scheduler
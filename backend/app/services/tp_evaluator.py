@@ -0,0 +1,303 @@
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, List, Optional
+from uuid import UUID
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from ..models.trading_models import PositionGroup, PositionGroupStatus, DCAOrder
+from ..services import exchange_manager
+from ..services.price_feed import price_feed
+from ..services.pool_manager import pool_slots
+from ..services.metrics_service import metrics
+from ..services.pnl_rollup import record_realized_pnl, position_pnl
+from ..services.take_profit_service import is_target_reached, closing_side
+
+ACTIVE_GROUP_STATUSES = (
+    PositionGroupStatus.LIVE,
+    PositionGroupStatus.PARTIALLY_FILLED,
+    PositionGroupStatus.ACTIVE,
+)
+
+# Leg statuses that still hold, or may still add to, a group's position.
+OPEN_LEG_STATUSES = ("pending", "open", "partially_filled")
+
+# Float screening is loosened by this relative margin so that borderline legs
+# are never missed; the Decimal re-check removes the false positives.
+SCREEN_TOLERANCE = 1e-9
+
+def leg_entry_price(leg: DCAOrder) -> Decimal:
+    """The leg's actual fill price, or its grid price before the fill is known."""
+    return leg.avg_fill_price or leg.price
+
+def leg_quantity(leg: DCAOrder) -> Decimal:
+    return leg.filled_quantity or leg.quantity
+
+def percent_target(entry_price: Decimal, percent: Decimal, side: str = "long") -> Decimal:
+    """Price `percent` (1.0 = 1%) in profit from `entry_price`: above it for longs, below it for shorts."""
+    move = Decimal(str(percent)) / Decimal("100")
+    if side == "short":
+        return entry_price * (1 - move)
+    return entry_price * (1 + move)
+
+def leg_tp_target(leg: DCAOrder, side: str) -> Decimal:
+    """
+    A leg's TP is measured from its actual fill price; the grid's `tp_price`
+    stands in until the fill price is known.
+    """
+    if leg.avg_fill_price:
+        return percent_target(leg.avg_fill_price, leg.tp_percent, side)
+    return leg.tp_price
+
+def average_entry_price(legs: List[DCAOrder]) -> Decimal:
+    """Quantity-weighted average fill price of `legs`."""
+    total_quantity = sum((leg_quantity(leg) for leg in legs), Decimal("0"))
+    if total_quantity == 0:
+        return Decimal("0")
+    return sum((leg_entry_price(leg) * leg_quantity(leg) for leg in legs), Decimal("0")) / total_quantity
+
+def aggregate_tp_target(group: PositionGroup, legs: List[DCAOrder]) -> Optional[Decimal]:
+    """Whole-position TP: `tp_aggregate_percent` from the average entry of the open legs."""
+    if group.tp_aggregate_percent is None:
+        return None
+    entry_price = average_entry_price(legs) or group.weighted_avg_entry
+    if not entry_price:
+        return None
+    return percent_target(entry_price, group.tp_aggregate_percent, group.side)
+
+def is_open_leg(leg: DCAOrder) -> bool:
+    return leg.status == "filled" and not leg.tp_hit
+
+def _float(value) -> float:
+    return float(value) if value is not None else np.nan
+
+class TPBook:
+    """
+    Snapshot of the open filled legs of every active position group, by
+    group, with the same legs as NumPy columns for the vectorized screen.
+    Leg columns are aligned by row; group columns are indexed by `leg_group`.
+    """
+    def __init__(self, legs: List[DCAOrder]):
+        self.rows = list(legs)
+        self.groups: List[PositionGroup] = []
+        self.legs: Dict[UUID, List[DCAOrder]] = {}
+        group_index: Dict[UUID, int] = {}
+        leg_group = []
+        for leg in self.rows:
+            group = leg.group
+            if group.id not in self.legs:
+                group_index[group.id] = len(self.groups)
+                self.groups.append(group)
+                self.legs[group.id] = []
+            self.legs[group.id].append(leg)
+            leg_group.append(group_index[group.id])
+
+        self.leg_group = np.array(leg_group, dtype=np.intp)
+        self.fill_price = np.array([_float(leg.avg_fill_price) for leg in self.rows], dtype=np.float64)
+        self.entry_price = np.array([_float(leg_entry_price(leg)) for leg in self.rows], dtype=np.float64)
+        self.quantity = np.array([_float(leg_quantity(leg)) for leg in self.rows], dtype=np.float64)
+        self.tp_percent = np.array([_float(leg.tp_percent) for leg in self.rows], dtype=np.float64)
+        self.grid_tp_price = np.array([_float(leg.tp_price) for leg in self.rows], dtype=np.float64)
+
+        self.group_side = np.array([-1.0 if g.side == "short" else 1.0 for g in self.groups], dtype=np.float64)
+        self.group_per_leg = np.array([g.tp_mode in ("per_leg", "hybrid") for g in self.groups], dtype=bool)
+        self.group_aggregate = np.array([g.tp_mode in ("aggregate", "hybrid") for g in self.groups], dtype=bool)
+        self.aggregate_percent = np.array([_float(g.tp_aggregate_percent) for g in self.groups], dtype=np.float64)
+        self.fallback_entry = np.array([_float(g.weighted_avg_entry or None) for g in self.groups], dtype=np.float64)
+
+    def __len__(self) -> int:
+        return len(self.groups)
+
+    def items(self):
+        return [(group, self.legs[group.id]) for group in self.groups]
+
+    def prices(self, feed=None) -> List[Optional[Decimal]]:
+        """Current price per group from the shared feed; None where no fresh tick exists."""
+        feed = feed or price_feed
+        prices = []
+        for group in self.groups:
+            feed.subscribe(group.exchange, group.symbol)
+            prices.append(feed.get_price(group.exchange, group.symbol))
+        return prices
+
+def _reached(price: np.ndarray, target: np.ndarray, side: np.ndarray) -> np.ndarray:
+    # NaN prices or targets compare False and therefore never trigger.
+    return side * (price - target) >= -SCREEN_TOLERANCE * np.abs(target)
+
+class TPEvaluation:
+    """Result of one vectorized pass: per-leg and per-group candidate masks."""
+    def __init__(self, leg_hits: np.ndarray, avg_entry: np.ndarray, aggregate_hits: np.ndarray):
+        self.leg_hits = leg_hits
+        self.avg_entry = avg_entry
+        self.aggregate_hits = aggregate_hits
+
+def evaluate(book: TPBook, prices: List[Optional[Decimal]]) -> TPEvaluation:
+    """
+    Screens every leg and group against `prices` (one per group) in a single
+    pass, with the same targets as `leg_tp_target` and `aggregate_tp_target`.
+    """
+    group_price = np.array([_float(price) for price in prices], dtype=np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        leg_side = book.group_side[book.leg_group]
+        leg_targets = np.where(
+            np.isnan(book.fill_price),
+            book.grid_tp_price,
+            book.fill_price * (1 + leg_side * book.tp_percent / 100),
+        )
+        leg_hits = _reached(group_price[book.leg_group], leg_targets, leg_side)
+        leg_hits &= book.group_per_leg[book.leg_group]
+
+        total_qty = np.bincount(book.leg_group, weights=book.quantity, minlength=len(book))
+        total_cost = np.bincount(book.leg_group, weights=book.entry_price * book.quantity, minlength=len(book))
+        avg_entry = np.where(total_qty > 0, total_cost / total_qty, book.fallback_entry)
+
+        aggregate_targets = avg_entry * (1 + book.group_side * book.aggregate_percent / 100)
+        aggregate_hits = _reached(group_price, aggregate_targets, book.group_side) & book.group_aggregate
+
+    return TPEvaluation(leg_hits, avg_entry, aggregate_hits)
+
+class TPTrigger:
+    """
+    A take-profit action for one group. "per_leg" closes the listed legs,
+    "aggregate" the whole position. Only ids are held, so a trigger outlives
+    the session it was built in.
+    """
+    def __init__(self, group_id: UUID, mode: str, leg_ids: List[UUID], current_price: Decimal = None):
+        self.group_id = group_id
+        self.mode = mode
+        self.leg_ids = leg_ids
+        self.current_price = current_price
+
+def confirm_triggers(book: TPBook, evaluation: TPEvaluation, prices: List[Optional[Decimal]]) -> List[TPTrigger]:
+    """
+    Re-checks the screened candidates with exact Decimal arithmetic. Only the
+    rows that passed the screen are touched here. A confirmed aggregate
+    trigger closes the whole position, so it replaces the group's per-leg one.
+    """
+    candidate_legs: Dict[int, List[DCAOrder]] = {}
+    for row in np.flatnonzero(evaluation.leg_hits):
+        candidate_legs.setdefault(int(book.leg_group[row]), []).append(book.rows[row])
+
+    triggers = []
+    for g in sorted(set(candidate_legs) | {int(g) for g in np.flatnonzero(evaluation.aggregate_hits)}):
+        group, price = book.groups[g], prices[g]
+        legs = book.legs[group.id]
+        if evaluation.aggregate_hits[g]:
+            target = aggregate_tp_target(group, legs)
+            if target is not None and is_target_reached(price, target, group.side):
+                triggers.append(TPTrigger(group.id, "aggregate", [leg.id for leg in legs], price))
+                continue
+        confirmed = [
+            leg for leg in candidate_legs.get(g, [])
+            if is_target_reached(price, leg_tp_target(leg, group.side), group.side)
+        ]
+        if confirmed:
+            triggers.append(TPTrigger(group.id, "per_leg", [leg.id for leg in confirmed], price))
+    return triggers
+
+async def load_tp_book(db: AsyncSession) -> TPBook:
+    """Loads all open filled legs of active position groups in one query."""
+    result = await db.execute(
+        select(DCAOrder)
+        .join(PositionGroup, DCAOrder.group_id == PositionGroup.id)
+        .options(selectinload(DCAOrder.group))
+        .where(
+            DCAOrder.status == "filled",
+            DCAOrder.tp_hit.is_not(True),
+            PositionGroup.status.in_(ACTIVE_GROUP_STATUSES),
+        )
+    )
+    return TPBook(result.scalars().all())
+
+async def load_group(db: AsyncSession, group_id: UUID) -> Optional[PositionGroup]:
+    result = await db.execute(
+        select(PositionGroup)
+        .options(selectinload(PositionGroup.dca_orders))
+        .where(PositionGroup.id == group_id)
+    )
+    return result.scalars().first()
+
+async def execute_trigger(db: AsyncSession, trigger: TPTrigger) -> Optional[UUID]:
+    """
+    Re-checks a fired trigger against the group's current rows, then closes
+    at market and books the PnL of the actual fill, without committing.
+    An aggregate close first cancels the group's working DCA legs, so none
+    can fill after the group is closed. Returns the owner's user id when the
+    group was closed, so the caller can free its pool slot once the close is
+    committed.
+    """
+    # Imported here: order_service builds on the trigger index, which builds on this module.
+    from .order_service import cancel_orders
+
+    group = await load_group(db, trigger.group_id)
+    if group is None or group.status not in ACTIVE_GROUP_STATUSES:
+        return None
+    price = trigger.current_price
+    if trigger.mode == "aggregate":
+        legs = [leg for leg in group.dca_orders if is_open_leg(leg)]
+        target = aggregate_tp_target(group, legs)
+        if target is None or not is_target_reached(price, target, group.side):
+            return None
+    else:
+        legs = [
+            leg for leg in group.dca_orders
+            if leg.id in trigger.leg_ids and is_open_leg(leg)
+            and is_target_reached(price, leg_tp_target(leg, group.side), group.side)
+        ]
+    if not legs:
+        return None
+
+    async with await exchange_manager.get_exchange(db, group.exchange, group.user_id) as manager:
+        if trigger.mode == "aggregate":
+            working = [leg for leg in group.dca_orders if leg.status in OPEN_LEG_STATUSES]
+            if working:
+                await cancel_orders(manager, group.symbol, working)
+                # Legs that filled before their cancel landed are closed too
+                legs = [leg for leg in group.dca_orders if is_open_leg(leg)]
+        quantity = sum((leg_quantity(leg) for leg in legs), Decimal("0"))
+        order = await manager.close_at_market(group.symbol, closing_side(group.side), quantity)
+    filled, fill_price = exchange_manager.order_fill(order)
+    if not filled:
+        raise RuntimeError(f"TP close order {order.get('id')} for {group.symbol} did not fill")
+
+    now = datetime.utcnow()
+    for leg in legs:
+        leg.tp_hit = True
+        leg.tp_order_id = order.get("id")
+        leg.tp_executed_at = now
+    closed = trigger.mode == "aggregate" or not any(
+        is_open_leg(leg) or leg.status in OPEN_LEG_STATUSES for leg in group.dca_orders
+    )
+    if closed:
+        group.status = PositionGroupStatus.CLOSED
+    await record_realized_pnl(
+        db, group, position_pnl(group, filled, average_entry_price(legs), fill_price), closed=closed, at=now
+    )
+    return group.user_id if closed else None
+
+async def evaluate_take_profits(db: AsyncSession, feed=None) -> List[TPTrigger]:
+    """
+    One TP tick for all groups: load the book, screen it in one vectorized
+    pass, confirm the hits in Decimal, then close the confirmed triggers.
+    Each close commits on its own, and a closed group's pool slot is freed
+    after its commit.
+    """
+    book = await load_tp_book(db)
+    if not len(book):
+        return []
+
+    prices = book.prices(feed)
+    triggers = confirm_triggers(book, evaluate(book, prices), prices)
+    for trigger in triggers:
+        try:
+            closed_by = await execute_trigger(db, trigger)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            metrics.incr("tp_execution_failures", mode=trigger.mode)
+            print(f"Error executing {trigger.mode} take-profit for group {trigger.group_id}: {e}")
+            continue
+        if closed_by:
+            await pool_slots.release(closed_by)
+    return triggers
@@ -0,0 +1,240 @@
+import math
+import time
+from bisect import bisect_left, bisect_right, insort
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+from uuid import UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+from ..models.trading_models import PositionGroup, DCAOrder
+from ..services.price_feed import price_feed
+from ..services.tp_evaluator import (
+    ACTIVE_GROUP_STATUSES, TPBook, TPTrigger, load_tp_book, execute_trigger,
+    leg_tp_target, leg_quantity, leg_entry_price, percent_target, is_open_leg,
+)
+from ..services.pool_manager import pool_slots
+from ..services.metrics_service import metrics
+from ..core.config import settings
+
+class SymbolTriggerIndex:
+    """
+    Sorted TP thresholds for one (exchange, symbol). Long thresholds are kept
+    ascending and short thresholds negated, so in both cases the crossed
+    entries form a prefix found with one bisect.
+    """
+    def __init__(self):
+        self._long: List[Tuple[Decimal, int, TPTrigger]] = []
+        self._short: List[Tuple[Decimal, int, TPTrigger]] = []
+
+    def __len__(self) -> int:
+        return len(self._long) + len(self._short)
+
+    def add(self, threshold: Decimal, side: str, trigger: TPTrigger, seq: int) -> None:
+        if side == "short":
+            insort(self._short, (-threshold, seq, trigger))
+        else:
+            insort(self._long, (threshold, seq, trigger))
+
+    def remove(self, threshold: Decimal, side: str, seq: int) -> None:
+        """Removes one entry; a no-op if it was already popped."""
+        entries, key = (self._short, -threshold) if side == "short" else (self._long, threshold)
+        i = bisect_left(entries, (key, seq))
+        if i < len(entries) and entries[i][:2] == (key, seq):
+            del entries[i]
+
+    def pop_crossed(self, price: Decimal) -> List[TPTrigger]:
+        """Removes and returns every trigger whose threshold `price` has reached."""
+        crossed = []
+        for entries, key in ((self._long, price), (self._short, -price)):
+            cut = bisect_right(entries, (key, math.inf))
+            if cut:
+                crossed.extend(trigger for _, _, trigger in entries[:cut])
+                del entries[:cut]
+        return crossed
+
+class IndexedGroup:
+    """
+    One active group as the index sees it: the threshold entry of each
+    per-leg target and of the aggregate target, and the open legs' quantity
+    and entry behind that aggregate, so a fill or a taken leg moves the
+    group's thresholds without reloading it.
+    """
+    def __init__(self, group: PositionGroup):
+        self.group_id = group.id
+        self.key = (group.exchange, group.symbol)
+        self.side = group.side
+        self.per_leg = group.tp_mode in ("per_leg", "hybrid")
+        self.aggregate_percent = group.tp_aggregate_percent if group.tp_mode in ("aggregate", "hybrid") else None
+        self.fallback_entry = group.weighted_avg_entry
+        # leg id -> (quantity, entry price) of the open filled legs
+        self.legs: Dict[UUID, Tuple[Decimal, Decimal]] = {}
+        # leg id, or None for the aggregate -> (threshold, seq, trigger)
+        self.entries: Dict[Optional[UUID], Tuple[Decimal, int, TPTrigger]] = {}
+
+    def aggregate_target(self) -> Optional[Decimal]:
+        """Same target as `aggregate_tp_target`, from the running leg totals."""
+        if self.aggregate_percent is None:
+            return None
+        total_quantity = sum((quantity for quantity, _ in self.legs.values()), Decimal("0"))
+        if total_quantity:
+            entry_price = sum((entry * quantity for quantity, entry in self.legs.values()), Decimal("0")) / total_quantity
+        else:
+            entry_price = self.fallback_entry
+        if not entry_price:
+            return None
+        return percent_target(entry_price, self.aggregate_percent, self.side)
+
+class TPTriggerIndex:
+    """
+    Incremental take-profit index over all active position groups. Per-leg
+    groups contribute one threshold per open filled leg, aggregate groups one
+    at their average-entry target, and hybrid groups both, so whichever is
+    crossed first executes. New fills are added with `add_fill` and fired
+    triggers are dropped or restored in place; the index is only rebuilt
+    from the database every TP_INDEX_REBUILD_SEC, or after `mark_dirty`, so
+    a price tick costs O(log n + hits) per symbol.
+    """
+    def __init__(self, rebuild_seconds: int):
+        self.rebuild_seconds = rebuild_seconds
+        self._symbols: Dict[Tuple[str, str], SymbolTriggerIndex] = {}
+        self._groups: Dict[UUID, IndexedGroup] = {}
+        self._seq = 0
+        self._dirty = True
+        self._built_at = 0.0
+
+    def mark_dirty(self) -> None:
+        """Forces a rebuild on the next check, for changes the index cannot apply itself."""
+        self._dirty = True
+
+    def needs_rebuild(self) -> bool:
+        return self._dirty or time.monotonic() - self._built_at > self.rebuild_seconds
+
+    def symbols(self) -> List[Tuple[str, str]]:
+        return [key for key, index in self._symbols.items() if len(index)]
+
+    def build(self, book: TPBook) -> None:
+        self._symbols = {}
+        self._groups = {}
+        self._seq = 0
+        for group, legs in book.items():
+            indexed = self._groups[group.id] = IndexedGroup(group)
+            for leg in legs:
+                self._index_leg(indexed, leg)
+            self._index_aggregate(indexed)
+
+        self._dirty = False
+        self._built_at = time.monotonic()
+
+    async def rebuild(self, db: AsyncSession) -> None:
+        self.build(await load_tp_book(db))
+
+    def add_fill(self, leg: DCAOrder) -> None:
+        """
+        Adds a newly filled leg's threshold and moves its group's aggregate
+        threshold to the new average entry. Call it before the fill is
+        committed, while the leg and its group are loaded; a pending rebuild
+        picks the leg up instead.
+        """
+        group = leg.group
+        if self.needs_rebuild() or group.status not in ACTIVE_GROUP_STATUSES or not is_open_leg(leg):
+            return
+        indexed = self._groups.get(group.id)
+        if indexed is None:
+            indexed = self._groups[group.id] = IndexedGroup(group)
+        self._index_leg(indexed, leg)
+        self._index_aggregate(indexed)
+
+    def _index_leg(self, indexed: IndexedGroup, leg: DCAOrder) -> None:
+        indexed.legs[leg.id] = (leg_quantity(leg), leg_entry_price(leg))
+        if indexed.per_leg:
+            self._discard(indexed, leg.id)
+            self._insert(indexed, leg.id, leg_tp_target(leg, indexed.side), TPTrigger(indexed.group_id, "per_leg", [leg.id]))
+
+    def _index_aggregate(self, indexed: IndexedGroup) -> None:
+        self._discard(indexed, None)
+        target = indexed.aggregate_target()
+        if target is not None:
+            self._insert(indexed, None, target, TPTrigger(indexed.group_id, "aggregate", list(indexed.legs)))
+
+    def _insert(self, indexed: IndexedGroup, slot: Optional[UUID], threshold: Decimal, trigger: TPTrigger) -> None:
+        if indexed.key not in self._symbols:
+            self._symbols[indexed.key] = SymbolTriggerIndex()
+            price_feed.subscribe(*indexed.key)
+        self._symbols[indexed.key].add(threshold, indexed.side, trigger, self._seq)
+        indexed.entries[slot] = (threshold, self._seq, trigger)
+        self._seq += 1
+
+    def _discard(self, indexed: IndexedGroup, slot: Optional[UUID]) -> None:
+        entry = indexed.entries.pop(slot, None)
+        if entry is not None:
+            self._symbols[indexed.key].remove(entry[0], indexed.side, entry[1])
+
+    def _drop_group(self, group_id: UUID) -> None:
+        indexed = self._groups.pop(group_id, None)
+        if indexed is not None:
+            for slot in list(indexed.entries):
+                self._discard(indexed, slot)
+
+    @staticmethod
+    def _slot(trigger: TPTrigger) -> Optional[UUID]:
+        return None if trigger.mode == "aggregate" else trigger.leg_ids[0]
+
+    def _restore(self, trigger: TPTrigger) -> None:
+        """Puts a popped trigger back, unless a newer fill already replaced it."""
+        indexed = self._groups.get(trigger.group_id)
+        entry = indexed.entries.get(self._slot(trigger)) if indexed is not None else None
+        if entry is not None and entry[2] is trigger:
+            self._symbols[indexed.key].add(entry[0], indexed.side, trigger, entry[1])
+
+    def _taken(self, trigger: TPTrigger, closed: bool) -> None:
+        """Applies an executed trigger: its legs leave the group, or the whole group leaves."""
+        indexed = self._groups.get(trigger.group_id)
+        if indexed is None:
+            return
+        if closed:
+            self._drop_group(trigger.group_id)
+        elif trigger.mode == "aggregate":
+            # The re-check found the rows differ from the index's view of them
+            self._drop_group(trigger.group_id)
+            self.mark_dirty()
+        else:
+            for leg_id in trigger.leg_ids:
+                indexed.legs.pop(leg_id, None)
+                indexed.entries.pop(leg_id, None)
+            self._index_aggregate(indexed)
+
+    def collect(self, feed=None) -> List[TPTrigger]:
+        """Pops the triggers crossed by the latest feed prices."""
+        feed = feed or price_feed
+        fired = []
+        for (exchange, symbol), index in self._symbols.items():
+            current_price = feed.get_price(exchange, symbol)
+            if current_price is None:
+                continue
+            for trigger in index.pop_crossed(current_price):
+                trigger.current_price = current_price
+                fired.append(trigger)
+        return fired
+
+    async def check(self, db: AsyncSession) -> List[TPTrigger]:
+        if self.needs_rebuild():
+            await self.rebuild(db)
+
+        fired = self.collect()
+        for trigger in fired:
+            # Each close commits on its own, so one failure cannot roll back
+            # closes that were already sent to the exchange.
+            try:
+                closed_by = await execute_trigger(db, trigger)
+                await db.commit()
+            except Exception as e:
+                await db.rollback()
+                self._restore(trigger)
+                metrics.incr("tp_execution_failures", mode=trigger.mode)
+                print(f"Error executing {trigger.mode} take-profit for group {trigger.group_id}: {e}")
+                continue
+            self._taken(trigger, closed=closed_by is not None)
+            if closed_by:
+                await pool_slots.release(closed_by)
+        return fired
+
+tp_trigger_index = TPTriggerIndex(settings.TP_INDEX_REBUILD_SEC)
@@ -1,7 +1,8 @@
 from decimal import Decimal
+from typing import List, Tuple
 from sqlalchemy.orm import Session
 
-from ..services import precision_service, exchange_manager
+from ..services import precision_service
 
 async def validate_and_adjust_order(
     db: Session,
@@ -14,25 +15,30 @@ async def validate_and_adjust_order(
     """
     Validate and adjust order parameters based on exchange precision rules.
     """
-    precision = await precision_service.fetch_precision_info(db, exchange, symbol)
+    rounding = await precision_service.fetch_symbol_rounding(db, exchange, symbol)
     
-    if not precision:
+    if not rounding:
         # As per SoW, if precision metadata is missing, signal is held (queued).
         # For now, we'll raise an error, and the calling service will handle queuing.
         raise ValueError(f"Precision rules not available for {exchange}:{symbol}. Cannot validate order.")
     
-    # Adjust quantity
-    quantity = Decimal(exchange_manager.ccxt.decimal_to_precision(
-        float(quantity),
-        exchange_manager.ccxt.ROUND,
-        precision['amount'],
-    ))
-    
-    # Adjust price
-    price = Decimal(exchange_manager.ccxt.decimal_to_precision(
-        float(price),
-        exchange_manager.ccxt.ROUND,
-        precision['price'],
-    ))
-    
-    return quantity, price
+    return rounding.round_grid([(quantity, price)])[0]
+
+async def validate_and_adjust_grid(
+    db: Session,
+    exchange: str,
+    symbol: str,
+    side: str,
+    legs: List[Tuple[Decimal, Decimal]],
+) -> List[Tuple[Decimal, Decimal]]:
+    """
+    Validate and adjust a whole grid of (quantity, price) legs for one symbol,
+    fetching the precision rules only once. Raises ValueError if any leg falls
+    below the symbol's minimum amount or notional.
+    """
+    rounding = await precision_service.fetch_symbol_rounding(db, exchange, symbol)
+
+    if not rounding:
+        raise ValueError(f"Precision rules not available for {exchange}:{symbol}. Cannot validate order.")
+
+    return rounding.round_grid(legs)
@@ -1,34 +1,48 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
 from ..models.trading_models import PositionGroup, PositionGroupStatus
-from ..services.queue_service import add_to_queue
-from ..core.config import settings
+from ..services.queue_service import add_to_queue, remove_from_queue
+from ..services.signal_executor import signal_executor, signal_key
+from ..services.pool_manager import pool_slots
 from uuid import UUID
 from typing import Dict, Any
 from decimal import Decimal
 
 async def process_webhook_signal(db: AsyncSession, user_id: UUID, tv_data: Dict[str, Any], execution_intent: Dict[str, Any]):
     """
-    Processes a webhook signal by checking the user's execution pool.
-    If the pool is full, the signal is queued. Otherwise, a new position group is created.
+    Processes a webhook signal on the sharded executor: signals for the same
+    (user, exchange, symbol, timeframe) run one at a time in arrival order.
     """
-    # 1. Check the number of currently live positions for the user.
-    live_positions_query = select(func.count(PositionGroup.id)).filter(
-        PositionGroup.user_id == user_id,
-        PositionGroup.status == PositionGroupStatus.LIVE
+    return await signal_executor.run(
+        signal_key(user_id, tv_data),
+        lambda: apply_webhook_signal(db, user_id, tv_data, execution_intent),
     )
-    result = await db.execute(live_positions_query)
-    live_positions_count = result.scalar_one()
 
-    # 2. Compare with the pool size from settings.
-    if live_positions_count >= settings.POOL_MAX_OPEN_GROUPS:
-        # Pool is full, add the signal to the queue.
+async def apply_webhook_signal(db: AsyncSession, user_id: UUID, tv_data: Dict[str, Any], execution_intent: Dict[str, Any]):
+    """
+    Applies a signal by checking the user's execution pool.
+    If the pool is full, the signal is queued. Otherwise, a new position group is created.
+    Callers must hold the signal's executor key (see process_webhook_signal).
+    """
+    # 0. An exit for a pair that is still waiting just drops it from the queue;
+    #    an exit never takes a pool slot or opens a position.
+    if execution_intent.get("type") == "exit":
+        cancelled = await remove_from_queue(db, user_id, tv_data["exchange"], tv_data["symbol"], tv_data["timeframe"])
+        if cancelled is not None:
+            return {"status": "success", "action": "dequeued", "queued_signal_id": cancelled.id}
+        return {"status": "success", "action": "ignored"}
+
+    # 1. Take a pool slot atomically; a full pool queues the signal.
+    if not await pool_slots.try_acquire(db, user_id):
         queued_signal = await add_to_queue(db, tv_data, user_id)
         return {"status": "success", "action": "queued", "queued_signal_id": queued_signal.id}
-    else:
-        # Pool has space, create a new position group.
+
+    # 2. Pool has space, create a new position group.
+    try:
         position_group = await create_position_group_from_signal(db, tv_data, user_id)
-        return {"status": "success", "action": "created", "position_group_id": position_group.id}
+    except Exception:
+        await pool_slots.release(user_id)
+        raise
+    return {"status": "success", "action": "created", "position_group_id": position_group.id}
 
 async def create_position_group_from_signal(db: AsyncSession, signal: Dict[str, Any], user_id: UUID) -> PositionGroup:
     """
@@ -1,24 +1,25 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import delete
 from ..db.session import get_async_db
-from ..models.log_models import SystemLog, AuditLog
-from datetime import datetime, timedelta
+from ..services import log_partitions
+from datetime import datetime
 
-async def delete_old_logs():
+async def maintain_log_partitions():
     """
-    Deletes old logs from the database.
+    Creates the upcoming daily log partitions and drops the ones past
+    retention, instead of deleting old rows.
     """
     async for db in get_async_db():
-        # Delete system logs older than 30 days
-        cutoff_date = datetime.utcnow() - timedelta(days=30)
-        await db.execute(delete(SystemLog).where(SystemLog.timestamp < cutoff_date))
-        
-        # Delete audit logs older than 90 days
-        cutoff_date = datetime.utcnow() - timedelta(days=90)
-        await db.execute(delete(AuditLog).where(AuditLog.timestamp < cutoff_date))
-        
-        await db.commit()
+        # Separate transactions, so a failure creating partitions never skips retention
+        try:
+            await log_partitions.ensure_partitions(db)
+        except Exception as e:
+            await db.rollback()
+            print(f"Error creating log partitions: {e}")
+        try:
+            await log_partitions.enforce_retention(db)
+        except Exception as e:
+            await db.rollback()
+            print(f"Error enforcing log retention: {e}")
 
 scheduler = AsyncIOScheduler()
-scheduler.add_job(delete_old_logs, 'interval', days=1)
\ No newline at end of file
+scheduler.add_job(maintain_log_partitions, 'interval', hours=1, next_run_time=datetime.now())
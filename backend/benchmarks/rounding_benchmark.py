@@ -0,0 +1,56 @@
+"""
+Micro-benchmark: rounding a DCA grid with the previous float round trip through
+ccxt.decimal_to_precision versus the precompiled Decimal SymbolRounding.
+
+Run from the backend directory:
+    python -m benchmarks.rounding_benchmark
+"""
+import timeit
+from decimal import Decimal
+
+from ccxt.base.decimal_to_precision import decimal_to_precision, ROUND
+from app.services.symbol_rounding import SymbolRounding
+
+RULES = {"amount": 8, "price": 2, "min_amount": 0.00001, "min_notional": 5}
+GRID = [
+    (Decimal("1000") / Decimal(price), Decimal(price))
+    for price in ("50000.123", "49500.456", "49000.789", "48500.012", "48000.345", "47500.678", "47000.901")
+]
+SMALL_TICK_RULES = {"amount": 1.0, "price": 1e-08, "precision_mode": "tick_size"}
+SMALL_TICK_PRICE = Decimal("0.000012344999")
+
+def float_round_trip(grid):
+    return [
+        (
+            Decimal(decimal_to_precision(float(quantity), ROUND, RULES["amount"])),
+            Decimal(decimal_to_precision(float(price), ROUND, RULES["price"])),
+        )
+        for quantity, price in grid
+    ]
+
+def main(number: int = 20000):
+    rounding = SymbolRounding.from_rules(RULES)
+    assert float_round_trip(GRID) == rounding.round_grid(GRID)
+
+    old = min(timeit.repeat(lambda: float_round_trip(GRID), number=number, repeat=3))
+    new = min(timeit.repeat(lambda: rounding.round_grid(GRID), number=number, repeat=3))
+
+    def per_grid(seconds: float) -> float:
+        return seconds / number * 1e6
+
+    print(f"{len(GRID)}-leg grid, {number} iterations")
+    print(f"  float round trip:  {per_grid(old):8.2f} us/grid")
+    print(f"  SymbolRounding:    {per_grid(new):8.2f} us/grid  ({old / new:.1f}x)")
+
+    # Tick-size exchanges report the tick itself; the old path passed it as a digit count.
+    small = SymbolRounding.from_rules(SMALL_TICK_RULES)
+    try:
+        old_small = decimal_to_precision(float(SMALL_TICK_PRICE), ROUND, SMALL_TICK_RULES["price"])
+    except Exception as e:
+        old_small = f"error: {e!r}"
+    print(f"Tick-size market (tick 1e-08), price {SMALL_TICK_PRICE}:")
+    print(f"  float round trip:  {old_small}")
+    print(f"  SymbolRounding:    {small.round_price(SMALL_TICK_PRICE)}")
+
+if __name__ == "__main__":
+    main()
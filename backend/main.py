@@ -25,11 +25,25 @@ async def lifespan(app: FastAPI):
     from app.tasks.log_cleanup import scheduler
     if not scheduler.running:
         scheduler.start()
+    from app.services.log_sink import log_sink
+    log_sink.start()
+    if settings.WEBHOOK_ASYNC_INTAKE:
+        from app.services.signal_inbox import signal_inbox
+        await signal_inbox.start()
     yield
     # Shutdown
     logger.info("Application shutdown...")
     if scheduler.running:
         scheduler.shutdown()
+    from app.services.signal_inbox import signal_inbox
+    await signal_inbox.stop()
+    from app.services.queue_promoter import queue_promoter
+    await queue_promoter.stop()
+    from app.services.fill_stream import fill_stream_manager
+    await fill_stream_manager.stop_all()
+    from app.services.exchange_manager import client_pool
+    await client_pool.close_all()
+    await log_sink.stop()
 
 app = FastAPI(lifespan=lifespan)
 
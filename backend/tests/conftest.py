@@ -5,11 +5,14 @@ from sqlalchemy.orm import sessionmaker
 from httpx import AsyncClient
 from unittest.mock import AsyncMock
 from datetime import datetime
+from decimal import Decimal
+from uuid import uuid4
 
 from app.db.base import Base
 from app.core.config import settings
 from main import app
 from app.db.session import get_async_db
+from app.models.trading_models import PositionGroup, DCAOrder, PositionGroupStatus
 
 # Ensure the database URL uses the asyncpg driver for tests
 settings.DATABASE_URL = settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://")
@@ -119,3 +122,56 @@ def mock_exchange_api():
         'timestamp': datetime.utcnow().timestamp() * 1000,
     }
     return mock_exchange
+
+@pytest.fixture
+def make_group():
+    """
+    Builds unsaved PositionGroup rows, e.g. make_group("BTC/USDT", "aggregate", side="short").
+    """
+    def make(symbol="BTC/USDT", tp_mode="per_leg", side="long", tp_aggregate_percent="5.0"):
+        return PositionGroup(
+            id=uuid4(),
+            user_id=uuid4(),
+            exchange_config_id=uuid4(),
+            exchange="binance",
+            symbol=symbol,
+            timeframe=60,
+            side=side,
+            status=PositionGroupStatus.LIVE,
+            total_dca_legs=5,
+            base_entry_price=Decimal("100"),
+            weighted_avg_entry=Decimal("100"),
+            realized_pnl_usd=Decimal("0"),
+            tp_mode=tp_mode,
+            tp_aggregate_percent=Decimal(tp_aggregate_percent) if tp_aggregate_percent is not None else None,
+        )
+    return make
+
+@pytest.fixture
+def make_leg():
+    """
+    Builds unsaved DCAOrder legs of a group, filled at `fill_price` unless a
+    `status` other than "filled" is given.
+    """
+    def make(group, leg_index, fill_price, tp_percent="1.0", quantity="1.0", status="filled"):
+        price = Decimal(fill_price)
+        move = Decimal(tp_percent) / 100
+        return DCAOrder(
+            id=uuid4(),
+            group=group,
+            group_id=group.id,
+            pyramid_id=uuid4(),
+            leg_index=leg_index,
+            symbol=group.symbol,
+            side="sell" if group.side == "short" else "buy",
+            price=price,
+            quantity=Decimal(quantity),
+            gap_percent=Decimal("0"),
+            weight_percent=Decimal("20"),
+            tp_percent=Decimal(tp_percent),
+            tp_price=price * (1 - move if group.side == "short" else 1 + move),
+            status=status,
+            avg_fill_price=price if status == "filled" else None,
+            tp_hit=False,
+        )
+    return make
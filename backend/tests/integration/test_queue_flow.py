@@ -5,6 +5,7 @@ from app.services.auth_service import create_user
 from app.models.key_models import ExchangeConfig
 from app.models.trading_models import PositionGroup, QueuedSignal, PositionGroupStatus
 from app.services.queue_service import promote_from_queue
+from app.services.queue_priority import priority_score
 from app.core.config import settings
 from app.services.jwt_service import create_access_token
 from sqlalchemy import select
@@ -75,22 +76,30 @@ async def test_promote_from_queue_prioritizes_correctly(db_session: AsyncSession
         test_user = await create_user(session, user_in)
         await session.flush()
 
-        # Lower priority signal
-        session.add(QueuedSignal(user_id=test_user.id, symbol="BTC/USDT", priority_score=10, replacement_count=0, original_signal={}))
-        # Highest priority signal (higher score)
-        session.add(QueuedSignal(user_id=test_user.id, symbol="ETH/USDT", priority_score=20, replacement_count=0, original_signal={}))
-        # Higher priority signal (same score, more replacements)
-        session.add(QueuedSignal(user_id=test_user.id, symbol="XRP/USDT", priority_score=20, replacement_count=1, original_signal={}))
+        def queued(symbol, loss_percent, replacements):
+            return QueuedSignal(
+                user_id=test_user.id, exchange="binance", symbol=symbol, timeframe=5, side="long",
+                entry_price=100, signal_payload={}, replacement_count=replacements,
+                current_loss_percent=loss_percent, priority_score=priority_score(False, loss_percent, replacements),
+            )
+
+        # Lower priority signal (shallower loss)
+        session.add(queued("BTC/USDT", -1, 0))
+        # Same loss as XRP, fewer replacements
+        session.add(queued("ETH/USDT", -3, 0))
+        # Highest priority signal (deepest loss, more replacements)
+        session.add(queued("XRP/USDT", -3, 1))
         await session.flush()
 
         # 2. Act: Call the promotion function
         promoted_signal = await promote_from_queue(session, test_user.id)
 
-        # 3. Assert: Verify that the correct signal was promoted and removed from the queue
+        # 3. Assert: Verify that the correct signal was promoted and left the queue
         assert promoted_signal is not None
         assert promoted_signal.symbol == "XRP/USDT"
 
-        result = await session.execute(select(QueuedSignal).filter(QueuedSignal.user_id == test_user.id))
+        assert promoted_signal.status == "promoted"
+        result = await session.execute(select(QueuedSignal).filter(QueuedSignal.user_id == test_user.id, QueuedSignal.status == "queued"))
         remaining_signals = result.scalars().all()
         assert len(remaining_signals) == 2
         assert "XRP/USDT" not in [s.symbol for s in remaining_signals]
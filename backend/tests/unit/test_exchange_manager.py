@@ -1,9 +1,10 @@
 import pytest
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 import unittest
 from uuid import uuid4
 from decimal import Decimal
-from backend.app.services.exchange_manager import ExchangeManager
+import ccxt.async_support as ccxt
+from backend.app.services.exchange_manager import ExchangeManager, ExchangeClientPool
 
 @pytest.fixture
 def mock_db_session():
@@ -34,3 +35,114 @@ async def test_exchange_manager_initialization(mock_db_session, mock_exchange_co
             # Further assertions can be made here
 
 # Add more tests for other methods in ExchangeManager
+
+def _mock_async_db(db_config):
+    db = MagicMock()
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.first.return_value = db_config
+    db.execute = AsyncMock(return_value=mock_result)
+    return db
+
+@pytest.mark.asyncio
+async def test_client_pool_reuses_warm_client(mock_exchange_config):
+    pool = ExchangeClientPool(idle_ttl_seconds=60)
+    db = _mock_async_db(MagicMock(**mock_exchange_config))
+    user_id = uuid4()
+
+    with patch.object(pool, '_build_client', return_value=AsyncMock()) as mock_build:
+        client1 = await pool.acquire(db, user_id, 'binance')
+        pool.release(user_id, 'binance')
+        client2 = await pool.acquire(db, user_id, 'binance')
+
+    assert client1 is client2
+    mock_build.assert_called_once()
+    db.execute.assert_awaited_once()
+    client1.close.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_client_pool_invalidate_closes_client(mock_exchange_config):
+    pool = ExchangeClientPool(idle_ttl_seconds=60)
+    db = _mock_async_db(MagicMock(**mock_exchange_config))
+    user_id = uuid4()
+
+    with patch.object(pool, '_build_client', side_effect=[AsyncMock(), AsyncMock()]):
+        client1 = await pool.acquire(db, user_id, 'binance')
+        await pool.invalidate(user_id, 'binance')
+        client2 = await pool.acquire(db, user_id, 'binance')
+
+    client1.close.assert_awaited_once()
+    assert client2 is not client1
+    assert db.execute.await_count == 2
+
+@pytest.mark.asyncio
+async def test_client_pool_evicts_idle_clients(mock_exchange_config):
+    pool = ExchangeClientPool(idle_ttl_seconds=0)
+    db = _mock_async_db(MagicMock(**mock_exchange_config))
+    user_id = uuid4()
+
+    with patch.object(pool, '_build_client', return_value=AsyncMock()):
+        client = await pool.acquire(db, user_id, 'binance')
+        await pool.evict_idle()
+
+    client.close.assert_awaited_once()
+    assert pool._lookup(user_id, 'binance') is None
+
+def test_public_clients_are_shared_per_exchange_and_testnet():
+    pool = ExchangeClientPool(idle_ttl_seconds=60)
+    exchange_class = MagicMock(side_effect=lambda config: MagicMock())
+    with patch('backend.app.services.exchange_manager.ccxt') as mock_ccxt, \
+         patch.object(pool, '_get_session', return_value=MagicMock()):
+        mock_ccxt.binance = exchange_class
+        live = pool.get_public_client('binance')
+        sandbox = pool.get_public_client('binance', testnet=True)
+
+        assert pool.get_public_client('binance') is live
+        assert pool.get_public_client('binance', testnet=True) is sandbox
+    assert live is not sandbox
+    sandbox.set_sandbox_mode.assert_called_once_with(True)
+    live.set_sandbox_mode.assert_not_called()
+    assert exchange_class.call_count == 2
+
+@pytest.mark.asyncio
+async def test_place_orders_uses_batch_endpoint_in_chunks():
+    manager = ExchangeManager(MagicMock(), uuid4(), "binance")
+    manager.exchange = MagicMock()
+    manager.exchange.has = {'createOrders': True}
+    manager.exchange.create_orders = AsyncMock(side_effect=lambda orders: [{"id": f"id-{o['price']}"} for o in orders])
+    orders = [(Decimal("1"), Decimal(str(100 - i))) for i in range(7)]
+
+    results = await manager.place_orders("BTC/USDT:USDT", "buy", orders)
+
+    # Binance accepts at most 5 orders per batch
+    assert manager.exchange.create_orders.await_count == 2
+    assert [r["id"] for r in results] == [f"id-{float(100 - i)}" for i in range(7)]
+
+@pytest.mark.asyncio
+async def test_place_orders_keeps_earlier_batches_when_a_later_one_fails():
+    manager = ExchangeManager(MagicMock(), uuid4(), "binance")
+    manager.exchange = MagicMock()
+    manager.exchange.has = {'createOrders': True}
+    error = ccxt.NetworkError("connection reset")
+    manager.exchange.create_orders = AsyncMock(side_effect=[[{"id": f"id-{i}"} for i in range(5)], error])
+    orders = [(Decimal("1"), Decimal(str(100 - i))) for i in range(7)]
+
+    results = await manager.place_orders("BTC/USDT:USDT", "buy", orders)
+
+    assert [r["id"] for r in results[:5]] == [f"id-{i}" for i in range(5)]
+    assert results[5:] == [error, error]
+
+@pytest.mark.asyncio
+async def test_place_orders_falls_back_to_concurrent_submission():
+    manager = ExchangeManager(MagicMock(), uuid4(), "binance")
+    manager.exchange = MagicMock()
+    manager.exchange.has = {'createOrders': True}
+    manager.exchange.create_orders = AsyncMock(side_effect=ccxt.NotSupported("binance createOrders() does not support spot orders"))
+    manager.exchange.create_limit_order = AsyncMock(side_effect=[{"id": "a"}, Exception("rejected"), {"id": "c"}])
+    orders = [(Decimal("1"), Decimal("100")), (Decimal("1"), Decimal("99")), (Decimal("1"), Decimal("98"))]
+
+    results = await manager.place_orders("BTC/USDT", "buy", orders)
+
+    assert manager.exchange.create_limit_order.await_count == 3
+    assert results[0] == {"id": "a"}
+    assert isinstance(results[1], Exception)
+    assert results[2] == {"id": "c"}
@@ -0,0 +1,152 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.fill_stream import FillStreamManager
+from backend.app.services.mock_exchange import MockStreamingExchange
+from backend.app.models.trading_models import DCAOrder
+
+@pytest.fixture
+def mock_db_session():
+    """Mocks a SQLAlchemy database session."""
+    return MagicMock(spec=AsyncSession)
+
+@pytest.fixture
+def mock_exchange():
+    return MockStreamingExchange("key", "secret")
+
+def make_session_factory(db):
+    async def session_factory():
+        yield db
+    return session_factory
+
+def with_pending_order(db):
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.first.return_value = MagicMock(spec=DCAOrder)
+    db.execute.return_value = mock_result
+
+async def wait_for(condition, timeout=1.0):
+    deadline = asyncio.get_event_loop().time() + timeout
+    while not condition():
+        if asyncio.get_event_loop().time() > deadline:
+            raise AssertionError("condition not met in time")
+        await asyncio.sleep(0.01)
+
+@pytest.mark.asyncio
+async def test_stream_feeds_filled_orders(mock_db_session, mock_exchange):
+    """
+    A fill pushed on the user-data stream is handed to handle_order_update.
+    """
+    user_id = uuid4()
+    order = await mock_exchange.create_order("BTC/USDT", "limit", "buy", 0.001, 99000.0)
+
+    dca_order = MagicMock(spec=DCAOrder)
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.first.return_value = dca_order
+    mock_db_session.execute.return_value = mock_result
+
+    manager = FillStreamManager(
+        client_factory=AsyncMock(return_value=mock_exchange),
+        session_factory=make_session_factory(mock_db_session),
+    )
+
+    with patch('backend.app.services.order_service.handle_order_update', new_callable=AsyncMock, return_value=True) as mock_handle, \
+         patch('backend.app.services.order_service.reconcile_pending_orders', new_callable=AsyncMock) as mock_reconcile:
+        manager.start(user_id, "binance")
+        await asyncio.sleep(0.05)
+        # Connected but nothing received yet: the poll still covers this key
+        assert not manager.is_streaming(user_id, "binance")
+
+        mock_exchange.fill_order(order["id"])
+        await wait_for(lambda: mock_handle.await_count == 1)
+        assert manager.streaming_keys() == {(user_id, "binance")}
+        mock_reconcile.assert_awaited_once_with(mock_db_session, only={(user_id, "binance")})
+
+        args = mock_handle.await_args.args
+        assert args[0] is mock_db_session
+        assert args[1] is dca_order
+        assert args[2]["id"] == order["id"]
+        assert args[2]["status"] == "closed"
+
+        await manager.stop_all()
+
+    assert not manager.is_streaming(user_id, "binance")
+
+@pytest.mark.asyncio
+async def test_stream_down_falls_back_to_poll(mock_db_session, mock_exchange):
+    """
+    When the stream drops, its key is no longer reported as streaming so the
+    batched poll covers it until the stream reconnects.
+    """
+    user_id = uuid4()
+    manager = FillStreamManager(
+        client_factory=AsyncMock(return_value=mock_exchange),
+        session_factory=make_session_factory(mock_db_session),
+    )
+    manager.reconnect_seconds = 0.05
+    with_pending_order(mock_db_session)
+
+    with patch('backend.app.services.order_service.handle_order_update', new_callable=AsyncMock, return_value=True), \
+         patch('backend.app.services.order_service.reconcile_pending_orders', new_callable=AsyncMock) as mock_reconcile:
+        manager.start(user_id, "binance")
+        mock_exchange.fill_order((await mock_exchange.create_order("BTC/USDT", "limit", "buy", 0.001, 99000.0))["id"])
+        await wait_for(lambda: manager.is_streaming(user_id, "binance"))
+
+        mock_exchange.disconnect()
+        await wait_for(lambda: not manager.is_streaming(user_id, "binance"))
+        assert (user_id, "binance") not in manager.streaming_keys()
+
+        # Back up only once the new subscription delivers, after reconciling again
+        mock_exchange.fill_order((await mock_exchange.create_order("BTC/USDT", "limit", "buy", 0.001, 98000.0))["id"])
+        await wait_for(lambda: manager.is_streaming(user_id, "binance"))
+        assert mock_reconcile.await_count == 2
+        await manager.stop_all()
+
+@pytest.mark.asyncio
+async def test_failed_reconcile_leaves_the_key_to_the_poll(mock_db_session, mock_exchange):
+    user_id = uuid4()
+    with_pending_order(mock_db_session)
+    manager = FillStreamManager(
+        client_factory=AsyncMock(return_value=mock_exchange),
+        session_factory=make_session_factory(mock_db_session),
+    )
+
+    with patch('backend.app.services.order_service.handle_order_update', new_callable=AsyncMock, return_value=True) as mock_handle, \
+         patch('backend.app.services.order_service.reconcile_pending_orders', new_callable=AsyncMock, side_effect=[RuntimeError("db down"), 0]):
+        manager.start(user_id, "binance")
+        mock_exchange.fill_order((await mock_exchange.create_order("BTC/USDT", "limit", "buy", 0.001, 99000.0))["id"])
+        await wait_for(lambda: mock_handle.await_count == 1)
+        assert not manager.is_streaming(user_id, "binance")
+
+        # The next message retries the reconcile
+        mock_exchange.fill_order((await mock_exchange.create_order("BTC/USDT", "limit", "buy", 0.001, 98000.0))["id"])
+        await wait_for(lambda: manager.is_streaming(user_id, "binance"))
+        await manager.stop_all()
+
+@pytest.mark.asyncio
+async def test_stream_settles_cancelled_orders(mock_db_session, mock_exchange):
+    """
+    Streamed keys are left out of the poll, so the stream settles orders that
+    end without filling as well.
+    """
+    user_id = uuid4()
+    dca_order = MagicMock(spec=DCAOrder, status="pending")
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.first.return_value = dca_order
+    mock_db_session.execute.return_value = mock_result
+    manager = FillStreamManager(
+        client_factory=AsyncMock(return_value=mock_exchange),
+        session_factory=make_session_factory(mock_db_session),
+    )
+
+    with patch('backend.app.services.order_service.reconcile_pending_orders', new_callable=AsyncMock):
+        manager.start(user_id, "binance")
+        order = await mock_exchange.create_order("BTC/USDT", "limit", "buy", 0.001, 99000.0)
+        await mock_exchange.cancel_order(order["id"], "BTC/USDT")
+        await wait_for(lambda: dca_order.status == "cancelled")
+        await manager.stop_all()
+
+    assert dca_order.cancelled_at is not None
+    mock_db_session.commit.assert_awaited_once()
@@ -0,0 +1,84 @@
+import csv
+import gzip
+import io
+import json
+import pytest
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+from sqlalchemy.dialects import postgresql
+
+from backend.app.services.log_export import export_filename, export_query, stream_export
+from backend.app.schemas.log_schemas import LogExportRequest
+from backend.app.models.log_models import SystemLog
+
+def make_row(i):
+    row = MagicMock(spec=SystemLog)
+    row.id = uuid4()
+    row.service = None
+    row.category = "orders"
+    row.user_id = None
+    row.message = f"message {i}, with a comma"
+    row.details = {"attempt": i}
+    row.level = "INFO"
+    row.timestamp = datetime(2025, 11, 24, 12, 0, i)
+    return row
+
+def make_session_factory(batches):
+    db = MagicMock()
+
+    async def partitions():
+        for batch in batches:
+            yield batch
+
+    result = MagicMock()
+    result.partitions = partitions
+    db.stream_scalars = AsyncMock(return_value=result)
+
+    async def factory():
+        yield db
+    return factory, db
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+@pytest.mark.asyncio
+async def test_csv_export_streams_batches_with_one_header():
+    batches = [[make_row(0), make_row(1)], [make_row(2)]]
+    factory, db = make_session_factory(batches)
+    request = LogExportRequest(log_type="system", format="csv", level="INFO")
+
+    body = await collect(stream_export(request, factory))
+
+    rows = list(csv.reader(io.StringIO(body.decode())))
+    assert rows[0] == ["id", "service", "category", "user_id", "message", "details", "level", "timestamp"]
+    assert len(rows) == 4
+    assert rows[1][4] == "message 0, with a comma"
+    assert json.loads(rows[3][5]) == {"attempt": 2}
+    # The query runs through a server-side cursor in batches
+    statement = db.stream_scalars.await_args.args[0]
+    assert statement.get_execution_options()["yield_per"] == 1000
+
+@pytest.mark.asyncio
+async def test_ndjson_export_can_be_gzipped():
+    factory, _ = make_session_factory([[make_row(0)], [make_row(1)]])
+    request = LogExportRequest(format="ndjson", compress=True)
+
+    body = gzip.decompress(await collect(stream_export(request, factory)))
+
+    lines = [json.loads(line) for line in body.decode().splitlines()]
+    assert [line["message"] for line in lines] == ["message 0, with a comma", "message 1, with a comma"]
+    assert lines[0]["timestamp"] == "2025-11-24 12:00:00"
+    assert export_filename(request) == "system_logs.ndjson.gz"
+
+@pytest.mark.asyncio
+async def test_empty_csv_export_still_has_a_header():
+    factory, _ = make_session_factory([])
+    body = await collect(stream_export(LogExportRequest(format="csv"), factory))
+    assert body.decode().strip().startswith("id,service,category")
+
+def test_export_query_uses_list_filters_in_chronological_order():
+    request = LogExportRequest(log_type="audit", action="login", user_id=str(uuid4()))
+    sql = str(export_query(request).compile(dialect=postgresql.dialect()))
+    assert "audit_logs.action =" in sql and "audit_logs.user_id =" in sql
+    assert sql.endswith("ORDER BY audit_logs.timestamp, audit_logs.id")
@@ -0,0 +1,120 @@
+import pytest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from backend.app.services import log_partitions
+from backend.app.services.log_partitions import (
+    PARTITIONED_LOG_TABLES, create_partition_sql, drop_partitions_before, enforce_retention,
+    ensure_partitions, partition_day, partition_name
+)
+
+def make_db(partitions, default_rows=()):
+    """
+    A session whose pg_inherits query returns `partitions[table]` and whose
+    default partitions hold rows for the (table, day) pairs in `default_rows`.
+    """
+    db = MagicMock()
+    executed = []
+
+    async def execute(statement, params=None):
+        result = MagicMock()
+        result.rowcount = 0
+        sql = str(statement)
+        if params and "table" in params:
+            result.all.return_value = [(name,) for name in partitions.get(params["table"], [])]
+        elif sql.startswith("SELECT EXISTS"):
+            result.scalar.return_value = any(
+                f"FROM {table}_default " in sql and params["start"] == day for table, day in default_rows
+            )
+        else:
+            executed.append(sql)
+        return result
+
+    db.execute = AsyncMock(side_effect=execute)
+    db.commit = AsyncMock()
+    db.rollback = AsyncMock()
+    return db, executed
+
+def test_partition_names_round_trip():
+    day = date(2025, 11, 24)
+    assert partition_name("system_logs", day) == "system_logs_p20251124"
+    assert partition_day("system_logs", "system_logs_p20251124") == day
+    assert partition_day("system_logs", "system_logs_default") is None
+    assert create_partition_sql("audit_logs", day) == (
+        "CREATE TABLE IF NOT EXISTS audit_logs_p20251124 PARTITION OF audit_logs "
+        "FOR VALUES FROM ('2025-11-24') TO ('2025-11-25')"
+    )
+
+@pytest.mark.asyncio
+async def test_ensure_partitions_creates_only_missing_days():
+    today = date(2025, 11, 24)
+    existing = {table: [f"{table}_default", f"{table}_p20251124"] for table in PARTITIONED_LOG_TABLES}
+    db, executed = make_db(existing)
+
+    created = await ensure_partitions(db, today=today, days_ahead=2)
+
+    assert len(created) == 2 * len(PARTITIONED_LOG_TABLES)
+    assert "webhook_logs_p20251126" in created
+    assert "webhook_logs_p20251124" not in created
+    assert len(executed) == len(created)
+    # One transaction per table
+    assert db.commit.await_count == len(PARTITIONED_LOG_TABLES)
+
+@pytest.mark.asyncio
+async def test_rows_in_the_default_partition_are_moved_to_the_new_day():
+    today = date(2025, 11, 24)
+    db, executed = make_db({"error_logs": ["error_logs_default"]}, default_rows=[("error_logs", today)])
+    with patch.object(log_partitions, "PARTITIONED_LOG_TABLES", {"error_logs": "timestamp"}):
+        created = await ensure_partitions(db, today=today, days_ahead=1)
+
+    assert created == ["error_logs_p20251124", "error_logs_p20251125"]
+    assert executed == [
+        "ALTER TABLE error_logs DETACH PARTITION error_logs_default",
+        create_partition_sql("error_logs", today),
+        'INSERT INTO error_logs SELECT * FROM error_logs_default WHERE "timestamp" >= :start AND "timestamp" < :end',
+        'DELETE FROM error_logs_default WHERE "timestamp" >= :start AND "timestamp" < :end',
+        "ALTER TABLE error_logs ATTACH PARTITION error_logs_default DEFAULT",
+        create_partition_sql("error_logs", date(2025, 11, 25)),
+    ]
+
+@pytest.mark.asyncio
+async def test_a_failing_table_does_not_block_the_others():
+    db, _ = make_db({})
+    db.commit = AsyncMock(side_effect=[Exception("lock timeout"), None])
+    with patch.object(log_partitions, "PARTITIONED_LOG_TABLES", {"system_logs": "timestamp", "audit_logs": "timestamp"}):
+        created = await ensure_partitions(db, today=date(2025, 11, 24), days_ahead=0)
+
+    assert created == ["audit_logs_p20251124"]
+    db.rollback.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_drop_partitions_before_keeps_the_boundary_day_and_default():
+    db, executed = make_db({"system_logs": [
+        "system_logs_default", "system_logs_p20251020", "system_logs_p20251021", "system_logs_p20251022",
+    ]})
+
+    dropped = await drop_partitions_before(db, "system_logs", datetime(2025, 10, 22, 6, 0))
+
+    assert dropped == ["system_logs_p20251020", "system_logs_p20251021"]
+    assert executed == [
+        'DELETE FROM system_logs_default WHERE "timestamp" < :cutoff',
+    ] + [f"DROP TABLE IF EXISTS {name}" for name in dropped]
+
+@pytest.mark.asyncio
+async def test_drop_partitions_before_prunes_expired_rows_in_the_default():
+    db, executed = make_db({"webhook_logs": ["webhook_logs_default"]})
+    cutoff = datetime(2025, 10, 22, 6, 0)
+
+    assert await drop_partitions_before(db, "webhook_logs", cutoff) == []
+
+    assert executed == ['DELETE FROM webhook_logs_default WHERE "received_at" < :cutoff']
+    assert db.execute.await_args.args[1] == {"cutoff": cutoff}
+    db.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_enforce_retention_skips_tables_kept_forever():
+    db, _ = make_db({})
+    with patch.object(log_partitions, "retention_days", return_value={"system_logs": 30, "webhook_logs": 0}):
+        dropped = await enforce_retention(db, now=datetime(2025, 11, 24))
+
+    assert list(dropped) == ["system_logs"]
@@ -0,0 +1,58 @@
+import pytest
+from datetime import datetime, timedelta
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+from sqlalchemy.dialects import postgresql
+
+from backend.app.services.log_query import (
+    audit_log_query, decode_cursor, encode_cursor, fetch_page, newest_first, system_log_query
+)
+from backend.app.models.log_models import SystemLog, AuditLog
+
+def compile_sql(query):
+    return str(query.compile(dialect=postgresql.dialect()))
+
+def make_rows(count):
+    start = datetime(2025, 11, 24, 12, 0, 0)
+    rows = []
+    for i in range(count):
+        row = MagicMock(spec=SystemLog)
+        row.id = uuid4()
+        row.timestamp = start - timedelta(seconds=i)
+        rows.append(row)
+    return rows
+
+def test_cursor_round_trip():
+    timestamp, entry_id = datetime(2025, 11, 24, 12, 30, 15, 123456), uuid4()
+    assert decode_cursor(encode_cursor(timestamp, entry_id)) == (timestamp, entry_id)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+def test_search_uses_the_indexed_tsvector_expression():
+    sql = compile_sql(system_log_query(level="ERROR", search="order timeout"))
+    assert "to_tsvector('simple'::regconfig, system_logs.message) @@ plainto_tsquery('simple'::regconfig" in sql
+    assert "system_logs.level =" in sql
+
+def test_keyset_orders_by_timestamp_and_id():
+    cursor = encode_cursor(datetime(2025, 11, 24), uuid4())
+    sql = compile_sql(newest_first(audit_log_query(action="login"), AuditLog, cursor))
+    assert "(audit_logs.timestamp, audit_logs.id) <" in sql
+    assert sql.endswith("ORDER BY audit_logs.timestamp DESC, audit_logs.id DESC")
+
+@pytest.mark.asyncio
+async def test_fetch_page_returns_cursor_only_when_more_rows_exist():
+    rows = make_rows(3)
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = rows
+    db = MagicMock()
+    db.execute = AsyncMock(return_value=result)
+
+    page, next_cursor = await fetch_page(db, system_log_query(), SystemLog, limit=2)
+    assert page == rows[:2]
+    assert decode_cursor(next_cursor) == (rows[1].timestamp, rows[1].id)
+    assert "LIMIT" in compile_sql(db.execute.await_args.args[0])
+
+    result.scalars.return_value.all.return_value = rows[2:]
+    page, next_cursor = await fetch_page(db, system_log_query(), SystemLog, limit=2, cursor=next_cursor)
+    assert page == rows[2:]
+    assert next_cursor is None
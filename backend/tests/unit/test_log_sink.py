@@ -0,0 +1,132 @@
+import asyncio
+import json
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from backend.app.services.log_sink import LogSink
+from backend.app.services import logging_service
+from backend.app.models.log_models import SystemLog, AuditLog
+
+SYSTEM = SystemLog.__table__
+AUDIT = AuditLog.__table__
+
+def make_sink(capacity=10, batch_size=5, **kwargs):
+    db = MagicMock()
+    db.execute = AsyncMock()
+    db.commit = AsyncMock()
+
+    async def factory():
+        yield db
+    return LogSink(session_factory=factory, capacity=capacity, batch_size=batch_size, flush_ms=50, **kwargs), db
+
+def row(message, level="INFO"):
+    return {"level": level, "category": "test", "message": message, "user_id": None, "details": None}
+
+@pytest.mark.asyncio
+async def test_flush_writes_batches_with_one_insert_per_table():
+    sink, db = make_sink(batch_size=3)
+    for i in range(4):
+        sink.emit(SYSTEM, row(f"m{i}"))
+    sink.emit(AUDIT, {"user_id": None, "action": "login", "resource": "user", "resource_id": None, "details": None})
+
+    assert await sink.flush() == 5
+    assert len(sink) == 0
+    # Two batches of at most 3 rows; the second holds the last system row and the audit row
+    assert db.execute.await_count == 3
+    assert db.commit.await_count == 2
+    first_rows = db.execute.await_args_list[0].args[1]
+    assert [r["message"] for r in first_rows] == ["m0", "m1", "m2"]
+    assert all("timestamp" in r for r in first_rows)
+
+@pytest.mark.asyncio
+async def test_full_buffer_drops_debug_first():
+    sink, _ = make_sink(capacity=3)
+    assert sink.emit(SYSTEM, row("d1", "DEBUG"), "DEBUG")
+    assert sink.emit(SYSTEM, row("i1"), "INFO")
+    assert sink.emit(SYSTEM, row("i2"), "INFO")
+
+    # A new DEBUG row is dropped; an ERROR row evicts the buffered DEBUG row
+    assert not sink.emit(SYSTEM, row("d2", "DEBUG"), "DEBUG")
+    assert sink.emit(SYSTEM, row("e1", "ERROR"), "ERROR")
+    # Nothing left to evict
+    assert not sink.emit(SYSTEM, row("i3"), "INFO")
+
+    messages = [record[1]["message"] for record in sink._take(10)]
+    assert messages == ["i1", "i2", "e1"]
+
+@pytest.mark.asyncio
+async def test_put_waits_for_a_flush_when_full():
+    sink, db = make_sink(capacity=2, batch_size=2)
+    sink.emit(SYSTEM, row("a"))
+    sink.emit(SYSTEM, row("b"))
+    sink.start()
+
+    await asyncio.wait_for(sink.put(SYSTEM, row("c")), timeout=1)
+    await sink.stop()
+
+    written = [r["message"] for call in db.execute.await_args_list for r in call.args[1]]
+    assert written == ["a", "b", "c"]
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_rows_for_the_next_attempt():
+    sink, db = make_sink()
+    db.execute.side_effect = [Exception("db down"), None]
+    sink.emit(SYSTEM, row("a"))
+
+    assert await sink.flush() == 0
+    assert len(sink) == 1
+    assert await sink.flush() == 1
+
+@pytest.mark.asyncio
+async def test_batch_failing_max_attempts_is_bisected_and_bad_rows_dead_lettered(tmp_path):
+    dead_letters = tmp_path / "dead.jsonl"
+    sink, db = make_sink(max_attempts=2, dead_letter_path=dead_letters)
+    written = []
+
+    async def execute(statement, rows):
+        if any(r["message"] == "bad" for r in rows):
+            raise Exception("invalid input")
+        written.extend(r["message"] for r in rows)
+    db.execute.side_effect = execute
+    for message in ["a", "b", "bad", "c", "d"]:
+        sink.emit(SYSTEM, row(message))
+
+    assert await sink.flush() == 0
+    assert len(sink) == 5
+    assert await sink.flush() == 4
+
+    assert len(sink) == 0
+    assert sorted(written) == ["a", "b", "c", "d"]
+    [line] = dead_letters.read_text().splitlines()
+    dead = json.loads(line)
+    assert dead["table"] == SYSTEM.name
+    assert dead["row"]["message"] == "bad"
+    assert dead["error"] == "invalid input"
+
+@pytest.mark.asyncio
+async def test_lost_connection_is_retried_without_bisecting(tmp_path):
+    dead_letters = tmp_path / "dead.jsonl"
+    sink, db = make_sink(max_attempts=1, dead_letter_path=dead_letters)
+    db.execute.side_effect = ConnectionRefusedError("connect call failed")
+    sink.emit(SYSTEM, row("a"))
+    sink.emit(SYSTEM, row("b"))
+
+    assert await sink.flush() == 0
+
+    assert len(sink) == 2
+    assert db.execute.await_count == 1
+    assert not dead_letters.exists()
+    assert sink._retry_at > 0
+
+def test_logging_service_enqueues_instead_of_committing():
+    db = MagicMock()
+    with patch.object(logging_service, "log_sink") as mock_sink:
+        logging_service.log_info(db, "webhook", "received")
+        logging_service.audit_log(db, None, "login", "user")
+
+    db.commit.assert_not_called()
+    system_call, audit_call = mock_sink.emit.call_args_list
+    assert system_call.args[0] is SYSTEM
+    assert system_call.args[1]["message"] == "received"
+    assert system_call.args[2] == "INFO"
+    assert audit_call.args[0] is AUDIT
@@ -1,13 +1,12 @@
 import pytest
-import asyncio
 from unittest.mock import AsyncMock, MagicMock, patch
 from decimal import Decimal
 from uuid import UUID
 from sqlalchemy.ext.asyncio import AsyncSession # Use AsyncSession
 from sqlalchemy import select
 
-from backend.app.services.order_service import place_dca_orders, handle_filled_order, cancel_pending_orders, monitor_order_fills
-from backend.app.models.trading_models import PositionGroup, DCAOrder
+from backend.app.services.order_service import place_dca_orders, handle_filled_order, cancel_pending_orders, cancel_orders, monitor_order_fills, place_partial_close_order
+from backend.app.models.trading_models import PositionGroup, Pyramid, DCAOrder
 from backend.app.services.exchange_manager import ExchangeManager
 
 # As per GEMINI.md, this is the correct way to mock an async context manager
@@ -43,11 +42,19 @@ Mocks a PositionGroup instance.
         "dca_config": {
             "dca_levels": 2,
             "price_gaps": [Decimal("0.01"), Decimal("0.02")],
-            "dca_weights": [Decimal("0.5"), Decimal("0.5")]
+            "dca_weights": [Decimal("0.5"), Decimal("0.5")],
+            "tp_percent": Decimal("0.01")
         }
     }
     return pg
 
+@pytest.fixture
+def mock_pyramid(mock_position_group):
+    pyramid = MagicMock(spec=Pyramid)
+    pyramid.id = UUID('87654321-4321-8765-4321-876543218765')
+    pyramid.group_id = mock_position_group.id
+    return pyramid
+
 @pytest.fixture
 def mock_exchange_manager():
     """
@@ -62,7 +69,7 @@ def mock_exchange_manager():
     return manager
 
 @pytest.mark.asyncio
-async def test_place_dca_orders_successfully(mock_db_session, mock_position_group, mock_exchange_manager):
+async def test_place_dca_orders_successfully(mock_db_session, mock_position_group, mock_pyramid, mock_exchange_manager):
     """
     Verify that place_dca_orders correctly uses the ExchangeManager to place orders.
     """
@@ -72,47 +79,111 @@ async def test_place_dca_orders_successfully(mock_db_session, mock_position_grou
     patch('backend.app.services.order_service.grid_calculator.calculate_position_size', return_value=[
         Decimal("500.00"), Decimal("500.00")
     ]), \
-    patch('backend.app.services.order_service.validation_service.validate_and_adjust_order', new_callable=AsyncMock) as mock_validate, \
+    patch('backend.app.services.order_service.validation_service.validate_and_adjust_grid', new_callable=AsyncMock) as mock_validate, \
     patch('backend.app.services.exchange_manager.ExchangeManager', return_value=mock_exchange_manager) as mock_exchange_manager_class:
 
-        mock_validate.side_effect = [
+        mock_validate.return_value = [
             (Decimal("5.0505"), Decimal("99.00")),
             (Decimal("5.1020"), Decimal("98.00"))
         ]
-        mock_exchange_manager.place_order.side_effect = [
+        mock_exchange_manager.place_orders = AsyncMock(return_value=[
             {"id": "order_id_1"}, {"id": "order_id_2"}
-        ]
+        ])
 
-        await place_dca_orders(mock_db_session, mock_position_group)
+        orders = await place_dca_orders(mock_db_session, mock_position_group, mock_pyramid)
 
+        # Precision is fetched and applied once for the whole grid
+        mock_validate.assert_awaited_once_with(
+            mock_db_session, "binance", "BTC/USDT", "buy",
+            [(Decimal("500.00") / Decimal("99.00"), Decimal("99.00")), (Decimal("500.00") / Decimal("98.00"), Decimal("98.00"))]
+        )
         mock_exchange_manager_class.assert_called_once_with(mock_db_session, mock_position_group.user_id, "binance")
         mock_exchange_manager.__aenter__.assert_awaited_once()
-        assert mock_exchange_manager.place_order.call_count == 2
-        mock_exchange_manager.place_order.assert_any_await(
-            symbol="BTC/USDT", side="buy", order_type="limit", amount=Decimal("5.0505"), price=Decimal("99.00")
+        mock_exchange_manager.place_orders.assert_awaited_once_with(
+            symbol="BTC/USDT", side="buy", orders=mock_validate.return_value, order_type="limit"
         )
+        mock_exchange_manager.place_order.assert_not_called()
         mock_exchange_manager.__aexit__.assert_awaited_once()
-        mock_db_session.commit.assert_called_once()
+        mock_db_session.add_all.assert_called_once_with(orders)
+        assert [o.exchange_order_id for o in orders] == ["order_id_1", "order_id_2"]
+        # Every required column is filled from the rounded grid
+        first = orders[0]
+        assert (first.group_id, first.pyramid_id, first.symbol, first.side) == (mock_position_group.id, mock_pyramid.id, "BTC/USDT", "buy")
+        assert (first.price, first.quantity) == (Decimal("99.00"), Decimal("5.0505"))
+        assert (first.gap_percent, first.weight_percent, first.tp_percent) == (Decimal("1"), Decimal("50"), Decimal("1"))
+        assert [o.tp_price for o in orders] == [Decimal("99.99"), Decimal("98.98")]
+        assert first.submitted_at is not None
+        mock_db_session.execute.assert_not_called()
+        mock_db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_place_dca_orders_skips_rejected_legs(mock_db_session, mock_position_group, mock_pyramid, mock_exchange_manager):
+    # Without an explicit pyramid the group's latest one is loaded
+    pyramid_result = MagicMock()
+    pyramid_result.scalars.return_value.first.return_value = mock_pyramid
+    mock_db_session.execute = AsyncMock(return_value=pyramid_result)
+    with patch('backend.app.services.order_service.grid_calculator.calculate_dca_levels', return_value=[
+        {"price": Decimal("99.00")}, {"price": Decimal("98.00")}
+    ]), \
+    patch('backend.app.services.order_service.grid_calculator.calculate_position_size', return_value=[
+        Decimal("500.00"), Decimal("500.00")
+    ]), \
+    patch('backend.app.services.order_service.validation_service.validate_and_adjust_grid', new_callable=AsyncMock) as mock_validate, \
+    patch('backend.app.services.exchange_manager.ExchangeManager', return_value=mock_exchange_manager):
+        mock_validate.return_value = [(Decimal("5.0505"), Decimal("99.00")), (Decimal("5.1020"), Decimal("98.00"))]
+        mock_exchange_manager.place_orders = AsyncMock(return_value=[Exception("Insufficient balance"), {"id": "order_id_2"}])
+
+        orders = await place_dca_orders(mock_db_session, mock_position_group)
+
+        assert [(o.leg_index, o.exchange_order_id, o.pyramid_id, o.gap_percent) for o in orders] == [(1, "order_id_2", mock_pyramid.id, Decimal("2"))]
+        mock_db_session.add_all.assert_called_once_with(orders)
+
+@pytest.mark.asyncio
+async def test_place_dca_orders_requires_a_pyramid(mock_db_session, mock_position_group):
+    pyramid_result = MagicMock()
+    pyramid_result.scalars.return_value.first.return_value = None
+    mock_db_session.execute = AsyncMock(return_value=pyramid_result)
+    with patch('backend.app.services.exchange_manager.ExchangeManager') as mock_exchange_manager_class:
+        with pytest.raises(ValueError):
+            await place_dca_orders(mock_db_session, mock_position_group)
+        mock_exchange_manager_class.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_place_partial_close_order_rounds_and_closes_at_market(mock_db_session, mock_position_group, mock_exchange_manager):
+    mock_position_group.side = "long"
+    order = {"id": "close_1", "filled": 0.123, "average": 101.0}
+    mock_exchange_manager.close_at_market = AsyncMock(return_value=order)
+    with patch('backend.app.services.order_service.validation_service.validate_and_adjust_order', new_callable=AsyncMock) as mock_validate, \
+         patch('backend.app.services.exchange_manager.ExchangeManager', return_value=mock_exchange_manager):
+        mock_validate.return_value = (Decimal("0.123"), Decimal("101.0"))
+
+        result = await place_partial_close_order(mock_db_session, mock_position_group, Decimal("0.12345"), Decimal("101.0"))
+
+    mock_validate.assert_awaited_once_with(mock_db_session, "binance", "BTC/USDT", "sell", Decimal("0.12345"), Decimal("101.0"))
+    mock_exchange_manager.close_at_market.assert_awaited_once_with("BTC/USDT", "sell", Decimal("0.123"))
+    assert result == order
 
 @pytest.mark.asyncio # Make test async
 async def test_handle_filled_order_updates_status(mock_db_session):
-    dca_order = MagicMock(spec=DCAOrder)
+    dca_order = DCAOrder(quantity=Decimal("5.0"), filled_quantity=Decimal("0"))
     fill_data = {"price": "99.50", "filled": "5.0"}
     await handle_filled_order(mock_db_session, dca_order, fill_data) # Await the call
     assert dca_order.status == "filled"
+    assert dca_order.avg_fill_price == Decimal("99.50")
+    # A full fill leaves filled_quantity alone
+    assert dca_order.filled_quantity == Decimal("0")
     mock_db_session.commit.assert_called_once()
 
 @pytest.mark.asyncio
 async def test_cancel_pending_orders_successfully(mock_db_session, mock_position_group, mock_exchange_manager):
     order1 = MagicMock(spec=DCAOrder)
     order1.exchange_order_id = "order_id_1"
-    order1.group_id = mock_position_group.id # Corrected to group_id
-    order1.position_group = mock_position_group # Add position_group attribute
+    order1.group_id = mock_position_group.id
+    order1.group = mock_position_group
     mock_result = MagicMock()
     mock_result.scalars.return_value.all.return_value = [order1]
-    future_result = asyncio.Future()
-    future_result.set_result(mock_result)
-    mock_db_session.execute.return_value = future_result
+    mock_db_session.execute.return_value = mock_result
+    mock_exchange_manager.cancel_order = AsyncMock(return_value={"id": "order_id_1", "status": "canceled", "filled": 0})
     with patch('backend.app.services.exchange_manager.ExchangeManager', return_value=mock_exchange_manager) as mock_exchange_manager_class:
         await cancel_pending_orders(mock_db_session, mock_position_group.id)
 
@@ -120,7 +191,25 @@ async def test_cancel_pending_orders_successfully(mock_db_session, mock_position
         mock_exchange_manager.__aenter__.assert_awaited_once()
         mock_exchange_manager.cancel_order.assert_awaited_once_with(symbol="BTC/USDT", order_id="order_id_1")
         assert order1.status == "cancelled"
-        mock_db_session.commit.assert_called_once()
+        assert order1.cancelled_at is not None
+        mock_db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_cancel_settles_a_leg_that_filled_first(mock_exchange_manager):
+    order = MagicMock(spec=DCAOrder, exchange_order_id="leg_1", quantity=Decimal("2"))
+    mock_exchange_manager.cancel_order = AsyncMock(side_effect=Exception("Order does not exist"))
+    mock_exchange_manager.fetch_order = AsyncMock(return_value={"id": "leg_1", "status": "closed", "filled": "2", "average": "99"})
+
+    await cancel_orders(mock_exchange_manager, "BTC/USDT", [order])
+
+    mock_exchange_manager.fetch_order.assert_awaited_once_with(order_id="leg_1", symbol="BTC/USDT")
+    assert order.status == "filled"
+    assert order.avg_fill_price == Decimal("99")
+
+    # Still on the book after a failed cancel: the caller must not go on
+    mock_exchange_manager.fetch_order.return_value = {"id": "leg_1", "status": "open"}
+    with pytest.raises(RuntimeError):
+        await cancel_orders(mock_exchange_manager, "BTC/USDT", [order])
 
 @pytest.mark.asyncio
 async def test_monitor_order_fills_updates_filled_orders(
@@ -135,13 +224,11 @@ async def test_monitor_order_fills_updates_filled_orders(
     pending_order.exchange_order_id = "pending_order_id"
     pending_order.group_id = mock_position_group.id # Corrected to group_id
     pending_order.status = "pending"
-    pending_order.position_group = mock_position_group # Add position_group attribute
+    pending_order.group = mock_position_group
 
     mock_result = MagicMock()
     mock_result.scalars.return_value.all.return_value = [pending_order]
-    future_result = asyncio.Future()
-    future_result.set_result(mock_result)
-    mock_db_session.execute.return_value = future_result
+    mock_db_session.execute.return_value = mock_result
     mock_context = MockAsyncContextManager(mock_exchange_manager)
     # Mock the exchange to return a filled status for the pending order
     mock_exchange_manager.fetch_order.return_value = {
@@ -155,7 +242,7 @@ async def test_monitor_order_fills_updates_filled_orders(
          patch('backend.app.services.order_service.handle_filled_order') as mock_handle_filled_order:
         mock_get_exchange.return_value = mock_context
 
-        await monitor_order_fills(mock_db_session) # Pass db session to the function
+        await monitor_order_fills(mock_db_session, batched=False) # Pass db session to the function
 
         # Assertions
         mock_get_exchange.assert_awaited_once_with(
@@ -173,3 +260,60 @@ async def test_monitor_order_fills_updates_filled_orders(
             {"id": "pending_order_id", "status": "closed", "filled": Decimal("1.0"), "price": Decimal("100.00")}
         )
         # The status update and commit are handled by handle_filled_order, so we don't assert them here directly
+
+
+@pytest.mark.asyncio
+async def test_monitor_order_fills_batched_reconciliation(
+    mock_db_session, mock_position_group, mock_exchange_manager
+):
+    """
+    Verify that batched reconciliation fetches open/closed orders once per symbol
+    and commits every fill in a single transaction.
+    """
+    orders = []
+    for order_id in ["still_open", "filled_1", "filled_2", "cancelled", "rejected", "old_fill"]:
+        order = MagicMock(spec=DCAOrder)
+        order.exchange_order_id = order_id
+        order.status = "pending"
+        order.quantity = Decimal("5.1")
+        order.created_at = None
+        order.group = mock_position_group
+        orders.append(order)
+
+    mock_result = MagicMock()
+    mock_result.scalars.return_value.all.return_value = orders
+    mock_db_session.execute.return_value = mock_result
+
+    mock_exchange_manager.fetch_open_orders = AsyncMock(return_value=[{"id": "still_open", "status": "open"}])
+    mock_exchange_manager.fetch_closed_orders = AsyncMock(return_value=[
+        {"id": "filled_1", "status": "closed", "price": "99.00", "average": "98.90", "filled": "5.0"},
+        {"id": "filled_2", "status": "closed", "price": "98.00", "average": None, "filled": "5.1"},
+        {"id": "cancelled", "status": "canceled", "price": "97.00", "filled": 0},
+        {"id": "rejected", "status": "rejected", "price": "96.00", "filled": None},
+    ])
+    # Closed before the `since` window, so only a direct fetch finds it
+    mock_exchange_manager.fetch_order = AsyncMock(return_value={"id": "old_fill", "status": "closed", "price": "95.00", "filled": "5.1"})
+    mock_context = MockAsyncContextManager(mock_exchange_manager)
+
+    with patch('backend.app.services.exchange_manager.get_exchange', new_callable=AsyncMock) as mock_get_exchange:
+        mock_get_exchange.return_value = mock_context
+
+        await monitor_order_fills(mock_db_session, batched=True)
+
+        mock_get_exchange.assert_awaited_once_with(mock_db_session, "binance", mock_position_group.user_id)
+        mock_exchange_manager.fetch_open_orders.assert_awaited_once_with("BTC/USDT")
+        mock_exchange_manager.fetch_closed_orders.assert_awaited_once_with("BTC/USDT", None)
+        mock_exchange_manager.fetch_order.assert_awaited_once_with(order_id="old_fill", symbol="BTC/USDT")
+
+        assert orders[0].status == "pending"
+        assert orders[1].status == "filled"
+        assert orders[1].avg_fill_price == Decimal("98.90")
+        assert orders[1].filled_quantity == Decimal("5.0")
+        assert orders[2].status == "filled"
+        assert orders[2].avg_fill_price == Decimal("98.00")
+        assert orders[3].status == "cancelled"
+        assert orders[3].cancelled_at is not None
+        assert orders[4].status == "failed"
+        assert orders[5].status == "filled"
+        assert orders[5].avg_fill_price == Decimal("95.00")
+        mock_db_session.commit.assert_awaited_once()
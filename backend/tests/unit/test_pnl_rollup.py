@@ -0,0 +1,84 @@
+import pytest
+from datetime import date, datetime
+from decimal import Decimal
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.pnl_rollup import position_pnl, realized_pnl_by_period, record_realized_pnl
+from backend.app.services.dashboard_service import get_dashboard_stats
+from backend.app.models.trading_models import PositionGroup
+
+def make_group(side="long"):
+    group = MagicMock(spec=PositionGroup)
+    group.user_id = uuid4()
+    group.symbol = "BTC/USDT"
+    group.timeframe = 60
+    group.side = side
+    group.realized_pnl_usd = Decimal("5")
+    return group
+
+def compile_sql(statement):
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+def test_position_pnl_is_side_aware():
+    assert position_pnl(make_group("long"), Decimal("2"), Decimal("100"), Decimal("110")) == Decimal("20")
+    assert position_pnl(make_group("short"), Decimal("2"), Decimal("100"), Decimal("110")) == Decimal("-20")
+
+@pytest.mark.asyncio
+async def test_record_realized_pnl_upserts_the_daily_row():
+    db = MagicMock(spec=AsyncSession)
+    group = make_group()
+    closed_at = datetime(2025, 11, 24, 15, 30)
+
+    await record_realized_pnl(db, group, Decimal("12.5"), closed=True, at=closed_at)
+
+    assert group.realized_pnl_usd == Decimal("17.5")
+    assert group.closed_at == closed_at
+    statement = db.execute.await_args.args[0]
+    sql = compile_sql(statement)
+    assert "ON CONFLICT (user_id, day, symbol, timeframe) DO UPDATE" in sql
+    assert "realized_pnl_usd = (pnl_rollups.realized_pnl_usd + excluded.realized_pnl_usd)" in sql
+    params = statement.compile(dialect=postgresql.dialect()).params
+    assert params["day"] == date(2025, 11, 24)
+    assert params["closed_groups"] == 1
+
+@pytest.mark.asyncio
+async def test_realized_pnl_by_period_buckets_rollup_rows():
+    row = MagicMock(period_start=datetime(2025, 11, 1), symbol="BTC/USDT", timeframe=60, realized_pnl_usd=Decimal("40"), closed_groups=3)
+    result = MagicMock()
+    result.all.return_value = [row]
+    db = MagicMock(spec=AsyncSession)
+    db.execute = AsyncMock(return_value=result)
+
+    buckets = await realized_pnl_by_period(db, uuid4(), "month", symbol="BTC/USDT")
+
+    assert buckets == [{"period_start": date(2025, 11, 1), "symbol": "BTC/USDT", "timeframe": 60, "realized_pnl_usd": Decimal("40"), "closed_groups": 3}]
+    sql = compile_sql(db.execute.await_args.args[0])
+    assert "date_trunc('month', pnl_rollups.day)" in sql
+    assert "position_groups" not in sql
+    with pytest.raises(ValueError):
+        await realized_pnl_by_period(db, uuid4(), "year")
+
+@pytest.mark.asyncio
+async def test_dashboard_stats_are_scoped_to_the_user():
+    user_id = uuid4()
+    groups = MagicMock()
+    groups.one.return_value = (2, 7, Decimal("-3"))
+    realized = MagicMock()
+    realized.scalar_one.return_value = Decimal("10")
+    db = MagicMock(spec=AsyncSession)
+    db.execute = AsyncMock(side_effect=[groups, realized])
+
+    stats = await get_dashboard_stats(db, user_id)
+
+    assert stats == {
+        "open_positions": 2,
+        "total_positions": 7,
+        "pnl": Decimal("7"),
+        "realized_pnl": Decimal("10"),
+        "unrealized_pnl": Decimal("-3"),
+    }
+    for call in db.execute.await_args_list:
+        assert "user_id =" in compile_sql(call.args[0])
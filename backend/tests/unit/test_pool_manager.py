@@ -1,36 +1,167 @@
 import pytest
-from unittest.mock import MagicMock
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
 from uuid import uuid4
-from backend.app.services.pool_manager import ExecutionPoolManager
+from backend.app.services.pool_manager import ExecutionPoolManager, PoolSlotCounter
 from backend.app.core.config import settings
-from fastapi import Depends # Import Depends
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func
+
+class FakeRedis:
+    """Just enough of redis.asyncio to run the slot scripts' logic in-process."""
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        value = self.values.get(key)
+        return None if value is None else str(value)
+
+    async def set(self, key, value, nx=False):
+        if nx and key in self.values:
+            return None
+        self.values[key] = int(value)
+        return True
+
+    async def scan_iter(self, match=None):
+        prefix = match.rstrip("*")
+        for key in list(self.values):
+            if key.startswith(prefix):
+                yield key
+
+    async def mget(self, keys):
+        return [await self.get(key) for key in keys]
+
+    def register_script(self, script):
+        async def run(keys, args=()):
+            if "ipairs" in script:
+                reset = 0
+                for i, key in enumerate(keys):
+                    if (await self.get(key) or "") == args[2 * i]:
+                        self.values[key] = int(args[2 * i + 1])
+                        reset += 1
+                return reset
+            key = keys[0]
+            if key not in self.values:
+                return -1
+            if "INCR" in script:
+                if self.values[key] >= int(args[0]):
+                    return 0
+                self.values[key] += 1
+                return 1
+            if self.values[key] <= 0:
+                return 0
+            self.values[key] -= 1
+            return self.values[key]
+        return run
 
 @pytest.fixture
 def mock_db_session():
     return MagicMock(spec=AsyncSession)
 
+@pytest.fixture
+def fake_redis():
+    return FakeRedis()
+
+@pytest.fixture
+def slots(fake_redis):
+    return PoolSlotCounter(redis_factory=AsyncMock(return_value=fake_redis))
+
+def count_result(value):
+    result = MagicMock()
+    result.scalar_one.return_value = value
+    return result
+
 @pytest.mark.asyncio
-async def test_pool_manager(mock_db_session):
+async def test_pool_manager(mock_db_session, slots, fake_redis):
     user_id = uuid4()
-    pool_manager = ExecutionPoolManager(db=mock_db_session)
+    pool_manager = ExecutionPoolManager(db=mock_db_session, slots=slots)
 
-    # Mock the execute method for counting
-    mock_result = MagicMock()
-    mock_result.scalar_one.return_value = 0
-    mock_db_session.execute.return_value = mock_result
+    # The counter is seeded from the table once
+    mock_db_session.execute = AsyncMock(return_value=count_result(0))
 
     open_slots = await pool_manager.get_open_slots(user_id)
     can_open = await pool_manager.can_open_position(user_id)
 
     assert open_slots == settings.POOL_MAX_OPEN_GROUPS # Should return max_open_groups if no open positions
     assert can_open is True
+    mock_db_session.execute.assert_awaited_once()
 
     # Test when there are open positions
-    mock_result.scalar_one.return_value = settings.POOL_MAX_OPEN_GROUPS # All slots filled
+    fake_redis.values[f"pool:slots:{user_id}"] = settings.POOL_MAX_OPEN_GROUPS # All slots filled
     open_slots = await pool_manager.get_open_slots(user_id)
     can_open = await pool_manager.can_open_position(user_id)
 
     assert open_slots == 0
-    assert can_open is False
\ No newline at end of file
+    assert can_open is False
+    mock_db_session.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_concurrent_acquires_never_exceed_limit(mock_db_session, slots):
+    user_id = uuid4()
+    mock_db_session.execute = AsyncMock(return_value=count_result(1))
+
+    results = await asyncio.gather(*[slots.try_acquire(mock_db_session, user_id, limit=3) for _ in range(10)])
+
+    assert results.count(True) == 2
+    assert await slots.used(mock_db_session, user_id) == 3
+
+@pytest.mark.asyncio
+async def test_release_frees_a_slot_and_never_goes_negative(mock_db_session, slots):
+    user_id = uuid4()
+    mock_db_session.execute = AsyncMock(return_value=count_result(0))
+    pool_manager = ExecutionPoolManager(db=mock_db_session, slots=slots)
+    group = MagicMock(user_id=user_id)
+
+    assert await pool_manager.consume_slot(group)
+    await pool_manager.release_slot(group)
+    await pool_manager.release_slot(group)
+
+    assert await slots.used(mock_db_session, user_id) == 0
+
+@pytest.mark.asyncio
+async def test_release_notifies_listeners(mock_db_session, slots):
+    user_id = uuid4()
+    mock_db_session.execute = AsyncMock(return_value=count_result(1))
+    released = []
+    slots.add_release_listener(released.append)
+
+    await slots.release(user_id)
+    await slots.release(user_id, notify=False)
+
+    assert released == [user_id]
+
+@pytest.mark.asyncio
+async def test_reconcile_resets_counters_to_table(mock_db_session, slots, fake_redis):
+    busy_user, idle_user = uuid4(), uuid4()
+    fake_redis.values[f"pool:slots:{busy_user}"] = 7
+    fake_redis.values[f"pool:slots:{idle_user}"] = 2
+    result = MagicMock()
+    result.all.return_value = [(busy_user, 3)]
+    mock_db_session.execute = AsyncMock(return_value=result)
+
+    assert await slots.reconcile(mock_db_session) == {busy_user: 3}
+    assert fake_redis.values[f"pool:slots:{busy_user}"] == 3
+    assert fake_redis.values[f"pool:slots:{idle_user}"] == 0
+
+@pytest.mark.asyncio
+async def test_reconcile_keeps_acquires_made_while_counting(mock_db_session, slots, fake_redis):
+    user_id = uuid4()
+    fake_redis.values[f"pool:slots:{user_id}"] = 2
+    result = MagicMock()
+    result.all.return_value = [(user_id, 2)]
+
+    async def count_while_acquiring(*args, **kwargs):
+        assert await slots.try_acquire(mock_db_session, user_id, limit=5)
+        return result
+
+    mock_db_session.execute = AsyncMock(side_effect=count_while_acquiring)
+
+    await slots.reconcile(mock_db_session)
+
+    assert fake_redis.values[f"pool:slots:{user_id}"] == 3
+
+@pytest.mark.asyncio
+async def test_redis_outage_falls_back_to_counting(mock_db_session):
+    slots = PoolSlotCounter(redis_factory=AsyncMock(side_effect=ConnectionError("redis down")))
+    mock_db_session.execute = AsyncMock(return_value=count_result(settings.POOL_MAX_OPEN_GROUPS))
+
+    assert not await slots.try_acquire(mock_db_session, uuid4())
@@ -5,7 +5,9 @@ from uuid import UUID
 import redis.asyncio as redis
 from sqlalchemy.orm import Session
 
-from backend.app.services.precision_service import PrecisionService, get_redis_client
+import asyncio
+from backend.app.services.precision_service import PrecisionService, PrecisionLRU, get_redis_client, find_symbols_in_use
+from backend.app.services.metrics_service import metrics
 from backend.app.core.config import settings
 from backend.app.services.exchange_manager import ExchangeManager
 
@@ -20,8 +22,20 @@ def mock_redis_client():
     mock = AsyncMock(spec=redis.Redis)
     mock.get = AsyncMock(return_value=None)
     mock.set = AsyncMock()
+    mock.pipeline = MagicMock(return_value=MagicMock(execute=AsyncMock()))
     return mock
 
+@pytest.fixture
+def mock_public_client():
+    """A public ccxt client whose load_markets returns two spot markets."""
+    client = MagicMock()
+    client.last_response_headers = {}
+    client.load_markets = AsyncMock(return_value={
+        "BTC/USDT": {"precision": {"amount": 5, "price": 2}, "limits": {"amount": {"min": 0.00001}, "cost": {"min": 5}}},
+        "ETH/USDT": {"precision": {"amount": 4, "price": 2}, "limits": {"amount": {"min": 0.0001}, "cost": {"min": 5}}},
+    })
+    return client
+
 @pytest.fixture
 def mock_exchange_manager_instance():
     """Mocks the instance that the async context manager will yield."""
@@ -62,25 +76,143 @@ async def test_get_precision_from_cache(mock_redis_client, mock_db_session):
         mock_get_exchange.assert_not_called()
 
 @pytest.mark.asyncio
-async def test_get_precision_fetch_if_no_cache(mock_redis_client, mock_db_session, mock_exchange_manager_instance):
+async def test_get_precision_fetch_if_no_cache(mock_redis_client, mock_db_session, mock_public_client):
     """
-    Test that get_precision fetches from the exchange when cache is empty.
+    Test that a miss loads every market of the exchange at once and caches them all.
     """
     settings.PRECISION_CACHE_EXPIRY_SECONDS = 3600
     service = PrecisionService(mock_redis_client)
 
-    # The function get_exchange is an async def, so its mock must be an AsyncMock
-    # that returns our context manager helper.
-    mock_context_manager = MockAsyncContextManager(mock_exchange_manager_instance)
-    
-    with patch('backend.app.services.precision_service.get_exchange', new_callable=AsyncMock, return_value=mock_context_manager) as mock_get_exchange:
+    with patch('backend.app.services.precision_service.get_exchange', new_callable=AsyncMock) as mock_get_exchange, \
+         patch('backend.app.services.precision_service.client_pool') as mock_pool:
+        mock_pool.get_public_client.return_value = mock_public_client
         result = await service.get_precision(mock_db_session, "binance", "BTC/USDT")
 
-        assert result == {"price_precision": 2, "amount_precision": 6}
+        assert result == {"amount": 5, "price": 2, "min_amount": 0.00001, "min_notional": 5}
         mock_redis_client.get.assert_awaited_once_with("precision:binance:BTC/USDT")
-        mock_get_exchange.assert_awaited_once_with(mock_db_session, "binance", UUID('00000000-0000-0000-0000-000000000001'))
-        mock_exchange_manager_instance.get_precision_rules.assert_awaited_once_with("BTC/USDT")
-        mock_redis_client.set.assert_awaited_once()
+        mock_get_exchange.assert_not_called()
+        mock_public_client.load_markets.assert_awaited_once_with(True)
+        mock_pool.get_public_client.assert_called_once_with("binance", settings.EXCHANGE_TESTNET)
+
+        # Both symbols are written to Redis in a single pipeline
+        pipe = mock_redis_client.pipeline.return_value
+        assert pipe.set.call_count == 2
+        pipe.set.assert_any_call("precision:binance:ETH/USDT", json.dumps({"amount": 4, "price": 2, "min_amount": 0.0001, "min_notional": 5}), ex=3600)
+        pipe.execute.assert_awaited_once()
+
+        # ...but only the requested one enters the bounded in-process tier
+        assert len(service.local) == 1
+        assert service.local.get("precision:binance:BTC/USDT") == result
+
+@pytest.mark.asyncio
+async def test_full_load_does_not_evict_the_in_process_tier(mock_redis_client, mock_public_client):
+    service = PrecisionService(mock_redis_client, local_cache=PrecisionLRU(maxsize=2, ttl_seconds=60))
+    service.local.set("precision:binance:ETH/USDT", {"amount": 3})
+    service.local.set("precision:okx:BTC/USDT", {"amount": 6})
+
+    with patch('backend.app.services.precision_service.client_pool') as mock_pool:
+        mock_pool.get_public_client.return_value = mock_public_client
+        await service.load_exchange_precisions("binance")
+
+    # The resident ETH entry is refreshed and nothing else is pushed in
+    assert service.local.get("precision:binance:ETH/USDT")["amount"] == 4
+    assert service.local.get("precision:okx:BTC/USDT") == {"amount": 6}
+    assert service.local.get("precision:binance:BTC/USDT") is None
+
+@pytest.mark.asyncio
+async def test_unknown_symbol_is_negatively_cached(mock_redis_client, mock_db_session, mock_public_client):
+    metrics.reset()
+    service = PrecisionService(mock_redis_client)
+
+    with patch('backend.app.services.precision_service.client_pool') as mock_pool:
+        mock_pool.get_public_client.return_value = mock_public_client
+        for _ in range(3):
+            assert await service.get_precision(mock_db_session, "binance", "NOPE/USDT") is None
+
+    mock_public_client.load_markets.assert_awaited_once()
+    mock_redis_client.get.assert_awaited_once()
+    assert metrics.get_counter("precision_negative_hits", exchange="binance") == 2
+
+    # A later load that lists the symbol lifts the negative entry
+    mock_public_client.load_markets.return_value["NOPE/USDT"] = mock_public_client.load_markets.return_value["BTC/USDT"]
+    with patch('backend.app.services.precision_service.client_pool') as mock_pool:
+        mock_pool.get_public_client.return_value = mock_public_client
+        await service.load_exchange_precisions("binance")
+    assert "precision:binance:NOPE/USDT" not in service.missing
+    metrics.reset()
+
+@pytest.mark.asyncio
+async def test_get_precision_serves_repeat_hits_in_process(mock_redis_client, mock_db_session):
+    mock_redis_client.get.return_value = '{"amount": 8, "price": 2}'
+    service = PrecisionService(mock_redis_client)
+
+    for _ in range(3):
+        assert await service.get_precision(mock_db_session, "binance", "BTC/USDT") == {"amount": 8, "price": 2}
+
+    mock_redis_client.get.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_are_coalesced(mock_redis_client, mock_db_session, mock_public_client):
+    service = PrecisionService(mock_redis_client)
+    release = asyncio.Event()
+    markets = mock_public_client.load_markets.return_value
+
+    async def slow_load_markets(reload=False):
+        await release.wait()
+        return markets
+    mock_public_client.load_markets = AsyncMock(side_effect=slow_load_markets)
+
+    with patch('backend.app.services.precision_service.client_pool') as mock_pool:
+        mock_pool.get_public_client.return_value = mock_public_client
+        tasks = [
+            asyncio.create_task(service.get_precision(mock_db_session, "binance", symbol))
+            for symbol in ["BTC/USDT"] * 5 + ["ETH/USDT"] * 5
+        ]
+        await asyncio.sleep(0)
+        release.set()
+        results = await asyncio.gather(*tasks)
+
+    assert [r["amount"] for r in results] == [5] * 5 + [4] * 5
+    mock_public_client.load_markets.assert_awaited_once()
+    # One Redis lookup per distinct symbol, not per caller
+    assert mock_redis_client.get.await_count == 2
+
+@pytest.mark.asyncio
+async def test_cancelled_load_releases_waiters(mock_redis_client):
+    service = PrecisionService(mock_redis_client)
+    started = asyncio.Event()
+
+    async def hanging_load():
+        started.set()
+        await asyncio.Event().wait()
+
+    leader = asyncio.create_task(service._single_flight("binance:*", hanging_load))
+    await started.wait()
+    waiter = asyncio.create_task(service._single_flight("binance:*", AsyncMock()))
+    await asyncio.sleep(0)
+    leader.cancel()
+
+    with pytest.raises(RuntimeError):
+        await asyncio.wait_for(waiter, timeout=1)
+    assert leader.cancelled()
+    assert service._inflight == {}
+    # The next caller loads afresh
+    assert await service._single_flight("binance:*", AsyncMock(return_value={"BTC/USDT": {}})) == {"BTC/USDT": {}}
+
+def test_precision_lru_evicts_and_expires():
+    cache = PrecisionLRU(maxsize=2, ttl_seconds=60)
+    cache.set("a", {"amount": 1})
+    cache.set("b", {"amount": 2})
+    cache.get("a")
+    cache.set("c", {"amount": 3})
+
+    assert cache.get("b") is None  # least recently used
+    assert cache.get("a") == {"amount": 1}
+
+    expired = PrecisionLRU(maxsize=2, ttl_seconds=-1)
+    expired.set("a", {"amount": 1})
+    assert expired.get("a") is None
+    assert len(expired) == 0
 
 @pytest.mark.asyncio
 async def test_fetch_and_cache_precision_rules(mock_redis_client, mock_db_session, mock_exchange_manager_instance):
@@ -132,4 +264,40 @@ async def test_get_redis_client():
 
             assert client1 == mock_redis_instance
             assert client2 == mock_redis_instance
-            mock_from_url.assert_awaited_once_with(settings.REDIS_URL, decode_responses=True)
\ No newline at end of file
+            mock_from_url.assert_awaited_once_with(settings.REDIS_URL, decode_responses=True)
+@pytest.mark.asyncio
+async def test_refresh_all_loads_each_exchange_once(mock_redis_client, mock_public_client):
+    metrics.reset()
+    service = PrecisionService(mock_redis_client)
+    okx_client = MagicMock(last_response_headers={})
+    okx_client.load_markets = AsyncMock(side_effect=Exception("okx down"))
+
+    with patch('backend.app.services.precision_service.client_pool') as mock_pool:
+        mock_pool.get_public_client.side_effect = lambda exchange, testnet: mock_public_client if exchange == "binance" else okx_client
+        refreshed = await service.refresh_all([
+            ("binance", "BTC/USDT"), ("binance", "ETH/USDT"), ("binance", "BTC/USDT"), ("okx", "BTC/USDT"),
+        ])
+
+    assert refreshed == {"binance": 2, "okx": 0}
+    mock_public_client.load_markets.assert_awaited_once_with(True)
+    # The rewrite is one MULTI/EXEC transaction
+    mock_redis_client.pipeline.assert_called_once_with(transaction=True)
+    assert service.local.get("precision:binance:ETH/USDT")["amount"] == 4
+    assert metrics.get_timing("precision_refresh_duration_seconds", exchange="binance").count == 1
+    assert metrics.get_counter("precision_refresh_failures", exchange="okx") == 1
+    metrics.reset()
+
+@pytest.mark.asyncio
+async def test_find_symbols_in_use_is_one_union_query():
+    db = MagicMock()
+    result = MagicMock()
+    result.all.return_value = [("binance", "BTC/USDT"), ("bybit", "ETH/USDT")]
+    db.execute = AsyncMock(return_value=result)
+
+    pairs = await find_symbols_in_use(db)
+
+    assert pairs == {("binance", "BTC/USDT"), ("bybit", "ETH/USDT")}
+    db.execute.assert_awaited_once()
+    query = str(db.execute.call_args[0][0])
+    assert query.count("UNION") == 2
+    assert "queued_signals" in query and "dca_orders" in query
@@ -0,0 +1,90 @@
+import pytest
+import time
+from unittest.mock import AsyncMock, MagicMock, patch
+from decimal import Decimal
+from uuid import uuid4
+
+from backend.app.services.price_feed import PriceFeed
+from backend.app.services.risk_engine import RiskEngine
+from backend.app.models.trading_models import PositionGroup
+
+@pytest.fixture
+def mock_client():
+    client = MagicMock()
+    client.has = {'fetchTickers': True}
+    client.fetch_tickers = AsyncMock(return_value={
+        "BTC/USDT": {"symbol": "BTC/USDT", "last": 29000.5},
+        "ETH/USDT": {"symbol": "ETH/USDT", "last": 1800.25},
+    })
+    return client
+
+@pytest.mark.asyncio
+async def test_refresh_coalesces_symbols_per_exchange(mock_client):
+    """
+    All subscribed symbols of one exchange are fetched with a single request,
+    however many times they were subscribed.
+    """
+    client_factory = MagicMock(return_value=mock_client)
+    feed = PriceFeed(max_age_seconds=10, client_factory=client_factory, testnet=True)
+    for _ in range(50):
+        feed.subscribe("binance", "BTC/USDT")
+    feed.subscribe("binance", "ETH/USDT")
+
+    await feed.refresh()
+
+    client_factory.assert_called_once_with("binance", True)
+    mock_client.fetch_tickers.assert_awaited_once_with(["BTC/USDT", "ETH/USDT"])
+    assert feed.get_price("binance", "BTC/USDT") == Decimal("29000.5")
+    assert feed.get_price("binance", "ETH/USDT") == Decimal("1800.25")
+
+@pytest.mark.asyncio
+async def test_refresh_notifies_listeners(mock_client):
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock(return_value=mock_client))
+    feed.subscribe("binance", "BTC/USDT")
+    listener = MagicMock()
+    feed.add_listener(listener)
+
+    await feed.refresh()
+
+    listener.assert_called_once_with("binance", {"BTC/USDT": Decimal("29000.5")})
+
+@pytest.mark.asyncio
+async def test_refresh_falls_back_to_single_tickers():
+    client = MagicMock()
+    client.has = {'fetchTickers': False}
+    client.fetch_ticker = AsyncMock(return_value={"last": 100})
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock(return_value=client))
+    feed.subscribe("mexc", "BTC/USDT")
+
+    await feed.refresh()
+
+    client.fetch_ticker.assert_awaited_once_with("BTC/USDT")
+    assert feed.get_price("mexc", "BTC/USDT") == Decimal("100")
+
+def test_get_price_respects_staleness_bound():
+    feed = PriceFeed(max_age_seconds=5, client_factory=MagicMock())
+    feed.update("binance", "BTC/USDT", 100, timestamp=time.monotonic() - 6)
+
+    assert feed.get_price("binance", "BTC/USDT") is None
+    assert feed.get_price("binance", "BTC/USDT", max_age=10) == Decimal("100")
+    assert feed.get_tick("binance", "BTC/USDT").price == Decimal("100")
+    assert feed.get_price("binance", "ETH/USDT") is None
+
+def test_risk_engine_marks_to_market_from_feed():
+    pg = MagicMock(spec=PositionGroup)
+    pg.id = uuid4()
+    pg.exchange = "binance"
+    pg.symbol = "BTC/USDT"
+    pg.side = "long"
+    pg.weighted_avg_entry = Decimal("100")
+    pg.total_filled_quantity = Decimal("2")
+    pg.total_invested_usd = Decimal("200")
+
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    feed.update("binance", "BTC/USDT", 95)
+
+    with patch('backend.app.services.risk_engine.price_feed', feed):
+        assert RiskEngine(db=MagicMock()).mark_to_market(pg) is True
+
+    assert pg.unrealized_pnl_usd == Decimal("-10")
+    assert pg.unrealized_pnl_percent == Decimal("-5")
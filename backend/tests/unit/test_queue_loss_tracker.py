@@ -0,0 +1,129 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from datetime import datetime
+from decimal import Decimal
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.queue_loss_tracker import QueueLossTracker
+from backend.app.services.queue_priority import queue_book, priority_score
+from backend.app.services.price_feed import PriceFeed
+from backend.app.models.trading_models import QueuedSignal
+
+@pytest.fixture(autouse=True)
+def reset_queue_book():
+    queue_book.invalidate()
+    yield
+    queue_book.invalidate()
+
+@pytest.fixture
+def feed():
+    return PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+
+def make_entry(user_id, symbol, side, entry_price, queued_at, loss=0):
+    entry = QueuedSignal(
+        id=uuid4(), user_id=user_id, exchange="binance", symbol=symbol, timeframe=15,
+        side=side, entry_price=Decimal(entry_price), signal_payload={},
+        queued_at=queued_at, replacement_count=0, is_pyramid_continuation=False,
+        current_loss_percent=Decimal(loss), status="queued",
+    )
+    entry.priority_score = priority_score(False, entry.current_loss_percent, 0)
+    return entry
+
+def test_price_update_reprices_and_reorders_heap(feed):
+    """
+    One price tick reprices every waiting signal of the symbol and moves the
+    deepest loss to the top of the user's heap.
+    """
+    user_id = uuid4()
+    btc_long = make_entry(user_id, "BTC/USDT", "long", "100", datetime(2024, 1, 1, 9))
+    btc_short = make_entry(user_id, "BTC/USDT", "short", "100", datetime(2024, 1, 1, 10))
+    eth_long = make_entry(user_id, "ETH/USDT", "long", "50", datetime(2024, 1, 1, 8))
+    queue_book.load(user_id, [btc_long, btc_short, eth_long])
+    assert queue_book.peek(user_id) == eth_long.id  # all tied, oldest first
+
+    tracker = QueueLossTracker(feed=feed)
+    feed.add_listener(tracker.on_prices)
+    for entry in (btc_long, btc_short, eth_long):
+        tracker.track(entry)
+    assert feed.subscriptions() == {"binance": {"BTC/USDT", "ETH/USDT"}}
+
+    feed._notify("binance", {"BTC/USDT": Decimal("92")})
+
+    assert queue_book.ordered(user_id) == [btc_long.id, eth_long.id, btc_short.id]
+    assert tracker._pending[btc_long.id][0] == Decimal("-8.0")
+    assert tracker._pending[btc_short.id][0] == Decimal("8.0")
+    assert eth_long.id not in tracker._pending
+
+def test_unchanged_price_is_not_rewritten(feed):
+    user_id = uuid4()
+    entry = make_entry(user_id, "BTC/USDT", "long", "100", datetime(2024, 1, 1), loss="-2")
+    tracker = QueueLossTracker(feed=feed)
+    tracker.track(entry)
+
+    tracker.on_prices("binance", {"BTC/USDT": Decimal("98.00001")})
+
+    assert tracker._pending == {}
+
+@pytest.mark.asyncio
+async def test_flush_batches_all_changes_in_one_statement(feed):
+    user_id = uuid4()
+    entries = [make_entry(user_id, "BTC/USDT", "long", str(100 + i), datetime(2024, 1, 1)) for i in range(5)]
+    tracker = QueueLossTracker(feed=feed)
+    for entry in entries:
+        tracker.track(entry)
+    tracker.on_prices("binance", {"BTC/USDT": Decimal("90")})
+    tracker.on_prices("binance", {"BTC/USDT": Decimal("91")})
+
+    db = MagicMock(spec=AsyncSession)
+    db.execute = AsyncMock()
+    db.commit = AsyncMock()
+    assert await tracker.flush(db) == 5
+
+    db.execute.assert_awaited_once()
+    params = db.execute.await_args.args[1]
+    assert len(params) == 5
+    # Coalesced: only the latest tick is written
+    assert {p["b_id"]: p["b_loss"] for p in params}[entries[0].id] == Decimal("-9.0")
+    db.commit.assert_awaited_once()
+    assert await tracker.flush(db) == 0
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_pending(feed):
+    entry = make_entry(uuid4(), "BTC/USDT", "long", "100", datetime(2024, 1, 1))
+    tracker = QueueLossTracker(feed=feed)
+    tracker.track(entry)
+    tracker.on_prices("binance", {"BTC/USDT": Decimal("90")})
+
+    db = MagicMock(spec=AsyncSession)
+    db.execute = AsyncMock(side_effect=Exception("db down"))
+    assert await tracker.flush(db) == 0
+    assert entry.id in tracker._pending
+
+def test_untrack_drops_symbol(feed):
+    entry = make_entry(uuid4(), "BTC/USDT", "long", "100", datetime(2024, 1, 1))
+    tracker = QueueLossTracker(feed=feed)
+    tracker.track(entry)
+    tracker.untrack(entry.id)
+    assert tracker.tracked_symbols() == []
+
+@pytest.mark.asyncio
+async def test_sync_adds_and_drops_entries_in_the_heap(feed):
+    user_id = uuid4()
+    kept = make_entry(user_id, "BTC/USDT", "long", "100", datetime(2024, 1, 1, 9))
+    promoted = make_entry(user_id, "ETH/USDT", "long", "50", datetime(2024, 1, 1, 8))
+    queue_book.load(user_id, [kept, promoted])
+    tracker = QueueLossTracker(feed=feed)
+    tracker.track(kept)
+    tracker.track(promoted)
+    # Queued by another worker, which this process's heap has never seen
+    added = make_entry(user_id, "SOL/USDT", "long", "20", datetime(2024, 1, 1, 7))
+
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = [kept, added]
+    db = MagicMock(spec=AsyncSession)
+    db.execute = AsyncMock(return_value=result)
+    await tracker.sync(db)
+
+    assert queue_book.ordered(user_id) == [added.id, kept.id]
+    assert sorted(tracker.tracked_symbols()) == [("binance", "BTC/USDT"), ("binance", "SOL/USDT")]
@@ -0,0 +1,51 @@
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from backend.app.services.queue_priority import IndexedHeap, heap_key, priority_score
+
+def test_priority_score_follows_sow_order():
+    """
+    Continuation beats any loss, deeper loss beats any replacement count,
+    and more replacements break ties.
+    """
+    assert priority_score(True, Decimal("5"), 0) > priority_score(False, Decimal("-99"), 9999)
+    assert priority_score(False, Decimal("-5.0001"), 0) > priority_score(False, Decimal("-5"), 9999)
+    assert priority_score(False, Decimal("-5"), 3) > priority_score(False, Decimal("-5"), 2)
+    assert priority_score(False, Decimal("2"), 0) > priority_score(False, Decimal("3"), 0)
+    # Fits the Numeric(20, 4) column
+    assert priority_score(True, Decimal("-5000"), 10 ** 6) < Decimal(10) ** 16
+
+def test_heap_key_breaks_ties_fifo():
+    now = datetime(2024, 1, 1)
+    older = heap_key(Decimal("10"), now, "b")
+    newer = heap_key(Decimal("10"), now + timedelta(minutes=1), "a")
+    better = heap_key(Decimal("11"), now + timedelta(hours=1), "c")
+    assert better < older < newer
+
+def test_indexed_heap_update_and_remove_keep_order():
+    rng = random.Random(7)
+    keys = {i: (rng.random(),) for i in range(200)}
+    heap = IndexedHeap.from_items(list(keys.items()))
+
+    for i in rng.sample(range(200), 50):
+        keys[i] = (rng.random(),)
+        heap.update(i, keys[i])
+    for i in rng.sample(range(200), 50):
+        if i in keys:
+            assert heap.remove(i)
+            del keys[i]
+    heap.push(1000, (-1.0,))
+    keys[1000] = (-1.0,)
+
+    assert len(heap) == len(keys)
+    assert heap.peek() == 1000
+    popped = [heap.pop() for _ in range(len(keys))]
+    assert popped == sorted(keys, key=lambda i: keys[i])
+    assert heap.pop() is None
+
+def test_indexed_heap_remove_missing_item():
+    heap = IndexedHeap()
+    heap.push("a", (1,))
+    assert not heap.remove("b")
+    assert "a" in heap
@@ -0,0 +1,126 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+
+from backend.app.services.queue_promoter import QueuePromoter
+from backend.app.models.trading_models import QueuedSignal
+
+def make_slots(free):
+    slots = MagicMock()
+    state = {"free": free}
+
+    async def try_acquire(db, user_id):
+        if state["free"] <= 0:
+            return False
+        state["free"] -= 1
+        return True
+
+    async def release(user_id, notify=True):
+        state["free"] += 1
+
+    slots.try_acquire = AsyncMock(side_effect=try_acquire)
+    slots.release = AsyncMock(side_effect=release)
+    return slots
+
+def make_session_factory(db):
+    async def factory():
+        yield db
+    return factory
+
+def make_entry(user_id):
+    entry = MagicMock(spec=QueuedSignal)
+    entry.id = uuid4()
+    entry.user_id = user_id
+    entry.signal_payload = {"symbol": "BTC/USDT", "exchange": "binance"}
+    return entry
+
+@pytest.mark.asyncio
+async def test_releases_in_one_tick_are_promoted_in_one_drain():
+    user_id = uuid4()
+    db = MagicMock()
+    entries = [make_entry(user_id), make_entry(user_id)]
+    promoter = QueuePromoter(slots=make_slots(2), session_factory=make_session_factory(db))
+
+    with patch('backend.app.services.queue_promoter.queue_service.promote_from_queue', new_callable=AsyncMock) as mock_promote, \
+         patch('backend.app.services.queue_promoter.webhook_service.create_position_group_from_signal', new_callable=AsyncMock) as mock_create, \
+         patch('backend.app.services.queue_promoter.metrics') as mock_metrics:
+        mock_promote.side_effect = entries
+        promoter.on_release(user_id)
+        promoter.on_release(user_id)
+        task = promoter._task
+        await promoter.join()
+
+    assert promoter._task is task
+    assert mock_create.await_count == 2
+    mock_create.assert_any_await(db, entries[0].signal_payload, user_id)
+    mock_metrics.incr.assert_called_once_with("queue_promotions", 2)
+    assert mock_metrics.observe.call_count == 2
+
+@pytest.mark.asyncio
+async def test_empty_queue_returns_the_slot_without_notifying():
+    user_id = uuid4()
+    slots = make_slots(1)
+    promoter = QueuePromoter(slots=slots, session_factory=make_session_factory(MagicMock()))
+
+    with patch('backend.app.services.queue_promoter.queue_service.promote_from_queue', new_callable=AsyncMock, return_value=None), \
+         patch('backend.app.services.queue_promoter.webhook_service.create_position_group_from_signal', new_callable=AsyncMock) as mock_create:
+        assert await promoter.promote_user(MagicMock(), user_id, [0.0]) == 0
+
+    mock_create.assert_not_awaited()
+    slots.release.assert_awaited_once_with(user_id, notify=False)
+
+@pytest.mark.asyncio
+async def test_failed_group_creation_requeues_the_signal():
+    user_id = uuid4()
+    db = MagicMock()
+    db.rollback = AsyncMock()
+    entry = make_entry(user_id)
+    slots = make_slots(1)
+    promoter = QueuePromoter(slots=slots, session_factory=make_session_factory(db))
+
+    with patch('backend.app.services.queue_promoter.queue_service.promote_from_queue', new_callable=AsyncMock, return_value=entry), \
+         patch('backend.app.services.queue_promoter.queue_service.requeue', new_callable=AsyncMock) as mock_requeue, \
+         patch('backend.app.services.queue_promoter.webhook_service.create_position_group_from_signal', new_callable=AsyncMock, side_effect=Exception("exchange down")):
+        assert await promoter.promote_user(db, user_id, [0.0]) == 0
+
+    mock_requeue.assert_awaited_once_with(db, entry)
+    slots.release.assert_awaited_once_with(user_id, notify=False)
+
+@pytest.mark.asyncio
+async def test_full_pool_promotes_nothing():
+    user_id = uuid4()
+    promoter = QueuePromoter(slots=make_slots(0), session_factory=make_session_factory(MagicMock()))
+
+    with patch('backend.app.services.queue_promoter.queue_service.promote_from_queue', new_callable=AsyncMock) as mock_promote:
+        assert await promoter.promote_user(MagicMock(), user_id, [0.0]) == 0
+
+    mock_promote.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_a_failing_user_does_not_drop_the_others_and_is_retried():
+    failing, other = uuid4(), uuid4()
+    db = MagicMock()
+    db.rollback = AsyncMock()
+    slots = make_slots(2)
+    promoter = QueuePromoter(slots=slots, session_factory=make_session_factory(db))
+    promoter.retry_delay = 0
+    attempts = {failing: 0}
+
+    async def promote_from_queue(db, user_id):
+        if user_id == failing and attempts[failing] == 0:
+            attempts[failing] += 1
+            raise Exception("deadlock detected")
+        return make_entry(user_id)
+
+    with patch('backend.app.services.queue_promoter.queue_service.promote_from_queue', new_callable=AsyncMock, side_effect=promote_from_queue), \
+         patch('backend.app.services.queue_promoter.webhook_service.create_position_group_from_signal', new_callable=AsyncMock) as mock_create:
+        promoter.on_release(failing)
+        promoter.on_release(other)
+        await promoter.join()
+
+    promoted_users = [call.args[2] for call in mock_create.await_args_list]
+    assert promoted_users == [other, failing]
+    db.rollback.assert_awaited_once()
+    # The slot taken for the failed attempt was handed back
+    slots.release.assert_awaited_once_with(failing, notify=False)
+    assert promoter._pending == {}
@@ -1,17 +1,20 @@
 import pytest
-from unittest.mock import MagicMock, patch, ANY
-from sqlalchemy.orm import Session
-from uuid import UUID
+from unittest.mock import AsyncMock, MagicMock, patch
+from sqlalchemy.ext.asyncio import AsyncSession
+from uuid import UUID, uuid4
 from decimal import Decimal
 from datetime import datetime # Import datetime
 
-from backend.app.services.queue_service import add_to_queue, handle_signal_replacement, promote_from_queue, calculate_priority
-from backend.app.models.trading_models import QueuedSignal, PositionGroup # Import PositionGroup for potential future use
+from backend.app.services.queue_service import (
+    add_to_queue, handle_signal_replacement, promote_from_queue, remove_from_queue, calculate_loss_percent
+)
+from backend.app.services.queue_priority import queue_book, priority_score
+from backend.app.models.trading_models import QueuedSignal
 
 @pytest.fixture
 def mock_db_session():
-    """Mocks a SQLAlchemy database session."""
-    return MagicMock(spec=Session)
+    """Mocks a SQLAlchemy async database session."""
+    return MagicMock(spec=AsyncSession)
 
 @pytest.fixture
 def mock_user_id():
@@ -22,140 +25,160 @@ def mock_signal():
     return {
         "symbol": "BTC/USDT",
         "exchange": "binance",
-        "timeframe": "1h",
-        "execution_intent": {"action": "buy", "amount": 0.001, "strategy": "grid"}
+        "timeframe": "60",
+        "action": "buy",
+        "entry_price": "100",
     }
 
-def test_add_to_queue_creates_new_entry(mock_db_session, mock_signal, mock_user_id):
+@pytest.fixture(autouse=True)
+def reset_queue_book():
+    queue_book.invalidate()
+    yield
+    queue_book.invalidate()
+
+def scalar_result(value):
+    result = MagicMock()
+    result.scalar_one.return_value = value
+    return result
+
+def scalars_result(values):
+    result = MagicMock()
+    result.scalars.return_value.first.return_value = values[0] if values else None
+    result.scalars.return_value.all.return_value = values
+    return result
+
+def make_entry(user_id, score, queued_at, status="queued"):
+    entry = MagicMock(spec=QueuedSignal)
+    entry.id = uuid4()
+    entry.user_id = user_id
+    entry.priority_score = score
+    entry.queued_at = queued_at
+    entry.status = status
+    return entry
+
+def test_calculate_loss_percent_is_side_aware():
+    assert calculate_loss_percent("long", Decimal("100"), Decimal("90")) == Decimal("-10")
+    assert calculate_loss_percent("short", Decimal("100"), Decimal("110")) == Decimal("-10")
+    assert calculate_loss_percent("long", Decimal("100"), None) == Decimal("0")
+
+@pytest.mark.asyncio
+async def test_add_to_queue_creates_new_entry(mock_db_session, mock_signal, mock_user_id):
     """
-    Test that add_to_queue creates and persists a new QueuedSignal.
+    Test that add_to_queue creates and persists a new QueuedSignal with its priority.
     """
-    # Mock the QueuedSignal constructor to return a MagicMock instance
-    with patch('backend.app.services.queue_service.QueuedSignal') as MockQueuedSignal:
-        mock_queue_entry_instance = MockQueuedSignal.return_value
-        mock_queue_entry_instance.priority_score = Decimal("0.0") # Default value
-        mock_queue_entry_instance.replacement_count = 0 # Default value
-
-        # Mock calculate_priority to return a specific value
-        with patch('backend.app.services.queue_service.calculate_priority', return_value=Decimal("100.0")) as mock_calc_priority:
-            queue_entry = add_to_queue(mock_db_session, mock_signal, mock_user_id)
-
-            # Assertions
-            MockQueuedSignal.assert_called_once_with(
-                user_id=mock_user_id,
-                exchange=mock_signal["exchange"],
-                symbol=mock_signal["symbol"],
-                timeframe=mock_signal["timeframe"],
-                original_signal=mock_signal,
-                priority_score=Decimal("100.0"),
-                replacement_count=0
-            )
-            mock_db_session.add.assert_called_once_with(mock_queue_entry_instance)
-            mock_db_session.commit.assert_called_once()
-            assert queue_entry == mock_queue_entry_instance
-
-def test_handle_signal_replacement_updates_existing_entry(mock_db_session, mock_signal, mock_user_id):
+    # No waiting entry for the pair, no active group
+    mock_db_session.execute = AsyncMock(side_effect=[scalars_result([]), scalar_result(0)])
+    mock_db_session.commit = AsyncMock()
+    mock_db_session.refresh = AsyncMock()
+
+    with patch('backend.app.services.queue_service.price_feed') as mock_feed:
+        mock_feed.get_price.return_value = Decimal("95")
+        queue_entry = await add_to_queue(mock_db_session, mock_signal, mock_user_id)
+
+    assert isinstance(queue_entry, QueuedSignal)
+    assert queue_entry.timeframe == 60
+    assert queue_entry.side == "long"
+    assert queue_entry.status == "queued"
+    assert queue_entry.replacement_count == 0
+    assert queue_entry.is_pyramid_continuation is False
+    assert queue_entry.current_loss_percent == Decimal("-5")
+    assert queue_entry.priority_score == priority_score(False, Decimal("-5"), 0)
+    mock_db_session.add.assert_called_once_with(queue_entry)
+    mock_db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_handle_signal_replacement_updates_existing_entry(mock_db_session, mock_signal, mock_user_id):
     """
     Test that handle_signal_replacement updates an existing QueuedSignal and increments replacement_count.
     """
     existing_entry = MagicMock(spec=QueuedSignal)
-    existing_entry.original_signal = {"old_data": True}
+    existing_entry.signal_payload = {"old_data": True}
     existing_entry.replacement_count = 5
-    existing_entry.priority_score = Decimal("50.0")
-
-    mock_db_session.query.return_value.filter.return_value.first.return_value = existing_entry
+    existing_entry.is_pyramid_continuation = False
+    existing_entry.side = "long"
+    existing_entry.exchange = "binance"
+    existing_entry.symbol = "BTC/USDT"
+    mock_db_session.execute = AsyncMock(return_value=scalars_result([existing_entry]))
+    mock_db_session.commit = AsyncMock()
+
+    with patch('backend.app.services.queue_service.price_feed') as mock_feed:
+        mock_feed.get_price.return_value = None
+        await handle_signal_replacement(mock_db_session, mock_signal, mock_user_id)
+
+    assert existing_entry.signal_payload == mock_signal
+    assert existing_entry.replacement_count == 6
+    assert existing_entry.priority_score == priority_score(False, Decimal("0"), 6)
+    mock_db_session.commit.assert_awaited_once()
 
-    with patch('backend.app.services.queue_service.calculate_priority', return_value=Decimal("150.0")) as mock_calc_priority:
-        handle_signal_replacement(mock_db_session, mock_signal, mock_user_id)
-
-        # Assertions
-        mock_db_session.query.assert_called_once_with(QueuedSignal)
-        mock_db_session.query.return_value.filter.assert_called_once_with(ANY, ANY)
-        assert existing_entry.original_signal == mock_signal
-        assert existing_entry.replacement_count == 6
-        assert existing_entry.priority_score == Decimal("150.0")
-        mock_db_session.commit.assert_called_once()
-
-def test_handle_signal_replacement_no_existing_entry(mock_db_session, mock_signal, mock_user_id):
+@pytest.mark.asyncio
+async def test_handle_signal_replacement_no_existing_entry(mock_db_session, mock_signal, mock_user_id):
     """
     Test that handle_signal_replacement does nothing if no existing entry is found.
     """
-    mock_db_session.query.return_value.filter.return_value.first.return_value = None
+    mock_db_session.execute = AsyncMock(return_value=scalars_result([]))
+    mock_db_session.commit = AsyncMock()
 
-    handle_signal_replacement(mock_db_session, mock_signal, mock_user_id)
+    await handle_signal_replacement(mock_db_session, mock_signal, mock_user_id)
 
-    # Assertions
-    mock_db_session.query.assert_called_once_with(QueuedSignal)
-    mock_db_session.query.return_value.filter.assert_called_once_with(ANY, ANY)
-    mock_db_session.commit.assert_not_called()
+    mock_db_session.commit.assert_not_awaited()
 
 @pytest.mark.asyncio
 async def test_promote_from_queue_selects_highest_priority(mock_db_session, mock_user_id):
     """
     Test that promote_from_queue selects the highest priority signal based on SoW rules.
     Priority rules: 1) Pyramid continuation, 2) Deepest loss, 3) Highest replacement, 4) FIFO.
-    For this test, we'll focus on replacement count and FIFO for simplicity.
     """
-    # Setup: Multiple queue entries with different priorities
-    entry_low_priority = MagicMock(spec=QueuedSignal)
-    entry_low_priority.id = UUID('11111111-1111-1111-1111-111111111111')
-    entry_low_priority.priority_score = Decimal("10.0")
-    entry_low_priority.replacement_count = 0
-    entry_low_priority.created_at = datetime(2023, 1, 1, 10, 0, 0)
-    entry_low_priority.original_signal = {"symbol": "LOW/USDT"}
-
-    entry_high_replacement = MagicMock(spec=QueuedSignal)
-    entry_high_replacement.id = UUID('22222222-2222-2222-2222-222222222222')
-    entry_high_replacement.priority_score = Decimal("20.0")
-    entry_high_replacement.replacement_count = 5
-    entry_high_replacement.created_at = datetime(2023, 1, 1, 11, 0, 0)
-    entry_high_replacement.original_signal = {"symbol": "HIGH_REP/USDT"}
-
-    entry_fifo = MagicMock(spec=QueuedSignal)
-    entry_fifo.id = UUID('33333333-3333-3333-3333-333333333333')
-    entry_fifo.priority_score = Decimal("20.0")
-    entry_fifo.replacement_count = 0
-    entry_fifo.created_at = datetime(2023, 1, 1, 9, 0, 0) # Older than high_replacement
-    entry_fifo.original_signal = {"symbol": "FIFO/USDT"}
-
-    # Mock the database query to return these entries
-    mock_db_session.query.return_value.filter.return_value.all.return_value = [
-        entry_low_priority, entry_high_replacement, entry_fifo
-    ]
-
-    # Mock the calculate_priority function to return consistent values for testing sorting
-    with patch('backend.app.services.queue_service.calculate_priority', side_effect=lambda signal: {
-        "LOW/USDT": Decimal("10.0"),
-        "HIGH_REP/USDT": Decimal("20.0"),
-        "FIFO/USDT": Decimal("20.0"),
-    }.get(signal["symbol"], Decimal("0.0"))) as mock_calc_priority:
-
-        promoted_entry = await promote_from_queue(mock_db_session, mock_user_id)
-
-        # Assertions
-        mock_db_session.query.assert_called_once_with(QueuedSignal)
-        mock_db_session.query.return_value.filter.assert_called_once_with(ANY)
-        # The application code sorts in Python, so no order_by assertion here.
-        
-        # The expected order based on on SoW rules (priority_score then replacement_count then created_at)
-        # Given the mock priority scores, entry_high_replacement and entry_fifo have the same priority.
-        # Then, entry_high_replacement has higher replacement_count (5 vs 0).
-        # So, entry_high_replacement should be promoted.
-        assert promoted_entry == entry_high_replacement
-        assert promoted_entry.status == "promoted" # Assuming a 'promoted' status
-        mock_db_session.delete.assert_called_once_with(entry_high_replacement)
-        mock_db_session.commit.assert_called_once()
+    entry_low_priority = make_entry(mock_user_id, priority_score(False, Decimal("-1"), 0), datetime(2023, 1, 1, 8, 0, 0))
+    entry_high_replacement = make_entry(mock_user_id, priority_score(False, Decimal("-3"), 5), datetime(2023, 1, 1, 11, 0, 0))
+    entry_fifo = make_entry(mock_user_id, priority_score(False, Decimal("-3"), 0), datetime(2023, 1, 1, 9, 0, 0))
+    entries = {e.id: e for e in (entry_low_priority, entry_high_replacement, entry_fifo)}
+
+    mock_db_session.execute = AsyncMock(return_value=scalars_result(list(entries.values())))
+    mock_db_session.get = AsyncMock(side_effect=lambda model, entry_id: entries[entry_id])
+    mock_db_session.commit = AsyncMock()
+
+    promoted_entry = await promote_from_queue(mock_db_session, mock_user_id)
+
+    assert promoted_entry == entry_high_replacement
+    assert promoted_entry.status == "promoted"
+    mock_db_session.commit.assert_awaited_once()
+    # The heap is reused for the next promotion without another query
+    assert await promote_from_queue(mock_db_session, mock_user_id) == entry_fifo
+    assert await promote_from_queue(mock_db_session, mock_user_id) == entry_low_priority
+    mock_db_session.execute.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_promote_from_queue_skips_entries_taken_elsewhere(mock_db_session, mock_user_id):
+    taken = make_entry(mock_user_id, priority_score(True, Decimal("0"), 0), datetime(2023, 1, 1, 8, 0, 0))
+    waiting = make_entry(mock_user_id, priority_score(False, Decimal("0"), 0), datetime(2023, 1, 1, 9, 0, 0))
+    entries = {taken.id: taken, waiting.id: waiting}
+    mock_db_session.execute = AsyncMock(return_value=scalars_result([taken, waiting]))
+    mock_db_session.get = AsyncMock(side_effect=lambda model, entry_id: entries[entry_id])
+    mock_db_session.commit = AsyncMock()
+    taken.status = "promoted"
+
+    assert await promote_from_queue(mock_db_session, mock_user_id) == waiting
+
 @pytest.mark.asyncio
 async def test_promote_from_queue_returns_none_if_empty(mock_db_session, mock_user_id):
     """
     Test that promote_from_queue returns None if the queue is empty.
     """
-    mock_db_session.query.return_value.filter.return_value.all.return_value = []
+    mock_db_session.execute = AsyncMock(return_value=scalars_result([]))
+    mock_db_session.commit = AsyncMock()
 
     promoted_entry = await promote_from_queue(mock_db_session, mock_user_id)
 
     assert promoted_entry is None
-    mock_db_session.query.assert_called_once_with(QueuedSignal)
-    mock_db_session.query.return_value.filter.assert_called_once_with(ANY)
-    mock_db_session.delete.assert_not_called()
-    mock_db_session.commit.assert_not_called()
\ No newline at end of file
+    mock_db_session.commit.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_remove_from_queue_cancels_and_unindexes(mock_db_session, mock_user_id):
+    entry = make_entry(mock_user_id, priority_score(False, Decimal("0"), 0), datetime(2023, 1, 1, 9, 0, 0))
+    queue_book.load(mock_user_id, [entry])
+    mock_db_session.execute = AsyncMock(return_value=scalars_result([entry]))
+    mock_db_session.commit = AsyncMock()
+
+    assert await remove_from_queue(mock_db_session, mock_user_id, "binance", "BTC/USDT", "60") is entry
+    assert entry.status == "cancelled"
+    assert queue_book.peek(mock_user_id) is None
@@ -0,0 +1,95 @@
+import pytest
+import asyncio
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+import ccxt.async_support as ccxt
+
+from backend.app.services.exchange_manager import (
+    TokenBucket, RateLimitScheduler, Priority, request_priority
+)
+from backend.app.services.metrics_service import metrics
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+@pytest.mark.asyncio
+async def test_queued_calls_are_served_by_priority():
+    bucket = TokenBucket(capacity=10, window_seconds=0.1)
+    bucket.tokens = 0
+    served = []
+
+    async def call(name, priority):
+        await bucket.acquire(5, priority)
+        served.append(name)
+
+    await asyncio.gather(
+        call("precision", Priority.PRECISION),
+        call("reconcile", Priority.RECONCILE),
+        call("exit", Priority.EXIT),
+        call("take_profit", Priority.TAKE_PROFIT),
+    )
+
+    assert served == ["exit", "take_profit", "reconcile", "precision"]
+
+@pytest.mark.asyncio
+async def test_scheduler_uses_method_and_context_priority():
+    limiter = RateLimitScheduler(budgets={"binance": (100, 60)})
+    client = MagicMock()
+    client.last_response_headers = {}
+    client.fetch_open_orders = AsyncMock(return_value=[])
+    client.create_market_order = AsyncMock(return_value={"id": "1"})
+    user_id = uuid4()
+
+    await limiter.call(user_id, "binance", client, "fetch_open_orders", "BTC/USDT")
+    with request_priority(Priority.TAKE_PROFIT):
+        await limiter.call(user_id, "binance", client, "create_market_order", "BTC/USDT", "sell", 1)
+
+    client.fetch_open_orders.assert_awaited_once_with("BTC/USDT")
+    assert metrics.get_timing("exchange_rate_limit_wait_seconds", exchange="binance", priority="reconcile").count == 1
+    assert metrics.get_timing("exchange_rate_limit_wait_seconds", exchange="binance", priority="take_profit").count == 1
+    # fetch_open_orders weighs 6, the order 1
+    assert limiter.bucket(user_id, "binance").tokens == pytest.approx(93, abs=0.1)
+
+@pytest.mark.asyncio
+async def test_scheduler_syncs_used_weight_header_and_blocks_on_ban():
+    limiter = RateLimitScheduler(budgets={"binance": (6000, 60)})
+    client = MagicMock()
+    client.last_response_headers = {"x-mbx-used-weight-1m": "5900"}
+    client.fetch_ticker = AsyncMock(return_value={"last": 1})
+    user_id = uuid4()
+
+    await limiter.call(user_id, "binance", client, "fetch_ticker", "BTC/USDT")
+    assert limiter.bucket(user_id, "binance").tokens <= 100
+
+    client.last_response_headers = {"Retry-After": "30"}
+    client.fetch_ticker = AsyncMock(side_effect=ccxt.DDoSProtection("418 I'm a teapot"))
+    with pytest.raises(ccxt.DDoSProtection):
+        await limiter.call(user_id, "binance", client, "fetch_ticker", "BTC/USDT")
+
+    bucket = limiter.bucket(user_id, "binance")
+    assert bucket.tokens == 0
+    assert metrics.get_counter("exchange_rate_limit_rejections", exchange="binance") == 1
+    # Other keys keep their own budget, but the ban is per IP, so the shared bucket is blocked too
+    assert limiter.bucket(uuid4(), "binance").tokens == 6000
+    assert limiter.ip_bucket("binance").tokens == 0
+
+@pytest.mark.asyncio
+async def test_keys_share_the_exchange_ip_budget():
+    limiter = RateLimitScheduler(budgets={"binance": (100, 60)}, ip_budgets={"binance": (30, 60)})
+    client = MagicMock()
+    client.last_response_headers = {}
+    client.fetch_closed_orders = AsyncMock(return_value=[])
+    first, second = uuid4(), uuid4()
+
+    await limiter.call(first, "binance", client, "fetch_closed_orders", "BTC/USDT")
+    # The second key has its own budget left but the host's IP budget does not
+    call = asyncio.create_task(limiter.call(second, "binance", client, "fetch_closed_orders", "BTC/USDT"))
+    await asyncio.sleep(0.05)
+
+    assert not call.done()
+    assert limiter.bucket(second, "binance").tokens == pytest.approx(80, abs=0.1)
+    assert limiter.ip_bucket("binance").queue_depth() == 1
+    call.cancel()
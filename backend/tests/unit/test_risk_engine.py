@@ -5,9 +5,10 @@ from uuid import UUID, uuid4
 from decimal import Decimal
 from datetime import datetime, timedelta
 from backend.app.services.risk_engine import RiskEngine
-from backend.app.models.trading_models import PositionGroup, Pyramid, PositionGroupStatus
+from backend.app.models.trading_models import PositionGroup, PositionGroupStatus
 from backend.app.models.risk_analytics_models import RiskAction
 from backend.app.core.config import settings
+from backend.app.core.config_models import RiskEngineConfig
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func
 
@@ -16,8 +17,15 @@ def mock_db_session():
     return MagicMock(spec=AsyncSession)
 
 @pytest.fixture
-def risk_engine(mock_db_session):
-    return RiskEngine(db=mock_db_session)
+def close_session():
+    """The session each concurrent partial close runs on."""
+    return MagicMock(spec=AsyncSession)
+
+@pytest.fixture
+def risk_engine(mock_db_session, close_session):
+    async def session_factory():
+        yield close_session
+    return RiskEngine(db=mock_db_session, session_factory=session_factory)
 
 @pytest.fixture
 def mock_position_group():
@@ -37,20 +45,16 @@ def mock_position_group():
 
 @pytest.mark.asyncio
 async def test_should_activate_risk_engine(risk_engine, mock_position_group):
-    # Mock pyramid count
-    mock_count_result = MagicMock()
-    mock_count_result.scalar_one.return_value = 5
-    
-    mock_last_pyramid = MagicMock(spec=Pyramid)
-    mock_last_pyramid.entry_timestamp = datetime.utcnow() - timedelta(minutes=settings.RISK_POST_FULL_WAIT_MINUTES + 1)
-    mock_pyramid_result = MagicMock()
-    mock_pyramid_result.scalars.return_value.first.return_value = mock_last_pyramid
-    
-    future_count_result = asyncio.Future()
-    future_count_result.set_result(mock_count_result)
-    future_pyramid_result = asyncio.Future()
-    future_pyramid_result.set_result(mock_pyramid_result)
-    risk_engine.db.execute.side_effect = [future_count_result, future_pyramid_result, future_count_result, future_pyramid_result] # For multiple execute calls
+    # Pyramid count and last entry time come back from one aggregated query
+    last_entry_at = datetime.utcnow() - timedelta(minutes=settings.RISK_POST_FULL_WAIT_MINUTES + 1)
+    mock_stats_result = MagicMock()
+    mock_stats_result.one.return_value = (5, last_entry_at)
+
+    def stats_future(*args, **kwargs):
+        future = asyncio.Future()
+        future.set_result(mock_stats_result)
+        return future
+    risk_engine.db.execute.side_effect = stats_future
     # Test case 1: PnL % is below threshold, should activate
     mock_position_group.unrealized_pnl_percent = Decimal(str(settings.RISK_LOSS_THRESHOLD_PERCENT)) - Decimal("1.0")
     assert await risk_engine.should_activate_risk_engine(mock_position_group, mock_position_group.unrealized_pnl_percent) is True
@@ -59,6 +63,14 @@ async def test_should_activate_risk_engine(risk_engine, mock_position_group):
     mock_position_group.unrealized_pnl_percent = Decimal(str(settings.RISK_LOSS_THRESHOLD_PERCENT)) + Decimal("1.0")
     assert await risk_engine.should_activate_risk_engine(mock_position_group, mock_position_group.unrealized_pnl_percent) is False
 
+    # One round trip per check
+    assert risk_engine.db.execute.call_count == 2
+
+    # Test case 3: too few pyramids, should not activate
+    mock_stats_result.one.return_value = (4, last_entry_at)
+    mock_position_group.unrealized_pnl_percent = Decimal(str(settings.RISK_LOSS_THRESHOLD_PERCENT)) - Decimal("1.0")
+    assert await risk_engine.should_activate_risk_engine(mock_position_group, mock_position_group.unrealized_pnl_percent) is False
+
 @pytest.mark.asyncio
 async def test_find_losing_positions(risk_engine, mock_db_session):
     user_id = uuid4()
@@ -68,14 +80,17 @@ async def test_find_losing_positions(risk_engine, mock_db_session):
     losing_group_3 = MagicMock(spec=PositionGroup, id=uuid4(), unrealized_pnl_percent=Decimal("-8.0"), unrealized_pnl_usd=Decimal("-80.0"), created_at=datetime.utcnow() - timedelta(minutes=15))
 
     mock_result = MagicMock()
+    # The database returns the groups already ranked
     mock_result.scalars.return_value.all.return_value = [
-        losing_group_1, losing_group_2, losing_group_3
+        losing_group_2, losing_group_1, losing_group_3
     ]
     future_result = asyncio.Future()
     future_result.set_result(mock_result)
     mock_db_session.execute.return_value = future_result
     selected_groups = await risk_engine.find_losing_positions(user_id)
     assert selected_groups[0].id == losing_group_2.id # Should select the one with worst PnL %
+    query = str(mock_db_session.execute.call_args[0][0])
+    assert "ORDER BY position_groups.unrealized_pnl_percent ASC, position_groups.unrealized_pnl_usd ASC, position_groups.created_at ASC" in query
 
 @pytest.mark.asyncio
 async def test_find_winning_positions(risk_engine, mock_db_session):
@@ -87,29 +102,243 @@ async def test_find_winning_positions(risk_engine, mock_db_session):
 
     mock_result = MagicMock()
     mock_result.scalars.return_value.all.return_value = [
-        winning_group_1, winning_group_2, winning_group_3
+        winning_group_3, winning_group_1, winning_group_2
     ]
     future_result = asyncio.Future()
     future_result.set_result(mock_result)
     mock_db_session.execute.return_value = future_result
     selected_groups = await risk_engine.find_winning_positions(user_id)
     assert selected_groups[0].id == winning_group_3.id # Should select the one with highest PnL USD
+    statement = mock_db_session.execute.call_args[0][0]
+    assert "ORDER BY position_groups.unrealized_pnl_usd DESC" in str(statement)
+    assert statement._limit == settings.RISK_MAX_WINNERS_TO_COMBINE
+
+def make_winner(pnl_usd, quantity="1.0", avg_entry="1000.0", exchange="binance"):
+    return MagicMock(
+        spec=PositionGroup, id=uuid4(), user_id=uuid4(), exchange=exchange, symbol="ETHUSDT", side="long",
+        unrealized_pnl_usd=Decimal(pnl_usd), total_filled_quantity=Decimal(quantity), weighted_avg_entry=Decimal(avg_entry),
+        total_invested_usd=Decimal(quantity) * Decimal(avg_entry), realized_pnl_usd=Decimal("0"),
+    )
+
+def filled_order(filled, average):
+    return {"id": str(uuid4()), "status": "closed", "filled": filled, "average": average}
 
 @pytest.mark.asyncio
-async def test_execute_risk_mitigation(risk_engine, mock_db_session, mock_position_group):
+async def test_execute_risk_mitigation(risk_engine, mock_db_session, close_session, mock_position_group):
     losing_group = mock_position_group
     losing_group.unrealized_pnl_usd = Decimal("-300.0")
 
-    winning_group_1 = MagicMock(spec=PositionGroup, id=uuid4(), unrealized_pnl_usd=Decimal("100.0"))
-    winning_group_2 = MagicMock(spec=PositionGroup, id=uuid4(), unrealized_pnl_usd=Decimal("200.0"))
+    winning_group_1 = make_winner("100.0")
+    winning_group_2 = make_winner("200.0", exchange="bybit")
 
     winning_positions = [winning_group_1, winning_group_2]
 
-    with patch('backend.app.services.risk_engine.place_partial_close_order', new_callable=AsyncMock) as mock_place_order:
-        await risk_engine.execute_risk_mitigation(losing_group, winning_positions)
+    with patch('backend.app.services.risk_engine.place_partial_close_order', new_callable=AsyncMock) as mock_place_order, \
+         patch('backend.app.services.risk_engine.client_pool') as mock_pool:
+        mock_pool.acquire = AsyncMock()
+        # The second winner fills below its mark, so it realizes less than planned
+        mock_place_order.side_effect = [filled_order(1.0, 1100.0), filled_order(1.0, 1190.0)]
+        plan = await risk_engine.execute_risk_mitigation(losing_group, winning_positions)
 
-        mock_place_order.assert_any_call(db=mock_db_session, position_group=winning_group_1, usd_amount_to_realize=Decimal("100.0"))
-        mock_place_order.assert_any_call(db=mock_db_session, position_group=winning_group_2, usd_amount_to_realize=Decimal("200.0"))
+        mock_place_order.assert_any_call(db=close_session, position_group=winning_group_1, quantity=Decimal("1.0"), mark_price=Decimal("1100.0"))
+        mock_place_order.assert_any_call(db=close_session, position_group=winning_group_2, quantity=Decimal("1.0"), mark_price=Decimal("1200.0"))
+        assert mock_pool.acquire.await_count == 2
         mock_db_session.add.assert_called_once()
         await mock_db_session.commit()
-        mock_db_session.commit.assert_called_once()
\ No newline at end of file
+        mock_db_session.commit.assert_called_once()
+
+    assert plan.realized_usd == Decimal("290.0")
+    # The covered loser is not picked up again by later passes
+    assert losing_group.risk_blocked is True
+    assert winning_group_2.realized_pnl_usd == Decimal("190.0")
+    assert winning_group_2.total_filled_quantity == Decimal("0")
+    # Both rollup upserts ran on the engine's session, after the closes
+    assert mock_db_session.execute.await_count == 2
+    close_session.execute.assert_not_called()
+    risk_action = mock_db_session.add.call_args[0][0]
+    assert [leg["status"] for leg in risk_action.winner_details] == ["closed", "closed"]
+    assert [Decimal(leg["realized_usd"]) for leg in risk_action.winner_details] == [Decimal("100"), Decimal("190")]
+    assert all(leg["latency_ms"] is not None for leg in risk_action.winner_details)
+
+@pytest.mark.asyncio
+async def test_execute_risk_mitigation_dry_run_returns_projected_plan(risk_engine, mock_db_session, mock_position_group):
+    mock_position_group.unrealized_pnl_usd = Decimal("-150.0")
+    winners = [make_winner("10.0", quantity="0.01"), make_winner("100.0"), make_winner("100.0"), make_winner("500.0")]
+    risk_engine.config.max_winners_to_combine = 3
+
+    with patch('backend.app.services.risk_engine.place_partial_close_order', new_callable=AsyncMock) as mock_place_order:
+        plan = await risk_engine.execute_risk_mitigation(mock_position_group, winners, dry_run=True)
+
+    mock_place_order.assert_not_awaited()
+    mock_db_session.add.assert_not_called()
+    projected = plan.to_dict()
+    # The first winner's close (0.01 @ 2000 = 20.2 notional) passes; the 4th is beyond max_winners_to_combine
+    assert [leg["profit_to_realize"] for leg in projected["legs"]] == ["10.0", "100.0", "40.0"]
+    assert projected["legs"][2]["quantity_closed"] == "0.4"
+    assert projected["skipped"] == []
+
+    # Closes below min_close_notional are left out of the plan
+    risk_engine.config.min_close_notional = Decimal("25")
+    plan = risk_engine.plan_offset(mock_position_group, winners)
+    assert [leg.winner for leg in plan.legs] == winners[1:3]
+    assert plan.skipped[0]["group_id"] == str(winners[0].id)
+
+@pytest.mark.asyncio
+async def test_execute_risk_mitigation_records_failed_closes(risk_engine, mock_db_session, mock_position_group):
+    mock_position_group.unrealized_pnl_usd = Decimal("-300.0")
+    winners = [make_winner("100.0"), make_winner("200.0")]
+
+    with patch('backend.app.services.risk_engine.place_partial_close_order', new_callable=AsyncMock) as mock_place_order, \
+         patch('backend.app.services.risk_engine.client_pool') as mock_pool:
+        mock_pool.acquire = AsyncMock()
+        mock_place_order.side_effect = [filled_order(1.0, 1100.0), Exception("Insufficient balance")]
+        plan = await risk_engine.execute_risk_mitigation(mock_position_group, winners)
+
+    assert [leg.status for leg in plan.legs] == ["closed", "failed"]
+    assert plan.realized_usd == Decimal("100.0")
+    assert winners[1].realized_pnl_usd == Decimal("0")
+    risk_action = mock_db_session.add.call_args[0][0]
+    assert risk_action.winner_details[1]["error"] == "Insufficient balance"
+    assert "1 of 2 closes failed" in risk_action.notes
+
+@pytest.mark.asyncio
+async def test_unfilled_close_realizes_nothing(risk_engine, mock_db_session, mock_position_group):
+    mock_position_group.unrealized_pnl_usd = Decimal("-100.0")
+    winner = make_winner("100.0")
+
+    with patch('backend.app.services.risk_engine.place_partial_close_order', new_callable=AsyncMock) as mock_place_order, \
+         patch('backend.app.services.risk_engine.client_pool') as mock_pool:
+        mock_pool.acquire = AsyncMock()
+        mock_place_order.return_value = {"id": "close_1", "status": "canceled", "filled": 0.0}
+        plan = await risk_engine.execute_risk_mitigation(mock_position_group, [winner])
+
+    assert [leg.status for leg in plan.legs] == ["failed"]
+    assert plan.realized_usd == Decimal("0")
+    assert winner.total_filled_quantity == Decimal("1.0")
+    mock_db_session.execute.assert_not_called()
+    # Nothing was covered, so the loser stays eligible
+    assert mock_position_group.risk_blocked is not True
+
+@pytest.mark.asyncio
+async def test_evaluate_risk_conditions_uses_constant_queries(risk_engine, mock_db_session):
+    user_a, user_b = uuid4(), uuid4()
+    loser_a = MagicMock(spec=PositionGroup, id=uuid4(), user_id=user_a, risk_skip_once=False)
+    loser_b = MagicMock(spec=PositionGroup, id=uuid4(), user_id=user_b, risk_skip_once=False)
+    winner_a1 = MagicMock(spec=PositionGroup, id=uuid4(), user_id=user_a)
+    winner_a2 = MagicMock(spec=PositionGroup, id=uuid4(), user_id=user_a)
+
+    losers_result = MagicMock()
+    losers_result.scalars.return_value.all.return_value = [loser_a, loser_b]
+    winners_result = MagicMock()
+    winners_result.scalars.return_value.all.return_value = [winner_a1, winner_a2]
+    active_result = MagicMock()
+    active_result.scalars.return_value.all.return_value = []
+    mock_db_session.execute.side_effect = [active_result, losers_result, winners_result]
+
+    with patch.object(risk_engine, 'execute_risk_mitigation', new_callable=AsyncMock) as mock_mitigate:
+        await risk_engine.evaluate_risk_conditions()
+
+    assert mock_db_session.execute.call_count == 3
+    losers_query = str(mock_db_session.execute.call_args_list[1][0][0])
+    assert "row_number() OVER (PARTITION BY position_groups.user_id" in losers_query
+    assert "count(pyramids.id)" in losers_query
+    # User B has no winners to combine, so only user A is mitigated
+    mock_mitigate.assert_awaited_once_with(loser_a, [winner_a1, winner_a2])
+    mock_db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_evaluate_risk_conditions_marks_active_groups_first(risk_engine, mock_db_session):
+    """The ranking queries see PnL re-marked from the price feed, flushed before they run."""
+    group = MagicMock(spec=PositionGroup, id=uuid4(), user_id=uuid4())
+    active_result = MagicMock()
+    active_result.scalars.return_value.all.return_value = [group]
+    losers_result = MagicMock()
+    losers_result.scalars.return_value.all.return_value = []
+    mock_db_session.execute.side_effect = [active_result, losers_result]
+    calls = []
+    mock_db_session.flush.side_effect = lambda: calls.append("flush")
+
+    with patch.object(risk_engine, 'mark_to_market', side_effect=lambda g: calls.append(g) or True):
+        await risk_engine.evaluate_risk_conditions()
+
+    assert calls == [group, "flush"]
+    assert "position_groups.status" in str(mock_db_session.execute.call_args_list[0][0][0])
+    # Nothing to mitigate, but the new marks are kept
+    mock_db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_eligibility_follows_the_engine_config(mock_db_session):
+    config = RiskEngineConfig(require_full_pyramids=False, enable_post_full_wait=False, loss_threshold_percent=Decimal("-12.5"))
+    engine = RiskEngine(db=mock_db_session, config=config)
+    result = MagicMock()
+    result.scalars.return_value.all.return_value = []
+    mock_db_session.execute = AsyncMock(return_value=result)
+
+    await engine.find_eligible_losers()
+
+    statement = mock_db_session.execute.await_args.args[0]
+    assert Decimal("-12.5") in statement.compile().params.values()
+    sql = str(statement)
+    assert "pyramid_count >=" not in sql
+    assert "last_entry_at <=" not in sql
+
+@pytest.mark.asyncio
+async def test_blocked_and_skip_once_losers_are_not_mitigated(risk_engine, mock_db_session):
+    skipped = MagicMock(spec=PositionGroup, id=uuid4(), user_id=uuid4(), risk_skip_once=True)
+    active_result = MagicMock()
+    active_result.scalars.return_value.all.return_value = []
+    losers_result = MagicMock()
+    losers_result.scalars.return_value.all.return_value = [skipped]
+    mock_db_session.execute.side_effect = [active_result, losers_result]
+
+    with patch.object(risk_engine, 'execute_risk_mitigation', new_callable=AsyncMock) as mock_mitigate:
+        await risk_engine.evaluate_risk_conditions()
+
+    assert "position_groups.risk_blocked IS NOT true" in str(mock_db_session.execute.call_args_list[1][0][0])
+    mock_mitigate.assert_not_awaited()
+    # The skip is used up, and that is committed
+    assert skipped.risk_skip_once is False
+    mock_db_session.commit.assert_awaited_once()
+
+@pytest.mark.asyncio
+async def test_partial_close_disabled_sends_nothing(mock_db_session, mock_position_group):
+    engine = RiskEngine(db=mock_db_session, config=RiskEngineConfig(partial_close_enabled=False))
+    mock_position_group.unrealized_pnl_usd = Decimal("-100.0")
+    active_result = MagicMock()
+    active_result.scalars.return_value.all.return_value = []
+    mock_db_session.execute.return_value = active_result
+
+    with patch('backend.app.services.risk_engine.place_partial_close_order', new_callable=AsyncMock) as mock_place_order:
+        plan = await engine.execute_risk_mitigation(mock_position_group, [make_winner("100.0")])
+        await engine.evaluate_risk_conditions()
+
+    assert len(plan.legs) == 1
+    mock_place_order.assert_not_awaited()
+    mock_db_session.add.assert_not_called()
+    # Only the mark-to-market query runs; no losers are looked up
+    assert mock_db_session.execute.await_count == 1
+
+@pytest.mark.asyncio
+async def test_each_offset_commits_with_its_loser_block(risk_engine, mock_db_session):
+    loser = MagicMock(spec=PositionGroup, id=uuid4(), user_id=uuid4(), risk_skip_once=False)
+    winner = MagicMock(spec=PositionGroup, id=uuid4(), user_id=loser.user_id)
+    active_result = MagicMock()
+    active_result.scalars.return_value.all.return_value = []
+    losers_result = MagicMock()
+    losers_result.scalars.return_value.all.return_value = [loser]
+    winners_result = MagicMock()
+    winners_result.scalars.return_value.all.return_value = [winner]
+    mock_db_session.execute.side_effect = [active_result, losers_result, winners_result]
+    calls = []
+
+    async def mitigate(losing, winners):
+        losing.risk_blocked = True
+        calls.append("mitigate")
+
+    mock_db_session.commit.side_effect = lambda: calls.append(("commit", loser.risk_blocked))
+
+    with patch.object(risk_engine, 'execute_risk_mitigation', side_effect=mitigate):
+        await risk_engine.evaluate_risk_conditions()
+
+    assert calls == ["mitigate", ("commit", True)]
+    mock_db_session.rollback.assert_not_awaited()
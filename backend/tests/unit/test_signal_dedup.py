@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+from backend.app.services.signal_dedup import SignalDeduplicator, SeenFingerprints, signal_fingerprint
+
+@pytest.fixture
+def tv_data():
+    return {"exchange": "BINANCE", "symbol": "BTCUSDT", "timeframe": "15", "action": "buy", "bar_time": "2024-01-01T00:15:00Z", "close_price": 42000.5}
+
+@pytest.fixture
+def mock_redis():
+    redis = MagicMock()
+    redis.set = AsyncMock(return_value=True)
+    redis.delete = AsyncMock(return_value=1)
+    return redis
+
+def test_fingerprint_ignores_non_identifying_fields(tv_data):
+    """
+    The same alert fired from another chart differs only in prices and sizes.
+    """
+    user_id = uuid4()
+    base = signal_fingerprint(user_id, tv_data, {"side": "buy"})
+    assert signal_fingerprint(user_id, {**tv_data, "close_price": 42001.0}, {"side": "buy"}) == base
+    assert signal_fingerprint(user_id, {**tv_data, "bar_time": "2024-01-01T00:30:00Z"}, {"side": "buy"}) != base
+    assert signal_fingerprint(user_id, {**tv_data, "action": "sell"}, {"side": "buy"}) != base
+    assert signal_fingerprint(uuid4(), tv_data, {"side": "buy"}) != base
+
+def test_fingerprint_without_bar_time_hashes_payload(tv_data):
+    user_id = uuid4()
+    del tv_data["bar_time"]
+    base = signal_fingerprint(user_id, tv_data, {"side": "buy"})
+    assert signal_fingerprint(user_id, dict(tv_data), {"side": "buy"}) == base
+    assert signal_fingerprint(user_id, {**tv_data, "close_price": 1.0}, {"side": "buy"}) != base
+    assert signal_fingerprint(user_id, tv_data, {"side": "buy"}, timestamp="2024-01-01T00:15:03Z") != base
+
+def test_seen_fingerprints_is_bounded():
+    seen = SeenFingerprints(maxsize=2, ttl_seconds=60)
+    for fingerprint in ("a", "b", "c"):
+        seen.add(fingerprint)
+    assert "a" not in seen
+    assert "b" in seen and "c" in seen
+    assert len(seen) == 2
+
+@pytest.mark.asyncio
+async def test_claim_rejects_duplicates(mock_redis):
+    dedup = SignalDeduplicator(redis_factory=AsyncMock(return_value=mock_redis))
+
+    assert await dedup.claim("abc")
+    # The second delivery is answered locally without a Redis round trip
+    assert not await dedup.claim("abc")
+    mock_redis.set.assert_awaited_once_with("signal_dedup:abc", "1", nx=True, ex=dedup.ttl_seconds)
+
+@pytest.mark.asyncio
+async def test_claim_rejects_duplicates_seen_by_other_workers(mock_redis):
+    mock_redis.set.return_value = None
+    dedup = SignalDeduplicator(redis_factory=AsyncMock(return_value=mock_redis))
+
+    assert not await dedup.claim("abc")
+
+@pytest.mark.asyncio
+async def test_release_allows_retry(mock_redis):
+    dedup = SignalDeduplicator(redis_factory=AsyncMock(return_value=mock_redis))
+
+    assert await dedup.claim("abc")
+    await dedup.release("abc")
+    assert await dedup.claim("abc")
+    mock_redis.delete.assert_awaited_once_with("signal_dedup:abc")
+
+@pytest.mark.asyncio
+async def test_redis_outage_fails_open(mock_redis):
+    mock_redis.set.side_effect = ConnectionError("redis down")
+    dedup = SignalDeduplicator(redis_factory=AsyncMock(return_value=mock_redis))
+
+    assert await dedup.claim("abc")
+    assert not await dedup.claim("abc")
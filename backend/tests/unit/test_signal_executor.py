@@ -0,0 +1,81 @@
+import pytest
+import asyncio
+from uuid import uuid4
+
+from backend.app.services.signal_executor import ShardedSignalExecutor, signal_key
+from backend.app.services.metrics_service import metrics
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.reset()
+    yield
+    metrics.reset()
+
+def test_signal_key_groups_by_position_group():
+    user_id = uuid4()
+    tv = {"exchange": "binance", "symbol": "BTC/USDT", "timeframe": "15m", "action": "buy"}
+    assert signal_key(user_id, tv) == (str(user_id), "binance", "BTC/USDT", "15m")
+    assert signal_key(user_id, {**tv, "action": "sell"}) == signal_key(user_id, tv)
+    assert signal_key(user_id, {**tv, "exchange": "bybit"}) != signal_key(user_id, tv)
+
+@pytest.mark.asyncio
+async def test_same_key_runs_in_order():
+    executor = ShardedSignalExecutor(max_concurrency=8)
+    key = ("u", "binance", "BTC/USDT", "15m")
+    order, running = [], []
+
+    def job(n):
+        async def run():
+            running.append(n)
+            assert len(running) == 1, "jobs for one key overlapped"
+            await asyncio.sleep(0)
+            order.append(n)
+            running.remove(n)
+            return n
+        return run
+
+    results = await asyncio.gather(*[executor.submit(key, job(n)) for n in range(5)])
+
+    assert results == [0, 1, 2, 3, 4]
+    assert order == [0, 1, 2, 3, 4]
+    assert executor.backlog() == {}
+    assert metrics.get_counter("signal_executor_processed") == 5
+
+@pytest.mark.asyncio
+async def test_different_keys_run_concurrently():
+    executor = ShardedSignalExecutor(max_concurrency=8)
+    started = asyncio.Event()
+    release = asyncio.Event()
+
+    async def blocking():
+        started.set()
+        await release.wait()
+        return "slow"
+
+    async def quick():
+        return "fast"
+
+    slow = executor.submit(("u", "binance", "BTC/USDT", "15m"), blocking)
+    await started.wait()
+    # A different key is not stuck behind the blocked one
+    assert await asyncio.wait_for(executor.run(("u", "binance", "ETH/USDT", "15m"), quick), timeout=1) == "fast"
+    assert executor.backlog() == {("u", "binance", "BTC/USDT", "15m"): 0}
+    release.set()
+    assert await slow == "slow"
+
+@pytest.mark.asyncio
+async def test_failure_does_not_block_key():
+    executor = ShardedSignalExecutor(max_concurrency=2)
+    key = ("u", "binance", "BTC/USDT", "15m")
+
+    async def boom():
+        raise ValueError("bad signal")
+
+    async def ok():
+        return "ok"
+
+    failed = executor.submit(key, boom)
+    assert await executor.run(key, ok) == "ok"
+    with pytest.raises(ValueError):
+        await failed
+    assert metrics.get_counter("signal_executor_failures") == 1
@@ -0,0 +1,185 @@
+import pytest
+import asyncio
+import json
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.signal_inbox import SignalInbox, missing_signal_fields
+from backend.app.services.signal_executor import ShardedSignalExecutor
+
+@pytest.fixture
+def mock_redis():
+    redis = MagicMock()
+    redis.xadd = AsyncMock(return_value="1700000000000-0")
+    redis.xack = AsyncMock(return_value=1)
+    redis.xgroup_create = AsyncMock()
+    return redis
+
+@pytest.fixture
+def mock_db_session():
+    return MagicMock(spec=AsyncSession)
+
+def make_inbox(redis, db, processor):
+    async def session_factory():
+        yield db
+    return SignalInbox(
+        redis_factory=AsyncMock(return_value=redis),
+        session_factory=session_factory,
+        processor=processor,
+        executor=ShardedSignalExecutor(max_concurrency=4),
+    )
+
+def make_fields(user_id, symbol, n):
+    return {
+        "user_id": str(user_id),
+        "tv": json.dumps({"exchange": "binance", "symbol": symbol, "timeframe": "15m", "n": n}),
+        "execution_intent": json.dumps({"action": "buy"}),
+    }
+
+def test_missing_signal_fields():
+    assert missing_signal_fields({"exchange": "binance", "symbol": "BTC/USDT", "timeframe": "15m"}) == []
+    assert missing_signal_fields({"exchange": "binance", "symbol": ""}) == ["symbol", "timeframe"]
+
+@pytest.mark.asyncio
+async def test_enqueue_appends_to_stream(mock_redis, mock_db_session):
+    inbox = make_inbox(mock_redis, mock_db_session, AsyncMock())
+    user_id = uuid4()
+    tv = {"exchange": "binance", "symbol": "BTC/USDT", "timeframe": "15m"}
+
+    entry_id = await inbox.enqueue(user_id, tv, {"action": "buy"})
+
+    assert entry_id == "1700000000000-0"
+    stream, fields = mock_redis.xadd.await_args.args
+    assert stream == inbox.stream
+    assert fields["user_id"] == str(user_id)
+    assert json.loads(fields["tv"]) == tv
+
+@pytest.mark.asyncio
+async def test_handle_processes_then_acks(mock_redis, mock_db_session):
+    processor = AsyncMock()
+    inbox = make_inbox(mock_redis, mock_db_session, processor)
+    user_id = uuid4()
+
+    assert await inbox.handle("1700000000000-0", make_fields(user_id, "BTC/USDT", 1))
+
+    db, called_user, tv, intent = processor.await_args.args
+    assert db is mock_db_session
+    assert called_user == user_id
+    assert tv["symbol"] == "BTC/USDT"
+    assert intent == {"action": "buy"}
+    mock_redis.xack.assert_awaited_once_with(inbox.stream, inbox.group, "1700000000000-0")
+
+@pytest.mark.asyncio
+async def test_failed_entry_is_not_acked(mock_redis, mock_db_session):
+    inbox = make_inbox(mock_redis, mock_db_session, AsyncMock(side_effect=Exception("db down")))
+
+    assert not await inbox.handle("1700000000000-0", make_fields(uuid4(), "BTC/USDT", 1))
+    mock_redis.xack.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_same_key_is_processed_in_order(mock_redis, mock_db_session):
+    """
+    Entries for one (user, symbol, timeframe) run sequentially in stream order.
+    """
+    processed = []
+
+    async def processor(db, user_id, tv, intent):
+        # Yield so that an out-of-order worker would get a chance to interleave
+        await asyncio.sleep(0)
+        processed.append((tv["symbol"], tv["n"]))
+
+    inbox = make_inbox(mock_redis, mock_db_session, processor)
+    user_id = uuid4()
+    entries = [
+        (f"1700000000000-{n}", make_fields(user_id, "BTC/USDT" if n % 2 else "ETH/USDT", n))
+        for n in range(10)
+    ]
+    await inbox.dispatch(entries)
+
+    assert [n for symbol, n in processed if symbol == "BTC/USDT"] == [1, 3, 5, 7, 9]
+    assert [n for symbol, n in processed if symbol == "ETH/USDT"] == [0, 2, 4, 6, 8]
+    assert mock_redis.xack.await_count == 10
+
+@pytest.mark.asyncio
+async def test_claim_stale_processes_entries_of_dead_consumers(mock_redis, mock_db_session):
+    processor = AsyncMock()
+    inbox = make_inbox(mock_redis, mock_db_session, processor)
+    user_id = uuid4()
+    mock_redis.xautoclaim = AsyncMock(side_effect=[
+        ["1700000000005-0", [("1700000000001-0", make_fields(user_id, "BTC/USDT", 1)), ("1700000000002-0", None)]],
+        ["0-0", [("1700000000005-0", make_fields(user_id, "ETH/USDT", 2))]],
+    ])
+
+    assert await inbox.claim_stale() == 2
+
+    assert processor.await_count == 2
+    first_call = mock_redis.xautoclaim.await_args_list[0]
+    assert first_call.args == (inbox.stream, inbox.group, inbox.consumer, inbox.claim_idle_ms)
+    assert first_call.kwargs["start_id"] == "0-0"
+    assert mock_redis.xautoclaim.await_args_list[1].kwargs["start_id"] == "1700000000005-0"
+    # The trimmed entry is only acknowledged
+    acked = [call.args[2] for call in mock_redis.xack.await_args_list]
+    assert sorted(acked) == ["1700000000001-0", "1700000000002-0", "1700000000005-0"]
+
+@pytest.mark.asyncio
+async def test_failed_entry_holds_back_its_key(mock_redis, mock_db_session):
+    """
+    After a failure, later entries for the same key wait for the retry;
+    other keys carry on.
+    """
+    processed = []
+    failures = {"BTC/USDT": 1}
+
+    async def processor(db, user_id, tv, intent):
+        if tv["n"] == 0 and failures["BTC/USDT"]:
+            failures["BTC/USDT"] -= 1
+            raise Exception("db down")
+        processed.append((tv["symbol"], tv["n"]))
+
+    inbox = make_inbox(mock_redis, mock_db_session, processor)
+    user_id = uuid4()
+    await inbox.dispatch([
+        ("1700000000000-0", make_fields(user_id, "BTC/USDT", 0)),
+        ("1700000000000-1", make_fields(user_id, "BTC/USDT", 1)),
+        ("1700000000000-2", make_fields(user_id, "ETH/USDT", 2)),
+    ])
+
+    assert processed == [("ETH/USDT", 2)]
+    assert await inbox.retry_held() == 0
+
+    inbox.retry_seconds = 0
+    inbox._retry_at = {key: 0 for key in inbox._retry_at}
+    assert await inbox.retry_held() == 1
+
+    assert processed == [("ETH/USDT", 2), ("BTC/USDT", 0), ("BTC/USDT", 1)]
+    assert inbox._held == {}
+    assert mock_redis.xack.await_count == 3
+
+@pytest.mark.asyncio
+async def test_entry_is_dead_lettered_after_max_attempts(mock_redis, mock_db_session):
+    inbox = make_inbox(mock_redis, mock_db_session, AsyncMock(side_effect=Exception("bad signal")))
+    inbox.max_attempts = 2
+    fields = make_fields(uuid4(), "BTC/USDT", 1)
+
+    assert not await inbox.handle("1700000000000-0", fields)
+    mock_redis.xadd.assert_not_awaited()
+    assert await inbox.handle("1700000000000-0", fields)
+
+    stream, dead = mock_redis.xadd.await_args.args
+    assert stream == inbox.dead_letter_stream
+    assert dead["entry_id"] == "1700000000000-0"
+    assert dead["error"] == "bad signal"
+    assert dead["tv"] == fields["tv"]
+    mock_redis.xack.assert_awaited_once_with(inbox.stream, inbox.group, "1700000000000-0")
+
+@pytest.mark.asyncio
+async def test_malformed_entry_is_dead_lettered(mock_redis, mock_db_session):
+    processor = AsyncMock()
+    inbox = make_inbox(mock_redis, mock_db_session, processor)
+
+    await inbox.dispatch([("1700000000000-0", {"user_id": str(uuid4()), "tv": "{not json"})])
+
+    processor.assert_not_awaited()
+    assert mock_redis.xadd.await_args.args[0] == inbox.dead_letter_stream
+    mock_redis.xack.assert_awaited_once_with(inbox.stream, inbox.group, "1700000000000-0")
@@ -0,0 +1,43 @@
+import pytest
+from decimal import Decimal
+
+from backend.app.services.symbol_rounding import SymbolRounding
+
+def test_decimal_places_rules_round_half_up():
+    rounding = SymbolRounding.from_rules({"amount": 3, "price": 2, "min_amount": 0.001, "min_notional": 5})
+
+    assert rounding.price_tick == Decimal("0.01")
+    assert rounding.round_leg(Decimal("0.12345"), Decimal("99.995")) == (Decimal("0.123"), Decimal("100.00"))
+
+def test_tick_size_rules_keep_small_ticks_exact():
+    rounding = SymbolRounding.from_rules({
+        "amount": 1.0, "price": 1e-08, "min_amount": 1.0, "min_notional": None, "precision_mode": "tick_size",
+    })
+
+    assert rounding.round_price(Decimal("0.000012344999")) == Decimal("0.00001234")
+    assert rounding.round_amount(Decimal("1500.6")) == Decimal("1501")
+
+def test_non_power_of_ten_tick():
+    rounding = SymbolRounding.from_rules({"amount": 0.5, "price": 0.25, "precision_mode": "tick_size"})
+
+    assert rounding.round_leg(Decimal("1.3"), Decimal("100.13")) == (Decimal("1.5"), Decimal("100.25"))
+    assert rounding.round_price(Decimal("100.12")) == Decimal("100.00")
+
+def test_round_grid_reports_every_rejected_leg():
+    rounding = SymbolRounding.from_rules({"amount": 4, "price": 2, "min_amount": 0.001, "min_notional": 10})
+
+    assert rounding.round_grid([(Decimal("0.10004"), Decimal("101.004"))]) == [(Decimal("0.1000"), Decimal("101.00"))]
+    with pytest.raises(ValueError) as e:
+        rounding.round_grid([
+            (Decimal("0.00004"), Decimal("100")),
+            (Decimal("0.1"), Decimal("100")),
+            (Decimal("0.09"), Decimal("100")),
+        ])
+    assert "leg 0: quantity 0.0000 rounds to zero" in str(e.value)
+    assert "leg 2: notional 9.000000 below min notional 10" in str(e.value)
+    assert "leg 1" not in str(e.value)
+
+def test_ticks_above_one():
+    rounding = SymbolRounding.from_rules({"amount": 10.0, "price": 5.0, "precision_mode": "tick_size"})
+
+    assert rounding.round_leg(Decimal("1234"), Decimal("1232.4")) == (Decimal("1230"), Decimal("1230"))
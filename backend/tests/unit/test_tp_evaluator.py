@@ -0,0 +1,207 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from decimal import Decimal
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.tp_evaluator import (
+    TPBook, TPTrigger, leg_tp_target, aggregate_tp_target, execute_trigger,
+    evaluate, confirm_triggers, evaluate_take_profits,
+)
+from backend.app.services.price_feed import PriceFeed
+from backend.app.models.trading_models import PositionGroupStatus
+
+class MockAsyncContextManager:
+    def __init__(self, mock_instance_to_return):
+        self.mock_instance = mock_instance_to_return
+    async def __aenter__(self):
+        return self.mock_instance
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+def make_db(group):
+    db = MagicMock(spec=AsyncSession)
+    result = MagicMock()
+    result.scalars.return_value.first.return_value = group
+    db.execute = AsyncMock(return_value=result)
+    return db
+
+def make_manager(filled="1.0", average="101.5"):
+    manager = MagicMock()
+    manager.close_at_market = AsyncMock(return_value={"id": "tp-1", "filled": float(filled), "average": float(average)})
+    return manager
+
+def test_targets_are_measured_from_the_fill_price(make_group, make_leg):
+    long_group = make_group("BTC/USDT", "per_leg")
+    short_group = make_group("ETH/USDT", "aggregate", side="short", tp_aggregate_percent="2.0")
+    leg = make_leg(long_group, 0, "100", tp_percent="1.5")
+    leg.avg_fill_price = Decimal("98")  # filled below the grid price
+    short_legs = [make_leg(short_group, 0, "100", quantity="1"), make_leg(short_group, 1, "90", quantity="3")]
+
+    assert leg_tp_target(leg, "long") == Decimal("99.47")
+    assert leg_tp_target(short_legs[0], "short") == Decimal("99")
+    # Short average entry 92.5, 2% below
+    assert aggregate_tp_target(short_group, short_legs) == Decimal("90.65")
+
+def test_unfilled_leg_falls_back_to_the_grid_tp_price(make_group, make_leg):
+    group = make_group()
+    leg = make_leg(group, 0, "100", status="open")
+    assert leg_tp_target(leg, "long") == leg.tp_price == Decimal("101")
+
+def test_book_groups_legs_by_position_group(make_group, make_leg):
+    first, second = make_group("BTC/USDT"), make_group("ETH/USDT")
+    legs = [make_leg(first, 0, "100"), make_leg(second, 0, "10"), make_leg(first, 1, "99")]
+
+    book = TPBook(legs)
+
+    assert book.items() == [(first, [legs[0], legs[2]]), (second, [legs[1]])]
+
+@pytest.mark.asyncio
+async def test_per_leg_trigger_marks_the_leg_and_books_the_fill(make_group, make_leg):
+    group = make_group("BTC/USDT", "per_leg")
+    leg, other = make_leg(group, 0, "100"), make_leg(group, 1, "95", status="open")
+    db = make_db(group)
+    manager = make_manager()
+
+    with patch('backend.app.services.exchange_manager.get_exchange', new_callable=AsyncMock) as mock_get_exchange:
+        mock_get_exchange.return_value = MockAsyncContextManager(manager)
+        closed_by = await execute_trigger(db, TPTrigger(group.id, "per_leg", [leg.id], Decimal("101.5")))
+
+    assert closed_by is None
+    manager.close_at_market.assert_awaited_once_with("BTC/USDT", "sell", Decimal("1.0"))
+    assert leg.status == "filled" and leg.tp_hit and leg.tp_order_id == "tp-1"
+    assert leg.tp_executed_at is not None
+    assert not other.tp_hit
+    # Another leg is still working, so the group stays open
+    assert group.status == PositionGroupStatus.LIVE
+    assert group.realized_pnl_usd == Decimal("1.5")
+
+@pytest.mark.asyncio
+async def test_aggregate_trigger_closes_the_group(make_group, make_leg):
+    group = make_group("BTC/USDT", "hybrid", tp_aggregate_percent="5.0")
+    legs = [make_leg(group, 0, "100"), make_leg(group, 1, "110")]  # avg 105, target 110.25
+    db = make_db(group)
+    manager = make_manager(filled="2.0", average="111")
+
+    with patch('backend.app.services.exchange_manager.get_exchange', new_callable=AsyncMock) as mock_get_exchange:
+        mock_get_exchange.return_value = MockAsyncContextManager(manager)
+        closed_by = await execute_trigger(db, TPTrigger(group.id, "aggregate", [leg.id for leg in legs], Decimal("111")))
+
+    assert closed_by == group.user_id
+    manager.close_at_market.assert_awaited_once_with("BTC/USDT", "sell", Decimal("2.0"))
+    assert group.status == PositionGroupStatus.CLOSED
+    assert group.closed_at is not None
+    assert all(leg.tp_hit for leg in legs)
+    assert group.realized_pnl_usd == Decimal("12")
+    db.commit.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_aggregate_close_cancels_working_legs_first(make_group, make_leg):
+    group = make_group("BTC/USDT", "aggregate", tp_aggregate_percent="5.0")
+    filled = make_leg(group, 0, "100")
+    working = make_leg(group, 1, "95", status="pending")
+    working.exchange_order_id = "dca-2"
+    db = make_db(group)
+    manager = make_manager(filled="1.0", average="106")
+    calls = []
+    manager.cancel_order = AsyncMock(side_effect=lambda **kw: calls.append("cancel") or {"id": "dca-2", "status": "canceled", "filled": 0})
+    manager.close_at_market.side_effect = lambda *args: calls.append("close") or {"id": "tp-1", "filled": 1.0, "average": 106.0}
+
+    with patch('backend.app.services.exchange_manager.get_exchange', new_callable=AsyncMock) as mock_get_exchange:
+        mock_get_exchange.return_value = MockAsyncContextManager(manager)
+        closed_by = await execute_trigger(db, TPTrigger(group.id, "aggregate", [filled.id], Decimal("106")))
+
+    assert calls == ["cancel", "close"]
+    manager.cancel_order.assert_awaited_once_with(symbol="BTC/USDT", order_id="dca-2")
+    assert working.status == "cancelled"
+    assert closed_by == group.user_id
+    assert group.status == PositionGroupStatus.CLOSED
+
+@pytest.mark.asyncio
+async def test_trigger_is_rechecked_against_the_current_rows(make_group, make_leg):
+    group = make_group("BTC/USDT", "per_leg")
+    leg = make_leg(group, 0, "100")
+    leg.tp_hit = True  # already taken by another pass
+    db = make_db(group)
+
+    with patch('backend.app.services.exchange_manager.get_exchange', new_callable=AsyncMock) as mock_get_exchange:
+        assert await execute_trigger(db, TPTrigger(group.id, "per_leg", [leg.id], Decimal("105"))) is None
+        mock_get_exchange.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_unfilled_close_books_nothing(make_group, make_leg):
+    group = make_group("BTC/USDT", "per_leg")
+    leg = make_leg(group, 0, "100")
+    db = make_db(group)
+    manager = make_manager(filled="0")
+
+    with patch('backend.app.services.exchange_manager.get_exchange', new_callable=AsyncMock) as mock_get_exchange:
+        mock_get_exchange.return_value = MockAsyncContextManager(manager)
+        with pytest.raises(RuntimeError):
+            await execute_trigger(db, TPTrigger(group.id, "per_leg", [leg.id], Decimal("102")))
+
+    assert not leg.tp_hit
+    assert group.realized_pnl_usd == Decimal("0")
+
+def test_vectorized_screen_matches_the_decimal_targets(make_group, make_leg):
+    per_leg = make_group("BTC/USDT", "per_leg")
+    short = make_group("ETH/USDT", "aggregate", side="short", tp_aggregate_percent="2.0")
+    hybrid = make_group("SOL/USDT", "hybrid", tp_aggregate_percent="5.0")
+    legs = [
+        make_leg(per_leg, 0, "100", tp_percent="1.5"),
+        make_leg(short, 0, "100", quantity="1"),
+        make_leg(per_leg, 1, "90", tp_percent="1.0"),
+        make_leg(short, 1, "90", quantity="3"),
+        make_leg(hybrid, 0, "100", tp_percent="10"),
+        make_leg(hybrid, 1, "110", tp_percent="10"),
+    ]
+    legs[0].avg_fill_price = Decimal("98")
+    book = TPBook(legs)
+    # 99.47 reaches only the leg filled at 98; the short target is exactly 90.65;
+    # SOL's average entry is 105, so 110.25 is its position target.
+    prices = [Decimal("99.47"), Decimal("90.65"), Decimal("110.25")]
+
+    evaluation = evaluate(book, prices)
+
+    assert evaluation.leg_hits.tolist() == [True, False, True, False, True, False]
+    assert evaluation.aggregate_hits.tolist() == [False, True, True]
+    triggers = confirm_triggers(book, evaluation, prices)
+    assert [(t.group_id, t.mode, t.leg_ids) for t in triggers] == [
+        (per_leg.id, "per_leg", [legs[0].id, legs[2].id]),
+        (short.id, "aggregate", [legs[1].id, legs[3].id]),
+        # The position close replaces the hybrid group's per-leg hit
+        (hybrid.id, "aggregate", [legs[4].id, legs[5].id]),
+    ]
+    assert all(t.current_price == prices[i] for i, t in enumerate(triggers))
+
+def test_screen_tolerance_false_positive_is_dropped_by_the_decimal_recheck(make_group, make_leg):
+    group = make_group("BTC/USDT", "per_leg")
+    leg = make_leg(group, 0, "100", tp_percent="1.0")
+    book = TPBook([leg])
+    prices = [Decimal("100.9999999999")]
+
+    evaluation = evaluate(book, prices)
+
+    assert evaluation.leg_hits.tolist() == [True]
+    assert confirm_triggers(book, evaluation, prices) == []
+
+@pytest.mark.asyncio
+async def test_evaluate_take_profits_closes_confirmed_triggers(make_group, make_leg):
+    group = make_group("ETH/USDT", "per_leg")
+    quiet = make_group("BTC/USDT", "per_leg")
+    legs = [make_leg(group, 0, "100"), make_leg(quiet, 0, "100")]
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    feed.update("binance", "ETH/USDT", "101.5")
+    db = MagicMock(spec=AsyncSession)
+    slots = MagicMock()
+    slots.release = AsyncMock()
+
+    with patch('backend.app.services.tp_evaluator.pool_slots', slots), \
+         patch('backend.app.services.tp_evaluator.load_tp_book', new_callable=AsyncMock, return_value=TPBook(legs)), \
+         patch('backend.app.services.tp_evaluator.execute_trigger', new_callable=AsyncMock, return_value=group.user_id) as mock_execute:
+        triggers = await evaluate_take_profits(db, feed)
+
+    # BTC has no fresh price, so only ETH's leg is screened in
+    assert [(t.group_id, t.leg_ids) for t in triggers] == [(group.id, [legs[0].id])]
+    mock_execute.assert_awaited_once_with(db, triggers[0])
+    db.commit.assert_awaited_once()
+    slots.release.assert_awaited_once_with(group.user_id)
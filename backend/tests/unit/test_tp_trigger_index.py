@@ -0,0 +1,152 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from decimal import Decimal
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.tp_trigger_index import SymbolTriggerIndex, TPTriggerIndex
+from backend.app.services.tp_evaluator import TPBook, TPTrigger
+from backend.app.services.price_feed import PriceFeed
+
+def test_symbol_index_pops_only_crossed_prefix():
+    index = SymbolTriggerIndex()
+    triggers = [TPTrigger(uuid4(), "per_leg", []) for _ in range(4)]
+    index.add(Decimal("101"), "long", triggers[0], 0)
+    index.add(Decimal("105"), "long", triggers[1], 1)
+    index.add(Decimal("95"), "short", triggers[2], 2)
+    index.add(Decimal("99"), "short", triggers[3], 3)
+
+    assert index.pop_crossed(Decimal("100")) == []
+    assert index.pop_crossed(Decimal("101")) == [triggers[0]]
+    assert index.pop_crossed(Decimal("98")) == [triggers[3]]
+    assert len(index) == 2
+
+def test_build_covers_all_tp_modes(make_group, make_leg):
+    per_leg = make_group("BTC/USDT", "per_leg")
+    aggregate = make_group("BTC/USDT", "aggregate", tp_aggregate_percent="1.0")
+    hybrid = make_group("BTC/USDT", "hybrid", side="short", tp_aggregate_percent="5.0")
+    legs = [
+        make_leg(per_leg, 0, "100", tp_percent="1.0"),      # 101
+        make_leg(per_leg, 1, "100", tp_percent="2.0"),      # 102
+        make_leg(aggregate, 0, "100"),
+        make_leg(aggregate, 1, "102"),                      # avg 101 -> 102.01
+        make_leg(hybrid, 0, "100", tp_percent="10.0"),      # short leg 90, position 95
+    ]
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    index = TPTriggerIndex(rebuild_seconds=60)
+    index.build(TPBook(legs))
+    assert not index.needs_rebuild()
+
+    feed.update("binance", "BTC/USDT", "102.01")
+    fired = index.collect(feed)
+    assert [(t.group_id, t.mode, t.leg_ids) for t in fired] == [
+        (per_leg.id, "per_leg", [legs[0].id]),
+        (per_leg.id, "per_leg", [legs[1].id]),
+        (aggregate.id, "aggregate", [legs[2].id, legs[3].id]),
+    ]
+    assert all(t.current_price == Decimal("102.01") for t in fired)
+    # Crossed thresholds are gone; the next tick touches nothing.
+    assert index.collect(feed) == []
+
+    # A hybrid group's whole-position target is crossed before its leg target
+    feed.update("binance", "BTC/USDT", "95")
+    assert [(t.group_id, t.mode) for t in index.collect(feed)] == [(hybrid.id, "aggregate")]
+    feed.update("binance", "BTC/USDT", "90")
+    assert [(t.group_id, t.mode) for t in index.collect(feed)] == [(hybrid.id, "per_leg")]
+
+def test_group_without_aggregate_percent_has_no_position_threshold(make_group, make_leg):
+    group = make_group("ETH/USDT", "aggregate", tp_aggregate_percent=None)
+    index = TPTriggerIndex(rebuild_seconds=60)
+    index.build(TPBook([make_leg(group, 0, "100")]))
+    assert index.symbols() == []
+
+@pytest.mark.asyncio
+async def test_check_commits_each_trigger_and_releases_closed_groups(make_group, make_leg):
+    group = make_group("ETH/USDT", "per_leg")
+    leg = make_leg(group, 0, "100")
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    feed.update("binance", "ETH/USDT", "101.5")
+    db = MagicMock(spec=AsyncSession)
+    slots = MagicMock()
+    slots.release = AsyncMock()
+
+    index = TPTriggerIndex(rebuild_seconds=60)
+    with patch('backend.app.services.tp_trigger_index.price_feed', feed), \
+         patch('backend.app.services.tp_trigger_index.pool_slots', slots), \
+         patch('backend.app.services.tp_trigger_index.load_tp_book', new_callable=AsyncMock, return_value=TPBook([leg])) as mock_load, \
+         patch('backend.app.services.tp_trigger_index.execute_trigger', new_callable=AsyncMock, return_value=group.user_id) as mock_execute:
+        fired = await index.check(db)
+
+    mock_load.assert_awaited_once_with(db)
+    assert len(fired) == 1
+    mock_execute.assert_awaited_once_with(db, fired[0])
+    db.commit.assert_awaited_once()
+    slots.release.assert_awaited_once_with(group.user_id)
+    # The closed group is dropped in place, without a rebuild
+    assert not index.needs_rebuild()
+    assert index.symbols() == []
+
+@pytest.mark.asyncio
+async def test_failed_trigger_is_rolled_back_alone(make_group, make_leg):
+    group = make_group("ETH/USDT", "per_leg")
+    legs = [make_leg(group, 0, "100"), make_leg(group, 1, "100", tp_percent="0.5")]
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    feed.update("binance", "ETH/USDT", "101.5")
+    db = MagicMock(spec=AsyncSession)
+
+    index = TPTriggerIndex(rebuild_seconds=60)
+    with patch('backend.app.services.tp_trigger_index.price_feed', feed), \
+         patch('backend.app.services.tp_trigger_index.load_tp_book', new_callable=AsyncMock, return_value=TPBook(legs)), \
+         patch('backend.app.services.tp_trigger_index.execute_trigger', new_callable=AsyncMock, side_effect=[RuntimeError("rejected"), None]):
+        fired = await index.check(db)
+
+    assert len(fired) == 2
+    db.rollback.assert_awaited_once()
+    db.commit.assert_awaited_once()
+    assert not index.needs_rebuild()
+    # Only the failed leg's threshold is back, ready to fire on the next tick
+    assert [t.leg_ids for t in index.collect(feed)] == [[legs[1].id]]
+
+def test_fill_adds_its_threshold_and_moves_the_aggregate(make_group, make_leg):
+    per_leg = make_group("BTC/USDT", "per_leg")
+    hybrid = make_group("ETH/USDT", "hybrid", tp_aggregate_percent="5.0")
+    first = make_leg(hybrid, 0, "100", tp_percent="20")
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    index = TPTriggerIndex(rebuild_seconds=60)
+    index.build(TPBook([first]))
+
+    # Not yet filled, so not indexed
+    pending = make_leg(per_leg, 0, "100", status="pending")
+    index.add_fill(pending)
+    assert index.symbols() == [("binance", "ETH/USDT")]
+
+    pending.status, pending.avg_fill_price = "filled", Decimal("100")
+    index.add_fill(pending)
+    second = make_leg(hybrid, 1, "80", tp_percent="20")
+    index.add_fill(second)
+    assert not index.needs_rebuild()
+
+    feed.update("binance", "BTC/USDT", "101")
+    assert [(t.group_id, t.leg_ids) for t in index.collect(feed)] == [(per_leg.id, [pending.id])]
+    # Average entry 90 -> 94.5; the old 105 target is gone
+    feed.update("binance", "ETH/USDT", "94.5")
+    fired = index.collect(feed)
+    assert [(t.mode, t.leg_ids) for t in fired] == [("aggregate", [first.id, second.id])]
+
+def test_rebuild_is_not_needed_after_a_taken_leg(make_group, make_leg):
+    group = make_group("ETH/USDT", "hybrid", tp_aggregate_percent="5.0")
+    legs = [make_leg(group, 0, "100", tp_percent="1.0"), make_leg(group, 1, "120", tp_percent="50")]
+    feed = PriceFeed(max_age_seconds=10, client_factory=MagicMock())
+    index = TPTriggerIndex(rebuild_seconds=60)
+    index.build(TPBook(legs))
+
+    feed.update("binance", "ETH/USDT", "101")
+    fired = index.collect(feed)
+    index._taken(fired[0], closed=False)
+
+    # Only the 120 leg is left, so the position target is 126
+    feed.update("binance", "ETH/USDT", "115.5")
+    assert index.collect(feed) == []
+    feed.update("binance", "ETH/USDT", "126")
+    assert [(t.mode, t.leg_ids) for t in index.collect(feed)] == [("aggregate", [legs[1].id])]
+    assert not index.needs_rebuild()
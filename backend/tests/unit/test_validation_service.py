@@ -4,8 +4,9 @@ from decimal import Decimal
 from uuid import UUID
 from sqlalchemy.orm import Session
 
-from backend.app.services.validation_service import validate_and_adjust_order
-from backend.app.services import precision_service, exchange_manager
+from backend.app.services.validation_service import validate_and_adjust_order, validate_and_adjust_grid
+from backend.app.services import precision_service
+from backend.app.services.symbol_rounding import SymbolRounding
 
 @pytest.fixture
 def mock_db_session():
@@ -33,20 +34,16 @@ async def test_validate_and_adjust_order_success(mock_db_session, mock_precision
     quantity = Decimal("0.123456789")
     price = Decimal("50000.123")
 
-    with patch('backend.app.services.precision_service.fetch_precision_info', new_callable=AsyncMock) as mock_fetch_precision_info:
-        mock_fetch_precision_info.return_value = mock_precision_info
-        
-        # Mock ccxt.decimal_to_precision directly
-        with patch('backend.app.services.exchange_manager.ccxt.decimal_to_precision') as mock_decimal_to_precision:
-            mock_decimal_to_precision.side_effect = lambda num, rounding_mode, precision: Decimal(f"{num:.{precision}f}")
+    with patch('backend.app.services.precision_service.fetch_symbol_rounding', new_callable=AsyncMock) as mock_fetch_rounding:
+        mock_fetch_rounding.return_value = SymbolRounding.from_rules(mock_precision_info)
 
-            adjusted_quantity, adjusted_price = await validate_and_adjust_order(
-                mock_db_session, exchange, symbol, side, quantity, price
-            )
+        adjusted_quantity, adjusted_price = await validate_and_adjust_order(
+            mock_db_session, exchange, symbol, side, quantity, price
+        )
 
-            mock_fetch_precision_info.assert_awaited_once_with(mock_db_session, exchange, symbol)
-            assert adjusted_quantity == Decimal("0.12345679") # Rounded to 8 decimal places
-            assert adjusted_price == Decimal("50000.12")    # Rounded to 2 decimal places
+        mock_fetch_rounding.assert_awaited_once_with(mock_db_session, exchange, symbol)
+        assert adjusted_quantity == Decimal("0.12345679") # Rounded to 8 decimal places
+        assert adjusted_price == Decimal("50000.12")    # Rounded to 2 decimal places
 
 @pytest.mark.asyncio
 async def test_validate_and_adjust_order_missing_precision(mock_db_session):
@@ -59,7 +56,7 @@ async def test_validate_and_adjust_order_missing_precision(mock_db_session):
     quantity = Decimal("0.1")
     price = Decimal("50000")
 
-    with patch('backend.app.services.precision_service.fetch_precision_info', new_callable=AsyncMock) as mock_fetch_precision_info:
+    with patch('backend.app.services.precision_service.fetch_symbol_rounding', new_callable=AsyncMock) as mock_fetch_precision_info:
         mock_fetch_precision_info.return_value = None # Simulate missing precision
 
         with pytest.raises(ValueError, match=f"Precision rules not available for {exchange}:{symbol}. Cannot validate order."):
@@ -68,4 +65,32 @@ async def test_validate_and_adjust_order_missing_precision(mock_db_session):
             )
         mock_fetch_precision_info.assert_awaited_once_with(mock_db_session, exchange, symbol)
 
-# TODO: Add tests for minimum notional value once implemented in validation_service.py
+@pytest.mark.asyncio
+async def test_validate_and_adjust_grid_fetches_precision_once(mock_db_session, mock_precision_info):
+    legs = [
+        (Decimal("0.123456789"), Decimal("50000.123")),
+        (Decimal("0.2"), Decimal("49000.456")),
+        (Decimal("0.3"), Decimal("48000.789")),
+    ]
+
+    with patch('backend.app.services.precision_service.fetch_symbol_rounding', new_callable=AsyncMock) as mock_fetch_precision_info:
+        mock_fetch_precision_info.return_value = SymbolRounding.from_rules(mock_precision_info)
+
+        adjusted = await validate_and_adjust_grid(mock_db_session, "binance", "BTC/USDT", "buy", legs)
+
+    mock_fetch_precision_info.assert_awaited_once_with(mock_db_session, "binance", "BTC/USDT")
+    assert adjusted == [
+        (Decimal("0.12345679"), Decimal("50000.12")),
+        (Decimal("0.2"), Decimal("49000.46")),
+        (Decimal("0.3"), Decimal("48000.79")),
+    ]
+
+@pytest.mark.asyncio
+async def test_validate_and_adjust_grid_enforces_min_notional(mock_db_session, mock_precision_info):
+    legs = [(Decimal("0.001"), Decimal("50000")), (Decimal("0.0001"), Decimal("49000"))]
+
+    with patch('backend.app.services.precision_service.fetch_symbol_rounding', new_callable=AsyncMock) as mock_fetch_rounding:
+        mock_fetch_rounding.return_value = SymbolRounding.from_rules(mock_precision_info)
+
+        with pytest.raises(ValueError, match="leg 1: quantity 0.00010000 below min amount 0.001"):
+            await validate_and_adjust_grid(mock_db_session, "binance", "BTC/USDT", "buy", legs)
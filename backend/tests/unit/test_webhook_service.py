@@ -0,0 +1,33 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from uuid import uuid4
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.app.services.webhook_service import apply_webhook_signal
+
+TV = {"exchange": "binance", "symbol": "BTC/USDT", "timeframe": "15m"}
+
+@pytest.mark.asyncio
+async def test_exit_dequeues_a_waiting_signal():
+    db = MagicMock(spec=AsyncSession)
+    cancelled = MagicMock(id=uuid4())
+    with patch('backend.app.services.webhook_service.remove_from_queue', new_callable=AsyncMock, return_value=cancelled), \
+         patch('backend.app.services.webhook_service.pool_slots') as mock_slots:
+        result = await apply_webhook_signal(db, uuid4(), TV, {"type": "exit"})
+
+    assert result == {"status": "success", "action": "dequeued", "queued_signal_id": cancelled.id}
+    mock_slots.try_acquire.assert_not_called()
+
+@pytest.mark.asyncio
+async def test_exit_without_a_waiting_signal_opens_nothing():
+    db = MagicMock(spec=AsyncSession)
+    with patch('backend.app.services.webhook_service.remove_from_queue', new_callable=AsyncMock, return_value=None), \
+         patch('backend.app.services.webhook_service.pool_slots') as mock_slots, \
+         patch('backend.app.services.webhook_service.add_to_queue', new_callable=AsyncMock) as mock_add, \
+         patch('backend.app.services.webhook_service.create_position_group_from_signal', new_callable=AsyncMock) as mock_create:
+        result = await apply_webhook_signal(db, uuid4(), TV, {"type": "exit"})
+
+    assert result == {"status": "success", "action": "ignored"}
+    mock_slots.try_acquire.assert_not_called()
+    mock_add.assert_not_awaited()
+    mock_create.assert_not_awaited()